@@ -0,0 +1,1312 @@
+# -*- coding: utf-8 -*-
+import glob
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from typing import Callable, Dict, Any, Iterable, List
+
+from docx import Document
+from openpyxl import Workbook
+from pptx import Presentation
+from pptx.util import Inches
+
+import chunking
+import content_codec
+import excel_llm_main
+import ingest
+import rag_with_deepseek
+import save_to_mysql
+import vector_index
+from excel_parser import ExcelParser
+from fake_backends import FakeElasticsearch, FakeMySQLConnection, use_fake_backends
+from fake_llm_server import start_fake_server
+from gemini_client import GeminiClient, CorrectionEngine
+from ingest_manifest import IngestManifest
+from pipeline import Stage, Pipeline
+from pptx_parser import PPTParser
+import save_to_es
+from save_to_es import Elastic
+from table_format import compact_document, expand_document
+
+def timed(func: Callable, repeat: int = 1) -> float:
+    """
+    多次执行函数，返回最短耗时（秒）。
+    :param func: 无参函数
+    :param repeat: 重复次数
+    :return: 最短耗时
+    """
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_parallel_parse(file_path: str, workers_list: List[int], repeat: int = 1) -> List[Dict[str, Any]]:
+    """
+    对比串行与多进程解析的耗时，并校验输出一致。
+    :param file_path: Excel 或 PPT 文件路径
+    :param workers_list: 需要测试的进程数列表
+    :param repeat: 每组重复次数（取最短耗时）
+    :return: [{"workers": n, "seconds": t, "speedup": x, "identical": bool}, ...]
+    """
+    parser_cls = PPTParser if file_path.lower().endswith(".pptx") else ExcelParser
+
+    serial_result = parser_cls(file_path).parse()
+    serial_time = timed(lambda: parser_cls(file_path).parse(), repeat)
+
+    report = [{"workers": 1, "seconds": serial_time, "speedup": 1.0, "identical": True}]
+    for workers in workers_list:
+        if workers <= 1:
+            continue
+        parallel_result = parser_cls(file_path).parse(workers=workers)
+        seconds = timed(lambda: parser_cls(file_path).parse(workers=workers), repeat)
+        report.append({
+            "workers": workers,
+            "seconds": seconds,
+            "speedup": serial_time / seconds if seconds else 0.0,
+            "identical": parallel_result == serial_result,
+        })
+    return report
+
+def bench_compact_format(json_dir: str) -> List[Dict[str, Any]]:
+    """
+    统计目录下 JSON 文件在常规格式与紧凑表格格式下的磁盘字节数、提示词字节数和 token 数，并校验可无损还原。
+    :param json_dir: JSON 文件目录
+    :return: [{"format": ..., "files": n, "disk_bytes": ..., "prompt_bytes": ..., "prompt_tokens": ...}, ...]
+    """
+    totals = {"full": [0, 0, 0], "compact": [0, 0, 0]}
+    files = 0
+    lossless = True
+    for path in sorted(glob.glob(os.path.join(json_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            try:
+                document = json.load(f)
+            except json.JSONDecodeError:
+                continue
+        files += 1
+        compact = compact_document(document)
+        lossless = lossless and expand_document(compact) == document
+        for name, data in (("full", document), ("compact", compact)):
+            disk = json.dumps(data, ensure_ascii=False, indent=2)
+            prompt = json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+            totals[name][0] += len(disk.encode("utf-8"))
+            totals[name][1] += len(prompt.encode("utf-8"))
+            totals[name][2] += chunking.count_tokens(prompt)
+
+    report = []
+    for name, (disk_bytes, prompt_bytes, prompt_tokens) in totals.items():
+        report.append({
+            "format": name,
+            "files": files,
+            "disk_bytes": disk_bytes,
+            "prompt_bytes": prompt_bytes,
+            "prompt_tokens": prompt_tokens,
+            "ratio": prompt_tokens / totals["full"][2] if totals["full"][2] else 0.0,
+            "lossless": lossless,
+        })
+    return report
+
+def build_dense_deck(file_path: str, slides: int = 200, tables_per_slide: int = 2, rows: int = 30, cols: int = 12):
+    """
+    生成包含大量合并单元格表格的测试 PPT：每页多个表格，每个表格按 2x2、1x3、3x1 的块交替合并。
+    :param file_path: 输出的 PPT 路径
+    :param slides: 页数
+    :param tables_per_slide: 每页表格数
+    :param rows: 表格行数
+    :param cols: 表格列数
+    """
+    prs = Presentation()
+    layout = prs.slide_layouts[5]
+    for s in range(slides):
+        slide = prs.slides.add_slide(layout)
+        slide.shapes.title.text = f"Slide {s}"
+        for t in range(tables_per_slide):
+            shape = slide.shapes.add_table(rows, cols, Inches(0.2 + 4.8 * t), Inches(1.5), Inches(4.6), Inches(5))
+            table = shape.table
+            for c in range(cols):
+                table.cell(0, c).text = f"H{c}"
+            for r in range(1, rows):
+                for c in range(cols):
+                    table.cell(r, c).text = f"{s}-{t}-{r}-{c}"
+            # 从第二行起按块合并：每 3 列一组，依次为 2x2、1x3、3x1 合并
+            for r in range(1, rows - 2, 3):
+                for c in range(0, cols - 2, 3):
+                    kind = (r // 3 + c // 3) % 3
+                    if kind == 0:
+                        table.cell(r, c).merge(table.cell(r + 1, c + 1))
+                    elif kind == 1:
+                        table.cell(r, c).merge(table.cell(r, c + 2))
+                    else:
+                        table.cell(r, c).merge(table.cell(r + 2, c))
+    prs.save(file_path)
+
+def _probe_table_data(table) -> List[List[str]]:
+    """
+    旧版表格提取方式（逐个单元格访问 cell.text，并通过探测 is_spanned 推断合并范围），仅用于对比耗时。
+    """
+    rows = len(table.rows)
+    cols = len(table.columns)
+    data = [["" for _ in range(cols)] for _ in range(rows)]
+    for row_idx in range(rows):
+        for col_idx in range(cols):
+            cell = table.cell(row_idx, col_idx)
+            if data[row_idx][col_idx]:
+                continue
+            value = cell.text.strip()
+            if not cell.is_merge_origin:
+                data[row_idx][col_idx] = value
+                continue
+            merge_rows = 1
+            merge_cols = 1
+            for r in range(row_idx + 1, rows):
+                if not table.cell(r, col_idx).is_spanned:
+                    break
+                merge_rows += 1
+            for c in range(col_idx + 1, cols):
+                if not table.cell(row_idx, c).is_spanned:
+                    break
+                merge_cols += 1
+            for r in range(row_idx, min(row_idx + merge_rows, rows)):
+                for c in range(col_idx, min(col_idx + merge_cols, cols)):
+                    data[r][c] = value
+    return data
+
+def bench_pptx_tables(slides: int = 200, repeat: int = 1) -> List[Dict[str, Any]]:
+    """
+    在生成的多表格、密集合并单元格 PPT 上对比旧版探测方式与直接读取表格 XML 的耗时。
+    :param slides: 测试 PPT 的页数
+    :param repeat: 每组重复次数（取最短耗时）
+    :return: [{"method": ..., "tables": n, "parsed_tables": n, "seconds": t, "speedup": x, "identical": bool}, ...]
+    """
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = os.path.join(tmp_dir, "dense_tables.pptx")
+        build_dense_deck(file_path, slides=slides)
+        parser = PPTParser(file_path)
+        tables = [shape.table for slide in Presentation(file_path).slides for shape in slide.shapes if shape.has_table]
+
+        xml_result = [parser.extract_table_data(table) for table in tables]
+        probe_result = [_probe_table_data(table) for table in tables]
+        probe_time = timed(lambda: [_probe_table_data(table) for table in tables], repeat)
+        xml_time = timed(lambda: [parser.extract_table_data(table) for table in tables], repeat)
+        parsed_tables = len(PPTParser(file_path).parse()["tables"])
+
+    # parsed_tables 校验整份 PPT 解析后每个表格都生成了 table（不再只取每页第一个表格）
+    return [
+        {"method": "probe is_spanned", "tables": len(tables), "parsed_tables": parsed_tables,
+         "seconds": probe_time, "speedup": 1.0, "identical": True},
+        {"method": "table xml", "tables": len(tables), "parsed_tables": parsed_tables,
+         "seconds": xml_time, "speedup": probe_time / xml_time if xml_time else 0.0,
+         "identical": xml_result == probe_result},
+    ]
+
+def _consume(make_records: Callable[[], Iterable[Any]]) -> Dict[str, Any]:
+    """
+    消费一个记录生成器（不保留记录），统计首条记录耗时、总耗时与 Python 内存分配峰值。
+    """
+    tracemalloc.start()
+    start = time.perf_counter()
+    first = None
+    count = 0
+    for _ in make_records():
+        if first is None:
+            first = time.perf_counter() - start
+        count += 1
+    total = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {"records": count, "first_record_s": first or 0.0, "total_s": total, "peak_mib": peak / (1 << 20)}
+
+def bench_lazy_iteration(file_path: str) -> List[Dict[str, Any]]:
+    """
+    对比先 parse 再输出（一次性构建完整结果）与直接消费 iter_tables 生成器的首条记录耗时和内存峰值。
+    :param file_path: Excel 或 PPT 文件路径
+    :return: [{"mode": ..., "records": n, "first_record_s": t, "total_s": t, "peak_mib": m}, ...]
+    """
+    parser_cls = PPTParser if file_path.lower().endswith(".pptx") else ExcelParser
+
+    def eager():
+        parser = parser_cls(file_path)
+        parser.parse()
+        return parser.iter_tables()
+
+    return [
+        {"mode": "parse + iter_tables", **_consume(eager)},
+        {"mode": "lazy iter_tables", **_consume(lambda: parser_cls(file_path).iter_tables())},
+    ]
+
+def bench_pipeline_overlap(units: int = 200, stage_seconds: Dict[str, float] = None,
+                           workers: Dict[str, int] = None) -> List[Dict[str, Any]]:
+    """
+    用固定耗时的模拟阶段对比分步执行（各阶段依次跑完）与流水线并发执行的总耗时。
+    :param units: 处理单元数
+    :param stage_seconds: 各阶段处理单个单元的耗时（秒）
+    :param workers: 各阶段的并发度
+    :return: [{"mode": ..., "wall_s": t, "slowest_stage_s": t, "sum_of_stages_s": t}, ...]
+    """
+    stage_seconds = stage_seconds or {"parse": 0.002, "llm": 0.05, "mysql": 0.004, "es": 0.002}
+    workers = workers or {"parse": 1, "llm": 8, "mysql": 2, "es": 1}
+
+    def make_func(seconds):
+        def func(item, _):
+            time.sleep(seconds)
+            yield item
+        return func
+
+    # 每个阶段单独运行的耗时（相当于分步脚本，各阶段内部同样并发）
+    per_stage = {}
+    for name, seconds in stage_seconds.items():
+        pipeline = Pipeline([Stage(name, make_func(seconds), workers=workers[name])])
+        pipeline.run(range(units))
+        per_stage[name] = pipeline.wall_seconds
+
+    pipeline = Pipeline([
+        Stage(name, make_func(seconds), workers=workers[name], queue_size=16)
+        for name, seconds in stage_seconds.items()
+    ])
+    pipeline.run(range(units))
+
+    report = []
+    for mode, wall in (("sequential stages", sum(per_stage.values())), ("pipelined stages", pipeline.wall_seconds)):
+        report.append({
+            "mode": mode,
+            "units": units,
+            "wall_s": wall,
+            "slowest_stage_s": max(per_stage.values()),
+            "sum_of_stages_s": sum(per_stage.values()),
+        })
+    return report
+
+def bench_llm_throughput(json_dir: str, limit: int = 60, concurrency_list: List[int] = None, latency: float = 0.3,
+                         fail_rate: float = 0.1, rpm: float = 0) -> List[Dict[str, Any]]:
+    """
+    在本地模拟 LLM 服务上对比不同并发数下的校对吞吐量（sheets/min），服务按概率返回 429 以覆盖退避重试。
+    :param json_dir: 作为输入的 JSON 文件目录
+    :param limit: 最多使用的文件数
+    :param concurrency_list: 需要测试的并发数列表
+    :param latency: 模拟服务每个请求的延迟（秒）
+    :param fail_rate: 模拟服务返回 429 的概率
+    :param rpm: 每分钟请求数上限，0 表示不限制
+    :return: [{"concurrency": n, "sheets": n, "retries": n, "elapsed_s": t, "sheets_per_minute": x}, ...]
+    """
+    prompts = []
+    for path in sorted(glob.glob(os.path.join(json_dir, "*.json")))[:limit]:
+        with open(path, "r", encoding="utf-8") as f:
+            prompts.append("请校对以下JSON：" + f.read())
+
+    server, url = start_fake_server(latency=latency, fail_rate=fail_rate)
+    report = []
+    try:
+        for concurrency in concurrency_list or [1, 4, 8, 16]:
+            engine = CorrectionEngine(GeminiClient(api_key="fake", endpoint=url), concurrency=concurrency,
+                                      rpm=rpm, backoff_base=0.1)
+            results = list(engine.map(engine.generate, prompts))
+            stats = engine.stats()
+            report.append({
+                "concurrency": concurrency,
+                "sheets": stats["sheets"],
+                "failed": sum(1 for _, _, error in results if error is not None),
+                "retries": stats["retries"],
+                "elapsed_s": stats["elapsed_s"],
+                "sheets_per_minute": stats["sheets_per_minute"],
+            })
+    finally:
+        server.shutdown()
+    return report
+
+def bench_llm_cache(json_dir: str, limit: int = 40, latency: float = 0.3, concurrency: int = 4) -> List[Dict[str, Any]]:
+    """
+    对比大模型响应缓存冷启动与命中时的校对耗时：同一批 JSON 连续校对两次，第二次应全部命中缓存、不发起请求。
+    :param json_dir: 作为输入的 JSON 文件目录
+    :param limit: 最多使用的文件数
+    :param latency: 模拟服务每个请求的延迟（秒）
+    :param concurrency: 并发数
+    :return: [{"run": "cold"/"warm", "sheets": n, "requests": n, "hit_rate": x, "elapsed_s": t}, ...]
+    """
+    documents = []
+    for path in sorted(glob.glob(os.path.join(json_dir, "*.json")))[:limit]:
+        with open(path, "r", encoding="utf-8") as f:
+            documents.append(json.load(f))
+
+    server, url = start_fake_server(latency=latency)
+    engine = CorrectionEngine(GeminiClient(api_key="fake", endpoint=url), concurrency=concurrency)
+    report = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        excel_llm_main.configure_cache(os.path.join(tmp_dir, "llm_cache.sqlite"))
+        cache = excel_llm_main.get_cache()
+        try:
+            for run in ("cold", "warm"):
+                hits, requests = cache.hits, server.requests
+                start = time.perf_counter()
+                results = list(engine.map(lambda document: excel_llm_main.correct_json_with_gemini(document, engine=engine),
+                                          documents))
+                elapsed = time.perf_counter() - start
+                report.append({
+                    "run": run,
+                    "sheets": sum(1 for _, _, error in results if error is None),
+                    "requests": server.requests - requests,
+                    "hit_rate": (cache.hits - hits) / len(documents) if documents else 0.0,
+                    "elapsed_s": elapsed,
+                })
+        finally:
+            server.shutdown()
+            cache.close()
+            excel_llm_main._cache = None
+    return report
+
+def bench_llm_stream(json_dir: str, limit: int = 40, latency: float = 0.3, truncate_rate: float = 0.3,
+                     concurrency: int = 4) -> List[Dict[str, Any]]:
+    """
+    对比输出被截断时两种处理方式的请求数、模型输出字符数与耗时：整张 sheet 重新请求，
+    与流式增量解析后只补发未正确返回的行范围。两者最终都应得到有效 JSON。
+    :param json_dir: 作为输入的 JSON 文件目录
+    :param limit: 最多使用的文件数
+    :param latency: 模拟服务每个请求的延迟（秒）
+    :param truncate_rate: 模拟服务截断响应的概率
+    :param concurrency: 并发数
+    :return: [{"mode": "whole-sheet"/"row-range", "sheets": n, "valid": n, "requests": n, "chars": n, "elapsed_s": t}, ...]
+    """
+    documents = []
+    for path in sorted(glob.glob(os.path.join(json_dir, "*.json")))[:limit]:
+        with open(path, "r", encoding="utf-8") as f:
+            documents.append(json.load(f))
+
+    def whole_sheet(document):
+        prompt = excel_llm_main.build_prompt(document)
+        for _ in range(excel_llm_main.MAX_REPAIRS + 1):
+            text = engine.generate(prompt)
+            try:
+                return json.dumps(json.loads(text[text.find("{"):text.rfind("}") + 1]), ensure_ascii=False)
+            except json.JSONDecodeError:
+                continue
+        return json.dumps(document, ensure_ascii=False)
+
+    def row_range(document):
+        return excel_llm_main.stream_correction(document, engine)
+
+    server, url = start_fake_server(latency=latency, truncate_rate=truncate_rate)
+    report = []
+    try:
+        for mode, func in (("whole-sheet", whole_sheet), ("row-range", row_range)):
+            engine = CorrectionEngine(GeminiClient(api_key="fake", endpoint=url), concurrency=concurrency)
+            requests, chars = server.requests, server.chars_sent
+            start = time.perf_counter()
+            results = list(engine.map(func, documents))
+            elapsed = time.perf_counter() - start
+            valid = 0
+            for _, result, error in results:
+                try:
+                    valid += error is None and isinstance(json.loads(result), dict)
+                except json.JSONDecodeError:
+                    pass
+            report.append({
+                "mode": mode,
+                "sheets": len(documents),
+                "valid": valid,
+                "requests": server.requests - requests,
+                "chars": server.chars_sent - chars,
+                "elapsed_s": elapsed,
+            })
+    finally:
+        server.shutdown()
+    return report
+
+# 合成元器件数据使用的取值，查询语句从中取词以保证能命中
+_CATEGORIES = ["电阻", "电容", "电感", "二极管", "MOSFET", "LDO", "摄像头", "传感器"]
+_PACKAGES = ["0402", "0603", "0805", "1206", "SOT-23", "QFN-32"]
+_VENDORS = ["村田", "国巨", "风华", "TI", "联合", "博世"]
+
+def build_synthetic_workbook(file_path: str, sheets: int = 4, rows: int = 300, seed: int = 0):
+    """
+    生成元器件规格表风格的测试工作簿：每个 sheet 一类器件，列包括编码、制造商料号、封装、规格参数与项目。
+    :param file_path: 输出的 Excel 路径
+    :param sheets: sheet 数
+    :param rows: 每个 sheet 的数据行数
+    :param seed: 用于生成料号的偏移，使不同文件的内容不同
+    """
+    workbook = Workbook()
+    workbook.remove(workbook.active)
+    for s in range(sheets):
+        category = _CATEGORIES[s % len(_CATEGORIES)]
+        sheet = workbook.create_sheet(category)
+        sheet.append(["编码", "制造商", "制造商料号", "封装", "额定功率", "标称值", "精度(%)", "使用项目", "备注"])
+        for r in range(rows):
+            n = seed * 100000 + s * 1000 + r
+            sheet.append([
+                f"0302{n:08d}",
+                _VENDORS[n % len(_VENDORS)],
+                f"{category[:2].upper()}{n:06d}-V{n % 5}",
+                _PACKAGES[n % len(_PACKAGES)],
+                f"{(n % 8 + 1) / 8:g}W",
+                f"{n % 97 + 1}k",
+                f"{n % 3 + 1}",
+                f"{2400 + n % 50}项目",
+                f"{category}批次{n % 13}，需确认{_VENDORS[(n + 1) % len(_VENDORS)]}替代料",
+            ])
+    workbook.save(file_path)
+
+def build_synthetic_document(file_path: str, sections: int = 12, paragraphs: int = 8, seed: int = 0):
+    """
+    生成带多级标题、段落和表格的测试 Word 文档。
+    :param file_path: 输出的 Word 路径
+    :param sections: 一级标题数
+    :param paragraphs: 每个标题下的段落数
+    :param seed: 用于区分不同文件的内容
+    """
+    document = Document()
+    for s in range(sections):
+        category = _CATEGORIES[(s + seed) % len(_CATEGORIES)]
+        document.add_heading(f"{s + 1}. {category}选型与验证", level=1)
+        for p in range(paragraphs):
+            document.add_paragraph(
+                f"{category}在{2400 + (seed + s + p) % 50}项目中的验证要求：封装{_PACKAGES[p % len(_PACKAGES)]}，"
+                f"高温高湿测试后参数漂移不超过{p % 3 + 1}%，供应商{_VENDORS[(s + p) % len(_VENDORS)]}需提供批次报告。"
+            )
+        table = document.add_table(rows=4, cols=3)
+        for r in range(4):
+            for c, value in enumerate(("测试项", "条件", "判定") if r == 0 else (f"测试{r}", f"{85 + r}℃/{r * 24}h", "通过")):
+                table.cell(r, c).text = value
+    document.save(file_path)
+
+def build_synthetic_corpus(corpus_dir: str, workbooks: int = 4, decks: int = 2, documents: int = 4):
+    """
+    在目录下生成一批测试工作簿、PPT 和 Word 文档，用于端到端基准测试。
+    :param corpus_dir: 输出目录
+    :param workbooks: 工作簿数
+    :param decks: PPT 数
+    :param documents: Word 文档数
+    """
+    if not os.path.exists(corpus_dir):
+        os.makedirs(corpus_dir)
+    for i in range(workbooks):
+        build_synthetic_workbook(os.path.join(corpus_dir, f"元器件规格{i}.xlsx"), seed=i)
+    for i in range(decks):
+        build_dense_deck(os.path.join(corpus_dir, f"器件验证进度{i}.pptx"), slides=20, rows=12)
+    for i in range(documents):
+        build_synthetic_document(os.path.join(corpus_dir, f"验证规范{i}.docx"), seed=i)
+
+def percentile(values: List[float], q: float) -> float:
+    """
+    计算百分位数（最近秩法）。
+    :param values: 数值列表
+    :param q: 百分位（0-100）
+    :return: 百分位数，列表为空时返回 0
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, int(round(q / 100 * len(ordered))) - 1))]
+
+def bench_end_to_end(workbooks: int = 4, decks: int = 2, documents: int = 4, queries: int = 50,
+                     llm_latency: float = 0.2, chat_latency: float = 0.3, search_latency: float = 0.002,
+                     mysql_latency: float = 0.0, llm_threshold: float = 0.0, llm_workers: int = 8) -> List[Dict[str, Any]]:
+    """
+    在本地替身后端（fake_backends）上运行完整的导入与问答流程：生成合成的工作簿、PPT 和 Word 文档，
+    经 ingest.run_ingest 解析 → 大模型校对 → MySQL → ES，然后执行一批检索与 RAG 问答。
+    统计各阶段吞吐量、导入过程的 Python 内存峰值，以及检索和问答的 p50/p99 延迟。
+    :param workbooks: 工作簿数
+    :param decks: PPT 数
+    :param documents: Word 文档数
+    :param queries: 查询次数
+    :param llm_latency: 模拟 Gemini 每个请求的延迟（秒）
+    :param chat_latency: 模拟 DeepSeek 每次生成的固定延迟（秒）
+    :param search_latency: 模拟 ES 每个请求的延迟（秒）
+    :param mysql_latency: 模拟 MySQL 每条语句的延迟（秒）
+    :param llm_threshold: 杂乱度阈值，默认 0 使每个 Excel 单元都经过校对阶段
+    :param llm_workers: 校对阶段线程数
+    :return: [{"phase": ..., "items": n, "per_second": x, "p50_ms": t, "p99_ms": t, "peak_mib": m}, ...]
+    """
+    index_name = "e_rag_bench"
+    questions = [
+        f"{_VENDORS[i % len(_VENDORS)]} {_PACKAGES[i % len(_PACKAGES)]} 封装的{_CATEGORIES[i % len(_CATEGORIES)]}用在哪些项目"
+        for i in range(queries)
+    ]
+    report = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        corpus_dir = os.path.join(tmp_dir, "corpus")
+        build_synthetic_corpus(corpus_dir, workbooks, decks, documents)
+        backends = use_fake_backends(os.path.join(tmp_dir, "backends"), llm_latency=llm_latency,
+                                     chat_latency=chat_latency, search_latency=search_latency,
+                                     mysql_latency=mysql_latency)
+        try:
+            tracemalloc.start()
+            result = ingest.run_ingest([corpus_dir], index_name=index_name,
+                                       manifest=IngestManifest(os.path.join(tmp_dir, "manifest.json")),
+                                       llm_workers=llm_workers, llm_threshold=llm_threshold)
+            peak = tracemalloc.get_traced_memory()[1] / (1 << 20)
+            tracemalloc.stop()
+
+            wall = result["wall_s"]
+            for stage in result["stages"]:
+                report.append({
+                    "phase": f"ingest: {stage['stage']}",
+                    "items": stage["items_out"],
+                    "per_second": stage["items_out"] / wall if wall else 0.0,
+                    "p50_ms": "-",
+                    "p99_ms": "-",
+                    "peak_mib": "-",
+                })
+            report.append({
+                "phase": "ingest: total",
+                "items": result["sources"],
+                "per_second": result["sources"] / wall if wall else 0.0,
+                "p50_ms": "-",
+                "p99_ms": "-",
+                "peak_mib": peak,
+            })
+
+            es = Elastic()
+            for phase, func in (("query: search + context", lambda q: es.search_and_build_context(index_name, q)),
+                                ("query: rag_pipeline", lambda q: rag_with_deepseek.rag_pipeline(q, index_name))):
+                latencies = []
+                start = time.perf_counter()
+                for question in questions:
+                    begin = time.perf_counter()
+                    func(question)
+                    latencies.append((time.perf_counter() - begin) * 1000)
+                elapsed = time.perf_counter() - start
+                report.append({
+                    "phase": phase,
+                    "items": len(questions),
+                    "per_second": len(questions) / elapsed if elapsed else 0.0,
+                    "p50_ms": percentile(latencies, 50),
+                    "p99_ms": percentile(latencies, 99),
+                    "peak_mib": "-",
+                })
+        finally:
+            backends.close()
+    return report
+
+def _legacy_save(connection, doc_id: str, file_name: str, sheet_name: str, json_content: str):
+    """
+    旧版逐条写入方式（先 SELECT 查重，再 INSERT 并立即提交），仅用于对比吞吐量。
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT id FROM llm_outputs WHERE file_name = %s AND sheet_name = %s LIMIT 1", (file_name, sheet_name))
+        if cursor.fetchone() is not None:
+            return
+        cursor.execute("INSERT INTO llm_outputs (doc_id, file_name, sheet_name, json_content) VALUES (%s, %s, %s, %s)",
+                       (doc_id, file_name, sheet_name, json_content))
+        connection.commit()
+    finally:
+        cursor.close()
+
+def bench_mysql_writer(sheets: int = 10000, latency: float = 0.0005, batch_sizes: List[int] = None,
+                       pool_size: int = 2) -> List[Dict[str, Any]]:
+    """
+    在本地 MySQL 替身（SQLite，每条语句和提交模拟 latency 秒往返）上对比逐条查重写入与连接池 + executemany 批量 upsert
+    写入 sheets 条记录的吞吐量，并校验批量写入后重复写入同一批记录不会产生重复行。
+    :param sheets: 写入的记录数
+    :param latency: 每次往返的模拟延迟（秒）
+    :param batch_sizes: 需要测试的批大小列表
+    :param pool_size: 连接池大小
+    :return: [{"mode": ..., "batch_size": n, "rows": n, "elapsed_s": t, "rows_per_second": x, "table_rows": n}, ...]
+    """
+    json_content = json.dumps({"tables": [{"rows": [{"料号": f"R{i:05d}", "封装": "0402", "阻值": "10k"}
+                                                    for i in range(20)]}]}, ensure_ascii=False, indent=2)
+    rows = [(str(i // 10), f"文件{i // 10}.xlsx", f"Sheet{i % 10}", json_content) for i in range(sheets)]
+
+    def count_rows(path):
+        connection = FakeMySQLConnection(path)
+        cursor = connection.cursor()
+        cursor.execute("SELECT COUNT(*) FROM llm_outputs")
+        count = cursor.fetchone()[0]
+        connection.close()
+        return count
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "legacy.sqlite")
+        connection = FakeMySQLConnection(path, latency=latency)
+        start = time.perf_counter()
+        for row in rows:
+            _legacy_save(connection, *row)
+        elapsed = time.perf_counter() - start
+        connection.close()
+        report.append({"mode": "select + insert per row", "batch_size": 1, "rows": sheets, "elapsed_s": elapsed,
+                       "rows_per_second": sheets / elapsed if elapsed else 0.0, "table_rows": count_rows(path)})
+
+        for batch_size in batch_sizes or [100, 500, 1000]:
+            path = os.path.join(tmp_dir, f"batched_{batch_size}.sqlite")
+            save_to_mysql.configure_mysql(lambda database: FakeMySQLConnection(path, latency=latency))
+            pool = save_to_mysql.ConnectionPool(size=pool_size)
+            try:
+                writer = save_to_mysql.BatchWriter(pool, batch_size=batch_size)
+                start = time.perf_counter()
+                for row in rows:
+                    writer.add(*row)
+                writer.flush()
+                elapsed = time.perf_counter() - start
+                # 再写一遍同一批记录：upsert 应覆盖而不是新增
+                for row in rows:
+                    writer.add(*row)
+                writer.flush()
+            finally:
+                pool.close()
+                save_to_mysql.configure_mysql(None)
+            report.append({"mode": "pooled executemany upsert", "batch_size": batch_size, "rows": sheets,
+                           "elapsed_s": elapsed, "rows_per_second": sheets / elapsed if elapsed else 0.0,
+                           "table_rows": count_rows(path)})
+    return report
+
+def bench_content_storage(json_dir: str, repeat: int = 3) -> List[Dict[str, Any]]:
+    """
+    对比 llm_outputs 两种存储方式：旧版缩进格式的 json_content 文本，与写入时规范化并压缩的 json_blob。
+    统计存储（即从 MySQL 传输）的字节数，以及 bulk_index_data 构造全部索引请求的 CPU 耗时，并校验索引内容一致。
+    :param json_dir: JSON 文件目录
+    :param repeat: 重复次数（取最短耗时）
+    :return: [{"storage": ..., "rows": n, "stored_bytes": n, "ratio": x, "build_requests_s": t, "identical": bool}, ...]
+    """
+    legacy_rows = []
+    stored_rows = []
+    for path in sorted(glob.glob(os.path.join(json_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            json_str = f.read()
+        row = {"chunk_id": os.path.basename(path), "doc_id": "0", "file_name": os.path.basename(path), "sheet_name": "0"}
+        legacy_rows.append(dict(row, json_content=json_str))
+        encoded = content_codec.encode_content(json_str)
+        stored_rows.append(dict(row, json_content=None if encoded["valid"] else encoded["text"],
+                                json_blob=encoded["blob"], codec=encoded["codec"], meta=encoded["meta"]))
+
+    def build(rows):
+        return [Elastic.build_index_request("e_rag", row) for row in rows]
+
+    legacy_requests = build(legacy_rows)
+    stored_requests = build(stored_rows)
+    identical = all(
+        content_codec.loads(a["_source"]["json_content"]) == content_codec.loads(b["_source"]["json_content"])
+        if a["_source"]["json_content"] != b["_source"]["json_content"] else True
+        for a, b in zip(legacy_requests, stored_requests)
+    )
+    legacy_bytes = sum(len(row["json_content"].encode("utf-8")) for row in legacy_rows)
+    stored_bytes = sum(len(row["json_blob"] or b"") + len((row["json_content"] or "").encode("utf-8")) +
+                       len(row["meta"].encode("utf-8")) for row in stored_rows)
+    legacy_time = timed(lambda: build(legacy_rows), repeat)
+    stored_time = timed(lambda: build(stored_rows), repeat)
+    return [
+        {"storage": "pretty json_content", "rows": len(legacy_rows), "stored_bytes": legacy_bytes, "ratio": 1.0,
+         "build_requests_s": legacy_time, "identical": True},
+        {"storage": f"canonical {content_codec.DEFAULT_CODEC} json_blob", "rows": len(stored_rows),
+         "stored_bytes": stored_bytes, "ratio": stored_bytes / legacy_bytes if legacy_bytes else 0.0,
+         "build_requests_s": stored_time, "identical": identical},
+    ]
+
+def _legacy_sync(es: Elastic, name: str, database: str = "e_rag", batch_size: int = 64):
+    """
+    旧版同步方式（缓冲游标一次读取全部结果，每 64 条构造一批并串行调用 bulk，不调整刷新设置），仅用于对比吞吐量。
+    """
+    conn = save_to_mysql.connect_to_mysql(database)
+    cursor = conn.cursor(dictionary=True)
+    cursor.execute("SELECT id, doc_id, chunk_id, file_name, sheet_name, json_content, json_blob, codec FROM llm_outputs")
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        save_to_es.bulk(es.client, [Elastic.build_index_request(name, row) for row in rows])
+    cursor.close()
+    conn.close()
+
+def bench_es_sync(sheets: int = 5000, latency: float = 0.02, per_mb: float = 0.5, workers_list: List[int] = None,
+                  max_batch_bytes: int = 1024 * 1024) -> List[Dict[str, Any]]:
+    """
+    在 MySQL 替身（SQLite）与 ES 替身（每个 bulk 请求模拟 latency 秒往返，外加每 MB 内容 per_mb 秒的服务端索引耗时）
+    上对比旧版串行同步与新版同步
+    （主键分页读取、按字节切分批次、多线程并发 bulk、导入期间关闭刷新）将 sheets 条大小不一的记录同步到 ES 的吞吐量，
+    并校验索引中的文档数以及导入结束后刷新设置已恢复。
+    :param sheets: 记录数
+    :param latency: 每个 bulk 请求的模拟延迟（秒）
+    :param per_mb: 每 MB 文档内容的模拟索引耗时（秒）
+    :param workers_list: 需要测试的并发数列表
+    :param max_batch_bytes: 每批的最大字节数
+    :return: [{"mode": ..., "workers": n, "docs": n, "requests": n, "elapsed_s": t, "docs_per_second": x,
+               "indexed_docs": n, "refresh_restored": bool}, ...]
+    """
+    rows = []
+    for i in range(sheets):
+        # 表格行数在 5 到 200 之间变化，使记录大小相差约 40 倍
+        table_rows = 5 + (i * 37) % 196
+        content = json.dumps({"tables": [{"rows": [{"料号": f"R{i:05d}-{j}", "封装": "0402", "阻值": f"{j}k"}
+                                                   for j in range(table_rows)]}]}, ensure_ascii=False)
+        rows.append((save_to_mysql.make_doc_id(f"文件{i // 10}.xlsx"), f"文件{i // 10}.xlsx", f"Sheet{i % 10}", content))
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "e_rag.sqlite")
+        connection = FakeMySQLConnection(path)
+        for start in range(0, len(rows), 500):
+            save_to_mysql.write_rows(connection, rows[start:start + 500])
+        connection.close()
+        save_to_mysql.configure_mysql(lambda database: FakeMySQLConnection(path))
+
+        modes = [("serial fetchmany(64) + bulk", 1)]
+        modes += [("keyset + byte batches + parallel bulk", workers) for workers in workers_list or [1, 4, 8]]
+        try:
+            for mode, workers in modes:
+                client = FakeElasticsearch(latency=latency, bulk_per_mb=per_mb)
+                save_to_es.configure_elastic(lambda hosts: client)
+                es = Elastic()
+                es.create_label_index("e_rag")
+                client.indices.put_settings(index="e_rag", body={"index": {"refresh_interval": "1s"}})
+                start = time.perf_counter()
+                if mode.startswith("serial"):
+                    _legacy_sync(es, "e_rag")
+                else:
+                    es.bulk_index_data("e_rag", max_batch_bytes=max_batch_bytes, workers=workers)
+                elapsed = time.perf_counter() - start
+                requests = client.requests
+                settings = client.indices.get_settings(index="e_rag")["e_rag"]["settings"]["index"]
+                report.append({"mode": mode, "workers": workers, "docs": sheets, "requests": requests,
+                               "elapsed_s": elapsed, "docs_per_second": sheets / elapsed if elapsed else 0.0,
+                               "indexed_docs": client.count(index="e_rag")["count"],
+                               "refresh_restored": settings.get("refresh_interval") == "1s"})
+        finally:
+            save_to_es.configure_elastic(None)
+            save_to_mysql.configure_mysql(None)
+    return report
+
+def bench_es_reindex(sheets: int = 3000, changed: int = 30, latency: float = 0.002, per_mb: float = 0.5,
+                     workers: int = 4) -> List[Dict[str, Any]]:
+    """
+    在替身后端上对比三种同步方式：旧版清空后全量重新导入、全量重建到新版本索引后切换别名、按水位线增量同步
+    （修改 changed 条并删除 changed 条记录后）。同步期间另一个线程持续查询，统计查询到的文档数不完整的次数。
+    :param sheets: 记录数
+    :param changed: 增量同步前修改和删除的记录数
+    :param latency: ES 替身每个请求的模拟延迟（秒）
+    :param per_mb: ES 替身 bulk 请求每 MB 内容的模拟索引耗时（秒）
+    :param workers: 并发 bulk 请求数
+    :return: [{"mode": ..., "elapsed_s": t, "indexed": n, "deleted": n, "queries": n, "incomplete_queries": n}, ...]
+    """
+    def make_rows(indices, tag):
+        return [(save_to_mysql.make_doc_id(f"文件{i // 10}.xlsx"), f"文件{i // 10}.xlsx", f"Sheet{i % 10}",
+                 json.dumps({"tables": [{"rows": [{"料号": f"{tag}{i:05d}-{j}", "描述": "贴片电阻"} for j in range(30)]}]},
+                            ensure_ascii=False)) for i in indices]
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "e_rag.sqlite")
+        connection = FakeMySQLConnection(path)
+        save_to_mysql.write_rows(connection, make_rows(range(sheets), "R"))
+        save_to_mysql.configure_mysql(lambda database: FakeMySQLConnection(path))
+        client = FakeElasticsearch(latency=latency, bulk_per_mb=per_mb)
+        save_to_es.configure_elastic(lambda hosts: client)
+        es = Elastic()
+
+        def measure(mode, sync, expected):
+            counts = []
+            stop = threading.Event()
+
+            def query():
+                while not stop.is_set():
+                    counts.append(es.client.count(index="e_rag")["count"])
+
+            thread = threading.Thread(target=query)
+            thread.start()
+            start = time.perf_counter()
+            stats = sync()
+            elapsed = time.perf_counter() - start
+            stop.set()
+            thread.join()
+            report.append({"mode": mode, "elapsed_s": elapsed, "indexed": stats["indexed"], "deleted": stats["deleted"],
+                           "queries": len(counts), "incomplete_queries": sum(1 for count in counts if count < expected)})
+
+        try:
+            es.create_label_index("e_rag")
+            es.bulk_index_data("e_rag", workers=workers)
+
+            def clear_and_reload():
+                es.clear_documents("e_rag")
+                return es.bulk_index_data("e_rag", workers=workers)
+
+            measure("clear_documents + full reload", clear_and_reload, sheets)
+            measure("rebuild new index + swap alias", lambda: es.rebuild_index("e_rag", workers=workers), sheets)
+
+            save_to_mysql.write_rows(connection, make_rows(range(changed), "C"))
+            save_to_mysql.delete_rows(connection, [(f"文件{i // 10}.xlsx", f"Sheet{i % 10}")
+                                                   for i in range(sheets - changed, sheets)])
+            measure(f"incremental ({changed} changed, {changed} deleted)",
+                    lambda: es.sync_incremental("e_rag", workers=workers), sheets - changed)
+        finally:
+            connection.close()
+            save_to_es.configure_elastic(None)
+            save_to_mysql.configure_mysql(None)
+    return report
+
+def bench_row_index(json_dir: str, queries: int = 100, rows_per_doc: int = 1, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    对比 sheet 粒度与行粒度索引在料号类问题上的检索效果：将 json_dir 下的校对结果分别写入两种索引（替身 ES），
+    从表格中抽取料号、型号、编码类单元格的值，以“哪些项目使用 X？”提问，统计 search_and_build_context 拼接的
+    上下文长度（字符与估算 token 数）、上下文中包含该值的比例和每次检索耗时。
+    :param json_dir: JSON 文件目录
+    :param queries: 问题数
+    :param rows_per_doc: 行粒度索引每个文档的行数
+    :param seed: 抽样随机种子
+    :return: [{"granularity": ..., "documents": n, "queries": n, "avg_context_chars": x, "avg_context_tokens": x,
+               "hit_rate": x, "avg_search_ms": x}, ...]
+    """
+    import random
+    from table_format import iter_row_groups
+
+    rows = []
+    values = []
+    for path in sorted(glob.glob(os.path.join(json_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            json_str = f.read()
+        try:
+            document = content_codec.loads(json_str)
+        except ValueError:
+            continue
+        name = os.path.basename(path)
+        rows.append({"chunk_id": name, "doc_id": "0", "file_name": document.get("file_name", name),
+                     "sheet_name": name, "json_content": content_codec.dumps(document)})
+        for group in iter_row_groups(document):
+            for item in group.get("rows", []):
+                values += [str(value) for key, value in item.items()
+                           if any(word in str(key) for word in ("料号", "型号", "编码", "编号")) and len(str(value)) >= 6]
+    values = sorted(set(values))
+    random.Random(seed).shuffle(values)
+    values = values[:queries]
+
+    report = []
+    client = FakeElasticsearch(latency=0.0)
+    save_to_es.configure_elastic(lambda hosts: client)
+    try:
+        es = Elastic()
+        for granularity in (save_to_es.GRANULARITY_SHEET, save_to_es.GRANULARITY_ROWS):
+            name = f"bench_{granularity}"
+            es.create_label_index(name, granularity=granularity, rows_per_doc=rows_per_doc)
+            requests = [request for row in rows for request in es.build_requests(name, row)]
+            save_to_es.bulk(client, requests)
+            chars, tokens, hits, elapsed = 0, 0, 0, 0.0
+            for value in values:
+                start = time.perf_counter()
+                context, _ = es.search_and_build_context(name, f"哪些项目使用 {value}？")
+                elapsed += time.perf_counter() - start
+                chars += len(context)
+                tokens += chunking.count_tokens(context)
+                hits += value in context
+            count = len(values) or 1
+            report.append({"granularity": granularity, "documents": len(requests), "queries": len(values),
+                           "avg_context_chars": chars / count, "avg_context_tokens": tokens / count,
+                           "hit_rate": hits / count, "avg_search_ms": elapsed / count * 1000})
+    finally:
+        save_to_es.configure_elastic(None)
+    return report
+
+def bench_spec_query(json_dir: str, repeat: int = 5) -> List[Dict[str, Any]]:
+    """
+    对比规格类问题（如“功率大于0.5W的1206电阻”）在行粒度索引上的两种检索方式：全文检索（search_rows）与
+    按结构化规格字段过滤（search_specs）。以 spec_fields.extract_specs 在原始行上逐行判断的结果为准，
+    统计召回率、精确率、上下文长度与检索耗时。
+    :param json_dir: JSON 文件目录
+    :param repeat: 每个问题重复检索的次数（取最短耗时）
+    :return: [{"question": ..., "method": ..., "expected": n, "returned": n, "recall": x, "precision": x,
+               "context_chars": n, "search_ms": x}, ...]
+    """
+    import spec_fields
+
+    questions = ["功率大于0.5W的1206电阻", "阻值在1k到10k之间的0603电阻", "耐压50V以上的电容", "100nF 电容有哪些",
+                 "频率不低于 16MHz 的晶振"]
+    rows = []
+    for path in sorted(glob.glob(os.path.join(json_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            json_str = f.read()
+        try:
+            document = content_codec.loads(json_str)
+        except ValueError:
+            continue
+        name = os.path.basename(path)
+        rows.append({"chunk_id": name, "doc_id": "0", "file_name": document.get("file_name", name),
+                     "sheet_name": name, "json_content": content_codec.dumps(document)})
+
+    def matches(source, constraints):
+        specs = source.get("spec", {})
+        for item in constraints["ranges"]:
+            value = specs.get(item["field"])
+            if value is None or any(not {"gt": value > bound, "gte": value >= bound, "lt": value < bound,
+                                         "lte": value <= bound}[op] for op, bound in item.items() if op != "field"):
+                return False
+        if constraints["package"] and specs.get(spec_fields.PACKAGE_FIELD) not in constraints["package"]:
+            return False
+        names = source["sheet_name"] + source["table_name"]
+        return not constraints["categories"] or any(word in names for word in constraints["categories"])
+
+    report = []
+    client = FakeElasticsearch(latency=0.0)
+    save_to_es.configure_elastic(lambda hosts: client)
+    try:
+        es = Elastic()
+        es.create_label_index("bench_specs", granularity=save_to_es.GRANULARITY_ROWS)
+        requests = [request for row in rows for request in es.build_requests("bench_specs", row)]
+        save_to_es.bulk(client, requests)
+        for question in questions:
+            constraints = spec_fields.parse_constraints(question)
+            expected = {request["_id"] for request in requests if matches(request["_source"], constraints)}
+            for method, search in (("full text", lambda: es.search_rows("bench_specs", question)),
+                                   ("spec filter", lambda: es.search_specs("bench_specs", question, size=1000))):
+                hits = search()
+                elapsed = timed(search, repeat)
+                returned = {f"{hit['parent_id']}-{hit['position']}" for hit in hits}
+                context, _ = es.build_row_context(hits)
+                report.append({"question": question, "method": method, "expected": len(expected),
+                               "returned": len(returned),
+                               "recall": len(returned & expected) / len(expected) if expected else 1.0,
+                               "precision": len(returned & expected) / len(returned) if returned else 1.0,
+                               "context_chars": len(context), "search_ms": elapsed * 1000})
+    finally:
+        save_to_es.configure_elastic(None)
+    return report
+
+def bench_part_lookup(json_dir: str, queries: int = 100, chat_latency: float = 0.5, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    对比料号查询在行粒度索引上的三种方式：全文检索（ik 式分词的 json_content，search_rows）、料号字段精确/前缀查找
+    （lookup_parts），以及 rag_pipeline 的查表直答与经过 DeepSeek（替身）的完整 RAG。
+    从标识类列中抽取料号，按原样、小写、去掉连接符、全角、前 70% 前缀五种写法提问，统计前 5 条结果中含该料号的比例
+    和每次查询耗时。
+    :param json_dir: JSON 文件目录
+    :param queries: 抽取的料号数
+    :param chat_latency: DeepSeek 替身每次生成的固定延迟（秒）
+    :param seed: 抽样随机种子
+    :return: [{"method": ..., "variant": ..., "queries": n, "hit_at_5": x, "avg_ms": x, "llm_calls": n}, ...]
+    """
+    import random
+    import unicodedata
+    from fake_backends import FakeArk
+    from part_numbers import IDENTIFIER_HEADERS, find_part_numbers, normalize_part_number
+    from table_format import iter_row_groups
+
+    rows = []
+    values = set()
+    for path in sorted(glob.glob(os.path.join(json_dir, "*.json"))):
+        with open(path, "r", encoding="utf-8") as f:
+            json_str = f.read()
+        try:
+            document = content_codec.loads(json_str)
+        except ValueError:
+            continue
+        name = os.path.basename(path)
+        rows.append({"chunk_id": name, "doc_id": "0", "file_name": name, "sheet_name": name,
+                     "json_content": content_codec.dumps(document)})
+        for group in iter_row_groups(document):
+            for item in group.get("rows", []):
+                for key, value in item.items():
+                    value = str(value).strip()
+                    if (any(word in str(key) for word in IDENTIFIER_HEADERS) and "-" in value and
+                            find_part_numbers(value) == [normalize_part_number(value)]):
+                        values.add(value)
+    values = sorted(values)
+    random.Random(seed).shuffle(values)
+    values = values[:queries]
+    variants = {
+        "as written": lambda value: value,
+        "lower case": lambda value: value.lower(),
+        "no dashes": lambda value: value.replace("-", ""),
+        "full width": lambda value: "".join(chr(ord(char) + 0xFEE0) if "!" <= char <= "~" else char for char in value),
+        "prefix 70%": lambda value: value[:max(4, int(len(value) * 0.7))],
+    }
+
+    def found(hits, value):
+        target = normalize_part_number(value)
+        return any(target in normalize_part_number(unicodedata.normalize("NFKC", hit["json_content"])) for hit in hits[:5])
+
+    report = []
+    client = FakeElasticsearch(latency=0.0)
+    ark = FakeArk(latency=chat_latency)
+    save_to_es.configure_elastic(lambda hosts: client)
+    rag_with_deepseek.configure_client(ark)
+    try:
+        es = Elastic()
+        es.create_label_index("e_rag", granularity=save_to_es.GRANULARITY_ROWS)
+        save_to_es.bulk(client, [request for row in rows for request in es.build_requests("e_rag", row)])
+        for variant, rewrite in variants.items():
+            questions = [(value, f"哪些项目使用 {rewrite(value)}？") for value in values]
+            for method, search in (("full text", lambda question: es.search_rows("e_rag", question)),
+                                   ("part number fields", lambda question: es.lookup_parts(
+                                       "e_rag", find_part_numbers(question)))):
+                hits, elapsed = 0, 0.0
+                for value, question in questions:
+                    start = time.perf_counter()
+                    result = search(question)
+                    elapsed += time.perf_counter() - start
+                    hits += found(result, value)
+                count = len(questions) or 1
+                report.append({"method": method, "variant": variant, "queries": len(questions),
+                               "hit_at_5": hits / count, "avg_ms": elapsed / count * 1000, "llm_calls": 0})
+
+        sample = [f"哪些项目使用 {value}？" for value in values[:10]]
+        for method, run in (("rag_pipeline lookup route", rag_with_deepseek.rag_pipeline),
+                            ("rag_pipeline via deepseek", lambda question: rag_with_deepseek.generate_with_deepseek(
+                                question, es.search_and_build_context("e_rag", question)[0]))):
+            calls = ark.calls
+            elapsed = timed(lambda: [run(question) for question in sample])
+            report.append({"method": method, "variant": "as written", "queries": len(sample), "hit_at_5": "-",
+                           "avg_ms": elapsed / (len(sample) or 1) * 1000, "llm_calls": ark.calls - calls})
+    finally:
+        save_to_es.configure_elastic(None)
+        rag_with_deepseek.configure_client(None)
+    return report
+
+def bench_hybrid_search(json_dir: str, sheets: int = 2000, latency: float = 0.02, per_mb: float = 0.5,
+                        workers: int = 4) -> List[Dict[str, Any]]:
+    """
+    评估 BM25 + kNN 混合检索：
+    1. 导入吞吐量：在替身后端上将 sheets 条记录同步到不带向量的索引、带向量的索引（向量缓存为空），以及重建到带向量的
+       新索引（向量缓存已命中），对比耗时；
+    2. 召回效果：在 json_dir 的 sheet 文档上，用与 sheet 名用词不同的问题（如“抹布烘干用的 PTC 有哪些注意事项”）
+       对比 BM25、kNN 与两者 RRF 融合的前 5 条命中率。
+    向量化器为 HashingEmbedder（不依赖模型文件）；安装 sentence-transformers 后可将 EMBEDDING_MODEL 设为模型名称对比。
+    :param json_dir: JSON 文件目录
+    :param sheets: 吞吐量测试的记录数
+    :param latency: ES 替身每个 bulk 请求的模拟延迟（秒）
+    :param per_mb: ES 替身 bulk 请求每 MB 内容的模拟索引耗时（秒）
+    :param workers: 并发 bulk 请求数
+    :return: [{"case": ..., "docs"/"queries": n, "elapsed_s"/"hit_at_5": x, ...}, ...]
+    """
+    from embeddings import HashingEmbedder, configure_embedder, rrf_fuse
+
+    rows = []
+    for i in range(sheets):
+        table_rows = 5 + (i * 37) % 196
+        content = json.dumps({"tables": [{"rows": [{"料号": f"R{i:05d}-{j}", "封装": "0402", "阻值": f"{j}k"}
+                                                   for j in range(table_rows)]}]}, ensure_ascii=False)
+        rows.append((save_to_mysql.make_doc_id(f"文件{i // 10}.xlsx"), f"文件{i // 10}.xlsx", f"Sheet{i % 10}", content))
+
+    questions = [
+        ("抹布烘干用的 PTC 有哪些注意事项", "PTC-抹布烘干"),
+        ("尘袋烘干的 PTC 进展如何", "PTC-尘袋烘干"),
+        ("机械臂验证到哪一步了", "R2521机械臂"),
+        ("基站里的 wifi 模组选型情况", "基站wifi模块"),
+        ("数字麦克风的验证情况", "数字硅麦"),
+        ("风机自研的进展", "自研风机"),
+        ("双光谱浊度传感器的问题", "迈博双光谱浊度"),
+        ("越南项目的电池包开发到什么阶段", "电池包开发进度-越南项目"),
+        ("摄像头一供二供怎么对照", "摄像头归一化一二供对照"),
+        ("扫地机怎么重新烧号", "扫地机重新烧号软件使用说明"),
+        ("沿边线激光模块的进度", "沿边侧线激光模块"),
+        ("充电芯片验证结论", "Charger芯片"),
+    ]
+
+    report = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "e_rag.sqlite")
+        connection = FakeMySQLConnection(path)
+        for start in range(0, len(rows), 500):
+            save_to_mysql.write_rows(connection, rows[start:start + 500])
+        connection.close()
+        save_to_mysql.configure_mysql(lambda database: FakeMySQLConnection(path))
+        embedder = configure_embedder(HashingEmbedder(), cache_path=os.path.join(tmp_dir, "embeddings.sqlite"))
+        try:
+            client = FakeElasticsearch(latency=latency, bulk_per_mb=per_mb)
+            save_to_es.configure_elastic(lambda hosts: client)
+            baseline = None
+            for case, dense_vectors in (("bm25 only", False), ("dense vectors, cold cache", True),
+                                        ("dense vectors, warm cache", True)):
+                es = Elastic()
+                name = f"bench_{len(report)}"
+                es.create_label_index(name, dense_vectors=dense_vectors)
+                embedder.cache.hits = embedder.cache.misses = 0
+                start = time.perf_counter()
+                es.bulk_index_data(name, workers=workers)
+                elapsed = time.perf_counter() - start
+                baseline = baseline or elapsed
+                report.append({"case": case, "docs": sheets, "elapsed_s": elapsed, "docs_per_second": sheets / elapsed,
+                               "vs_bm25": elapsed / baseline, "cache_hit_rate": embedder.cache.stats()["hit_rate"]
+                               if dense_vectors else "-", "hit_at_5": "-"})
+
+            client = FakeElasticsearch(latency=0.0)
+            save_to_es.configure_elastic(lambda hosts: client)
+            es = Elastic()
+            es.create_label_index("e_rag", dense_vectors=True)
+            documents = []
+            for json_path in sorted(glob.glob(os.path.join(json_dir, "*.json"))):
+                with open(json_path, "r", encoding="utf-8") as f:
+                    json_str = f.read()
+                name = os.path.splitext(os.path.basename(json_path))[0]
+                documents.append({"chunk_id": name, "doc_id": "0", "file_name": name.split("_")[0],
+                                  "sheet_name": name.split("_", 1)[-1], "json_content": json_str})
+            save_to_es.bulk(client, es.with_embeddings("e_rag", [request for row in documents
+                                                                 for request in es.build_requests("e_rag", row)]))
+            fields = ["file_name", "sheet_name", "json_content"]
+
+            def bm25(question):
+                body = {"_source": fields, "size": 10, "query": {"match": {"json_content": question}}}
+                return client.search(index="e_rag", body=body)["hits"]["hits"]
+
+            def knn(question):
+                return es.search_knn("e_rag", question, fields)
+
+            for case, search in (("bm25", bm25), ("knn", knn),
+                                 ("bm25 + knn (rrf)", lambda question: rrf_fuse([bm25(question), knn(question)]))):
+                hits, elapsed = 0, 0.0
+                for question, target in questions:
+                    start = time.perf_counter()
+                    result = search(question)
+                    elapsed += time.perf_counter() - start
+                    hits += any(target in f"{hit['_source']['file_name']}_{hit['_source']['sheet_name']}"
+                                for hit in result[:5])
+                report.append({"case": f"retrieval: {case}", "docs": len(questions), "elapsed_s": elapsed,
+                               "docs_per_second": "-", "vs_bm25": "-", "cache_hit_rate": "-",
+                               "hit_at_5": hits / len(questions)})
+        finally:
+            configure_embedder(None)
+            save_to_es.configure_elastic(None)
+            save_to_mysql.configure_mysql(None)
+    return report
+
+def bench_local_vectors(rows: int = 1000000, dims: int = 256, clusters: int = 2000, queries: int = 200, k: int = 10,
+                        append_batch: int = 1000, nprobe_list: List[int] = None, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    本地向量索引（vector_index.LocalVectorIndex）的基准测试：以 append_batch 条一批追加 rows 条聚簇分布的合成单位向量
+    （模拟导入时逐批写入），统计每批追加耗时；之后分别在追加得到的索引与按全部数据重新训练后的索引上，用不同的 nprobe
+    查询，统计单次查询耗时和相对 float32 暴力检索的 recall@k，并给出 int8 暴力扫描与重新打开索引（内存映射）的耗时。
+    :param rows: 向量条数
+    :param dims: 向量维数
+    :param clusters: 合成数据的簇数
+    :param queries: 查询数
+    :param k: 每次查询返回的条数
+    :param append_batch: 每批追加的条数
+    :param nprobe_list: 需要测试的 nprobe 列表
+    :param seed: 随机种子
+    :return: [{"case": ..., "nprobe": n, "queries": n, "recall_at_k": x, "p50_ms": x, "p99_ms": x}, ...]
+    """
+    import numpy as np
+    from vector_index import LocalVectorIndex
+
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dims)).astype(np.float32)
+
+    def make_vectors(count):
+        vectors = centers[rng.integers(0, clusters, count)] + rng.standard_normal((count, dims)) * 0.6
+        return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+    query_vectors = make_vectors(queries)
+    truth_scores = np.full((queries, k), -np.inf, dtype=np.float32)
+    truth_ids = np.zeros((queries, k), dtype=np.int64)
+    report = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = LocalVectorIndex(os.path.join(tmp_dir, "vectors"), dims)
+        append_ms = []
+        for start in range(0, rows, append_batch):
+            vectors = make_vectors(min(append_batch, rows - start))
+            entries = [{"key": str(start + i), "file_name": f"文件{(start + i) // 10000}.xlsx",
+                        "sheet_name": f"Sheet{(start + i) // 1000 % 10}", "row": (start + i) % 1000}
+                       for i in range(len(vectors))]
+            begin = time.perf_counter()
+            index.add(vectors, entries)
+            append_ms.append((time.perf_counter() - begin) * 1000)
+            # float32 暴力检索的真实近邻，逐批合并（不在内存中保留全部 float32 向量）
+            scores = np.concatenate([truth_scores, query_vectors @ vectors.T], axis=1)
+            ids = np.concatenate([truth_ids, np.broadcast_to(np.arange(start, start + len(vectors)),
+                                                             (queries, len(vectors)))], axis=1)
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            truth_scores = np.take_along_axis(scores, top, axis=1)
+            truth_ids = np.take_along_axis(ids, top, axis=1)
+        report.append({"case": f"append {append_batch} vectors", "nprobe": "-", "queries": len(append_ms),
+                       "recall_at_k": "-", "p50_ms": percentile(append_ms, 50), "p99_ms": percentile(append_ms, 99)})
+        truth = [set(row) for row in truth_ids.tolist()]
+
+        def measure(case, search, nprobe="-"):
+            elapsed, found = [], 0
+            for i, query in enumerate(query_vectors):
+                begin = time.perf_counter()
+                result = search(query)
+                elapsed.append((time.perf_counter() - begin) * 1000)
+                found += len(truth[i] & set(result))
+            report.append({"case": case, "nprobe": nprobe, "queries": queries, "recall_at_k": found / (queries * k),
+                           "p50_ms": percentile(elapsed, 50), "p99_ms": percentile(elapsed, 99)})
+
+        def brute_force(query):
+            arrays = index._load()
+            scores = (arrays["vectors"] @ query) * arrays["scales"]
+            return np.argpartition(-scores, k - 1)[:k].tolist()
+
+        for case in (f"ivf after appends (nlist={index.meta['nlist']})", "ivf retrained"):
+            if case == "ivf retrained":
+                begin = time.perf_counter()
+                index.train()
+                report.append({"case": f"train nlist={index.meta['nlist']}", "nprobe": "-", "queries": 1,
+                               "recall_at_k": "-", "p50_ms": (time.perf_counter() - begin) * 1000, "p99_ms": "-"})
+                case = f"ivf retrained (nlist={index.meta['nlist']})"
+            for nprobe in nprobe_list or [4, 8, 16, 32]:
+                measure(case, lambda query: [item["id"] for item in index.search(query, k=k, nprobe=nprobe)], nprobe)
+        measure("int8 brute force", brute_force)
+
+        begin = time.perf_counter()
+        reopened = LocalVectorIndex(index.path, dims)
+        reopened.search(query_vectors[0], k=k)
+        report.append({"case": "open + first query (mmap)", "nprobe": 8, "queries": 1, "recall_at_k": "-",
+                       "p50_ms": (time.perf_counter() - begin) * 1000, "p99_ms": "-"})
+        reopened.close()
+        index.close()
+    return report
+
+def print_report(title: str, report: List[Dict[str, Any]]):
+    """
+    打印基准测试结果表格。
+    :param title: 标题
+    :param report: 结果列表
+    """
+    print(f"\n=== {title} ===")
+    if not report:
+        return
+    columns = list(report[0].keys())
+    print("\t".join(columns))
+    for item in report:
+        print("\t".join(f"{item[c]:.3f}" if isinstance(item[c], float) else str(item[c]) for c in columns))
+
+def main():
+    # 用法：python benchmarks.py [文件路径 ...]
+    base_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+    file_paths = sys.argv[1:] or [
+        os.path.join(base_dir, "数据表格纯文字+复杂图片", "电子元器件规格归一V02-20240628.xlsx"),
+        os.path.join(base_dir, "ppt", "50S新器件部件验证进度-20250224.pptx"),
+    ]
+    cpu_count = os.cpu_count() or 1
+    workers_list = sorted({n for n in (2, 4, 8, 16, cpu_count) if n <= max(cpu_count, 2)})
+
+    for file_path in file_paths:
+        report = bench_parallel_parse(file_path, workers_list)
+        print_report(f"parallel parse: {os.path.basename(file_path)} (cpu={cpu_count})", report)
+
+    for json_dir in ("output", "llm_output"):
+        json_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), json_dir)
+        print_report(f"compact table format: {os.path.basename(json_dir)}", bench_compact_format(json_dir))
+
+    print_report("pptx table extraction: 200 slides x 2 dense tables", bench_pptx_tables())
+
+    print_report("ingest pipeline overlap (simulated stages)", bench_pipeline_overlap())
+
+    json_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
+    print_report("llm correction throughput (fake server, 0.3s latency, 10% 429)", bench_llm_throughput(json_dir))
+    print_report("llm response cache (fake server, 0.3s latency)", bench_llm_cache(json_dir))
+    print_report("llm truncated output recovery (fake server, 30% truncated)", bench_llm_stream(json_dir))
+
+    for file_path in file_paths:
+        print_report(f"lazy iteration: {os.path.basename(file_path)}", bench_lazy_iteration(file_path))
+
+    print_report("mysql writer: 10k sheets (sqlite stand-in, 0.5ms round trip)", bench_mysql_writer())
+    for json_dir in ("output", "llm_output"):
+        json_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), json_dir)
+        print_report(f"json_content storage: {os.path.basename(json_dir)}", bench_content_storage(json_dir))
+    print_report("mysql -> es sync: 5k sheets (fake backends, 20ms + 0.5s/MB per bulk request)", bench_es_sync())
+    print_report("es reindex while serving queries: 3k sheets (fake backends)", bench_es_reindex())
+    json_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "llm_output")
+    print_report("part-number questions: sheet vs row documents (fake es)", bench_row_index(json_dir))
+    json_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), "output")
+    print_report("spec questions: full text vs structured spec filters (fake es)", bench_spec_query(json_dir))
+    print_report("part-number lookup: full text vs part number fields (fake es, fake deepseek 0.5s)",
+                 bench_part_lookup(json_dir))
+    print_report("hybrid bm25 + knn: ingest cost and paraphrase recall (fake es, hashing embedder)",
+                 bench_hybrid_search(json_dir))
+    if vector_index.np is not None:
+        print_report("local vector index: 1M x 256 int8 vectors, ivf vs brute force", bench_local_vectors())
+    else:
+        print("\nlocal vector index: skipped (numpy is not installed)")
+    print_report("end-to-end ingest and query (fake backends)", bench_end_to_end())
+
+if __name__ == "__main__":
+    main()
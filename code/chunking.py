@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+import csv
+import io
+import json
+import os
+import re
+from typing import Dict, Any, List, Iterable, Iterator, Tuple
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # tiktoken 为可选依赖，未安装时使用估算
+    _ENCODING = None
+
+# 中日韩字符（含全角标点），每个字符大致对应一个 token
+_CJK_PATTERN = re.compile(r"[\u2e80-\u9fff\uac00-\ud7af\uf900-\ufaff\uff00-\uffef]")
+
+# chunk 元数据中数字字段的占位值，用于计算基础结构大小的上界
+_METADATA_PLACEHOLDER = 10 ** 9
+
+SIZE_UNITS = ("chars", "tokens")
+
+def count_tokens(text: str) -> int:
+    """
+    统计文本的 token 数。安装了 tiktoken 时精确计算，否则按 CJK 字符 1 token、其他字符 4 字符 1 token 估算。
+    :param text: 文本
+    :return: token 数
+    """
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    return cjk_count + -(-(len(text) - cjk_count) // 4)
+
+def measure(text: str, unit: str = "chars") -> int:
+    """
+    按指定单位计算文本大小。
+    :param text: 文本
+    :param unit: "chars"（字符数）或 "tokens"（模型 token 数）
+    :return: 大小
+    """
+    if unit == "chars":
+        return len(text)
+    if unit == "tokens":
+        return count_tokens(text)
+    raise ValueError(f"Unknown size unit: {unit}. Expected one of {SIZE_UNITS}")
+
+def csv_line(values: Iterable[Any]) -> str:
+    """
+    按 pandas.DataFrame.to_csv 的规则（QUOTE_MINIMAL、os.linesep 换行）序列化一行。
+    :param values: 单元格值
+    :return: CSV 行文本（含换行符）
+    """
+    buffer = io.StringIO()
+    csv.writer(buffer, lineterminator=os.linesep).writerow(["" if v is None else v for v in values])
+    return buffer.getvalue()
+
+def _json_string_body(text: str) -> str:
+    """
+    返回文本作为 JSON 字符串值时的转义结果（不含首尾引号）。
+    JSON 转义逐字符进行，因此拼接后的转义长度等于各部分转义长度之和。
+    """
+    return json.dumps(text, ensure_ascii=False)[1:-1]
+
+def row_size(row: Dict[str, Any], headers: List[str], unit: str = "chars") -> int:
+    """
+    计算一行在 chunk JSON 中的真实序列化大小：rows 数组中的 JSON 对象 + data 中转义后的 CSV 行。
+    :param row: 行字典
+    :param headers: 表头列表
+    :param unit: 大小单位
+    :return: 大小
+    """
+    row_json = json.dumps(row, ensure_ascii=False) + ", "
+    row_csv = _json_string_body(csv_line(row.get(h, "") for h in headers))
+    return measure(row_json, unit) + measure(row_csv, unit)
+
+def base_size(doc_type: str, file_name: str, sheet_name: str, headers: List[str], unit: str = "chars") -> int:
+    """
+    计算不含数据行的 chunk JSON 大小上界（含重复的表头、CSV 表头行和 chunk 元数据）。
+    :return: 大小
+    """
+    base_json = {
+        "doc_type": doc_type,
+        "file_name": file_name,
+        "tables": [{
+            "sheet": sheet_name,
+            "headers": headers,
+            "data": "",
+            "rows": [],
+            "chunk": {
+                "index": _METADATA_PLACEHOLDER,
+                "row_offset": _METADATA_PLACEHOLDER,
+                "row_count": _METADATA_PLACEHOLDER,
+                "last": False,
+            },
+        }]
+    }
+    header_csv = _json_string_body(csv_line(headers))
+    return measure(json.dumps(base_json, ensure_ascii=False), unit) + measure(header_csv, unit)
+
+def iter_row_chunks(rows: Iterable[Dict[str, Any]], headers: List[str], budget: int, base: int,
+                    unit: str = "chars") -> Iterator[Tuple[int, List[Dict[str, Any]]]]:
+    """
+    单遍贪心打包：累加每行的真实序列化大小，超出预算前切分。单行超过预算时单独成块。
+    :param rows: 行字典（可为生成器）
+    :param headers: 表头列表
+    :param budget: 每个 chunk 的大小预算
+    :param base: 每个 chunk 的固定开销（见 base_size）
+    :param unit: 大小单位
+    :return: (起始行偏移, 行列表) 的生成器
+    """
+    chunk_rows = []
+    chunk_size = base
+    offset = 0
+    for row in rows:
+        size = row_size(row, headers, unit)
+        if chunk_rows and chunk_size + size > budget:
+            yield offset, chunk_rows
+            offset += len(chunk_rows)
+            chunk_rows = []
+            chunk_size = base
+        chunk_rows.append(row)
+        chunk_size += size
+    if chunk_rows or offset == 0:
+        yield offset, chunk_rows
+
+def with_last_flag(chunks: Iterator[Tuple[int, List[Dict[str, Any]]]]) -> Iterator[Tuple[int, List[Dict[str, Any]], bool]]:
+    """
+    为 chunk 生成器附加“是否最后一块”标记（只预读一个 chunk）。
+    :param chunks: iter_row_chunks 的输出
+    :return: (起始行偏移, 行列表, 是否最后一块) 的生成器
+    """
+    previous = None
+    for chunk in chunks:
+        if previous is not None:
+            yield previous[0], previous[1], False
+        previous = chunk
+    if previous is not None:
+        yield previous[0], previous[1], True
+
+def merge_chunks(tables: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    按 chunk 元数据中的 row_offset 将同一 sheet 的多个 chunk 还原为一个 table，并校验行是否连续、完整。
+    :param tables: 同一 sheet 的 chunk table 列表（顺序任意）
+    :return: 合并后的 table（不含 chunk 元数据）
+    """
+    if not tables:
+        raise ValueError("No chunks to merge")
+    ordered = sorted(tables, key=lambda t: t.get("chunk", {}).get("row_offset", 0))
+
+    rows = []
+    for table in ordered:
+        chunk = table.get("chunk")
+        if chunk is not None and chunk["row_offset"] != len(rows):
+            raise ValueError(f"Chunk rows are not contiguous at offset {chunk['row_offset']} (expected {len(rows)})")
+        rows.extend(table["rows"])
+    if "chunk" in ordered[-1] and not ordered[-1]["chunk"].get("last", True):
+        raise ValueError("Last chunk is missing")
+
+    headers = ordered[0].get("headers") or (list(rows[0].keys()) if rows else [])
+    merged = {key: value for key, value in ordered[0].items() if key not in ("chunk", "rows", "data")}
+    merged["data"] = csv_line(headers) + "".join(csv_line(row.get(h, "") for h in headers) for row in rows)
+    merged["rows"] = rows
+    return merged
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+import zlib
+from typing import Dict, Any, Iterable, Iterator, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    orjson = None
+
+try:
+    import zstandard
+except ImportError:  # zstandard 为可选依赖，未安装时使用 zlib
+    zstandard = None
+
+CODEC_ZLIB = "zlib"
+CODEC_ZSTD = "zstd"
+
+# 默认压缩方式：安装了 zstandard 时使用 zstd（压缩率与解压速度都更好），否则使用 zlib
+DEFAULT_CODEC = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+
+# 19 位及以上的整数可能超出 64 位：orjson 解析时会变成浮点数、序列化时报错，含有这类数字的内容交给标准库
+_WIDE_INTEGER = re.compile(r"(?<![\d.eE])\d{19,}(?![\d.eE])")
+_WIDE_INTEGER_BYTES = re.compile(_WIDE_INTEGER.pattern.encode("ascii"))
+
+def _has_wide_integer(data: Any) -> bool:
+    if isinstance(data, str):
+        return _WIDE_INTEGER.search(data) is not None
+    if isinstance(data, (bytes, bytearray, memoryview)):
+        return _WIDE_INTEGER_BYTES.search(bytes(data)) is not None
+    return False
+
+def loads(data: Any) -> Any:
+    """
+    解析 JSON 文本或 UTF-8 字节，安装了 orjson 时优先使用 orjson（orjson 不接受的 NaN 等写法、
+    可能超出 64 位的整数再交给标准库，保证数值无损）。
+    :param data: JSON 文本或字节
+    :return: 解析结果
+    """
+    if orjson is not None and not _has_wide_integer(data):
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(data)
+
+def dumps(data: Any) -> str:
+    """
+    序列化为规范 JSON 文本：保持键的顺序（列顺序有意义），不转义中文，不含多余空白。
+    安装了 orjson 时使用 orjson（输出格式相同；超出 64 位的整数等 orjson 不支持的数据使用标准库）。
+    :param data: 待序列化的数据
+    :return: JSON 文本
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data).decode("utf-8")
+        except TypeError:
+            pass
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+def project_metadata(document: Any) -> Dict[str, Any]:
+    """
+    从文档中提取少量元数据（与压缩内容一同存储，无需解压即可筛选和统计）。
+    :param document: 解析后的 JSON 文档
+    :return: {"doc_type": ..., "tables": n, "rows": n}
+    """
+    if not isinstance(document, dict):
+        return {"doc_type": None, "tables": 0, "rows": 0}
+    tables = document.get("tables") if isinstance(document.get("tables"), list) else []
+    rows = 0
+    for table in tables:
+        if isinstance(table, dict):
+            items = table.get("values", table.get("rows"))
+            rows += len(items) if isinstance(items, list) else 0
+    return {"doc_type": document.get("doc_type"), "tables": len(tables), "rows": rows}
+
+def compress(text: str, codec: str = DEFAULT_CODEC) -> bytes:
+    """
+    压缩 UTF-8 文本。
+    :param text: 文本
+    :param codec: "zlib" 或 "zstd"
+    :return: 压缩后的字节
+    """
+    data = text.encode("utf-8")
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstandard is not installed")
+        return zstandard.ZstdCompressor(level=6).compress(data)
+    if codec == CODEC_ZLIB:
+        return zlib.compress(data, 6)
+    raise ValueError(f"Unknown codec: {codec}")
+
+def decompress(blob: bytes, codec: str) -> str:
+    """
+    解压为 UTF-8 文本。
+    :param blob: 压缩后的字节
+    :param codec: "zlib" 或 "zstd"
+    :return: 文本
+    """
+    if codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError("zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(bytes(blob)).decode("utf-8")
+    if codec == CODEC_ZLIB:
+        return zlib.decompress(bytes(blob)).decode("utf-8")
+    raise ValueError(f"Unknown codec: {codec}")
+
+def encode_content(json_str: str, codec: str = DEFAULT_CODEC) -> Dict[str, Any]:
+    """
+    写入时对 JSON 内容只做一次校验和规范化，然后压缩。无法解析的内容原样保留（不压缩），由 valid 标记。
+    :param json_str: JSON 文本
+    :param codec: 压缩方式
+    :return: {"valid": bool, "text": 规范化后的文本（无效时为原文）, "blob": 压缩字节或 None,
+              "codec": 压缩方式或 None, "meta": 元数据 JSON 文本}
+    """
+    try:
+        document = loads(json_str)
+    except (ValueError, TypeError):
+        return {"valid": False, "text": json_str, "blob": None, "codec": None,
+                "meta": dumps({"valid": False, "chars": len(json_str or "")})}
+    text = dumps(document)
+    meta = dict(project_metadata(document), valid=True, chars=len(text))
+    return {"valid": True, "text": text, "blob": compress(text, codec), "codec": codec, "meta": dumps(meta)}
+
+def row_content(row: Dict[str, Any]) -> Optional[str]:
+    """
+    取出一条 llm_outputs 记录的 JSON 文本：有压缩内容时解压（已是规范格式），否则返回 json_content 原文（旧记录或无效内容）。
+    :param row: 记录字典
+    :return: JSON 文本
+    """
+    if row.get("json_blob") is not None and row.get("codec"):
+        return decompress(row["json_blob"], row["codec"])
+    return row.get("json_content")
+
+def iter_decoded(rows: Iterable[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+    """
+    逐条解压从数据库流式读取的记录（写入 json_content，并删除 json_blob），不会一次性解压整个结果集。
+    :param rows: 记录字典的可迭代对象
+    :return: 记录字典生成器
+    """
+    for row in rows:
+        row["json_content"] = row_content(row)
+        row.pop("json_blob", None)
+        yield row
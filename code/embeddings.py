@@ -0,0 +1,264 @@
+# -*- coding: utf-8 -*-
+import array
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import threading
+import zlib
+from collections import Counter
+from typing import Dict, Any, List, Optional
+
+try:
+    from sentence_transformers import SentenceTransformer
+except ImportError:  # sentence-transformers 为可选依赖，未安装时使用 HashingEmbedder
+    SentenceTransformer = None
+
+# 安装了 sentence-transformers 时默认使用的本地中文向量模型（CPU 可用，512 维）
+DEFAULT_MODEL = "BAAI/bge-small-zh-v1.5"
+
+# 每个文档参与向量化的最大字符数（sheet 粒度的文档很长，只取开头；行粒度的文档通常不会截断）
+EMBED_MAX_CHARS = 2000
+
+# 英文/数字词与连续的中文字符
+_TOKEN = re.compile(r"[0-9a-z]+|[一-鿿]+")
+
+class HashingEmbedder:
+    """
+    不依赖模型文件的本地向量化：中文取单字与相邻两字、英文和数字取整词，按特征哈希映射到 dims 维，
+    词频取对数后 L2 归一化。只能召回字面相近的文本（如“抹布烘干的事项”与“PTC-抹布烘干”），
+    不理解同义改写；需要语义召回时安装 sentence-transformers（见 SentenceTransformerEmbedder）。
+    """
+
+    def __init__(self, dims: int = 256):
+        """
+        初始化 HashingEmbedder 类。
+        :param dims: 向量维数
+        """
+        self.dims = dims
+        self.name = f"hashing-{dims}"
+
+    def _features(self, text: str) -> Counter:
+        features = Counter()
+        for token in _TOKEN.findall(text.lower()):
+            if token[0] >= "一":
+                features.update(token)
+                features.update(token[i:i + 2] for i in range(len(token) - 1))
+            else:
+                features[token] += 1
+        return features
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        计算一批文本的向量。
+        :param texts: 文本列表
+        :return: 与 texts 一一对应的单位向量列表
+        """
+        vectors = []
+        for text in texts:
+            vector = [0.0] * self.dims
+            for feature, count in self._features(text).items():
+                hashed = zlib.crc32(feature.encode("utf-8"))
+                vector[hashed % self.dims] += (1.0 + math.log(count)) * (1 if hashed & 0x80000000 else -1)
+            norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+            vectors.append([value / norm for value in vector])
+        return vectors
+
+class SentenceTransformerEmbedder:
+    """
+    使用 sentence-transformers 加载的本地模型（默认 bge-small-zh，CPU 即可运行）计算归一化向量。
+    """
+
+    def __init__(self, model_name: str = DEFAULT_MODEL, batch_size: int = 32, device: str = "cpu"):
+        """
+        初始化 SentenceTransformerEmbedder 类。
+        :param model_name: 模型名称或本地路径
+        :param batch_size: 模型每次前向计算的文本数
+        :param device: 运行设备
+        """
+        if SentenceTransformer is None:
+            raise ValueError("sentence-transformers is not installed")
+        self.model = SentenceTransformer(model_name, device=device)
+        self.batch_size = batch_size
+        self.dims = self.model.get_sentence_embedding_dimension()
+        self.name = f"st:{model_name}"
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        计算一批文本的向量。
+        :param texts: 文本列表
+        :return: 与 texts 一一对应的单位向量列表
+        """
+        return self.model.encode(texts, batch_size=self.batch_size, normalize_embeddings=True).tolist()
+
+class EmbeddingCache:
+    """
+    基于 SQLite 的向量缓存：键为模型名称与文本的哈希，值为 float32 向量。内容未变化的文档重新导入或重建索引时
+    不再重复计算。可在多个线程中共用。
+    """
+
+    def __init__(self, path: str = "embedding_cache.sqlite"):
+        """
+        初始化 EmbeddingCache 类。
+        :param path: SQLite 文件路径
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model: str, text: str) -> str:
+        """
+        计算缓存键：模型名称与文本一起取 SHA-256。
+        """
+        digest = hashlib.sha256()
+        for part in (model, text):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        """
+        批量查询缓存。
+        :param keys: 缓存键列表
+        :return: {缓存键: 向量}，只包含命中的键
+        """
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                part = keys[start:start + 500]
+                sql = f"SELECT key, vector FROM embeddings WHERE key IN ({', '.join('?' * len(part))})"
+                for key, blob in self._conn.execute(sql, part):
+                    found[key] = array.array("f", blob).tolist()
+            self.hits += len(found)
+            self.misses += len(set(keys)) - len(found)
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]):
+        """
+        批量写入缓存。
+        :param items: {缓存键: 向量}
+        """
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                                   [(key, array.array("f", vector).tobytes()) for key, vector in items.items()])
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        返回缓存统计。
+        :return: {"hits", "misses", "hit_rate", "entries"}
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hits / lookups if lookups else 0.0,
+                    "entries": entries}
+
+    def close(self):
+        """
+        关闭数据库连接。
+        """
+        with self._lock:
+            self._conn.close()
+
+class CachedEmbedder:
+    """
+    为任意向量化器加上缓存与分批：先批量查缓存，只对未命中的文本（去重后）按 batch_size 分批计算并写回缓存。
+    """
+
+    def __init__(self, embedder: Any, cache: Optional[EmbeddingCache] = None, batch_size: int = 64):
+        """
+        初始化 CachedEmbedder 类。
+        :param embedder: 向量化器（需有 name、dims 属性与 embed(texts) 方法）
+        :param cache: 向量缓存，为 None 时不缓存
+        :param batch_size: 每次调用 embedder.embed 的最大文本数
+        """
+        self.embedder = embedder
+        self.cache = cache
+        self.batch_size = batch_size
+        self.name = embedder.name
+        self.dims = embedder.dims
+
+    def embed(self, texts: List[str]) -> List[List[float]]:
+        """
+        计算一批文本的向量。
+        :param texts: 文本列表
+        :return: 与 texts 一一对应的向量列表
+        """
+        keys = [EmbeddingCache.make_key(self.name, text) for text in texts]
+        vectors = self.cache.get_many(keys) if self.cache is not None else {}
+        missing = {key: text for key, text in zip(keys, texts) if key not in vectors}
+        items = list(missing.items())
+        for start in range(0, len(items), self.batch_size):
+            part = items[start:start + self.batch_size]
+            computed = dict(zip((key for key, _ in part), self.embedder.embed([text for _, text in part])))
+            if self.cache is not None:
+                self.cache.put_many(computed)
+            vectors.update(computed)
+        return [vectors[key] for key in keys]
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+def configure_embedder(embedder: Any = None, cache_path: Optional[str] = "embedding_cache.sqlite",
+                       batch_size: int = 64) -> Optional[CachedEmbedder]:
+    """
+    设置共享的向量化器（加上缓存与分批）；传入 None 时恢复为默认（首次使用时按环境变量创建，见 get_embedder）。
+    :param embedder: 向量化器（需有 name、dims 属性与 embed(texts) 方法）
+    :param cache_path: 向量缓存的 SQLite 文件路径，为 None 时不缓存
+    :param batch_size: 每次计算的最大文本数
+    :return: CachedEmbedder 对象（embedder 为 None 时返回 None）
+    """
+    global _embedder
+    with _embedder_lock:
+        if embedder is None:
+            _embedder = None
+            return None
+        cache = EmbeddingCache(cache_path) if cache_path else None
+        _embedder = CachedEmbedder(embedder, cache, batch_size)
+        return _embedder
+
+def get_embedder() -> CachedEmbedder:
+    """
+    获取共享的向量化器，未配置时按环境变量 EMBEDDING_MODEL（"hashing" 或模型名称，默认安装了
+    sentence-transformers 时用 bge-small-zh，否则用 HashingEmbedder）与 EMBEDDING_CACHE_PATH 创建。
+    :return: CachedEmbedder 对象
+    """
+    with _embedder_lock:
+        embedder = _embedder
+    if embedder is None:
+        model = os.getenv("EMBEDDING_MODEL", DEFAULT_MODEL if SentenceTransformer is not None else "hashing")
+        embedder = configure_embedder(
+            HashingEmbedder() if model == "hashing" else SentenceTransformerEmbedder(model),
+            cache_path=os.getenv("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite"),
+        )
+    return embedder
+
+def rrf_fuse(result_lists: List[List[Dict[str, Any]]], size: int = 10, k: int = 60) -> List[Dict[str, Any]]:
+    """
+    倒数排名融合（RRF）：每个结果在各列表中按 1 / (k + 名次) 累加得分，按总分排序。不需要对 BM25 分数与向量相似度
+    做归一化。
+    :param result_lists: 多个按相关度排序的 ES hits 列表（以 _id 识别同一文档）
+    :param size: 返回的结果数
+    :param k: 平滑常数（常用 60）
+    :return: 融合后的 hits（_score 为融合得分）
+    """
+    scores = {}
+    hits = {}
+    for results in result_lists:
+        for rank, hit in enumerate(results, start=1):
+            scores[hit["_id"]] = scores.get(hit["_id"], 0.0) + 1.0 / (k + rank)
+            hits.setdefault(hit["_id"], hit)
+    ranked = sorted(scores, key=scores.get, reverse=True)[:size]
+    return [dict(hits[doc_id], _score=scores[doc_id]) for doc_id in ranked]
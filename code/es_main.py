@@ -1,14 +1,30 @@
+import argparse
+
 from save_to_es import Elastic
 
 def main():
-    
-    es = Elastic()
-    print(es.create_label_index("e_rag"))
+    parser = argparse.ArgumentParser(description="将 MySQL 中的 llm_outputs 同步到 ES 并测试检索")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="全量重建到新的版本索引并原子切换 e_rag 别名（默认按 updated_at 水位线增量同步）")
+    parser.add_argument("--granularity", choices=["sheet", "rows"], default=None,
+                        help="重建时新索引的粒度：每个 sheet 一个文档，或每个表格行一个文档（默认沿用当前索引）")
+    parser.add_argument("--dense-vectors", choices=["on", "off"], default=None,
+                        help="重建时新索引是否带向量字段（BM25 + kNN 混合检索，默认沿用当前索引）")
+    parser.add_argument("--vector-store", choices=["es", "local"], default=None,
+                        help="重建时向量存入 ES，或本地向量索引（用于不支持 kNN 的 ES，默认沿用当前索引）")
+    parser.add_argument("--keep", type=int, default=0, help="重建后保留的旧版本索引个数（用于回滚）")
+    args = parser.parse_args()
 
-    # 清空现有文档（可选）
-    print(es.clear_documents("e_rag"))
-
-    print(es.bulk_index_data("e_rag", database="e_rag"))
+    es = Elastic()
+    # 两种方式都不清空正在服务的索引：增量同步只写入变化的记录，重建写入新索引后再切换别名
+    if args.rebuild:
+        stats = es.rebuild_index("e_rag", database="e_rag", keep=args.keep, granularity=args.granularity,
+                                 dense_vectors=None if args.dense_vectors is None else args.dense_vectors == "on",
+                                 vector_store=args.vector_store)
+    else:
+        stats = es.sync_incremental("e_rag", database="e_rag")
+    if stats["failed"]:
+        print(f"{stats['failed']} documents failed to index, rerun to retry them")
     # 搜索关键词
     file_names, sheet_names, json_contents, scores = es.search_by_text("e_rag", "哪些项目使用联合 CZMVF3568-V3-1228 摄像头？")
     # 组合 file_names 和 sheet_names 为 file_name_sheet_name 格式
@@ -1,31 +1,111 @@
 # -*- coding: utf-8 -*-
 import json
 from datetime import datetime
-from typing import Dict, Any
-import google.generativeai as genai
+from typing import Dict, Any, List, Tuple
 from dotenv import load_dotenv
 import os
-import time
+import threading
 import re  # 用于解析文件名中的 chunk 编号
+import time
+import chunking
+from gemini_client import CorrectionEngine
+from json_stream import RowStreamParser, MalformedStream
+from ingest_manifest import IngestManifest, STAGE_LLM, remove_files
+from llm_cache import ResponseCache
+from table_format import build_csv, compact_document, expand_document, is_compact, load_document
+from table_normalizer import normalize_document, MESSINESS_THRESHOLD
 
 # 加载 .env 文件
 load_dotenv()
 
-def correct_json_with_gemini(input_json: Dict[str, Any], retries=3) -> str:
+# 单次发送给大模型的字符数上限，超过时按行切分为多个批次分别校对后合并
+CHARACTER_LIMIT = 20000
+
+# 输出不完整或格式错误时，对未正确返回的行范围最多补发的次数
+MAX_REPAIRS = 2
+
+# 提示词模板版本：修改 build_prompt 或 COMPACT_PROMPT 的内容后需递增，使旧的缓存响应失效
+PROMPT_VERSION = "1"
+
+# 输入为紧凑表格格式时追加的说明
+COMPACT_PROMPT = (
+    "7.表格采用紧凑格式：format为compact的table中，headers为列名数组，values为行数组，"
+    "每行是与headers一一对应的值数组（省略末尾空值），或以列索引为键的稀疏对象（只包含非空单元格）。"
+    "请保持该紧凑格式输出，修改列名时同步修改headers。"
+)
+
+# 进程内共享的大模型调用引擎（复用客户端，所有线程共用同一组限流器）
+_engine = None
+_engine_lock = threading.Lock()
+
+def configure_engine(concurrency: int = 4, rpm: float = 0, tpm: float = 0, retries: int = 5, client=None) -> CorrectionEngine:
     """
-    调用 Gemini API，使用输入的 JSON 数据和提示词，生成校对后的 JSON 字符串。
-    （不再强制用 json.loads 验证）
-    :param input_json: 读取的 JSON 数据（单个 sheet）
-    :param retries: 重试次数
-    :return: 校对后的“JSON字符串”文本（不保证一定是有效JSON）
+    创建并设置共享的大模型调用引擎。
+    :param concurrency: 最大并发请求数
+    :param rpm: 每分钟请求数上限，0 表示不限制
+    :param tpm: 每分钟 token 数上限，0 表示不限制
+    :param retries: 最大尝试次数
+    :param client: GeminiClient 对象，默认按环境变量创建（GEMINI_API_ENDPOINT 可指向本地模拟服务）
+    :return: CorrectionEngine 对象
+    """
+    global _engine
+    with _engine_lock:
+        _engine = CorrectionEngine(client, concurrency=concurrency, rpm=rpm, tpm=tpm, retries=retries)
+        return _engine
+
+def get_engine() -> CorrectionEngine:
+    """
+    获取共享的大模型调用引擎，未配置时按环境变量 GEMINI_CONCURRENCY、GEMINI_RPM、GEMINI_TPM 创建。
+    :return: CorrectionEngine 对象
+    """
+    with _engine_lock:
+        engine = _engine
+    if engine is None:
+        engine = configure_engine(
+            concurrency=int(os.getenv("GEMINI_CONCURRENCY", "4")),
+            rpm=float(os.getenv("GEMINI_RPM", "0")),
+            tpm=float(os.getenv("GEMINI_TPM", "0")),
+        )
+    return engine
+
+# 进程内共享的大模型响应缓存
+_cache = None
+
+def configure_cache(path: str = "llm_cache.sqlite", max_mb: float = 512, bypass: bool = False) -> ResponseCache:
+    """
+    创建并设置共享的大模型响应缓存。
+    :param path: SQLite 文件路径
+    :param max_mb: 缓存总大小上限（MB），超出时按最久未访问淘汰
+    :param bypass: 是否绕过缓存读取（强制重新请求，结果仍写入缓存）
+    :return: ResponseCache 对象
     """
-    # 从环境变量中获取 API 密钥
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
-        raise ValueError("GEMINI_API_KEY not found in .env file")
+    global _cache
+    with _engine_lock:
+        _cache = ResponseCache(path, max_bytes=int(max_mb * (1 << 20)), bypass=bypass)
+        return _cache
 
-    # 配置 Gemini API
-    genai.configure(api_key=api_key)
+def get_cache() -> ResponseCache:
+    """
+    获取共享的大模型响应缓存，未配置时按环境变量 LLM_CACHE_PATH、LLM_CACHE_MAX_MB、LLM_CACHE_BYPASS 创建。
+    :return: ResponseCache 对象
+    """
+    with _engine_lock:
+        cache = _cache
+    if cache is None:
+        cache = configure_cache(
+            path=os.getenv("LLM_CACHE_PATH", "llm_cache.sqlite"),
+            max_mb=float(os.getenv("LLM_CACHE_MAX_MB", "512")),
+            bypass=os.getenv("LLM_CACHE_BYPASS", "0") == "1",
+        )
+    return cache
+
+def build_prompt(input_json: Dict[str, Any]) -> str:
+    """
+    构造校对提示词，嵌入 JSON 数据。
+    :param input_json: 读取的 JSON 数据（单个 sheet），支持常规格式与紧凑表格格式
+    :return: 提示词
+    """
+    uses_compact = any(isinstance(t, dict) and is_compact(t) for t in input_json.get("tables", []))
 
     # 将输入的 JSON 数据转换为字符串（紧凑格式以减少 token 数量）
     json_str = json.dumps(input_json, ensure_ascii=False, indent=None, separators=(",", ":"))
@@ -37,7 +117,7 @@ def correct_json_with_gemini(input_json: Dict[str, Any], retries=3) -> str:
     print(f"Last 500 characters:\n{json_str[-500:]}")
 
     # 创建提示词，嵌入 JSON 数据
-    prompt = (
+    return (
         "你是一个JSON数据校正和标准化专家。我将提供一个从Excel文件解析得到的JSON对象，其中包含表格数据（tables），但可能混杂自然段内容。你的任务是校对和修正这个JSON数据，确保其符合正确的JSON表格形式，同时最大程度保留自然段的格式。JSON数据可能较大，请确保完整处理所有内容。具体要求如下："
         "1.确保所有字段名和值都保持中文，不要将中文转换为英文。"
         "2.识别表格数据和自然段内容，并保持格式正确"
@@ -45,56 +125,407 @@ def correct_json_with_gemini(input_json: Dict[str, Any], retries=3) -> str:
         "4.如果JSON数据较大，请分块处理，确保不遗漏任何内容。"
         "5.确保输出的JSON结构清晰、格式正确，所有内容均为中文。"
         "6.只返回校对后的有效JSON字符串，不要包含其他任何文字或注释，不要包含任何前后缀（如```json或'''）。"
+        f"{COMPACT_PROMPT if uses_compact else ''}"
         "以下是输入的JSON数据："
         f"{json_str}"
         "请返回校对后的JSON字符串。"
     )
 
+def correct_json_with_gemini(input_json: Dict[str, Any], retries: int = None, compact: bool = False,
+                             engine: CorrectionEngine = None) -> str:
+    """
+    调用 Gemini API，使用输入的 JSON 数据和提示词，生成校对后的 JSON 字符串。
+    以流式方式接收并增量校验（见 stream_correction），可在多个线程中同时调用，请求经共享引擎限流、失败时退避重试。
+    :param input_json: 读取的 JSON 数据（单个 sheet），支持常规格式与紧凑表格格式
+    :param retries: 重试次数，默认使用引擎的设置
+    :param compact: 是否先将表格转换为紧凑格式再发送（减少重复的列名和 CSV，节省 token）
+    :param engine: 大模型调用引擎，默认使用共享引擎
+    :return: 校对后的有效 JSON 字符串；命中响应缓存时不调用 API
+    """
+    if compact:
+        input_json = compact_document(input_json)
+
+    # 先查缓存：相同输入、提示词版本和模型的响应直接复用，不发起网络请求
+    engine = engine or get_engine()
+    cache = get_cache()
+    model_name = engine.client.model_name
+    cache_key = cache.make_key(input_json, PROMPT_VERSION, model_name)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        print("LLM cache hit, skipping Gemini API call...")
+        return cached
+
+    corrected_json_str = stream_correction(input_json, engine, retries)
+    cache.put(cache_key, corrected_json_str, model_name, PROMPT_VERSION)
+
+    return corrected_json_str
+
+def _table_items(document: Dict[str, Any]) -> List[Any]:
+    """
+    取出文档中唯一 table 的行数组（常规格式为 rows，紧凑格式为 values），不是单个 table 时返回 None。
+    """
+    tables = document.get("tables") if isinstance(document, dict) else None
+    if not isinstance(tables, list) or len(tables) != 1 or not isinstance(tables[0], dict):
+        return None
+    items = tables[0].get("values" if is_compact(tables[0]) else "rows")
+    return items if isinstance(items, list) else None
+
+def _with_items(document: Dict[str, Any], items: List[Any]) -> Dict[str, Any]:
+    """
+    用新的行数组替换文档中唯一 table 的行（常规格式同时重建 data，列以第一行为准）。
+    """
+    table = dict(document["tables"][0])
+    if is_compact(table):
+        table["values"] = items
+        table.pop("data", None)
+    else:
+        columns = list(items[0].keys()) if items else (table.get("headers") or [])
+        if "headers" in table:
+            table["headers"] = columns
+        if "data" in table:
+            table["data"] = build_csv(columns, items)
+        table["rows"] = items
+    return {**document, "tables": [table]}
+
+def _cell_values(item: Any) -> set:
+    """
+    行中非空单元格的值（去除首尾空白），常规格式的行字典、紧凑格式的数组和稀疏对象均可。
+    """
+    values = item.values() if isinstance(item, dict) else item if isinstance(item, list) else [item]
+    return {str(value).strip() for value in values if value not in ("", None)}
+
+def _row_overlap(item: Any, source: Any) -> float:
+    """
+    source 行的非空值在 item 行中出现的比例（大模型只修正个别单元格时仍接近 1）。
+    """
+    expected = _cell_values(source)
+    return len(expected & _cell_values(item)) / len(expected) if expected else float(not _cell_values(item))
+
+def _rows_line_up(items: List[Any], source_items: List[Any]) -> bool:
+    """
+    检查已收到的行是否仍与输入逐行对应：首行和最后一行都应与输入的同位置行基本一致，且最后一行不能更像输入的下一行
+    （模型删除或合并了前面的行时，后面的行整体前移）。
+    """
+    if not items:
+        return True
+    last = len(items) - 1
+    for index in {0, last}:
+        if _row_overlap(items[index], source_items[index]) < 0.5:
+            return False
+    if last + 1 < len(source_items) and _cell_values(source_items[last + 1]) != _cell_values(source_items[last]):
+        return _row_overlap(items[last], source_items[last]) > _row_overlap(items[last], source_items[last + 1])
+    return True
+
+def stream_correction(input_json: Dict[str, Any], engine: CorrectionEngine, retries: int = None,
+                      repairs: int = MAX_REPAIRS) -> str:
+    """
+    以流式方式请求校对，边接收边增量解析行；输出被截断或某一行格式错误时立即停止接收，
+    保留已正确解析的行，只对剩余的行范围重新请求，最后拼接为完整的 table；已收到的行与输入对不上时
+    （模型删除或合并了行，见 _rows_line_up）重新请求整张表。
+    补发次数用尽或输入不是单个 table 时，使用未校对的输入，保证返回的一定是有效 JSON。
+    :param input_json: 发送给大模型的 JSON 数据
+    :param engine: 大模型调用引擎
+    :param retries: 请求失败时的最大尝试次数
+    :param repairs: 剩余的补发次数
+    :return: 校对后的有效 JSON 字符串
+    """
+    prompt = build_prompt(input_json)
+
     # 调试：检查 prompt 的完整性
     print("\n=== Prompt Before API Call ===")
     print(f"Prompt length: {len(prompt)} characters")
     print(f"First 500 characters of prompt:\n{prompt[:500]}")
     print(f"Last 500 characters of prompt:\n{prompt[-500:]}")
 
-    for attempt in range(retries):
-        try:
-            # 调用 Gemini API
-            model = genai.GenerativeModel('models/gemini-2.5-pro-preview-03-25')  # 更新为可用模型
-            response = model.generate_content(prompt)
-
-            # 获取校对后的 JSON 字符串（此处只当作文本，不再做 json.loads 校验）
-            corrected_json_str = response.text.strip()
-
-            # 移除可能的 ```json 前缀和 ``` 后缀，或者 ''' 前后缀
-            corrected_json_str = corrected_json_str.strip()
-            if corrected_json_str.startswith("```json"):
-                corrected_json_str = corrected_json_str[len("```json"):].strip()
-            if corrected_json_str.endswith("```"):
-                corrected_json_str = corrected_json_str[:-len("```")].strip()
-            if corrected_json_str.startswith("'''"):
-                corrected_json_str = corrected_json_str[len("'''"):].strip()
-            if corrected_json_str.endswith("'''"):
-                corrected_json_str = corrected_json_str[:-len("'''")].strip()
-
-            print("\n原始 API 返回的内容（清理前后缀后）：")
-            print(corrected_json_str)
-
-            return corrected_json_str
-
-        except Exception as e:
-            if attempt == retries - 1:
-                raise Exception(f"Error calling Gemini API after {retries} attempts: {str(e)}")
-            print(f"Attempt {attempt + 1} failed, retrying... Error: {str(e)}")
-            time.sleep(2)
-
-def main():
+    parser = RowStreamParser()
+    try:
+        for text in engine.stream(prompt, retries):
+            parser.feed(text)
+        document = parser.finish()
+        return json.dumps(document, ensure_ascii=False, indent=None, separators=(",", ":"))
+    except MalformedStream as e:
+        print(f"Malformed response after {e.rows_ok} rows: {str(e)}")
+    except (OSError, ValueError) as e:
+        # 接收过程中连接中断，按截断处理
+        print(f"Response stream interrupted after {len(parser.rows)} rows: {str(e)}")
+
+    source_items = _table_items(input_json)
+    if source_items is None or repairs <= 0:
+        print("Cannot repair the response, using the uncorrected JSON...")
+        return json.dumps(input_json, ensure_ascii=False, indent=None, separators=(",", ":"))
+
+    good_items = parser.rows[:len(source_items)]
+    if not _rows_line_up(good_items, source_items):
+        # 模型删除或合并了行，剩余范围无法确定，整张表重新请求
+        print("Received rows no longer match the input rows, re-requesting the whole table...")
+        good_items = []
+    remaining = source_items[len(good_items):]
+    if remaining:
+        print(f"Re-requesting rows {len(good_items)}-{len(source_items) - 1} of {len(source_items)}...")
+        repaired = _table_items(json.loads(stream_correction(_with_items(input_json, remaining), engine,
+                                                             retries, repairs - 1)))
+        if repaired is None:
+            repaired = remaining
+        if good_items and not is_compact(input_json["tables"][0]):
+            if not all(isinstance(row, dict) for row in good_items + repaired):
+                print("Repaired rows are not objects, using the uncorrected JSON...")
+                return json.dumps(input_json, ensure_ascii=False, indent=None, separators=(",", ":"))
+            columns = list(good_items[0].keys())
+            repaired = _align_rows(repaired, columns) or _align_rows(remaining, columns)
+            if repaired is None:
+                print("Repaired rows have inconsistent columns, using the uncorrected JSON...")
+                return json.dumps(input_json, ensure_ascii=False, indent=None, separators=(",", ":"))
+        good_items = good_items + repaired
+    return json.dumps(_with_items(input_json, good_items), ensure_ascii=False, indent=None, separators=(",", ":"))
+
+def describe_unit(parsed_json: Dict[str, Any]) -> str:
+    """
+    生成 sheet/chunk 的简短描述，用于路由报告。
+    :param parsed_json: 解析得到的 JSON 数据
+    :return: 如 "xxx.xlsx/Sheet1#2"
+    """
+    tables = [t for t in parsed_json.get("tables", []) if isinstance(t, dict)]
+    if not tables:
+        return parsed_json.get("file_name", "")
+    chunk = tables[0].get("chunk")
+    suffix = f"#{chunk['index']}" if chunk else ""
+    return f"{parsed_json.get('file_name', '')}/{tables[0].get('sheet', '')}{suffix}"
+
+def split_document(parsed_json: Dict[str, Any], limit: int = CHARACTER_LIMIT) -> List[Tuple[int, Dict[str, Any]]]:
+    """
+    将超过字符数限制的 sheet 按行切分为多个批次，每个批次都带完整表头，序列化后不超过 limit（单行超限时单独成批）。
+    :param parsed_json: 规整后的 JSON 数据（常规格式，单个 table）
+    :param limit: 每个批次的字符数上限
+    :return: (起始行偏移, 批次 JSON) 列表；无法按行切分时返回空列表
+    """
+    tables = parsed_json.get("tables", [])
+    if len(tables) != 1 or not isinstance(tables[0], dict) or is_compact(tables[0]):
+        return []
+    table = tables[0]
+    rows = table.get("rows")
+    if not isinstance(rows, list) or len(rows) < 2 or not all(isinstance(row, dict) for row in rows):
+        return []
+
+    headers = table.get("headers") or list(rows[0].keys())
+    base = chunking.base_size(parsed_json.get("doc_type", ""), parsed_json.get("file_name", ""),
+                              table.get("sheet", ""), headers)
+    batches = []
+    for offset, batch_rows in chunking.iter_row_chunks(rows, headers, limit, base):
+        batch_table = {key: value for key, value in table.items() if key not in ("headers", "data", "rows", "chunk")}
+        batch_table["headers"] = headers
+        batch_table["data"] = build_csv(headers, batch_rows)
+        batch_table["rows"] = batch_rows
+        batches.append((offset, {**parsed_json, "tables": [batch_table]}))
+    return batches
+
+def _corrected_rows(json_str: str, expected: int) -> List[Dict[str, Any]]:
+    """
+    从大模型返回的批次 JSON 中取出行列表，无法解析或行数不一致时返回 None。
+    """
+    document = expand_document(load_document(json_str))
+    if not isinstance(document, dict) or not isinstance(document.get("tables"), list) or len(document["tables"]) != 1:
+        return None
+    rows = document["tables"][0].get("rows") if isinstance(document["tables"][0], dict) else None
+    if not isinstance(rows, list) or len(rows) != expected or not all(isinstance(row, dict) for row in rows):
+        return None
+    return rows
+
+def _align_rows(rows: List[Dict[str, Any]], columns: List[str]) -> List[Dict[str, Any]]:
+    """
+    将批次的行对齐到统一的列：列名集合相同时按列名对齐；多出的列全部为空时丢弃；
+    列数相同但列名不同时（大模型改名不一致）按位置对齐。无法对齐时返回 None。
+    """
+    keys = list(rows[0].keys()) if rows else list(columns)
+    if any(list(row.keys()) != keys and set(row.keys()) != set(keys) for row in rows):
+        return None
+    if set(keys) == set(columns):
+        return [{column: row[column] for column in columns} for row in rows]
+    extra = [key for key in keys if key not in columns]
+    if set(columns) <= set(keys) and all(row[key] in ("", None) for row in rows for key in extra):
+        return [{column: row[column] for column in columns} for row in rows]
+    if len(keys) == len(columns):
+        return [dict(zip(columns, (row[key] for key in keys))) for row in rows]
+    return None
+
+def correct_oversized(parsed_json: Dict[str, Any], compact: bool = False,
+                      engine: CorrectionEngine = None) -> Tuple[str, Dict[str, Any]]:
+    """
+    校对超过 CHARACTER_LIMIT 的 sheet：按行切分为带表头的批次，并发交给大模型校对后按行偏移合并为一个 table。
+    合并前校验每个批次的行数，并将各批次对齐到第一个有效批次的列；校验失败的批次使用规整后的原始行，
+    所有批次都无法对齐时整张表使用规整后的原始 JSON。
+    :param parsed_json: 规整后的 JSON 数据（常规格式）
+    :param compact: 是否以紧凑格式发送给大模型并输出
+    :param engine: 大模型调用引擎，默认使用共享引擎
+    :return: (校对后的 JSON 字符串, {"batches": 批次数, "fallbacks": 使用原始行的批次数})；无法切分时批次数为 0
+    """
+    batches = split_document(parsed_json)
+    if not batches:
+        json_str = json.dumps(compact_document(parsed_json) if compact else parsed_json,
+                              ensure_ascii=False, indent=None, separators=(",", ":"))
+        return json_str, {"batches": 0, "fallbacks": 0}
+
+    engine = engine or get_engine()
+    corrected = {}
+    for (offset, batch), json_str, error in engine.map(
+            lambda item: correct_json_with_gemini(item[1], compact=compact, engine=engine), batches):
+        if error is not None:
+            print(f"Batch at row {offset} failed: {str(error)}")
+            continue
+        corrected[offset] = _corrected_rows(json_str, len(batch["tables"][0]["rows"]))
+
+    # 以第一个有效批次的列为准
+    columns = None
+    for offset, _ in batches:
+        if corrected.get(offset):
+            columns = list(corrected[offset][0].keys())
+            break
+
+    table = parsed_json["tables"][0]
+    original_columns = table.get("headers") or list(table["rows"][0].keys())
+    rows, fallbacks = [], 0
+    for offset, batch in batches:
+        aligned = _align_rows(corrected[offset], columns) if corrected.get(offset) and columns else None
+        if aligned is None:
+            fallbacks += 1
+            aligned = _align_rows(batch["tables"][0]["rows"], columns or original_columns)
+            if aligned is None:
+                # 原始行也无法与校对后的列对齐，整张表不做合并
+                print("Corrected batches have inconsistent columns, using the normalized sheet...")
+                json_str = json.dumps(compact_document(parsed_json) if compact else parsed_json,
+                                      ensure_ascii=False, indent=None, separators=(",", ":"))
+                return json_str, {"batches": len(batches), "fallbacks": len(batches)}
+        rows.extend(aligned)
+
+    if len(rows) != len(table["rows"]):
+        raise ValueError(f"Merged row count {len(rows)} does not match the original {len(table['rows'])}")
+
+    columns = columns or original_columns
+    merged = {key: value for key, value in table.items() if key not in ("headers", "data", "rows")}
+    if "headers" in table:
+        merged["headers"] = columns
+    merged["data"] = build_csv(columns, rows)
+    merged["rows"] = rows
+    merged_json = {**parsed_json, "tables": [merged]}
+    if compact:
+        merged_json = compact_document(merged_json)
+    print(f"Merged {len(batches)} batches ({len(rows)} rows, {fallbacks} batches kept uncorrected)")
+    return json.dumps(merged_json, ensure_ascii=False, indent=None, separators=(",", ":")), \
+        {"batches": len(batches), "fallbacks": fallbacks}
+
+def correct_document(parsed_json: Dict[str, Any], compact: bool = False, route_log: List[Dict[str, Any]] = None,
+                     threshold: float = MESSINESS_THRESHOLD) -> str:
+    """
+    校对单个 sheet/chunk 的 JSON：先按规则在本地规整（删除空占位列、空行等），
+    杂乱度低于 threshold 时直接使用本地结果，否则将规整后的 JSON 交给大模型；
+    序列化后超过 CHARACTER_LIMIT 时按行切分为多个批次并发校对后合并（见 correct_oversized）。
+    :param parsed_json: 解析得到的 JSON 数据
+    :param compact: 是否以紧凑表格格式发送给大模型（字符数限制按紧凑格式计算）
+    :param route_log: 若指定，追加本单元的路由记录 {"unit", "path": local/llm/split/skip, "score", "seconds", "batches"}
+    :param threshold: 杂乱度阈值，0 表示全部交给大模型
+    :return: 校对后的 JSON 字符串
+    """
+    start = time.perf_counter()
+    normalized, score, metrics = normalize_document(parsed_json)
+    parsed_json = compact_document(normalized) if compact else normalized
+
+    # 将 JSON 数据转换为字符串（紧凑格式）
+    json_str = json.dumps(parsed_json, ensure_ascii=False, indent=None, separators=(",", ":"))
+
+    # 检查字符数
+    json_str_length = len(json_str)
+    print(f"JSON string length: {json_str_length} characters, messiness: {score:.2f} {metrics}")
+
+    batches = 0
+    if score < threshold:
+        print("Clean after local normalization, skipping Gemini API processing...")
+        path = "local"
+    elif json_str_length > CHARACTER_LIMIT:
+        print(f"JSON string exceeds {CHARACTER_LIMIT} characters, splitting into row batches...")
+        json_str, split_stats = correct_oversized(normalized, compact)
+        batches = split_stats["batches"]
+        # 无法切分或所有批次都未能校对时，相当于直接使用规整后的 JSON
+        path = "split" if batches and split_stats["fallbacks"] < batches else "skip"
+    else:
+        # 调用大模型校对
+        print("Processing with Gemini API...")
+        json_str = correct_json_with_gemini(parsed_json)
+        path = "llm"
+
+    if route_log is not None:
+        route_log.append({
+            "unit": describe_unit(parsed_json),
+            "path": path,
+            "score": score,
+            "seconds": time.perf_counter() - start,
+            "batches": batches,
+        })
+    return json_str
+
+def print_route_report(route_log: List[Dict[str, Any]]):
+    """
+    打印各 sheet/chunk 的处理路径（local/llm/split/skip）、杂乱度和耗时，以及各路径的汇总。
+    :param route_log: correct_document 追加的路由记录
+    """
+    print("\n=== Routing ===")
+    for entry in sorted(route_log, key=lambda e: e["unit"]):
+        batches = f"  ({entry['batches']} batches)" if entry.get("batches") else ""
+        print(f"{entry['path']:<6}{entry['score']:.2f}  {entry['seconds']:.3f}s  {entry['unit']}{batches}")
+    for path in ("local", "llm", "split", "skip"):
+        entries = [e for e in route_log if e["path"] == path]
+        if entries:
+            print(f"{path}: {len(entries)} units, {sum(e['seconds'] for e in entries):.2f}s total")
+
+def build_output_file_name(json_file: str, parsed_json: Dict[str, Any]) -> str:
+    """
+    根据输入 JSON 确定校对结果的输出文件名。
+    优先使用 chunk 元数据，缺失时从输入文件名中解析 excel 文件名、sheet 名称和 chunk 编号。
+    :param json_file: 输入文件名（不含路径）
+    :param parsed_json: 输入 JSON 数据
+    :return: 输出文件名
+    """
+    chunk = parsed_json["tables"][0].get("chunk") if parsed_json.get("tables") else None
+    if chunk is not None:
+        excel_name = os.path.splitext(parsed_json["file_name"])[0]
+        sheet_name = parsed_json["tables"][0]["sheet"]
+        return f"{excel_name}_{sheet_name}{chunk['index']}_llm_output_0.json"
+
+    # 从输入文件名中提取 excel 文件名、sheet 名称和 chunk 编号
+    # 去掉扩展名，例如 "R2350电机保护逻辑_Sheet11_0.json" -> "R2350电机保护逻辑_Sheet11_0"
+    base_file_name = os.path.splitext(json_file)[0]
+    # 以 "_" 分割，例如 ["R2350电机保护逻辑", "Sheet11", "0"]
+    parts = base_file_name.split("_")
+    if len(parts) < 3:
+        raise ValueError(f"Invalid input file name format: {json_file}")
+
+    # 提取 excel 文件名（可能是多个部分，例如 "R2350电机保护逻辑"）
+    excel_name = "_".join(parts[:-2])  # 取除最后两个部分之前的所有部分
+    # 提取 sheet 名称和可能的 chunk 编号
+    sheet_part = parts[-2]  # 倒数第二部分，例如 "Sheet11" 或 "Sheet2"
+
+    # 使用正则表达式分离 sheet 名称和 chunk 编号
+    match = re.match(r"^(.*?)([0-9]+)$", sheet_part)
+    if match:
+        # 分块文件，例如 "Sheet11" -> sheet_name = "Sheet1", chunk_number = "1"
+        sheet_name = match.group(1)  # "Sheet1"
+        chunk_number = match.group(2)  # "1"
+        return f"{excel_name}_{sheet_name}{chunk_number}_llm_output_0.json"
+    # 非分块文件，例如 "Sheet2" -> sheet_name = "Sheet2"
+    sheet_name = sheet_part
+    return f"{excel_name}_{sheet_name}_llm_output_0.json"
+
+def main(manifest: IngestManifest = None, compact: bool = False, bypass_cache: bool = False,
+         threshold: float = MESSINESS_THRESHOLD):
+    """
+    遍历解析结果目录，本地规整后将仍然杂乱的 sheet 交给大模型校对，并保存。
+    :param manifest: 增量导入清单；内容未变化的 sheet/chunk 直接跳过，已删除的输入会清理其输出
+    :param compact: 是否以紧凑表格格式发送给大模型（字符数限制按紧凑格式计算）
+    :param bypass_cache: 是否绕过大模型响应缓存（强制重新请求）
+    :param threshold: 杂乱度阈值，0 表示全部交给大模型
+    """
     # 定义输入和输出目录
     input_dir = "output_test"  # 存储原始 JSON 文件的目录
     output_dir = "llm_output_test"  # 存储大模型校对后文件的目录
 
-    # 字符数限制
-    CHARACTER_LIMIT = 20000  # 字符数超过 70000 时跳过大模型处理
-
     # 确保输入目录存在
     if not os.path.exists(input_dir):
         raise FileNotFoundError(f"Input directory not found: {input_dir}")
@@ -103,72 +534,82 @@ def main():
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    # 遍历 input_dir 中的所有 JSON 文件
+    if manifest is None:
+        manifest = IngestManifest()
+
+    # 遍历 input_dir 中的所有 JSON 文件，收集需要校对的任务
+    live_inputs = []
+    jobs = []
     for json_file in os.listdir(input_dir):
         if not json_file.endswith(".json"):
             continue
 
         input_json_path = os.path.join(input_dir, json_file)
-        print(f"\n=== Processing JSON file: {input_json_path} ===")
+        live_inputs.append(input_json_path)
 
         # 读取 JSON 文件
         with open(input_json_path, "r", encoding="utf-8") as f:
             parsed_json = json.load(f)
 
+        # 构造输出路径
+        output_path = os.path.join(output_dir, build_output_file_name(json_file, parsed_json))
+
+        # 内容未变化且输出仍存在时跳过大模型调用
+        content_hash = IngestManifest.hash_json(parsed_json)
+        if manifest.is_current(STAGE_LLM, input_json_path, content_hash) and os.path.exists(output_path):
+            print(f"Unchanged since last run, skipping: {input_json_path}")
+            continue
+        jobs.append((input_json_path, output_path, content_hash, parsed_json))
+
+    def correct_job(job):
+        input_json_path, _, _, parsed_json = job
+        print(f"\n=== Processing JSON file: {input_json_path} ===")
+
         # 调试：检查 parsed_json 的完整性
         print(f"Total tables: {len(parsed_json['tables'])}")
         for i, table in enumerate(parsed_json['tables']):
             print(f"Table {i + 1} - Sheet: {table['sheet']}")
-            print(f"Number of rows: {len(table['rows'])}")
-            print(f"Data length: {len(table['data'])} characters")
-
-        # 将 JSON 数据转换为字符串（紧凑格式）
-        json_str = json.dumps(parsed_json, ensure_ascii=False, indent=None, separators=(",", ":"))
-
-        # 检查字符数
-        json_str_length = len(json_str)
-        print(f"JSON string length: {json_str_length} characters")
-
-        if json_str_length > CHARACTER_LIMIT:
-            print(f"JSON string exceeds {CHARACTER_LIMIT} characters, skipping Gemini API processing...")
-            corrected_json_str = json_str  # 直接使用原始 JSON 字符串
-        else:
-            # 调用大模型校对
-            print("Processing with Gemini API...")
-            corrected_json_str = correct_json_with_gemini(parsed_json)
-
-        # 从输入文件名中提取 excel 文件名、sheet 名称和 chunk 编号
-        # 去掉扩展名，例如 "R2350电机保护逻辑_Sheet11_0.json" -> "R2350电机保护逻辑_Sheet11_0"
-        base_file_name = os.path.splitext(json_file)[0]
-        # 以 "_" 分割，例如 ["R2350电机保护逻辑", "Sheet11", "0"]
-        parts = base_file_name.split("_")
-        if len(parts) < 3:
-            raise ValueError(f"Invalid input file name format: {json_file}")
-
-        # 提取 excel 文件名（可能是多个部分，例如 "R2350电机保护逻辑"）
-        excel_name = "_".join(parts[:-2])  # 取除最后两个部分之前的所有部分
-        # 提取 sheet 名称和可能的 chunk 编号
-        sheet_part = parts[-2]  # 倒数第二部分，例如 "Sheet11" 或 "Sheet2"
-
-        # 使用正则表达式分离 sheet 名称和 chunk 编号
-        match = re.match(r"^(.*?)([0-9]+)$", sheet_part)
-        if match:
-            # 分块文件，例如 "Sheet11" -> sheet_name = "Sheet1", chunk_number = "1"
-            sheet_name = match.group(1)  # "Sheet1"
-            chunk_number = match.group(2)  # "1"
-            output_file_name = f"{excel_name}_{sheet_name}{chunk_number}_llm_output_0.json"
-        else:
-            # 非分块文件，例如 "Sheet2" -> sheet_name = "Sheet2"
-            sheet_name = sheet_part
-            output_file_name = f"{excel_name}_{sheet_name}_llm_output_0.json"
+            print(f"Number of rows: {len(table.get('rows', table.get('values', [])))}")
+            print(f"Data length: {len(table.get('data', ''))} characters")
 
-        # 构造输出路径
-        output_path = os.path.join(output_dir, output_file_name)
+        return correct_document(parsed_json, compact, route_log, threshold)
+
+    # 多个 sheet 并发校对（并发数与限流见 get_engine），按完成顺序保存
+    route_log = []
+    engine = get_engine()
+    cache = get_cache()
+    cache.bypass = bypass_cache or cache.bypass
+    for (input_json_path, output_path, content_hash, _), corrected_json_str, error in engine.map(correct_job, jobs):
+        if error is not None:
+            print(f"Error processing {input_json_path}: {str(error)}")
+            continue
 
         # 保存校对后的 JSON 字符串到文件
         with open(output_path, "w", encoding="utf-8") as f:
             f.write(corrected_json_str)
         print(f"\nSaved JSON to: {output_path}")
 
+        # 每处理完一个文件就写回清单，中断后重跑不会重复调用大模型
+        previous = manifest.get(STAGE_LLM, input_json_path)
+        if previous and previous["artifacts"] != [output_path]:
+            remove_files(previous["artifacts"])
+        manifest.record(STAGE_LLM, input_json_path, content_hash, [output_path])
+        manifest.save()
+
+    print_route_report(route_log)
+    stats = engine.stats()
+    print("\n=== LLM Throughput ===")
+    print(f"Sheets: {stats['sheets']}, failed: {stats['failed']}, retries: {stats['retries']}, "
+          f"{stats['sheets_per_minute']:.1f} sheets/min, throttled {stats['throttled_s']:.1f}s")
+    cache_stats = cache.stats()
+    print(f"Cache: {cache_stats['hits']} hits, {cache_stats['misses']} misses "
+          f"({cache_stats['hit_rate']:.0%}), {cache_stats['entries']} entries, {cache_stats['bytes']} bytes")
+
+    # 清理已删除输入对应的输出
+    for key, entry in manifest.stale(STAGE_LLM, live_inputs, prefix=os.path.join(input_dir, "")).items():
+        remove_files(entry["artifacts"])
+        manifest.forget(STAGE_LLM, key)
+    manifest.save()
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
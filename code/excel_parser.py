@@ -3,17 +3,32 @@ import json
 import pandas as pd
 import openpyxl
 import os
+import posixpath
+import zipfile
+import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Iterator, Tuple
+from openpyxl.utils.cell import range_boundaries
+
+import chunking
+from ingest_manifest import IngestManifest, run_parse_stage
+from table_format import compact_document, dedupe_headers
+
+# xlsx 包内 XML 命名空间
+_NS_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_NS_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_NS_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
 
 class ExcelParser:
     """用于解析 Excel 文件并将其转换为 JSON 格式的类，仅提取表格数据。"""
 
-    def __init__(self, file_path: str, doc_type: str = "excel"):
+    def __init__(self, file_path: str, doc_type: str = "excel", streaming: bool = False):
         """
         初始化 ExcelParser 类。
         :param file_path: Excel 文件路径
         :param doc_type: 文档类型
+        :param streaming: 是否使用只读流式解析（逐行读取，合并单元格通过区间索引展开）
         """
         if not os.path.exists(file_path):
             raise FileNotFoundError(f"Excel file not found: {file_path}")
@@ -21,6 +36,7 @@ class ExcelParser:
         self.file_path = file_path
         self.file_name = os.path.basename(file_path)
         self.doc_type = doc_type
+        self.streaming = streaming
         self.result = {
             "doc_type": self.doc_type,
             "file_name": self.file_name,
@@ -63,12 +79,196 @@ class ExcelParser:
         
         return data
 
-    def parse(self) -> Dict[str, Any]:
+    @staticmethod
+    def _cell_to_str(value: Any) -> str:
+        """
+        将单元格值转换为字符串，与 fill_merged_cells 的转换规则保持一致。
+        :param value: 单元格原始值
+        :return: 字符串值（None 转为空字符串）
+        """
+        if isinstance(value, datetime):
+            return value.isoformat()
+        if value is None:
+            return ""
+        return str(value)
+
+    def read_merged_ranges(self) -> Dict[str, List[Tuple[int, int, int, int]]]:
+        """
+        直接扫描 xlsx 包内的 sheet XML，读取每个 sheet 的合并单元格区域。
+        只读模式下 openpyxl 不提供 merged_cells，这里用 iterparse 流式扫描，不构建单元格对象。
+        :return: {sheet名称: [(min_row, max_row, min_col, max_col), ...]}
+        """
+        merged = {}
+        with zipfile.ZipFile(self.file_path) as archive:
+            workbook_xml = ET.fromstring(archive.read("xl/workbook.xml"))
+            rels_xml = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+            targets = {rel.get("Id"): rel.get("Target") for rel in rels_xml.iter(f"{_NS_PKG_REL}Relationship")}
+
+            for sheet in workbook_xml.iter(f"{_NS_MAIN}sheet"):
+                target = targets.get(sheet.get(f"{_NS_REL}id"))
+                if not target:
+                    continue
+                # Target 可能是相对 xl/ 的路径，也可能是以 / 开头的包内绝对路径
+                if target.startswith("/"):
+                    sheet_path = target.lstrip("/")
+                else:
+                    sheet_path = posixpath.normpath(posixpath.join("xl", target))
+
+                ranges = []
+                with archive.open(sheet_path) as source:
+                    for _, elem in ET.iterparse(source, events=("end",)):
+                        if elem.tag == f"{_NS_MAIN}mergeCell":
+                            min_col, min_row, max_col, max_row = range_boundaries(elem.get("ref"))
+                            ranges.append((min_row, max_row, min_col, max_col))
+                        # 及时释放已解析的节点，保证内存与 sheet 大小无关
+                        elem.clear()
+                merged[sheet.get("name")] = ranges
+        return merged
+
+    def iter_filled_rows(self, worksheet, merged_ranges: List[Tuple[int, int, int, int]]) -> Iterator[List[str]]:
+        """
+        逐行读取只读 worksheet，并按合并区域索引填充合并单元格的值。
+        合并区域按起始行排序，扫描时只维护与当前行相交的区域，无需构建 max_row × max_column 的稠密网格。
+        :param worksheet: openpyxl 只读模式下的 worksheet 对象
+        :param merged_ranges: 该 sheet 的合并区域列表 [(min_row, max_row, min_col, max_col), ...]
+        :return: 每行填充后的字符串列表（生成器）
+        """
+        # sheet XML 中的 dimension 经常不准确（如只写了 A1），先清除后流式扫描一遍计算真实尺寸，
+        # 否则只读模式的 iter_rows 会按错误的尺寸截断行列
+        worksheet.reset_dimensions()
+        worksheet.calculate_dimension(force=True)
+
+        width = worksheet.max_column or 0
+        for _, _, _, max_col in merged_ranges:
+            width = max(width, max_col)
+
+        pending = sorted(merged_ranges)
+        next_range = 0
+        active = []  # [min_row, max_row, min_col, max_col, value]
+
+        for row_idx, row in enumerate(worksheet.iter_rows(values_only=True), 1):
+            values = [self._cell_to_str(value) for value in row]
+            if len(values) < width:
+                values.extend([""] * (width - len(values)))
+
+            while next_range < len(pending) and pending[next_range][0] == row_idx:
+                min_row, max_row, min_col, max_col = pending[next_range]
+                active.append([min_row, max_row, min_col, max_col, ""])
+                next_range += 1
+            while next_range < len(pending) and pending[next_range][0] < row_idx:
+                # 跳过起始行不存在的区域（通常为损坏的合并信息）
+                next_range += 1
+
+            if active:
+                active = [merge for merge in active if merge[1] >= row_idx]
+                for merge in active:
+                    min_row, _, min_col, max_col, _ = merge
+                    if min_row == row_idx:
+                        # 左上角单元格的值在区域第一行出现，缓存后用于填充整个区域
+                        merge[4] = values[min_col - 1]
+                    for col in range(min_col - 1, max_col):
+                        values[col] = merge[4]
+
+            yield values
+
+    def read_sheet_rows(self, worksheet, merged_ranges: List[Tuple[int, int, int, int]]) -> Tuple[List[str], Iterator[Dict[str, str]]]:
+        """
+        流式读取单个只读 worksheet，去除空白行并以第一行为表头。
+        :param worksheet: openpyxl 只读模式下的 worksheet 对象
+        :param merged_ranges: 该 sheet 的合并区域列表
+        :return: (表头列表, 行字典生成器)；空 sheet 返回 (None, None)
+        """
+        filled_rows = (
+            row for row in self.iter_filled_rows(worksheet, merged_ranges)
+            if any(cell != "" for cell in row)
+        )
+
+        # 假设第一行为表头
+        headers = next(filled_rows, None)
+        if headers is None:
+            return None, None
+        new_headers = dedupe_headers(headers)
+
+        rows = (dict(zip(new_headers, row)) for row in filled_rows)
+        return new_headers, rows
+
+    def iter_sheet_rows(self) -> Iterator[Tuple[str, List[str], Iterator[Dict[str, str]]]]:
+        """
+        以只读模式流式遍历所有 sheet，逐行产出去除空白行后的记录。
+        注意：每个 sheet 的行生成器必须在取下一个 sheet 之前消费完毕。
+        :return: (sheet名称, 表头列表, 行字典生成器) 的生成器
+        """
+        merged = self.read_merged_ranges()
+        wb = openpyxl.load_workbook(self.file_path, read_only=True)
+        try:
+            for sheet_name in wb.sheetnames:
+                headers, rows = self.read_sheet_rows(wb[sheet_name], merged.get(sheet_name, []))
+                if headers is None:
+                    continue
+                yield sheet_name, headers, rows
+        finally:
+            wb.close()
+
+    def iter_sheet_chunks(self, target_char_limit: int = 10000, size_unit: str = "chars") -> Iterator[Tuple[str, int, Dict[str, Any]]]:
+        """
+        流式产出每个 sheet 的 table（或 chunk），内存占用上限为一个 chunk。
+        - 整个 sheet 放得进一个 chunk 时产出编号为 0 的完整 table；
+        - 否则按行的真实序列化大小贪心打包，产出编号从 1 开始、带表头和 chunk 元数据的 chunk。
+        :param target_char_limit: 每个 chunk 的大小预算
+        :param size_unit: 大小单位，"chars" 或 "tokens"
+        :return: (sheet名称, chunk编号, table字典) 的生成器
+        """
+        for sheet_name, headers, rows in self.iter_sheet_rows():
+            base = chunking.base_size(self.doc_type, self.file_name, sheet_name, headers, size_unit)
+            chunks = chunking.with_last_flag(
+                chunking.iter_row_chunks(rows, headers, target_char_limit, base, size_unit)
+            )
+            for index, (offset, chunk_rows, last) in enumerate(chunks, 1):
+                if index == 1 and last:
+                    # 整个 sheet 都在第一个 chunk 内，按未分块输出
+                    yield sheet_name, 0, self._build_table(sheet_name, headers, chunk_rows)
+                else:
+                    chunk = {"index": index, "row_offset": offset, "row_count": len(chunk_rows), "last": last}
+                    yield sheet_name, index, self._build_table(sheet_name, headers, chunk_rows, chunk)
+
+    @staticmethod
+    def _build_table(sheet_name: str, headers: List[str], rows: List[Dict[str, str]],
+                     chunk: Dict[str, Any] = None) -> Dict[str, Any]:
+        """
+        由表头和行字典构造 table（含 CSV 文本）。
+        :param sheet_name: sheet 名称
+        :param headers: 表头列表
+        :param rows: 行字典列表
+        :param chunk: chunk 元数据（index、row_offset、row_count、last），为 None 表示未分块
+        :return: table 字典
+        """
+        df = pd.DataFrame(rows, columns=headers)
+        table = {"sheet": sheet_name}
+        if chunk is not None:
+            # 分块时每个 chunk 重复表头，并携带元数据，便于下游按 row_offset 还原
+            table["headers"] = headers
+        table["data"] = df.to_csv(index=False, encoding='utf-8')
+        table["rows"] = rows
+        if chunk is not None:
+            table["chunk"] = chunk
+        return table
+
+    def parse(self, workers: int = 1) -> Dict[str, Any]:
         """
         解析 Excel 文件，提取表格数据，处理合并单元格。
+        :param workers: 并行解析的进程数，大于 1 时各 sheet 分发到进程池解析，结果按原顺序合并
         :return: 解析后的 JSON 数据，仅包含表格
         """
         try:
+            if workers > 1:
+                self.result["tables"] = self._parse_parallel(workers)
+                return self.result
+
+            if self.streaming:
+                for sheet_name, headers, rows in self.iter_sheet_rows():
+                    self.result["tables"].append(self._build_table(sheet_name, headers, list(rows)))
+                return self.result
+
             wb = openpyxl.load_workbook(self.file_path)
 
             for sheet_name in wb.sheetnames:
@@ -85,17 +285,7 @@ class ExcelParser:
                     continue
                 
                 # 假设第一行为表头
-                headers = filled_data[0]
-                header_counts = {}
-                new_headers = []
-                for i, header in enumerate(headers):
-                    header = str(header).strip() if header else f"Column_{i+1}"
-                    if header in header_counts:
-                        header_counts[header] += 1
-                        new_headers.append(f"{header}_{header_counts[header]}")
-                    else:
-                        header_counts[header] = 0
-                        new_headers.append(header)
+                new_headers = dedupe_headers(filled_data[0])
                 
                 df_data = filled_data[1:]
                 df = pd.DataFrame(df_data, columns=new_headers)
@@ -114,11 +304,36 @@ class ExcelParser:
 
         return self.result
 
-    def split_into_chunks_by_rows(self, table: Dict[str, Any], target_char_limit: int = 10000) -> List[Dict[str, Any]]:
+    def _parse_parallel(self, workers: int) -> List[Dict[str, Any]]:
+        """
+        将相互独立的 sheet 分发到进程池解析，按 sheet 原始顺序合并结果。
+        每个工作进程只加载一次只读工作簿，输出与串行路径一致。
+        :param workers: 进程数
+        :return: table 列表
         """
-        将 table 的 rows 均分成多个 chunk，使每个 chunk 的字符数接近 target_char_limit。
+        merged = self.read_merged_ranges()
+        wb = openpyxl.load_workbook(self.file_path, read_only=True)
+        sheet_names = wb.sheetnames
+        wb.close()
+
+        tasks = [(sheet_name, merged.get(sheet_name, [])) for sheet_name in sheet_names]
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(tasks)) or 1,
+            initializer=_init_sheet_worker,
+            initargs=(self.file_path, self.doc_type),
+        ) as executor:
+            # executor.map 按提交顺序返回结果
+            tables = list(executor.map(_parse_sheet_worker, tasks))
+        return [table for table in tables if table is not None]
+
+    def split_into_chunks_by_rows(self, table: Dict[str, Any], target_char_limit: int = 10000,
+                                  size_unit: str = "chars") -> List[Dict[str, Any]]:
+        """
+        单遍扫描 table 的 rows，累加每行真实的序列化大小（字符数或 token 数），贪心打包至预算上限。
+        每个 chunk 重复表头，并带有 chunk 元数据（index、row_offset、row_count、last）。
         :param table: 单个 table 字典，包含 sheet, data, rows
-        :param target_char_limit: 目标字符数限制，默认为 10000
+        :param target_char_limit: 每个 chunk 的大小预算，默认为 10000
+        :param size_unit: 大小单位，"chars" 或 "tokens"
         :return: 分割后的 table 列表
         """
         sheet_name = table["sheet"]
@@ -126,125 +341,146 @@ class ExcelParser:
         if not rows:
             return [table]
 
-        # 估算每行的平均字符数
-        sample_size = min(10, len(rows))  # 采样前 10 行（或全部行如果少于 10 行）
-        sample_rows = rows[:sample_size]
-        avg_row_char_count = 0
-        if sample_rows:
-            sample_json = json.dumps(sample_rows, ensure_ascii=False)
-            avg_row_char_count = len(sample_json) / len(sample_rows)
-
-        # 估算基础 JSON 结构（不含 rows）的字符数
-        base_json = {
-            "doc_type": self.doc_type,
-            "file_name": self.file_name,
-            "tables": [
-                {
-                    "sheet": sheet_name,
-                    "data": "",  # 占位符
-                    "rows": []
-                }
-            ]
-        }
-        base_char_count = len(json.dumps(base_json, ensure_ascii=False))
-
-        # 估算总字符数
-        total_row_char_count = avg_row_char_count * len(rows)
-        total_char_count = base_char_count + total_row_char_count
-
-        # 计算需要的 chunk 数量
-        num_chunks = max(1, int(total_char_count / target_char_limit) + 1)
-        rows_per_chunk = max(1, len(rows) // num_chunks)
-
-        # 调整 rows_per_chunk 使字符数更接近 target_char_limit
-        while True:
-            estimated_char_count = base_char_count + (rows_per_chunk * avg_row_char_count)
-            if estimated_char_count <= target_char_limit or rows_per_chunk <= 1:
-                break
-            num_chunks += 1
-            rows_per_chunk = max(1, len(rows) // num_chunks)
-
-        # 分割 rows
+        headers = table.get("headers") or list(rows[0].keys())
+        base = chunking.base_size(self.doc_type, self.file_name, sheet_name, headers, size_unit)
         chunks = []
-        for i in range(0, len(rows), rows_per_chunk):
-            chunk_rows = rows[i:i + rows_per_chunk]
-            # 重新生成 data (CSV)
-            df = pd.DataFrame(chunk_rows)
-            csv_content = df.to_csv(index=False, encoding='utf-8')
-            chunks.append({
-                "sheet": sheet_name,
-                "data": csv_content,
-                "rows": chunk_rows
-            })
+        for index, (offset, chunk_rows, last) in enumerate(chunking.with_last_flag(
+                chunking.iter_row_chunks(rows, headers, target_char_limit, base, size_unit)), 1):
+            chunk = {"index": index, "row_offset": offset, "row_count": len(chunk_rows), "last": last}
+            chunks.append(self._build_table(sheet_name, headers, chunk_rows, chunk))
 
         return chunks
 
-    def save_sheets_to_files(self, output_dir: str = "output", target_char_limit: int = 10000):
+    def _iter_parsed_chunks(self, target_char_limit: int = 10000,
+                            size_unit: str = "chars") -> Iterator[Tuple[str, int, Dict[str, Any]]]:
         """
-        将每个 sheet 的数据保存为单独的 JSON 文件。
-        - 如果需要分块，文件名为“excel文件名_sheet名称数字_0.json”。
-        - 如果不需要分块，文件名为“excel文件名_sheet名称_0.json”。
-        :param output_dir: 输出目录
-        :param target_char_limit: 目标字符数限制，默认为 60000
+        基于 parse 的结果逐个产出 table（或 chunk），整个 sheet 的 JSON 不超过预算时不分块。
+        :param target_char_limit: 每个 chunk 的大小预算
+        :param size_unit: 大小单位，"chars" 或 "tokens"
+        :return: (sheet名称, chunk编号, table字典) 的生成器，未分块时编号为 0
         """
-        # 确保输出目录存在
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        # 遍历每个 sheet
         for table in self.result["tables"]:
-            sheet_name = table["sheet"]
-            # 构造基础文件名：excel文件名_sheet名称
-            base_name = os.path.splitext(self.file_name)[0]  # 去掉扩展名
-
-            # 检查 JSON 字符数
             sheet_json = {
                 "doc_type": self.doc_type,
                 "file_name": self.file_name,
                 "tables": [table]
             }
             json_str = json.dumps(sheet_json, ensure_ascii=False)
-            char_count = len(json_str)
-
-            if char_count <= target_char_limit:
-                # 如果字符数未超过限制，直接保存
-                output_file_name = f"{base_name}_{sheet_name}_0.json"  # 修改为期望格式
-                output_path = os.path.join(output_dir, output_file_name)
-                with open(output_path, "w", encoding="utf-8") as f:
-                    json.dump(sheet_json, f, ensure_ascii=False, indent=2)
-                print(f"Saved sheet '{sheet_name}' to: {output_path}")
+            if chunking.measure(json_str, size_unit) <= target_char_limit:
+                yield table["sheet"], 0, table
             else:
-                # 如果字符数超过限制，按行数均分保存
-                chunks = self.split_into_chunks_by_rows(table, target_char_limit)
+                # 如果超过限制，按行的真实大小贪心分块
+                chunks = self.split_into_chunks_by_rows(table, target_char_limit, size_unit)
                 for i, chunk in enumerate(chunks, 1):  # 从 1 开始编号
-                    output_file_name = f"{base_name}_{sheet_name}{i}_0.json"
-                    output_path = os.path.join(output_dir, output_file_name)
-                    chunk_json = {
-                        "doc_type": self.doc_type,
-                        "file_name": self.file_name,
-                        "tables": [chunk]
-                    }
-                    with open(output_path, "w", encoding="utf-8") as f:
-                        json.dump(chunk_json, f, ensure_ascii=False, indent=2)
-                    print(f"Saved chunk {i} of sheet '{sheet_name}' to: {output_path}")
+                    yield table["sheet"], i, chunk
+
+    def iter_tables(self, target_char_limit: int = 10000,
+                    size_unit: str = "chars") -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        逐个产出单个 sheet（或 chunk）的 JSON 文档，下游（写文件、入库）可以边解析边消费。
+        - 如果需要分块，文件名为“excel文件名_sheet名称数字_0.json”。
+        - 如果不需要分块，文件名为“excel文件名_sheet名称_0.json”。
+        未调用 parse 时以只读模式流式读取工作簿，内存占用上限为一个 chunk。
+        :param target_char_limit: 每个 chunk 的大小预算
+        :param size_unit: 大小单位，"chars" 或 "tokens"
+        :return: (输出文件名, JSON 文档) 的生成器
+        """
+        if self.result["tables"]:
+            tables = self._iter_parsed_chunks(target_char_limit, size_unit)
+        else:
+            tables = self.iter_sheet_chunks(target_char_limit, size_unit)
+
+        base_name = os.path.splitext(self.file_name)[0]  # 去掉扩展名
+        for sheet_name, chunk_index, table in tables:
+            if chunk_index == 0:
+                output_file_name = f"{base_name}_{sheet_name}_0.json"
+            else:
+                output_file_name = f"{base_name}_{sheet_name}{chunk_index}_0.json"
+            yield output_file_name, {
+                "doc_type": self.doc_type,
+                "file_name": self.file_name,
+                "tables": [table]
+            }
+
+    def save_sheets_to_files(self, output_dir: str = "output", target_char_limit: int = 10000,
+                             size_unit: str = "chars", compact: bool = False):
+        """
+        将每个 sheet（或 chunk）的数据保存为单独的 JSON 文件，文件名规则见 iter_tables。
+        未调用 parse 时直接从工作簿逐块读取并写出，不在内存中保留整个工作簿。
+        :param output_dir: 输出目录
+        :param target_char_limit: 目标字符数限制，默认为 10000
+        :param size_unit: 大小单位，"chars"（字符数）或 "tokens"（模型 token 数）
+        :param compact: 是否以紧凑表格格式（表头数组 + 行值数组）保存
+        :return: 输出文件路径列表
+        """
+        # 确保输出目录存在
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        output_paths = []
+        for output_file_name, sheet_json in self.iter_tables(target_char_limit, size_unit):
+            output_path = os.path.join(output_dir, output_file_name)
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(compact_document(sheet_json) if compact else sheet_json, f, ensure_ascii=False, indent=2)
+
+            table = sheet_json["tables"][0]
+            if "chunk" in table:
+                print(f"Saved chunk {table['chunk']['index']} of sheet '{table['sheet']}' to: {output_path}")
+            else:
+                print(f"Saved sheet '{table['sheet']}' to: {output_path}")
+            output_paths.append(output_path)
+
+        return output_paths
+
+# 进程池工作进程内缓存的解析器与只读工作簿（由 _init_sheet_worker 初始化）
+_worker_parser = None
+_worker_workbook = None
+
+def _init_sheet_worker(file_path: str, doc_type: str):
+    """
+    进程池初始化函数：每个工作进程只打开一次只读工作簿。
+    :param file_path: Excel 文件路径
+    :param doc_type: 文档类型
+    """
+    global _worker_parser, _worker_workbook
+    _worker_parser = ExcelParser(file_path, doc_type, streaming=True)
+    _worker_workbook = openpyxl.load_workbook(file_path, read_only=True)
+
+def _parse_sheet_worker(task: Tuple[str, List[Tuple[int, int, int, int]]]) -> Dict[str, Any]:
+    """
+    在工作进程中解析单个 sheet。
+    :param task: (sheet名称, 合并区域列表)
+    :return: table 字典；空 sheet 返回 None
+    """
+    sheet_name, merged_ranges = task
+    headers, rows = _worker_parser.read_sheet_rows(_worker_workbook[sheet_name], merged_ranges)
+    if headers is None:
+        return None
+    return _worker_parser._build_table(sheet_name, headers, list(rows))
 
 def main():
     try:
         # 1. 使用 ExcelParser 解析 Excel 文件
         file_path = r"C:\Users\dreame\Desktop\电子元件RAG\数据表格纯文字+复杂图片\电子元器件规格归一V02-20240628.xlsx"
         parser = ExcelParser(file_path)
-        parsed_json = parser.parse()
-
-        # 调试：检查解析结果
-        print("=== Debugging Parsed JSON Data ===")
-        print(f"Total sheets: {len(parsed_json['tables'])}")
-        for i, table in enumerate(parsed_json['tables']):
-            print(f"Sheet {i + 1} - Name: {table['sheet']}")
-            print(f"Number of rows: {len(table['rows'])}")
-            print(f"Data length: {len(table['data'])} characters")
-
-        # 2. 将每个 sheet 保存为单独的 JSON 文件
-        parser.save_sheets_to_files(output_dir="output_test")
+        manifest = IngestManifest()
+
+        def parse_and_save():
+            parsed_json = parser.parse()
+
+            # 调试：检查解析结果
+            print("=== Debugging Parsed JSON Data ===")
+            print(f"Total sheets: {len(parsed_json['tables'])}")
+            for i, table in enumerate(parsed_json['tables']):
+                print(f"Sheet {i + 1} - Name: {table['sheet']}")
+                print(f"Number of rows: {len(table['rows'])}")
+                print(f"Data length: {len(table['data'])} characters")
+
+            # 2. 将每个 sheet 保存为单独的 JSON 文件
+            return parser.save_sheets_to_files(output_dir="output_test")
+
+        # 文件内容未变化时跳过解析
+        run_parse_stage(manifest, file_path, parse_and_save)
     except Exception as e:
         print(f"Error: {str(e)}")
 
@@ -0,0 +1,680 @@
+# -*- coding: utf-8 -*-
+import fnmatch
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from types import SimpleNamespace
+from typing import Dict, Any, Iterable, List, Tuple
+
+# 替身数据库中 llm_outputs 与 llm_outputs_deleted 表的结构（与线上 MySQL 表的列一致）；
+# 用触发器模拟 MySQL 的 ON UPDATE CURRENT_TIMESTAMP(6)：只在内容实际变化时更新 updated_at
+LLM_OUTPUTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS llm_outputs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    doc_id TEXT,
+    chunk_id TEXT UNIQUE,
+    file_name TEXT NOT NULL,
+    sheet_name TEXT NOT NULL,
+    json_content TEXT,
+    json_blob BLOB,
+    codec TEXT,
+    meta TEXT,
+    updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now')),
+    UNIQUE (file_name, sheet_name)
+);
+CREATE INDEX IF NOT EXISTS idx_updated_at ON llm_outputs (updated_at, id);
+CREATE TRIGGER IF NOT EXISTS llm_outputs_touch AFTER UPDATE OF doc_id, chunk_id, json_content, json_blob, codec, meta
+ON llm_outputs
+WHEN OLD.doc_id IS NOT NEW.doc_id OR OLD.chunk_id IS NOT NEW.chunk_id OR OLD.json_content IS NOT NEW.json_content
+    OR OLD.json_blob IS NOT NEW.json_blob OR OLD.codec IS NOT NEW.codec OR OLD.meta IS NOT NEW.meta
+BEGIN
+    UPDATE llm_outputs SET updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE id = NEW.id;
+END;
+CREATE TABLE IF NOT EXISTS llm_outputs_deleted (
+    chunk_id TEXT PRIMARY KEY,
+    doc_id TEXT,
+    deleted_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now'))
+);
+CREATE INDEX IF NOT EXISTS idx_deleted_at ON llm_outputs_deleted (deleted_at);
+"""
+
+# MySQL 的 upsert 子句，转换为 SQLite 的 ON CONFLICT DO UPDATE
+_ON_DUPLICATE = re.compile(r"ON\s+DUPLICATE\s+KEY\s+UPDATE", re.IGNORECASE)
+_VALUES_REF = re.compile(r"VALUES\((\w+)\)", re.IGNORECASE)
+
+# 英文/数字词与连续的中文字符（中文按相邻两字切分，近似 ik 分词的召回效果）
+_TOKEN = re.compile(r"[0-9a-z]+|[一-鿿]+")
+
+def analyze(text: str) -> List[str]:
+    """
+    替身 ES 的分词器：英文和数字按词切分并转小写，中文切分为相邻两字（单字保留为一个词）。
+    :param text: 文本
+    :return: 词列表
+    """
+    terms = []
+    for token in _TOKEN.findall(str(text).lower()):
+        if token[0] >= "一" and len(token) > 1:
+            terms.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            terms.append(token)
+    return terms
+
+def _as_list(value: Any) -> List[Any]:
+    """字段值统一为列表（ES 中数组字段的每个元素都参与匹配）。"""
+    return value if isinstance(value, list) else [value]
+
+def _field_value(source: Dict[str, Any], field: str) -> Any:
+    """按字段路径取值，支持对象字段（如 spec.power_w）。"""
+    value = source
+    for part in field.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+class FakeMySQLCursor:
+    """兼容 mysql.connector 游标常用接口的 SQLite 游标：参数占位符 %s 转为 ?，支持 dictionary=True。"""
+
+    def __init__(self, connection: "FakeMySQLConnection", dictionary: bool = False):
+        """
+        初始化 FakeMySQLCursor 类。
+        :param connection: 所属连接
+        :param dictionary: 是否以字典形式返回每行
+        """
+        self.connection = connection
+        self.dictionary = dictionary
+        self._cursor = connection._conn.cursor()
+
+    @staticmethod
+    def _translate(query: str) -> str:
+        query = query.replace("%s", "?").strip().rstrip(";")
+        match = _ON_DUPLICATE.search(query)
+        if match:
+            query = query[:match.start()] + "ON CONFLICT DO UPDATE SET" + _VALUES_REF.sub(r"excluded.\1", query[match.end():])
+        return query
+
+    def _sleep(self):
+        if self.connection.latency:
+            time.sleep(self.connection.latency)
+
+    def execute(self, query: str, params: Iterable[Any] = ()):
+        self._sleep()
+        self._cursor.execute(self._translate(query), tuple(params or ()))
+
+    def executemany(self, query: str, seq_params: Iterable[Iterable[Any]]):
+        self._sleep()
+        self._cursor.executemany(self._translate(query), [tuple(params) for params in seq_params])
+
+    def _row(self, row):
+        if row is None or not self.dictionary:
+            return row
+        return {column[0]: value for column, value in zip(self._cursor.description, row)}
+
+    def fetchone(self):
+        return self._row(self._cursor.fetchone())
+
+    def fetchmany(self, size: int = 1):
+        self._sleep()
+        return [self._row(row) for row in self._cursor.fetchmany(size)]
+
+    def fetchall(self):
+        return [self._row(row) for row in self._cursor.fetchall()]
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    def close(self):
+        self._cursor.close()
+
+class FakeMySQLConnection:
+    """
+    以本地 SQLite 文件模拟 MySQL 连接（兼容 mysql.connector 连接的 cursor/commit/rollback/close/is_connected），
+    每次执行语句和提交前等待 latency 秒以模拟网络往返。多个连接可指向同一个文件。
+    表结构由替身自行创建（manages_schema），支持 ON DUPLICATE KEY UPDATE 形式的 upsert。
+    """
+
+    manages_schema = True
+
+    def __init__(self, path: str, latency: float = 0.0):
+        """
+        初始化 FakeMySQLConnection 类。
+        :param path: SQLite 文件路径
+        :param latency: 每次执行语句的模拟延迟（秒）
+        """
+        self.path = path
+        self.latency = latency
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(LLM_OUTPUTS_SCHEMA)
+        self._conn.commit()
+        self._open = True
+
+    def cursor(self, dictionary: bool = False, buffered: bool = None) -> FakeMySQLCursor:
+        return FakeMySQLCursor(self, dictionary)
+
+    def commit(self):
+        if self.latency:
+            time.sleep(self.latency)
+        self._conn.commit()
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def is_connected(self) -> bool:
+        return self._open
+
+    def close(self):
+        if self._open:
+            self._conn.close()
+            self._open = False
+
+class _FakeIndices:
+    """FakeElasticsearch.indices：索引的创建、删除、存在性检查、刷新、设置、映射 _meta 与别名。"""
+
+    def __init__(self, es: "FakeElasticsearch"):
+        self._es = es
+
+    def exists(self, index: str, **kwargs) -> bool:
+        with self._es._lock:
+            return index in self._es._indices or index in self._es._aliases
+
+    def create(self, index: str, body: Dict[str, Any] = None, **kwargs) -> Dict[str, Any]:
+        self._es._sleep()
+        with self._es._lock:
+            if index in self._es._indices or index in self._es._aliases:
+                raise ValueError(f"index [{index}] already exists")
+            self._es._indices[index] = {"body": body or kwargs, "docs": {}, "postings": {}, "lengths": {}}
+        return {"acknowledged": True, "index": index}
+
+    def delete(self, index: str, **kwargs) -> Dict[str, Any]:
+        self._es._sleep()
+        with self._es._lock:
+            self._es._indices.pop(index, None)
+            for alias, indices in list(self._es._aliases.items()):
+                if index in indices:
+                    indices.remove(index)
+                if not indices:
+                    del self._es._aliases[alias]
+        return {"acknowledged": True}
+
+    def get(self, index: str, **kwargs) -> Dict[str, Any]:
+        """按名称、别名或通配符（如 e_rag_v*）列出索引，通配符无匹配时返回空字典。"""
+        with self._es._lock:
+            names = [name for name in self._es._indices if fnmatch.fnmatchcase(name, index)]
+            if not names:
+                names = list(self._es._aliases.get(index, []))
+            return {name: {"aliases": {alias: {} for alias, indices in self._es._aliases.items() if name in indices},
+                           "mappings": dict(self._es._indices[name]["body"].get("mappings", {})),
+                           "settings": {"index": dict(self._settings(name))}} for name in names}
+
+    def refresh(self, index: str = None, **kwargs) -> Dict[str, Any]:
+        with self._es._lock:
+            self._es.refreshes += 1
+        return {"_shards": {"failed": 0}}
+
+    def _settings(self, index: str) -> Dict[str, Any]:
+        data = self._es._index(index)
+        if "settings" not in data:
+            created = dict((data["body"] or {}).get("settings", {}))
+            data["settings"] = {key: str(value) for key, value in created.items()}
+            data["settings"].setdefault("number_of_replicas", "1")
+        return data["settings"]
+
+    def get_settings(self, index: str, **kwargs) -> Dict[str, Any]:
+        """与 ES 一致：以实际索引名（而非别名）为键，设置值以字符串返回，只包含显式设置过的项。"""
+        with self._es._lock:
+            return {self._es._resolve(index): {"settings": {"index": dict(self._settings(index))}}}
+
+    def get_mapping(self, index: str, **kwargs) -> Dict[str, Any]:
+        with self._es._lock:
+            name = self._es._resolve(index)
+            return {name: {"mappings": dict(self._es._index(name)["body"].get("mappings", {}))}}
+
+    def put_mapping(self, index: str, body: Dict[str, Any] = None, **kwargs) -> Dict[str, Any]:
+        """只支持更新 _meta 与新增字段（与 ES 一致，已有字段的类型不能修改）。"""
+        self._es._sleep()
+        update = dict(body or {}, **kwargs)
+        with self._es._lock:
+            mappings = self._es._index(index)["body"].setdefault("mappings", {})
+            if "_meta" in update:
+                mappings["_meta"] = update["_meta"]
+            for field, spec in update.get("properties", {}).items():
+                mappings.setdefault("properties", {}).setdefault(field, spec)
+        return {"acknowledged": True}
+
+    def exists_alias(self, name: str, **kwargs) -> bool:
+        with self._es._lock:
+            return name in self._es._aliases
+
+    def get_alias(self, name: str = None, index: str = None, **kwargs) -> Dict[str, Any]:
+        with self._es._lock:
+            if name is not None and name not in self._es._aliases:
+                raise KeyError(f"alias [{name}] missing")
+            result = {}
+            for alias, indices in self._es._aliases.items():
+                if name is not None and alias != name:
+                    continue
+                for target in indices:
+                    if index is None or target == index:
+                        result.setdefault(target, {"aliases": {}})["aliases"][alias] = {}
+            return result
+
+    def update_aliases(self, body: Dict[str, Any] = None, actions: List[Dict[str, Any]] = None,
+                       **kwargs) -> Dict[str, Any]:
+        """
+        原子地执行一组别名操作（add/remove/remove_index）：先校验全部操作，再在同一把锁内一次性生效，
+        查询不会看到中间状态。
+        """
+        self._es._sleep()
+        actions = actions if actions is not None else (body or {}).get("actions", [])
+        with self._es._lock:
+            aliases = {alias: list(indices) for alias, indices in self._es._aliases.items()}
+            indices = dict(self._es._indices)
+            for action in actions:
+                kind, spec = next(iter(action.items()))
+                if kind == "remove_index":
+                    if spec["index"] not in indices:
+                        raise KeyError(f"no such index [{spec['index']}]")
+                    indices.pop(spec["index"])
+                    for targets in aliases.values():
+                        if spec["index"] in targets:
+                            targets.remove(spec["index"])
+                elif kind == "add":
+                    if spec["index"] not in indices:
+                        raise KeyError(f"no such index [{spec['index']}]")
+                    targets = aliases.setdefault(spec["alias"], [])
+                    if spec["index"] not in targets:
+                        targets.append(spec["index"])
+                elif kind == "remove":
+                    if spec["index"] not in aliases.get(spec["alias"], []):
+                        raise KeyError(f"alias [{spec['alias']}] missing on [{spec['index']}]")
+                    aliases[spec["alias"]].remove(spec["index"])
+                else:
+                    raise ValueError(f"Unsupported alias action in fake backend: {kind}")
+            for alias in aliases:
+                if alias in indices:
+                    raise ValueError(f"an index exists with the same name as the alias [{alias}]")
+            self._es._aliases = {alias: targets for alias, targets in aliases.items() if targets}
+            self._es._indices = indices
+        return {"acknowledged": True}
+
+    def put_settings(self, index: str, body: Dict[str, Any] = None, settings: Dict[str, Any] = None,
+                     **kwargs) -> Dict[str, Any]:
+        """更新索引设置，值为 None 的项恢复为默认值（即删除）。"""
+        self._es._sleep()
+        update = body if body is not None else settings or {}
+        update = update.get("index", update)
+        with self._es._lock:
+            current = self._settings(index)
+            for key, value in update.items():
+                if value is None:
+                    current.pop(key, None)
+                else:
+                    current[key] = str(value)
+        return {"acknowledged": True}
+
+class FakeElasticsearch:
+    """
+    内存中的 Elasticsearch 替身：支持 get/index/delete/count/search/delete_by_query 与 bulk_actions，以及索引别名
+    （读写别名时解析为其指向的索引，update_aliases 原子切换），text 字段用 analyze 分词后建立倒排索引，match 查询按 BM25 打分。每个请求等待 latency 秒以模拟网络往返。
+    可在多个线程中共用。
+    """
+
+    def __init__(self, latency: float = 0.0, bulk_per_mb: float = 0.0):
+        """
+        初始化 FakeElasticsearch 类。
+        :param latency: 每个请求的模拟延迟（秒）
+        :param bulk_per_mb: bulk 请求每 MB 文档内容增加的延迟（秒），模拟服务端的索引耗时（不占用替身的锁，多个请求可并行）
+        """
+        self.latency = latency
+        self.bulk_per_mb = bulk_per_mb
+        self.indices = _FakeIndices(self)
+        self.requests = 0
+        self.refreshes = 0
+        self._indices = {}
+        self._aliases = {}
+        self._lock = threading.RLock()
+
+    def _sleep(self):
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _resolve(self, index: str) -> str:
+        """将别名解析为实际索引（读写别名时，与 ES 一样要求别名只指向一个索引）。"""
+        targets = self._aliases.get(index)
+        if targets is None:
+            return index
+        if len(targets) != 1:
+            raise ValueError(f"alias [{index}] points to {len(targets)} indices")
+        return targets[0]
+
+    def _index(self, index: str) -> Dict[str, Any]:
+        index = self._resolve(index)
+        if index not in self._indices:
+            raise KeyError(f"no such index [{index}]")
+        return self._indices[index]
+
+    def _remove(self, data: Dict[str, Any], doc_id: str) -> bool:
+        source = data["docs"].pop(doc_id, None)
+        if source is None:
+            return False
+        for field, lengths in data["lengths"].items():
+            if lengths.pop(doc_id, None) is not None:
+                postings = data["postings"][field]
+                for term in set(analyze(source.get(field, ""))):
+                    postings[term].pop(doc_id, None)
+                    if not postings[term]:
+                        del postings[term]
+        return True
+
+    def _put(self, index: str, doc_id: Any, source: Dict[str, Any]):
+        index = self._resolve(index)
+        if index not in self._indices:
+            # 与 ES 一致：写入不存在的索引时自动创建
+            self._indices[index] = {"body": {}, "docs": {}, "postings": {}, "lengths": {}}
+        data = self._indices[index]
+        doc_id = str(doc_id)
+        self._remove(data, doc_id)
+        data["docs"][doc_id] = dict(source)
+        for field, value in source.items():
+            if not isinstance(value, str):
+                continue
+            terms = Counter(analyze(value))
+            postings = data["postings"].setdefault(field, {})
+            for term, tf in terms.items():
+                postings.setdefault(term, {})[doc_id] = tf
+            data["lengths"].setdefault(field, {})[doc_id] = sum(terms.values())
+
+    def index(self, index: str, id: Any = None, document: Dict[str, Any] = None, body: Dict[str, Any] = None,
+              **kwargs) -> Dict[str, Any]:
+        self._sleep()
+        with self._lock:
+            doc_id = str(id if id is not None else len(self._indices.get(index, {}).get("docs", {})))
+            self._put(index, doc_id, document if document is not None else body)
+        return {"_index": index, "_id": doc_id, "result": "created"}
+
+    def get(self, index: str, id: Any, _source: List[str] = None, **kwargs) -> Dict[str, Any]:
+        self._sleep()
+        with self._lock:
+            source = self._index(index)["docs"].get(str(id))
+        if source is None:
+            raise KeyError(f"document [{id}] not found in index [{index}]")
+        if _source:
+            source = {key: source[key] for key in _source if key in source}
+        return {"_index": index, "_id": str(id), "found": True, "_source": source}
+
+    def delete(self, index: str, id: Any, **kwargs) -> Dict[str, Any]:
+        self._sleep()
+        with self._lock:
+            deleted = self._remove(self._index(index), str(id))
+        return {"_index": index, "_id": str(id), "result": "deleted" if deleted else "not_found"}
+
+    def count(self, index: str, **kwargs) -> Dict[str, Any]:
+        self._sleep()
+        with self._lock:
+            return {"count": len(self._index(index)["docs"])}
+
+    def delete_by_query(self, index: str, body: Dict[str, Any] = None, query: Dict[str, Any] = None,
+                        **kwargs) -> Dict[str, Any]:
+        self._sleep()
+        query = query or (body or {}).get("query") or {"match_all": {}}
+        with self._lock:
+            data = self._index(index)
+            doc_ids = [doc_id for doc_id, _ in self._query(data, query)]
+            for doc_id in doc_ids:
+                self._remove(data, doc_id)
+        return {"deleted": len(doc_ids)}
+
+    def _query(self, data: Dict[str, Any], query: Dict[str, Any]) -> List[Tuple[str, float]]:
+        """
+        执行查询，返回按得分降序的 (文档 id, 得分)。支持 match_all、match（BM25）、ids、term、terms、range、
+        constant_score 与 bool（must/filter/should/must_not，filter 与 must_not 不计分）。
+        对 xxx.prefix 子字段的 match 按前缀匹配 xxx 字段的值（近似 edge n-gram 分析器，查询词需已规范化），
+        越接近完整值得分越高。
+        """
+        kind, spec = next(iter(query.items()))
+        if kind == "match_all":
+            return [(doc_id, 1.0) for doc_id in data["docs"]]
+        if kind == "constant_score":
+            return [(doc_id, float(spec.get("boost", 1.0))) for doc_id, _ in self._query(data, spec["filter"])]
+        if kind == "match" and next(iter(spec)).endswith(".prefix"):
+            field, text = next(iter(spec.items()))
+            text = str(text.get("query", "") if isinstance(text, dict) else text)
+            scores = {}
+            for doc_id, source in data["docs"].items():
+                for item in _as_list(_field_value(source, field[:-len(".prefix")])):
+                    if isinstance(item, str) and text and item.startswith(text):
+                        scores[doc_id] = max(scores.get(doc_id, 0.0), len(text) / len(item))
+            return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        if kind == "ids":
+            return [(str(doc_id), 1.0) for doc_id in spec.get("values", []) if str(doc_id) in data["docs"]]
+        if kind in ("term", "terms"):
+            field, value = next(iter(spec.items()))
+            values = value if isinstance(value, list) else [value.get("value") if isinstance(value, dict) else value]
+            return [(doc_id, 1.0) for doc_id, source in data["docs"].items()
+                    if any(item in values for item in _as_list(_field_value(source, field)))]
+        if kind == "range":
+            field, bounds = next(iter(spec.items()))
+            checks = {"gt": lambda a, b: a > b, "gte": lambda a, b: a >= b,
+                      "lt": lambda a, b: a < b, "lte": lambda a, b: a <= b}
+            return [(doc_id, 1.0) for doc_id, source in data["docs"].items()
+                    if any(isinstance(item, (int, float)) and all(checks[op](item, bound) for op, bound in bounds.items()
+                                                                  if op in checks)
+                           for item in _as_list(_field_value(source, field)))]
+        if kind == "bool":
+            return self._bool_query(data, spec)
+        if kind != "match":
+            raise ValueError(f"Unsupported query type in fake backend: {kind}")
+
+        field, text = next(iter(spec.items()))
+        if isinstance(text, dict):
+            text = text.get("query", "")
+        postings = data["postings"].get(field, {})
+        lengths = data["lengths"].get(field, {})
+        if not lengths:
+            return []
+        total = len(lengths)
+        avg_length = sum(lengths.values()) / total
+        k1, b = 1.2, 0.75
+        scores = {}
+        for term in set(analyze(text)):
+            docs = postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (total - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = tf + k1 * (1 - b + b * lengths[doc_id] / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+    def _bool_query(self, data: Dict[str, Any], spec: Dict[str, Any]) -> List[Tuple[str, float]]:
+        def clauses(key):
+            value = spec.get(key) or []
+            return value if isinstance(value, list) else [value]
+
+        candidates = None
+        scores = {}
+        for key in ("must", "filter"):
+            for clause in clauses(key):
+                matches = dict(self._query(data, clause))
+                candidates = set(matches) if candidates is None else candidates & set(matches)
+                if key == "must":
+                    for doc_id, score in matches.items():
+                        scores[doc_id] = scores.get(doc_id, 0.0) + score
+        should = [dict(self._query(data, clause)) for clause in clauses("should")]
+        if should:
+            matched = set().union(*should)
+            minimum = spec.get("minimum_should_match", 0 if candidates is not None else 1)
+            if minimum:
+                matched = {doc_id for doc_id in matched if sum(doc_id in m for m in should) >= int(minimum)}
+                candidates = matched if candidates is None else candidates & matched
+            for matches in should:
+                for doc_id, score in matches.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score
+        if candidates is None:
+            candidates = set(data["docs"])
+        for clause in clauses("must_not"):
+            candidates -= {doc_id for doc_id, _ in self._query(data, clause)}
+        return sorted(((doc_id, scores.get(doc_id, 0.0)) for doc_id in candidates), key=lambda item: item[1],
+                      reverse=True)
+
+    def _knn(self, data: Dict[str, Any], knn: Dict[str, Any]) -> List[Tuple[str, float]]:
+        """
+        暴力计算余弦相似度模拟 ES 的 kNN 检索，得分与 ES 的 cosine 相似度一致：(1 + cos) / 2
+        """
+        query = knn["query_vector"]
+        query_norm = math.sqrt(sum(value * value for value in query)) or 1.0
+        scored = []
+        for doc_id, source in data["docs"].items():
+            vector = _field_value(source, knn["field"])
+            if not vector:
+                continue
+            norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+            cosine = sum(a * b for a, b in zip(query, vector)) / (query_norm * norm)
+            scored.append((doc_id, (1.0 + cosine) / 2))
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:knn.get("k", 10)]
+
+    def search(self, index: str, body: Dict[str, Any] = None, **kwargs) -> Dict[str, Any]:
+        self._sleep()
+        body = dict(body or {}, **kwargs)
+        size = body.get("size", 10)
+        fields = body.get("_source")
+        with self._lock:
+            data = self._index(index)
+            if "knn" in body:
+                matches = self._knn(data, body["knn"])
+            else:
+                matches = self._query(data, body.get("query") or {"match_all": {}})
+            hits = []
+            for doc_id, score in matches[:size]:
+                source = data["docs"][doc_id]
+                if isinstance(fields, list):
+                    source = {key: source[key] for key in fields if key in source}
+                hits.append({"_index": self._resolve(index), "_id": doc_id, "_score": score, "_source": source})
+        return {"hits": {"total": {"value": len(matches), "relation": "eq"}, "hits": hits}}
+
+    def bulk_actions(self, actions: Iterable[Dict[str, Any]], raise_on_error: bool = True,
+                     **kwargs) -> Tuple[int, List[Dict[str, Any]]]:
+        """
+        执行 elasticsearch.helpers.bulk 格式的请求（_op_type 为 index/create/delete），整批只计一次延迟，
+        另按文档内容大小增加 bulk_per_mb 的延迟。
+        :return: (成功数, 错误列表)；raise_on_error=True 且有错误时抛出异常
+        """
+        actions = list(actions)
+        self._sleep()
+        if self.bulk_per_mb:
+            # 文本字段按 UTF-8 字节数计，向量字段按其 JSON 长度计
+            size = sum(len(value.encode("utf-8")) if isinstance(value, str) else len(json.dumps(value))
+                       for action in actions for value in action.get("_source", {}).values()
+                       if isinstance(value, (str, list)))
+            time.sleep(size / 1048576 * self.bulk_per_mb)
+        success = 0
+        errors = []
+        with self._lock:
+            for action in actions:
+                op_type = action.get("_op_type", "index")
+                index, doc_id = action["_index"], action.get("_id")
+                if op_type == "delete":
+                    index = self._resolve(index)
+                    if index in self._indices and self._remove(self._indices[index], str(doc_id)):
+                        success += 1
+                    else:
+                        errors.append({"delete": {"_index": index, "_id": doc_id, "status": 404}})
+                    continue
+                self._put(index, doc_id, action.get("_source", {}))
+                success += 1
+        if errors and raise_on_error:
+            raise Exception(f"{len(errors)} document(s) failed to index: {errors[:3]}")
+        return success, errors
+
+class FakeArk:
+    """
+    Ark（DeepSeek）客户端替身，兼容 chat.completions.create：等待 latency + 每千字符提示词 per_kchar 秒
+    （模拟预填充耗时随上下文增长），返回问题与上下文开头拼成的固定格式回答，并统计调用次数和提示词字符数。
+    """
+
+    def __init__(self, latency: float = 0.5, per_kchar: float = 0.01):
+        """
+        初始化 FakeArk 类。
+        :param latency: 每次调用的固定延迟（秒）
+        :param per_kchar: 每千个提示词字符增加的延迟（秒）
+        """
+        self.latency = latency
+        self.per_kchar = per_kchar
+        self.calls = 0
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _create(self, model: str = None, messages: List[Dict[str, str]] = None, stream: bool = False, **kwargs):
+        prompt = "".join(message.get("content", "") for message in messages or [])
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(prompt)
+        time.sleep(self.latency + len(prompt) / 1000 * self.per_kchar)
+
+        question = prompt.rsplit("问题：", 1)[-1].split("\n\n", 1)[0].strip()
+        context = prompt.split("以下是上下文：", 1)[-1].rsplit("问题：", 1)[0].strip()[:200]
+        content = f"（离线模拟回答）问题：{question}\n参考上下文：{context}"
+        message = SimpleNamespace(role="assistant", content=content)
+        usage = SimpleNamespace(prompt_tokens=len(prompt), completion_tokens=len(content))
+        return SimpleNamespace(choices=[SimpleNamespace(message=message, finish_reason="stop")], usage=usage)
+
+def use_fake_backends(data_dir: str, llm_latency: float = 0.2, llm_fail_rate: float = 0.0, chat_latency: float = 0.5,
+                      search_latency: float = 0.002, mysql_latency: float = 0.0) -> SimpleNamespace:
+    """
+    将整个流水线切换到本地替身：Gemini 校对请求发往本地模拟服务（fake_llm_server），DeepSeek 使用 FakeArk，
+    ES 使用进程内共享的 FakeElasticsearch，MySQL 使用 data_dir 下的 SQLite 文件（每个数据库一个文件），
+    大模型响应缓存也放在 data_dir 下。各替身的延迟可分别设置。
+    :param data_dir: 替身数据（SQLite 文件、响应缓存）目录
+    :param llm_latency: 模拟 Gemini 每个请求的延迟（秒）
+    :param llm_fail_rate: 模拟 Gemini 返回 429 的概率
+    :param chat_latency: 模拟 DeepSeek 每次生成的固定延迟（秒）
+    :param search_latency: 模拟 ES 每个请求的延迟（秒）
+    :param mysql_latency: 模拟 MySQL 每条语句的延迟（秒）
+    :return: 包含 llm_server、es、ark 各替身对象和 close() 的命名空间；用完后调用 close() 恢复真实后端
+    """
+    import excel_llm_main
+    import rag_with_deepseek
+    import save_to_es
+    import save_to_mysql
+    from fake_llm_server import start_fake_server
+    from gemini_client import GeminiClient
+
+    if not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+
+    llm_server, url = start_fake_server(latency=llm_latency, fail_rate=llm_fail_rate)
+    excel_llm_main.configure_engine(client=GeminiClient(api_key="fake", endpoint=url))
+    cache = excel_llm_main.configure_cache(os.path.join(data_dir, "llm_cache.sqlite"))
+
+    es = FakeElasticsearch(latency=search_latency)
+    save_to_es.configure_elastic(lambda hosts: es)
+    save_to_mysql.configure_mysql(lambda database: FakeMySQLConnection(os.path.join(data_dir, f"{database}.sqlite"),
+                                                                       latency=mysql_latency))
+    ark = FakeArk(latency=chat_latency)
+    rag_with_deepseek.configure_client(ark)
+
+    def close():
+        llm_server.shutdown()
+        cache.close()
+        excel_llm_main._engine = None
+        excel_llm_main._cache = None
+        save_to_es.configure_elastic(None)
+        save_to_mysql.configure_mysql(None)
+        rag_with_deepseek.configure_client(None)
+
+    return SimpleNamespace(llm_server=llm_server, llm_url=url, es=es, ark=ark, cache=cache, close=close)
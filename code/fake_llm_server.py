@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    """
+    模拟 Gemini REST 接口（POST /v1beta/models/<模型>:generateContent 及 :streamGenerateContent?alt=sse）：
+    等待固定延迟后原样返回提示词中的 JSON（第一个 “{” 到最后一个 “}”），按概率返回 429 用于测试重试，
+    按概率截断响应用于测试不完整输出的检测与补发。流式接口将延迟平均分摊到各个分片。
+    """
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length).decode("utf-8"))
+
+        with server.lock:
+            server.requests += 1
+        path = self.path.split("?")[0]
+        streaming = path.endswith(":streamGenerateContent")
+        if not streaming and not path.endswith(":generateContent"):
+            self.send_error(404)
+            return
+        if random.random() < server.fail_rate:
+            with server.lock:
+                server.rejected += 1
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.end_headers()
+            return
+
+        prompt = "".join(part.get("text", "") for part in body["contents"][0]["parts"])
+        start, end = prompt.find("{"), prompt.rfind("}")
+        text = prompt[start:end + 1] if start != -1 and end > start else prompt
+        if random.random() < server.truncate_rate:
+            with server.lock:
+                server.truncated += 1
+            text = text[:random.randint(len(text) // 4, len(text) * 3 // 4)]
+
+        if streaming:
+            self._send_stream(text)
+            return
+
+        time.sleep(server.latency)
+        payload = json.dumps({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}]
+        }, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+        with server.lock:
+            server.chars_sent += len(text)
+
+    def _send_stream(self, text: str):
+        """
+        以 SSE 格式分片发送文本，客户端提前断开时停止发送（只统计已发送的字符）。
+        """
+        server = self.server
+        size = server.stream_chunk_chars
+        pieces = [text[i:i + size] for i in range(0, len(text), size)] or [""]
+        delay = server.latency / len(pieces)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        for piece in pieces:
+            time.sleep(delay)
+            event = json.dumps({"candidates": [{"content": {"role": "model", "parts": [{"text": piece}]}}]},
+                               ensure_ascii=False)
+            try:
+                self.wfile.write(f"data: {event}\r\n\r\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                return
+            with server.lock:
+                server.chars_sent += len(piece)
+
+    def log_message(self, format, *args):
+        # 不打印每个请求的访问日志
+        pass
+
+def start_fake_server(port: int = 0, latency: float = 0.2, fail_rate: float = 0.0, truncate_rate: float = 0.0,
+                      stream_chunk_chars: int = 512) -> Tuple[ThreadingHTTPServer, str]:
+    """
+    在后台线程启动模拟服务。
+    :param port: 端口，0 表示随机可用端口
+    :param latency: 每个请求的模拟延迟（秒）
+    :param fail_rate: 返回 429 的概率
+    :param truncate_rate: 响应被截断（输出不完整的 JSON）的概率
+    :param stream_chunk_chars: 流式接口每个分片的字符数
+    :return: (server 对象, 接口地址)；用完后调用 server.shutdown()
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", port), FakeLLMHandler)
+    server.daemon_threads = True
+    server.latency = latency
+    server.fail_rate = fail_rate
+    server.truncate_rate = truncate_rate
+    server.stream_chunk_chars = max(1, stream_chunk_chars)
+    server.requests = 0
+    server.rejected = 0
+    server.truncated = 0
+    server.chars_sent = 0
+    server.lock = threading.Lock()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+def main():
+    # 用法：python fake_llm_server.py --port 8765 --latency 2 --fail-rate 0.1 --truncate-rate 0.1
+    # 然后设置环境变量 GEMINI_API_ENDPOINT=http://127.0.0.1:8765 运行 excel_llm_main.py
+    arg_parser = argparse.ArgumentParser(description="本地模拟 Gemini generateContent 接口")
+    arg_parser.add_argument("--port", type=int, default=8765)
+    arg_parser.add_argument("--latency", type=float, default=0.2)
+    arg_parser.add_argument("--fail-rate", type=float, default=0.0)
+    arg_parser.add_argument("--truncate-rate", type=float, default=0.0)
+    args = arg_parser.parse_args()
+
+    server, url = start_fake_server(args.port, args.latency, args.fail_rate, args.truncate_rate)
+    print(f"Fake LLM server listening on {url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Any, Iterable, Iterator, Tuple
+
+import chunking
+
+# 默认模型，可通过环境变量 GEMINI_MODEL 覆盖
+DEFAULT_MODEL = "models/gemini-2.5-pro-preview-03-25"
+
+class TokenBucket:
+    """线程安全的令牌桶：按每分钟配额匀速补充，容量为一分钟的配额（允许短时突发）。"""
+
+    def __init__(self, per_minute: float):
+        """
+        初始化 TokenBucket 类。
+        :param per_minute: 每分钟配额；小于等于 0 表示不限制
+        """
+        self.per_minute = per_minute
+        self.capacity = per_minute
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount: float = 1.0) -> float:
+        """
+        取出 amount 个令牌，不足时阻塞等待补充。超过桶容量的请求按容量计（否则永远无法满足）。
+        :param amount: 令牌数
+        :return: 等待的秒数
+        """
+        if self.per_minute <= 0:
+            return 0.0
+        amount = min(amount, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.per_minute / 60.0)
+                self.updated = now
+                if self.tokens >= amount:
+                    self.tokens -= amount
+                    return waited
+                wait = (amount - self.tokens) * 60.0 / self.per_minute
+            time.sleep(wait)
+            waited += wait
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0) -> float:
+    """
+    带随机抖动的指数退避（full jitter）：在 [0, min(cap, base * 2^attempt)] 内均匀取值，避免并发请求同时重试。
+    :param attempt: 第几次重试（从 0 开始）
+    :param base: 基础等待秒数
+    :param cap: 等待上限
+    :return: 等待秒数
+    """
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+class GeminiClient:
+    """
+    复用的 Gemini 客户端：只配置一次 API 并缓存模型对象。
+    指定 endpoint（或环境变量 GEMINI_API_ENDPOINT）时直接以 REST 接口（generateContent）请求该地址，
+    可指向本地模拟服务（fake_llm_server.py）进行测试。
+    """
+
+    def __init__(self, api_key: str = None, model_name: str = None, endpoint: str = None, timeout: float = 600.0):
+        """
+        初始化 GeminiClient 类。
+        :param api_key: API 密钥，默认读取环境变量 GEMINI_API_KEY
+        :param model_name: 模型名称，默认读取环境变量 GEMINI_MODEL
+        :param endpoint: REST 接口地址（如 http://127.0.0.1:8765），默认读取环境变量 GEMINI_API_ENDPOINT
+        :param timeout: REST 请求超时秒数
+        """
+        self.api_key = api_key or os.getenv("GEMINI_API_KEY")
+        if not self.api_key:
+            raise ValueError("GEMINI_API_KEY not found in .env file")
+        self.model_name = model_name or os.getenv("GEMINI_MODEL") or DEFAULT_MODEL
+        self.endpoint = (endpoint or os.getenv("GEMINI_API_ENDPOINT") or "").rstrip("/")
+        self.timeout = timeout
+        self._model = None
+
+        if not self.endpoint:
+            import google.generativeai as genai
+
+            # 配置 Gemini API（只配置一次，模型对象在各线程间复用）
+            genai.configure(api_key=self.api_key)
+            self._model = genai.GenerativeModel(self.model_name)
+
+    def generate(self, prompt: str) -> str:
+        """
+        发送提示词并返回模型输出文本。
+        :param prompt: 提示词
+        :return: 输出文本
+        """
+        if self._model is not None:
+            return self._model.generate_content(prompt).text
+
+        model_path = self.model_name if self.model_name.startswith("models/") else f"models/{self.model_name}"
+        url = f"{self.endpoint}/v1beta/{model_path}:generateContent?key={self.api_key}"
+        body = json.dumps({"contents": [{"role": "user", "parts": [{"text": prompt}]}]}).encode("utf-8")
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            result = json.loads(response.read().decode("utf-8"))
+        return "".join(part.get("text", "") for part in result["candidates"][0]["content"]["parts"])
+
+    def generate_stream(self, prompt: str) -> Iterator[str]:
+        """
+        以流式方式发送提示词，逐个产出模型输出的文本分片；调用方提前停止迭代时关闭连接，不再接收剩余输出。
+        :param prompt: 提示词
+        :return: 文本分片生成器
+        """
+        if self._model is not None:
+            for chunk in self._model.generate_content(prompt, stream=True):
+                yield chunk.text
+            return
+
+        model_path = self.model_name if self.model_name.startswith("models/") else f"models/{self.model_name}"
+        url = f"{self.endpoint}/v1beta/{model_path}:streamGenerateContent?alt=sse&key={self.api_key}"
+        body = json.dumps({"contents": [{"role": "user", "parts": [{"text": prompt}]}]}).encode("utf-8")
+        request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            for line in response:
+                line = line.decode("utf-8").strip()
+                if not line.startswith("data:"):
+                    continue
+                event = json.loads(line[len("data:"):])
+                for candidate in event.get("candidates", [])[:1]:
+                    yield "".join(part.get("text", "") for part in candidate.get("content", {}).get("parts", []))
+
+class CorrectionEngine:
+    """
+    并发、限流的大模型调用引擎：共享的信号量限制同时进行的请求数（无论从多少个线程调用），RPM/TPM 令牌桶控制
+    请求速率和 token 速率，失败时按带抖动的指数退避重试，并统计吞吐量。
+    """
+
+    def __init__(self, client: GeminiClient = None, concurrency: int = 4, rpm: float = 0, tpm: float = 0,
+                 retries: int = 5, backoff_base: float = 2.0, backoff_cap: float = 60.0):
+        """
+        初始化 CorrectionEngine 类。
+        :param client: GeminiClient 对象，默认按环境变量创建
+        :param concurrency: 最大并发请求数
+        :param rpm: 每分钟请求数上限，0 表示不限制
+        :param tpm: 每分钟 token 数上限（输入 + 预估输出），0 表示不限制
+        :param retries: 最大尝试次数
+        :param backoff_base: 退避基础秒数
+        :param backoff_cap: 单次退避上限秒数
+        """
+        self.client = client or GeminiClient()
+        self.concurrency = max(1, concurrency)
+        self.request_bucket = TokenBucket(rpm)
+        self.token_bucket = TokenBucket(tpm)
+        self.retries = max(1, retries)
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self._lock = threading.Lock()
+        # 所有调用方共用的请求槽位：map 嵌套调用或多个流水线线程同时调用时，进行中的请求数仍不超过 concurrency
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self.started = None
+        self.finished = None
+        self.sheets = 0
+        self.failed = 0
+        self.retried = 0
+        self.tokens = 0
+        self.throttled_seconds = 0.0
+
+    def generate(self, prompt: str, retries: int = None) -> str:
+        """
+        限流并带重试地调用模型（可在多个线程中同时调用）。
+        :param prompt: 提示词
+        :param retries: 最大尝试次数，默认使用引擎的设置
+        :return: 输出文本
+        """
+        retries = retries or self.retries
+        # 输出为校对后的 JSON，长度与输入相当，按输入 token 数的两倍预估
+        tokens = chunking.count_tokens(prompt) * 2
+        with self._lock:
+            if self.started is None:
+                self.started = time.perf_counter()
+
+        for attempt in range(retries):
+            throttled = self.request_bucket.acquire(1) + self.token_bucket.acquire(tokens)
+            try:
+                with self._slots:
+                    text = self.client.generate(prompt)
+                with self._lock:
+                    self.sheets += 1
+                    self.tokens += tokens
+                    self.throttled_seconds += throttled
+                    self.finished = time.perf_counter()
+                return text
+            except Exception as e:
+                if attempt == retries - 1:
+                    with self._lock:
+                        self.failed += 1
+                        self.finished = time.perf_counter()
+                    raise Exception(f"Error calling Gemini API after {retries} attempts: {str(e)}")
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                if isinstance(e, urllib.error.HTTPError) and e.headers.get("Retry-After", "").isdigit():
+                    # 服务端给出了重试等待时间（如 429），至少等待该时长
+                    delay = max(delay, float(e.headers["Retry-After"]))
+                with self._lock:
+                    self.retried += 1
+                print(f"Attempt {attempt + 1} failed, retrying in {delay:.1f}s... Error: {str(e)}")
+                time.sleep(delay)
+
+    def stream(self, prompt: str, retries: int = None) -> Iterator[str]:
+        """
+        限流并流式调用模型，逐个产出文本分片。建立连接、收到第一个分片之前的失败按 generate 的规则退避重试；
+        之后的中断（连接断开等）直接抛给调用方，由调用方根据已收到的内容决定如何补发。
+        :param prompt: 提示词
+        :param retries: 最大尝试次数，默认使用引擎的设置
+        :return: 文本分片生成器
+        """
+        retries = retries or self.retries
+        tokens = chunking.count_tokens(prompt) * 2
+        with self._lock:
+            if self.started is None:
+                self.started = time.perf_counter()
+
+        for attempt in range(retries):
+            throttled = self.request_bucket.acquire(1) + self.token_bucket.acquire(tokens)
+            # 槽位一直占用到流读完或关闭为止；退避等待期间释放
+            self._slots.acquire()
+            try:
+                pieces = self.client.generate_stream(prompt)
+                first = next(pieces, "")
+                break
+            except Exception as e:
+                self._slots.release()
+                if attempt == retries - 1:
+                    with self._lock:
+                        self.failed += 1
+                        self.finished = time.perf_counter()
+                    raise Exception(f"Error calling Gemini API after {retries} attempts: {str(e)}")
+                delay = backoff_delay(attempt, self.backoff_base, self.backoff_cap)
+                if isinstance(e, urllib.error.HTTPError) and e.headers.get("Retry-After", "").isdigit():
+                    delay = max(delay, float(e.headers["Retry-After"]))
+                with self._lock:
+                    self.retried += 1
+                print(f"Attempt {attempt + 1} failed, retrying in {delay:.1f}s... Error: {str(e)}")
+                time.sleep(delay)
+
+        try:
+            yield first
+            yield from pieces
+        finally:
+            pieces.close()
+            self._slots.release()
+            with self._lock:
+                self.sheets += 1
+                self.tokens += tokens
+                self.throttled_seconds += throttled
+                self.finished = time.perf_counter()
+
+    def map(self, func: Callable[[Any], Any], items: Iterable[Any]) -> Iterator[Tuple[Any, Any, Exception]]:
+        """
+        以 concurrency 个线程并发处理 items，按完成顺序产出结果。func 内部应调用 self.generate。
+        map 可以嵌套调用（如超大 sheet 的各批次在外层任务中并发校对），进行中的请求数由共享的槽位限制，
+        等待内层结果的外层线程不占用槽位。
+        :param func: 处理单个任务的函数
+        :param items: 任务列表
+        :return: (任务, 结果, 异常) 的生成器，成功时异常为 None，失败时结果为 None
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            futures = {executor.submit(func, item): item for item in items}
+            for future in as_completed(futures):
+                item = futures[future]
+                try:
+                    yield item, future.result(), None
+                except Exception as e:
+                    yield item, None, e
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        返回吞吐量统计。
+        :return: {"sheets", "failed", "retries", "tokens", "elapsed_s", "sheets_per_minute", "throttled_s"}
+        """
+        with self._lock:
+            elapsed = (self.finished - self.started) if self.started and self.finished else 0.0
+            return {
+                "sheets": self.sheets,
+                "failed": self.failed,
+                "retries": self.retried,
+                "tokens": self.tokens,
+                "elapsed_s": elapsed,
+                "sheets_per_minute": self.sheets * 60.0 / elapsed if elapsed else 0.0,
+                "throttled_s": self.throttled_seconds,
+            }
@@ -0,0 +1,389 @@
+# -*- coding: utf-8 -*-
+import argparse
+import json
+import os
+import threading
+from typing import Dict, Any, List, Iterable, Iterator
+
+from content_codec import encode_content
+from excel_llm_main import correct_document, build_output_file_name, get_cache, print_route_report
+from excel_parser import ExcelParser
+from ingest_manifest import IngestManifest, STAGE_INGEST
+from pipeline import Stage, Pipeline
+from pptx_parser import PPTParser
+from save_to_es import Elastic, bulk, GRANULARITY_SHEET, VECTOR_STORE_ES
+from save_to_mysql import (ConnectionPool, connect_to_mysql, write_rows, delete_rows, delete_document,
+                           extract_info_from_json, make_doc_id)
+from table_normalizer import MESSINESS_THRESHOLD
+from word_parser import WordParser
+
+# 按扩展名分发到对应的解析器
+PARSERS = {
+    ".xlsx": ExcelParser,
+    ".xlsm": ExcelParser,
+    ".pptx": PPTParser,
+    ".docx": WordParser,
+}
+
+def iter_source_files(paths: Iterable[str]) -> Iterator[str]:
+    """
+    遍历输入路径（文件或目录，目录递归），产出支持的源文件路径，忽略 Office 临时文件（~$ 开头）。
+    :param paths: 文件或目录路径列表
+    :return: 源文件路径生成器
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for file_name in sorted(files):
+                    if os.path.splitext(file_name)[1].lower() in PARSERS and not file_name.startswith("~$"):
+                        yield os.path.join(root, file_name)
+        elif os.path.splitext(path)[1].lower() in PARSERS:
+            yield path
+        else:
+            print(f"Unsupported file type, skipping: {path}")
+
+def iter_units(file_path: str, target_char_limit: int = 10000, size_unit: str = "chars") -> Iterator[tuple]:
+    """
+    按扩展名选择解析器，逐个产出源文件的处理单元（Excel sheet/chunk、PPT 页表格、Word 分段）。
+    :param file_path: 源文件路径
+    :param target_char_limit: Excel 每个 chunk 的大小预算
+    :param size_unit: 大小单位，"chars" 或 "tokens"
+    :return: (文件名, JSON 文档) 的生成器
+    """
+    parser = PARSERS[os.path.splitext(file_path)[1].lower()](file_path)
+    if isinstance(parser, ExcelParser):
+        return parser.iter_tables(target_char_limit, size_unit)
+    if isinstance(parser, PPTParser):
+        return parser.iter_tables()
+    return parser.iter_sections()
+
+class SourceTracker:
+    """跟踪每个源文件的处理进度：全部单元写入 ES 后清理过期的 MySQL 记录和 ES 文档，并记录到增量导入清单。"""
+
+    def __init__(self, manifest: IngestManifest, es: Elastic, index_name: str):
+        """
+        初始化 SourceTracker 类。
+        :param manifest: 增量导入清单
+        :param es: Elastic 对象（用于删除过期文档）
+        :param index_name: ES 索引名称
+        """
+        self.manifest = manifest
+        self.es = es
+        self.index_name = index_name
+        self.sources = {}
+        self.processed = 0
+        self._lock = threading.Lock()
+
+    def begin(self, key: str, content_hash: str) -> bool:
+        """
+        登记源文件；内容未变化时返回 False（可跳过）。
+        """
+        with self._lock:
+            if self.manifest.is_current(STAGE_INGEST, key, content_hash):
+                return False
+            previous = self.manifest.get(STAGE_INGEST, key)
+            artifacts = previous["artifacts"] if previous else {"mysql": [], "es": []}
+            self.sources[key] = {
+                "hash": content_hash,
+                "expected": None,
+                "mysql": [],
+                "es": [],
+                "previous_mysql": [tuple(item) for item in artifacts["mysql"]],
+                "previous_es": artifacts["es"],
+            }
+            return True
+
+    def parsed(self, key: str, unit_count: int):
+        """
+        源文件解析完成，登记单元总数。
+        """
+        with self._lock:
+            self.sources[key]["expected"] = unit_count
+        self._maybe_finish(key)
+
+    def indexed(self, key: str, file_name: str, sheet_name: str, chunk_id: str):
+        """
+        一个单元已写入 MySQL 和 ES。
+        """
+        with self._lock:
+            source = self.sources[key]
+            source["mysql"].append((file_name, sheet_name))
+            source["es"].append(chunk_id)
+        self._maybe_finish(key)
+
+    def _maybe_finish(self, key: str):
+        """
+        源文件的全部单元处理完毕时，删除上次导入产生、本次不再产生的记录和文档，并写回清单。
+        有单元失败时不会完成，下次运行会重新处理该源文件。
+        """
+        with self._lock:
+            source = self.sources.get(key)
+            if source is None or source["expected"] is None or len(source["es"]) < source["expected"]:
+                return
+            del self.sources[key]
+
+        stale_rows = set(source["previous_mysql"]) - set(source["mysql"])
+        stale_ids = set(source["previous_es"]) - set(source["es"])
+        remove_outputs(stale_rows, stale_ids, self.es, self.index_name)
+
+        with self._lock:
+            self.manifest.record(STAGE_INGEST, key, source["hash"], {
+                "mysql": [list(item) for item in source["mysql"]],
+                "es": source["es"],
+            })
+            self.manifest.save()
+            self.processed += 1
+        print(f"Finished ingesting: {key} ({len(source['es'])} units)")
+
+def remove_outputs(rows: Iterable[tuple], doc_ids: Iterable[Any], es: Elastic, index_name: str):
+    """
+    删除过期的 MySQL 记录和 ES 文档。
+    :param rows: (file_name, sheet_name) 列表
+    :param doc_ids: sheet/chunk 的 chunk_id 列表（行粒度索引中删除其全部行文档）
+    :param es: Elastic 对象
+    :param index_name: ES 索引名称
+    """
+    rows = list(rows)
+    doc_ids = list(doc_ids)
+    if rows:
+        connection = connect_to_mysql()
+        try:
+            delete_rows(connection, rows)
+        finally:
+            connection.close()
+    if doc_ids:
+        es.delete_chunks(index_name, doc_ids)
+        print(f"Deleted {len(doc_ids)} stale documents from index '{index_name}'.")
+
+def remove_document(file_name: str, es: Elastic, index_name: str, manifest: IngestManifest = None) -> int:
+    """
+    按确定性的 doc_id 删除一个文件在 MySQL 和 ES 中的全部单元（无需清空后全量重载）。
+    :param file_name: 文件名（如 xxx.xlsx，与 llm_outputs.file_name 一致）
+    :param es: Elastic 对象
+    :param index_name: ES 索引名称
+    :param manifest: 增量导入清单；同时移除该文件的记录，下次导入时重新处理
+    :return: 删除的 MySQL 记录数
+    """
+    doc_id = make_doc_id(file_name)
+    connection = connect_to_mysql()
+    try:
+        deleted = delete_document(connection, doc_id)
+    finally:
+        connection.close()
+    es.delete_document(index_name, doc_id)
+    if manifest is not None:
+        for key, entry in list(manifest.stages.get(STAGE_INGEST, {}).items()):
+            if any(item[0] == file_name for item in entry["artifacts"]["mysql"]):
+                manifest.forget(STAGE_INGEST, key)
+        manifest.save()
+    return deleted
+
+def run_ingest(paths: List[str], index_name: str = "e_rag", manifest: IngestManifest = None,
+               parse_workers: int = 2, llm_workers: int = 4, mysql_workers: int = 2, es_workers: int = 1,
+               mysql_batch_size: int = 64, es_batch_size: int = 64, queue_size: int = 16, use_llm: bool = True, compact: bool = False,
+               llm_output_dir: str = None, target_char_limit: int = 10000, size_unit: str = "chars",
+               llm_threshold: float = MESSINESS_THRESHOLD, granularity: str = GRANULARITY_SHEET,
+               dense_vectors: bool = False, vector_store: str = VECTOR_STORE_ES) -> Dict[str, Any]:
+    """
+    一体化导入：解析 → 大模型校对 → 写入 MySQL → 写入 ES 四个阶段并发运行，阶段之间以有界队列连接。
+    每个阶段有独立的并发度，队列满时上游阻塞（背压），总耗时接近最慢的阶段而不是各阶段之和。
+    内容未变化的源文件跳过；变化的源文件重写其记录并删除不再产生的记录；已删除的源文件清理其记录和文档。
+    :param paths: 源文件或目录列表
+    :param index_name: ES 索引名称
+    :param manifest: 增量导入清单
+    :param parse_workers: 解析阶段线程数
+    :param llm_workers: 大模型校对阶段线程数（Gemini 请求以等待网络为主）
+    :param mysql_workers: MySQL 写入阶段线程数（共用一个同样大小的连接池）
+    :param mysql_batch_size: 每个 MySQL 事务最多写入的记录数
+    :param es_workers: ES 写入阶段线程数
+    :param es_batch_size: 每次 bulk 请求的最大文档数
+    :param queue_size: 每个阶段输入队列的容量
+    :param use_llm: 是否调用大模型校对 Excel 单元（PPT、Word 单元不经过大模型）
+    :param compact: 是否以紧凑表格格式发送给大模型并写入 ES
+    :param llm_output_dir: 若指定，同时将校对结果写入该目录（与分步脚本的输出文件一致，便于排查）
+    :param target_char_limit: Excel 每个 chunk 的大小预算
+    :param size_unit: 大小单位，"chars" 或 "tokens"
+    :param llm_threshold: 杂乱度阈值，本地规整后仍达到该值的 Excel 单元才交给大模型，0 表示全部交给大模型
+    :param granularity: 新建索引的粒度，"sheet" 或 "rows"（每个表格行一个文档）；已有索引沿用其粒度
+    :param dense_vectors: 新建索引是否带向量字段（用于 BM25 + kNN 混合检索）；已有索引沿用其映射
+    :param vector_store: 向量存放位置，"es" 或 "local"（本地向量索引，用于不支持 kNN 的 ES）
+    :return: {"wall_s": 总耗时, "sources": 完成的源文件数, "stages": 各阶段统计, "routes": 各 Excel 单元的处理路径}
+    """
+    if manifest is None:
+        manifest = IngestManifest()
+    if llm_output_dir and not os.path.exists(llm_output_dir):
+        os.makedirs(llm_output_dir)
+
+    es = Elastic()
+    print(es.create_label_index(index_name, granularity=granularity, dense_vectors=dense_vectors,
+                                vector_store=vector_store))
+    tracker = SourceTracker(manifest, es, index_name)
+    pool = ConnectionPool(size=mysql_workers)
+    route_log = []
+
+    source_files = list(iter_source_files(paths))
+    live_keys = [os.path.normpath(file_path) for file_path in source_files]
+
+    def parse_stage(file_path, _):
+        key = os.path.normpath(file_path)
+        if not tracker.begin(key, IngestManifest.hash_file(file_path)):
+            print(f"Unchanged since last run, skipping: {file_path}")
+            return
+        count = 0
+        for name, document in iter_units(file_path, target_char_limit, size_unit):
+            count += 1
+            yield {"source": key, "name": name, "document": document}
+        tracker.parsed(key, count)
+
+    def llm_stage(unit, _):
+        document = unit["document"]
+        if document.get("doc_type") == "excel":
+            output_file_name = build_output_file_name(unit["name"], document)
+            if use_llm:
+                json_str = correct_document(document, compact, route_log, llm_threshold)
+            else:
+                json_str = json.dumps(document, ensure_ascii=False, indent=2)
+        else:
+            output_file_name = unit["name"]
+            json_str = json.dumps(document, ensure_ascii=False, indent=2)
+
+        if llm_output_dir:
+            with open(os.path.join(llm_output_dir, output_file_name), "w", encoding="utf-8") as f:
+                f.write(json_str)
+
+        file_name, sheet_name = extract_info_from_json(json_str, output_file_name)
+        yield {"source": unit["source"], "file_name": file_name, "sheet_name": sheet_name, "json_str": json_str}
+
+    def mysql_stage(units, _):
+        # 按 (file_name, sheet_name) upsert：源文件内容变化时直接覆盖原记录；doc_id、chunk_id 由文件名和 sheet 名确定
+        # 内容只在这里校验、规范化和压缩一次，ES 阶段直接使用规范化后的文本
+        rows = [(make_doc_id(unit["file_name"]), unit["file_name"], unit["sheet_name"], encode_content(unit["json_str"]))
+                for unit in units]
+        with pool.connection() as connection:
+            chunk_ids = write_rows(connection, rows)
+        for unit, row, chunk_id in zip(units, rows, chunk_ids):
+            unit["doc_id"] = row[0]
+            unit["chunk_id"] = chunk_id
+            unit["json_str"] = row[3]["text"]
+            unit["codec"] = row[3]["codec"]
+            yield unit
+
+    def es_stage(units, _):
+        requests = []
+        row_counts = {}  # 行粒度索引中每个 chunk 的行文档数，用于删除重新导入后多出来的旧行文档
+        for unit in units:
+            unit_requests = es.build_requests(index_name, {
+                "doc_id": unit["doc_id"],
+                "chunk_id": unit["chunk_id"],
+                "file_name": unit["file_name"],
+                "sheet_name": unit["sheet_name"],
+                "json_content": unit["json_str"],
+                "codec": unit["codec"],
+            }, compact)
+            row_counts[unit["chunk_id"]] = len(unit_requests)
+            requests.extend(unit_requests)
+        bulk(es.client, es.with_embeddings(index_name, requests))
+        es.prune_rows(index_name, row_counts)
+        for unit in units:
+            tracker.indexed(unit["source"], unit["file_name"], unit["sheet_name"], unit["chunk_id"])
+            yield unit
+
+    pipeline = Pipeline([
+        Stage("parse", parse_stage, workers=parse_workers, queue_size=queue_size),
+        Stage("llm", llm_stage, workers=llm_workers, queue_size=queue_size),
+        Stage("mysql", mysql_stage, workers=mysql_workers, batch_size=mysql_batch_size, queue_size=queue_size),
+        Stage("es", es_stage, workers=es_workers, batch_size=es_batch_size, queue_size=queue_size),
+    ])
+    try:
+        stages = pipeline.run(source_files)
+    finally:
+        pool.close()
+
+    # 清理已删除源文件对应的记录和文档（只检查本次扫描的目录）
+    for path in paths:
+        if not os.path.isdir(path):
+            continue
+        for key, entry in manifest.stale(STAGE_INGEST, live_keys, prefix=os.path.join(os.path.normpath(path), "")).items():
+            remove_outputs([tuple(item) for item in entry["artifacts"]["mysql"]], entry["artifacts"]["es"], es, index_name)
+            manifest.forget(STAGE_INGEST, key)
+    manifest.save()
+
+    return {"wall_s": pipeline.wall_seconds, "sources": tracker.processed, "stages": stages, "routes": route_log}
+
+def main():
+    # 用法：python ingest.py 文件或目录 [...] [--llm-workers 8 ...]
+    arg_parser = argparse.ArgumentParser(description="Excel/PPT/Word 一体化导入（解析 → 大模型校对 → MySQL → ES）")
+    arg_parser.add_argument("paths", nargs="*", help="源文件或目录")
+    arg_parser.add_argument("--remove", nargs="+", default=[], metavar="FILE_NAME",
+                            help="从 MySQL 和 ES 中删除这些文件（如 xxx.xlsx）的全部单元")
+    arg_parser.add_argument("--index", default="e_rag", help="ES 索引名称")
+    arg_parser.add_argument("--parse-workers", type=int, default=2)
+    arg_parser.add_argument("--llm-workers", type=int, default=4)
+    arg_parser.add_argument("--mysql-workers", type=int, default=2)
+    arg_parser.add_argument("--es-workers", type=int, default=1)
+    arg_parser.add_argument("--mysql-batch-size", type=int, default=64)
+    arg_parser.add_argument("--es-batch-size", type=int, default=64)
+    arg_parser.add_argument("--queue-size", type=int, default=16)
+    arg_parser.add_argument("--no-llm", action="store_true", help="跳过大模型校对")
+    arg_parser.add_argument("--compact", action="store_true", help="使用紧凑表格格式")
+    arg_parser.add_argument("--llm-output-dir", default=None, help="同时将校对结果写入该目录")
+    arg_parser.add_argument("--llm-threshold", type=float, default=MESSINESS_THRESHOLD,
+                            help="杂乱度阈值，本地规整后仍达到该值的 sheet 才交给大模型（0 表示全部交给大模型）")
+    arg_parser.add_argument("--llm-cache-bypass", action="store_true", help="绕过大模型响应缓存，强制重新请求")
+    arg_parser.add_argument("--granularity", choices=["sheet", "rows"], default=GRANULARITY_SHEET,
+                            help="新建索引的粒度：每个 sheet 一个文档，或每个表格行一个文档（已有索引沿用其粒度）")
+    arg_parser.add_argument("--dense-vectors", action="store_true",
+                            help="新建索引时加入向量字段，检索时 BM25 与 kNN 结果融合（已有索引沿用其映射）")
+    arg_parser.add_argument("--vector-store", choices=["es", "local"], default=VECTOR_STORE_ES,
+                            help="向量存入 ES 的 dense_vector 字段，或本地向量索引（VECTOR_INDEX_DIR，用于不支持 kNN 的 ES）")
+    arg_parser.add_argument("--manifest", default="ingest_manifest.json", help="增量导入清单路径")
+    arg_parser.add_argument("--fake-backends", default=None, metavar="DIR",
+                            help="使用本地替身代替 Gemini/MySQL/ES（数据保存在该目录），用于离线测试和压测")
+    arg_parser.add_argument("--fake-llm-latency", type=float, default=0.2, help="替身 Gemini 每个请求的延迟（秒）")
+    args = arg_parser.parse_args()
+
+    if args.fake_backends:
+        from fake_backends import use_fake_backends
+        use_fake_backends(args.fake_backends, llm_latency=args.fake_llm_latency)
+
+    if args.remove:
+        es = Elastic()
+        manifest = IngestManifest(args.manifest)
+        for file_name in args.remove:
+            remove_document(file_name, es, args.index, manifest)
+    if not args.paths:
+        return
+
+    if args.llm_cache_bypass:
+        get_cache().bypass = True
+
+    report = run_ingest(
+        args.paths,
+        index_name=args.index,
+        manifest=IngestManifest(args.manifest),
+        parse_workers=args.parse_workers,
+        llm_workers=args.llm_workers,
+        mysql_workers=args.mysql_workers,
+        es_workers=args.es_workers,
+        mysql_batch_size=args.mysql_batch_size,
+        es_batch_size=args.es_batch_size,
+        queue_size=args.queue_size,
+        use_llm=not args.no_llm,
+        compact=args.compact,
+        llm_output_dir=args.llm_output_dir,
+        llm_threshold=args.llm_threshold,
+        granularity=args.granularity,
+        dense_vectors=args.dense_vectors,
+        vector_store=args.vector_store,
+    )
+
+    if report["routes"]:
+        print_route_report(report["routes"])
+    print("\n=== Ingest Report ===")
+    print(f"Sources ingested: {report['sources']}, wall time: {report['wall_s']:.1f}s")
+    for stage in report["stages"]:
+        print(f"{stage['stage']}: workers={stage['workers']} in={stage['items_in']} out={stage['items_out']} "
+              f"failures={stage['failures']} busy={stage['busy_s']:.1f}s")
+
+if __name__ == "__main__":
+    main()
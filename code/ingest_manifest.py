@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+from typing import Dict, Any, List, Iterable, Optional, Callable
+
+# 流水线各阶段名称
+STAGE_PARSE = "parse"   # 源文件 -> 解析后的 JSON 文件
+STAGE_LLM = "llm"       # 解析后的 JSON 文件 -> 大模型校对后的 JSON 文件
+STAGE_MYSQL = "mysql"   # 校对后的 JSON 文件 -> llm_outputs 记录
+STAGE_ES = "es"         # llm_outputs 记录 -> ES 文档
+STAGE_INGEST = "ingest" # 源文件 -> 流水线写入的 MySQL 记录与 ES 文档（ingest.py）
+
+class IngestManifest:
+    """持久化的增量导入清单：记录每个处理单元（源文件、sheet/chunk 文件、数据库记录）的内容哈希及各阶段产物。"""
+
+    VERSION = 1
+
+    def __init__(self, path: str = "ingest_manifest.json"):
+        """
+        初始化 IngestManifest 类，若清单文件已存在则加载。
+        :param path: 清单文件路径
+        """
+        self.path = path
+        self.stages = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("version") == self.VERSION:
+                self.stages = data.get("stages", {})
+
+    @staticmethod
+    def hash_file(file_path: str, block_size: int = 1 << 20) -> str:
+        """
+        分块计算文件内容的 SHA-256。
+        :param file_path: 文件路径
+        :param block_size: 每次读取的字节数
+        :return: 十六进制哈希
+        """
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for block in iter(lambda: f.read(block_size), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    @staticmethod
+    def hash_text(text: str) -> str:
+        """
+        计算文本的 SHA-256。
+        :param text: 文本
+        :return: 十六进制哈希
+        """
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def hash_json(data: Any) -> str:
+        """
+        计算 JSON 数据规范化（键排序、紧凑格式）后的 SHA-256，与缩进、键顺序无关。
+        :param data: JSON 数据
+        :return: 十六进制哈希
+        """
+        canonical = json.dumps(data, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        return IngestManifest.hash_text(canonical)
+
+    def get(self, stage: str, key: str) -> Optional[Dict[str, Any]]:
+        """
+        获取某阶段某单元的记录。
+        :return: {"hash": ..., "artifacts": ...}，不存在时返回 None
+        """
+        return self.stages.get(stage, {}).get(key)
+
+    def is_current(self, stage: str, key: str, content_hash: str) -> bool:
+        """
+        判断单元是否已按相同内容处理过（可跳过）。
+        :param stage: 阶段名称
+        :param key: 单元标识
+        :param content_hash: 当前内容哈希
+        :return: True 表示内容未变化
+        """
+        entry = self.get(stage, key)
+        return entry is not None and entry.get("hash") == content_hash
+
+    def record(self, stage: str, key: str, content_hash: str, artifacts: Any = None):
+        """
+        记录单元的内容哈希及该阶段生成的产物（文件路径、记录键、文档 id 等）。
+        :param stage: 阶段名称
+        :param key: 单元标识
+        :param content_hash: 内容哈希
+        :param artifacts: 产物，需可 JSON 序列化
+        """
+        self.stages.setdefault(stage, {})[key] = {"hash": content_hash, "artifacts": artifacts}
+
+    def forget(self, stage: str, key: str) -> Optional[Dict[str, Any]]:
+        """
+        删除单元记录。
+        :return: 被删除的记录，不存在时返回 None
+        """
+        return self.stages.get(stage, {}).pop(key, None)
+
+    def keys(self, stage: str) -> List[str]:
+        """
+        返回某阶段已记录的所有单元标识。
+        """
+        return list(self.stages.get(stage, {}).keys())
+
+    def stale(self, stage: str, live_keys: Iterable[str], prefix: str = "") -> Dict[str, Dict[str, Any]]:
+        """
+        找出本次运行中已不存在的单元（需要删除其产物）。
+        :param stage: 阶段名称
+        :param live_keys: 本次运行中仍存在的单元标识
+        :param prefix: 只检查以该前缀开头的单元（如本次扫描的输入目录），避免误删其他目录的记录
+        :return: {单元标识: 记录}
+        """
+        live = set(live_keys)
+        return {
+            key: entry for key, entry in self.stages.get(stage, {}).items()
+            if key.startswith(prefix) and key not in live
+        }
+
+    def save(self):
+        """
+        原子地写回清单文件（先写临时文件再替换），避免中断时损坏清单。
+        """
+        directory = os.path.dirname(os.path.abspath(self.path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"version": self.VERSION, "stages": self.stages}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+def remove_files(paths: Iterable[str]):
+    """
+    删除过期的产物文件（不存在则忽略）。
+    :param paths: 文件路径列表
+    """
+    for path in paths or []:
+        if os.path.exists(path):
+            os.remove(path)
+            print(f"Removed stale file: {path}")
+
+def run_parse_stage(manifest: IngestManifest, file_path: str, parse_and_save: Callable[[], List[str]]) -> bool:
+    """
+    解析阶段的增量执行：源文件内容未变化时跳过；变化时重新解析，并删除本次不再产生的旧输出文件。
+    :param manifest: 增量导入清单
+    :param file_path: 源文件路径
+    :param parse_and_save: 执行解析并保存，返回输出文件路径列表
+    :return: 是否实际执行了解析
+    """
+    key = os.path.normpath(file_path)
+    content_hash = manifest.hash_file(file_path)
+    if manifest.is_current(STAGE_PARSE, key, content_hash):
+        print(f"Unchanged since last run, skipping: {file_path}")
+        return False
+
+    previous = manifest.get(STAGE_PARSE, key)
+    outputs = parse_and_save()
+    if previous:
+        remove_files(set(previous["artifacts"] or []) - set(outputs))
+    manifest.record(STAGE_PARSE, key, content_hash, outputs)
+    manifest.save()
+    return True
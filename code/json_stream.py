@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+import json
+import re
+from typing import Any, List
+
+# 第一个 table 的行数组：常规格式为 "rows"，紧凑格式为 "values"
+_ROWS_KEY = re.compile(r'(?<!\\)"(?:rows|values)"\s*:\s*\[')
+
+class MalformedStream(ValueError):
+    """模型输出不是有效 JSON（格式错误或被截断）。rows_ok 为出错前已完整解析的行数。"""
+
+    def __init__(self, message: str, rows_ok: int):
+        super().__init__(message)
+        self.rows_ok = rows_ok
+
+class RowStreamParser:
+    """
+    增量解析模型的流式输出：文本分片到达时即从第一个 table 的 rows/values 数组中逐个取出完整的行并解析，
+    行格式错误时立即抛出 MalformedStream（调用方可以停止接收剩余输出），结束时再校验整个 JSON 文档。
+    输出前后的 ```json 等前后缀自动忽略。
+    """
+
+    def __init__(self):
+        """
+        初始化 RowStreamParser 类。
+        """
+        self.text = ""
+        self.rows: List[Any] = []
+        self._pos = 0
+        self._state = "seek"  # seek: 查找行数组；items: 在行数组中；done: 行数组已结束
+        self._item_start = None
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._need_separator = False
+
+    def feed(self, text: str) -> int:
+        """
+        追加一段输出文本并解析其中新完成的行。
+        :param text: 文本分片
+        :return: 新解析出的行数
+        """
+        self.text += text
+        before = len(self.rows)
+        if self._state == "seek":
+            match = _ROWS_KEY.search(self.text, self._pos)
+            if match is None:
+                # 保留可能被分片截断的键名
+                self._pos = max(self._pos, len(self.text) - 32)
+                return 0
+            self._state = "items"
+            self._pos = match.end()
+        if self._state == "items":
+            self._scan()
+        return len(self.rows) - before
+
+    def _scan(self):
+        """
+        从上次的位置继续扫描行数组，跟踪字符串与括号深度，每遇到一个完整的行就解析。
+        """
+        text = self.text
+        i = self._pos
+        while i < len(text):
+            char = text[i]
+            if self._item_start is None:
+                if char in " \t\r\n":
+                    pass
+                elif char == "," and self._need_separator:
+                    self._need_separator = False
+                elif char == "]" and (self._need_separator or not self.rows):
+                    self._state = "done"
+                    self._pos = i + 1
+                    return
+                elif char in "{[" and not self._need_separator:
+                    self._item_start = i
+                    self._depth = 1
+                else:
+                    raise MalformedStream(f"Unexpected {char!r} after row {len(self.rows)}", len(self.rows))
+            elif self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        self.rows.append(json.loads(text[self._item_start:i + 1]))
+                    except json.JSONDecodeError as e:
+                        raise MalformedStream(f"Row {len(self.rows)} is not valid JSON: {str(e)}", len(self.rows))
+                    self._item_start = None
+                    self._need_separator = True
+            i += 1
+        self._pos = i
+
+    def finish(self) -> Any:
+        """
+        输出结束后校验整个 JSON 文档（忽略第一个 “{” 之前和最后一个 “}” 之后的内容）。
+        :return: 解析后的文档
+        """
+        start, end = self.text.find("{"), self.text.rfind("}")
+        if start == -1 or end < start:
+            raise MalformedStream("Response contains no JSON object", len(self.rows))
+        try:
+            document = json.loads(self.text[start:end + 1])
+        except json.JSONDecodeError as e:
+            raise MalformedStream(f"Response is not valid JSON: {str(e)}", len(self.rows))
+        if self._state == "items":
+            raise MalformedStream("Rows array is not closed", len(self.rows))
+        return document
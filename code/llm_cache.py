@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Any, Optional
+
+class ResponseCache:
+    """
+    基于 SQLite 的大模型响应缓存：键为输入 JSON（规范化后）、提示词版本和模型名称的哈希，
+    按总大小做 LRU 淘汰，统计命中率，支持绕过缓存（不读取，但写入新结果）。可在多个线程中共用。
+    """
+
+    def __init__(self, path: str = "llm_cache.sqlite", max_bytes: int = 512 << 20, bypass: bool = False):
+        """
+        初始化 ResponseCache 类。
+        :param path: SQLite 文件路径
+        :param max_bytes: 缓存响应的总字节数上限，超出时淘汰最久未访问的条目
+        :param bypass: 是否绕过缓存读取（强制重新请求，结果仍会写入缓存）
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path = path
+        self.max_bytes = max_bytes
+        self.bypass = bypass
+        self.hits = 0
+        self.misses = 0
+        self.puts = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses (accessed_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(input_json: Any, prompt_version: str, model: str) -> str:
+        """
+        计算缓存键：输入 JSON 规范化（键排序、紧凑格式）后与提示词版本、模型名称一起取 SHA-256。
+        :param input_json: 发送给大模型的 JSON 数据
+        :param prompt_version: 提示词模板版本
+        :param model: 模型名称
+        :return: 十六进制哈希
+        """
+        canonical = json.dumps(input_json, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+        digest = hashlib.sha256()
+        for part in (str(prompt_version), model, canonical):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """
+        查询缓存并更新访问时间；绕过模式下总是未命中。
+        :param key: 缓存键
+        :return: 缓存的响应，未命中返回 None
+        """
+        with self._lock:
+            if self.bypass:
+                self.misses += 1
+                return None
+            row = self._conn.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+            self._conn.commit()
+            self.hits += 1
+            return row[0]
+
+    def put(self, key: str, response: str, model: str = "", prompt_version: str = ""):
+        """
+        写入缓存，超出总大小上限时按最久未访问淘汰。
+        :param key: 缓存键
+        :param response: 响应文本
+        :param model: 模型名称（仅记录）
+        :param prompt_version: 提示词版本（仅记录）
+        """
+        size = len(response.encode("utf-8"))
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, prompt_version, response, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, model, str(prompt_version), response, size, now, now),
+            )
+            self.puts += 1
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """
+        淘汰最久未访问的条目，直到总大小不超过上限（调用方持有锁）。
+        """
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed_at").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            self.evictions += 1
+
+    def clear(self):
+        """
+        清空缓存。
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        返回缓存统计。
+        :return: {"hits", "misses", "hit_rate", "puts", "evictions", "entries", "bytes"}
+        """
+        with self._lock:
+            entries, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "puts": self.puts,
+                "evictions": self.evictions,
+                "entries": entries,
+                "bytes": total,
+            }
+
+    def close(self):
+        """
+        关闭数据库连接。
+        """
+        with self._lock:
+            self._conn.close()
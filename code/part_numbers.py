@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+import re
+import unicodedata
+from typing import Dict, Any, List
+
+from spec_fields import CATEGORIES, PACKAGE_PATTERN, QUANTITY
+
+# 标识类列名关键词：制造商料号、编码/编号、规格型号、机型、项目号、物料名称（常直接写料号）等
+IDENTIFIER_HEADERS = ("料号", "编码", "编号", "型号", "机型", "项目", "名称", "Part", "PN", "P/N")
+
+# 料号中的连接符，规范化时去除（全角字符先经 NFKC 转为半角）
+SEPARATORS = re.compile(r"[-_\s]+")
+# 由字母数字组成、中间可含连接符的片段，如 CZMVF3568-V3-1228、RC0402FR-0739KL、04160100000105
+TOKEN = re.compile(r"[A-Za-z0-9](?:[A-Za-z0-9]|[-_](?=[A-Za-z0-9]))*")
+# 规范化后的最短长度；纯数字（物料编码）至少 6 位，避免与封装尺寸、年份、序号混淆
+MIN_LENGTH = 4
+MIN_DIGITS_ONLY = 6
+
+# 直接查表的问题只由料号、查询用语、元器件类别（见 spec_fields.CATEGORIES）和少量其它字（如品牌）组成，
+# 如“哪些项目使用联合 CZMVF3568-V3-1228 摄像头？”；其余问题（“R2350电机保护逻辑是什么”）交给大模型回答
+LOOKUP_WORDS = ("哪些项目", "哪个项目", "哪些机型", "哪个机型", "哪些产品", "哪个产品", "哪款产品", "哪些型号",
+                "用在", "用于", "用到", "用了", "使用", "采用", "在哪", "哪里")
+# 虚词和常见客套用语，判断时忽略
+FILLER_WORDS = ("请问", "查询", "查找", "有", "的", "了", "吗", "呢", "都", "被", "还")
+# 去除料号、查询用语、类别和虚词后最多剩余的字数
+LOOKUP_LEFTOVER_MAX = 4
+
+def normalize_part_number(value: Any) -> str:
+    """
+    规范化料号：全角转半角（NFKC）、转为大写、去除连接符和空白，如“ｃｚｍｖｆ３５６８－Ｖ３”→“CZMVF3568V3”。
+    与索引映射中的 part_number 规范化器一致。
+    :param value: 料号文本
+    :return: 规范化后的料号
+    """
+    return SEPARATORS.sub("", unicodedata.normalize("NFKC", str(value))).upper()
+
+def _is_identifier(token: str, normalized: str) -> bool:
+    if len(normalized) < MIN_LENGTH or not any(char.isdigit() for char in normalized):
+        return False
+    if normalized.isdigit() and len(normalized) < MIN_DIGITS_ONLY:
+        return False
+    return not (QUANTITY.fullmatch(token) or PACKAGE_PATTERN.fullmatch(token))
+
+def find_part_numbers(text: Any) -> List[str]:
+    """
+    从文本中找出形如料号的片段（至少含一位数字；纯数字的物料编码至少 6 位；带单位的数值和封装名称除外），
+    按出现顺序返回规范化后的料号（去重）。单元格中以“/”、“、”、换行等分隔的多个料号分别返回。
+    :param text: 单元格内容或问题
+    :return: 规范化后的料号列表
+    """
+    if text in ("", None):
+        return []
+    found = []
+    for match in TOKEN.finditer(unicodedata.normalize("NFKC", str(text))):
+        token = match.group(0)
+        normalized = normalize_part_number(token)
+        if _is_identifier(token, normalized):
+            found.append(normalized)
+    return list(dict.fromkeys(found))
+
+def extract_part_numbers(row: Dict[str, Any]) -> List[str]:
+    """
+    提取一行表格数据中标识类列（见 IDENTIFIER_HEADERS）里的料号。
+    :param row: 行字典（列名 -> 单元格）
+    :return: 规范化后的料号列表，没有时为空列表
+    """
+    found = []
+    for header, value in row.items():
+        if any(word in str(header) for word in IDENTIFIER_HEADERS):
+            found.extend(find_part_numbers(value))
+    return list(dict.fromkeys(found))
+
+def route_question(question: str) -> Dict[str, Any]:
+    """
+    判断问题是否为按料号直接查表的问题：含有料号，且除料号外只有查询用语（见 LOOKUP_WORDS）、元器件类别和
+    不超过 LOOKUP_LEFTOVER_MAX 个其它字；问题只有料号时也直接查表。
+    :param question: 用户问题
+    :return: {"route": "lookup" 或 "rag", "part_numbers": [规范化后的料号, ...]}
+    """
+    part_numbers = find_part_numbers(question)
+    if not part_numbers:
+        return {"route": "rag", "part_numbers": part_numbers}
+
+    rest = TOKEN.sub(lambda match: "" if _is_identifier(match.group(0), normalize_part_number(match.group(0)))
+                     else match.group(0), unicodedata.normalize("NFKC", question))
+    asks = any(word in rest for word in LOOKUP_WORDS)
+    for word in LOOKUP_WORDS + CATEGORIES + FILLER_WORDS:
+        rest = rest.replace(word, "")
+    rest = re.sub(r"[\W_]+", "", rest)
+    if (asks or not rest) and len(rest) <= LOOKUP_LEFTOVER_MAX:
+        return {"route": "lookup", "part_numbers": part_numbers}
+    return {"route": "rag", "part_numbers": part_numbers}
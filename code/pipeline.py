@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+import queue
+import threading
+import time
+import traceback
+from typing import Callable, Dict, Any, List, Iterable
+
+# 队列结束标记：上游所有工作线程退出后，向下游每个工作线程各发送一个
+_END = object()
+
+class Stage:
+    """流水线中的一个阶段：多个工作线程从有界输入队列取任务，处理结果放入下一阶段的队列。"""
+
+    def __init__(self, name: str, func: Callable[..., Iterable[Any]], workers: int = 1, batch_size: int = 1,
+                 queue_size: int = 16, setup: Callable[[], Any] = None, teardown: Callable[[Any], None] = None):
+        """
+        初始化 Stage 类。
+        :param name: 阶段名称
+        :param func: 处理函数 func(item, context)，返回输出项的可迭代对象（可为空、可为生成器）；
+                     batch_size > 1 时第一个参数为任务列表
+        :param workers: 工作线程数（该阶段的并发度）
+        :param batch_size: 每次最多合并处理的任务数（如批量写库），不足时不等待，有多少取多少
+        :param queue_size: 输入队列容量；队列满时上游阻塞，形成背压，内存占用不随输入规模增长
+        :param setup: 每个工作线程启动时调用一次，返回值作为 context 传给 func（如每线程一个数据库连接）
+        :param teardown: 工作线程退出时以 context 调用一次
+        """
+        self.name = name
+        self.func = func
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.queue_size = max(1, queue_size)
+        self.setup = setup
+        self.teardown = teardown
+
+        self.items_in = 0
+        self.items_out = 0
+        self.failures = 0
+        self.busy_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        返回阶段统计：输入/输出数量、失败数、各线程处理耗时之和（不含等待队列的时间）。
+        """
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "items_in": self.items_in,
+            "items_out": self.items_out,
+            "failures": self.failures,
+            "busy_s": self.busy_seconds,
+        }
+
+class Pipeline:
+    """由有界队列串联的多阶段并发流水线：各阶段同时运行，总耗时接近最慢阶段而不是各阶段之和。"""
+
+    def __init__(self, stages: List[Stage]):
+        """
+        初始化 Pipeline 类。
+        :param stages: 按顺序排列的阶段列表
+        """
+        if not stages:
+            raise ValueError("Pipeline needs at least one stage")
+        self.stages = stages
+        self.wall_seconds = 0.0
+
+    def run(self, inputs: Iterable[Any], on_output: Callable[[Any], None] = None) -> List[Dict[str, Any]]:
+        """
+        运行流水线直到所有输入处理完毕。单个任务失败只计入该阶段的 failures，不会中断流水线。
+        :param inputs: 第一阶段的输入（可为生成器，按背压逐个读取）
+        :param on_output: 最后一阶段每个输出项的回调
+        :return: 各阶段统计列表
+        """
+        queues = [queue.Queue(maxsize=stage.queue_size) for stage in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        remaining_lock = threading.Lock()
+
+        def feed():
+            for item in inputs:
+                queues[0].put(item)
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_END)
+
+        def emit(index: int, item: Any):
+            if index + 1 < len(self.stages):
+                queues[index + 1].put(item)
+            elif on_output is not None:
+                on_output(item)
+
+        def worker(index: int):
+            stage = self.stages[index]
+            context = None
+            try:
+                context = stage.setup() if stage.setup else None
+                finished = False
+                while not finished:
+                    item = queues[index].get()
+                    if item is _END:
+                        break
+                    batch = [item]
+                    while len(batch) < stage.batch_size:
+                        try:
+                            item = queues[index].get_nowait()
+                        except queue.Empty:
+                            break
+                        if item is _END:
+                            finished = True
+                            break
+                        batch.append(item)
+
+                    start = time.perf_counter()
+                    outputs = 0
+                    try:
+                        for output in stage.func(batch if stage.batch_size > 1 else batch[0], context):
+                            emit(index, output)
+                            outputs += 1
+                    except Exception as e:
+                        with stage._lock:
+                            stage.failures += len(batch)
+                        print(f"[{stage.name}] Error processing item: {str(e)}")
+                        traceback.print_exc()
+                    with stage._lock:
+                        stage.items_in += len(batch)
+                        stage.items_out += outputs
+                        stage.busy_seconds += time.perf_counter() - start
+            finally:
+                if stage.teardown and context is not None:
+                    stage.teardown(context)
+                # 本阶段最后一个退出的线程通知下游结束
+                with remaining_lock:
+                    remaining[index] -= 1
+                    last = remaining[index] == 0
+                if last and index + 1 < len(self.stages):
+                    for _ in range(self.stages[index + 1].workers):
+                        queues[index + 1].put(_END)
+
+        start = time.perf_counter()
+        threads = [threading.Thread(target=feed, name="pipeline-feed", daemon=True)]
+        for index, stage in enumerate(self.stages):
+            for n in range(stage.workers):
+                threads.append(threading.Thread(target=worker, args=(index,), name=f"{stage.name}-{n}", daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.wall_seconds = time.perf_counter() - start
+
+        return [stage.stats() for stage in self.stages]
@@ -2,9 +2,21 @@
 import json
 import pandas as pd
 from pptx import Presentation
+from pptx.oxml.ns import qn
 import os
-from typing import Dict, Any, List
-from datetime import datetime
+from typing import Dict, Any, List, Iterator, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from ingest_manifest import IngestManifest, run_parse_stage
+from table_format import compact_document, dedupe_headers
+
+# 表格 XML 中用到的 DrawingML 元素标签
+_TC = qn("a:tc")
+_TX_BODY = qn("a:txBody")
+_P = qn("a:p")
+_R = qn("a:r")
+_BR = qn("a:br")
+_FLD = qn("a:fld")
+_T = qn("a:t")
 
 class PPTParser:
     """用于解析 PowerPoint 文件并将其转换为 JSON 格式的类，每页视为一个 sheet。"""
@@ -40,145 +52,181 @@ class PPTParser:
                     return text
         return "Untitled"  # 默认标题
 
+    @staticmethod
+    def _cell_text(tc) -> str:
+        """
+        直接从 a:tc 元素读取单元格文本，规则与 python-pptx 的 cell.text 一致：
+        段落之间用换行连接，a:br 转为垂直制表符，a:r/a:fld 取其 a:t 文本。
+        :param tc: a:tc 元素
+        :return: 单元格文本
+        """
+        tx_body = tc.find(_TX_BODY)
+        if tx_body is None:
+            return ""
+        paragraphs = []
+        for p in tx_body.iterchildren(_P):
+            parts = []
+            for child in p.iterchildren(_R, _BR, _FLD):
+                if child.tag == _BR:
+                    parts.append("\v")
+                else:
+                    t = child.find(_T)
+                    parts.append((t.text or "") if t is not None else "")
+            paragraphs.append("".join(parts))
+        return "\n".join(paragraphs)
+
     def extract_table_data(self, table: 'pptx.table.Table') -> List[List[str]]:
         """
         提取表格数据，处理合并单元格。
+        单遍扫描表格 XML：合并起始单元格的 gridSpan/rowSpan 给出合并范围，带 hMerge/vMerge 的单元格为被合并单元格，
+        无需逐个探测 is_spanned。
         :param table: PPT 表格对象
         :return: 二维数据列表
         """
-        rows = len(table.rows)
-        cols = len(table.columns)
+        tbl = table._tbl
+        tr_list = tbl.tr_lst
+        rows = len(tr_list)
+        cols = len(tbl.tblGrid.gridCol_lst)
         data = [["" for _ in range(cols)] for _ in range(rows)]
 
-        # 遍历所有单元格
-        for row_idx in range(rows):
-            for col_idx in range(cols):
-                cell = table.cell(row_idx, col_idx)
-                # 如果单元格未被填充（非合并区域）
-                if not data[row_idx][col_idx]:
-                    value = cell.text.strip()
-                    if isinstance(value, datetime):
-                        value = value.isoformat()
-                    elif value is not None:
-                        value = str(value)
-
-                    # 处理合并单元格
-                    if cell.is_merge_origin:
-                        # 填充合并区域
-                        try:
-                            # 推断合并范围（基于 is_spanned）
-                            merge_rows = 1
-                            merge_cols = 1
-                            for r in range(row_idx + 1, rows):
-                                next_cell = table.cell(r, col_idx)
-                                if next_cell.is_spanned:
-                                    merge_rows += 1
-                                else:
-                                    break
-                            for c in range(col_idx + 1, cols):
-                                next_cell = table.cell(row_idx, c)
-                                if next_cell.is_spanned:
-                                    merge_cols += 1
-                                else:
-                                    break
-                            # 填充合并区域
-                            for r in range(row_idx, row_idx + merge_rows):
-                                for c in range(col_idx, col_idx + merge_cols):
-                                    if r < rows and c < cols:
-                                        data[r][c] = value
-                        except AttributeError:
-                            # 如果 is_spanned 不可用，直接填充当前单元格
-                            data[row_idx][col_idx] = value
-                    else:
-                        # 非合并单元格，直接填充
-                        data[row_idx][col_idx] = value
+        for row_idx, tr in enumerate(tr_list):
+            for col_idx, tc in enumerate(tr.iterchildren(_TC)):
+                if col_idx >= cols:
+                    break
+                # 被合并的单元格，值由合并起始单元格填充
+                if tc.get("hMerge") in ("1", "true") or tc.get("vMerge") in ("1", "true"):
+                    continue
+
+                value = self._cell_text(tc).strip()
+                row_span = int(tc.get("rowSpan", "1"))
+                grid_span = int(tc.get("gridSpan", "1"))
+                if row_span == 1 and grid_span == 1:
+                    data[row_idx][col_idx] = value
+                    continue
+
+                # 填充合并区域
+                for r in range(row_idx, min(row_idx + row_span, rows)):
+                    for c in range(col_idx, min(col_idx + grid_span, cols)):
+                        data[r][c] = value
 
         return data
 
-    def parse(self) -> Dict[str, Any]:
+    def build_table(self, sheet_name: str, table_data: List[List[str]], text: str = "") -> Dict[str, Any]:
         """
-        解析 PPT 文件，提取每页的表格和文本内容，每页视为一个 sheet。
+        将二维表格数据构造为 table 字典（第一行为表头）。
+        :param sheet_name: sheet 名称
+        :param table_data: 二维数据列表，可为空
+        :param text: 非表格文本内容
+        :return: table 字典
+        """
+        # 过滤空白行
+        table_data = [row for row in table_data if any(cell != "" for cell in row)]
+        if table_data:
+            # 假设第一行为表头
+            new_headers = dedupe_headers(table_data[0])
+
+            df_data = table_data[1:] if len(table_data) > 1 else []
+            df = pd.DataFrame(df_data, columns=new_headers)
+
+            csv_content = df.to_csv(index=False, encoding='utf-8')
+            rows = df.to_dict(orient="records")
+        else:
+            csv_content = ""
+            rows = []
+
+        return {
+            "sheet": sheet_name,
+            "data": csv_content,
+            "rows": rows,
+            "text": text  # 非表格文本内容
+        }
+
+    def parse_slide(self, slide: 'pptx.slide.Slide') -> List[Dict[str, Any]]:
+        """
+        解析单页幻灯片，提取表格和文本内容。
+        页内每个表格各生成一个 table，非表格文本挂在第一个 table 上；没有表格时只返回一个含文本的 table。
+        :param slide: PPT 幻灯片对象
+        :return: 该页对应的 table 字典列表
+        """
+        # 获取 sheet 名称（大标题）
+        sheet_name = self.get_slide_title(slide)
+
+        # 提取文本内容（非表格部分）和所有表格
+        text_parts = []
+        tables_data = []
+        for shape in slide.shapes:
+            if shape.has_table:
+                tables_data.append(self.extract_table_data(shape.table))
+            elif shape.has_text_frame:
+                text = shape.text.strip()
+                if text:
+                    text_parts.append(text)
+
+        text = "\n".join(text_parts)
+        if not tables_data:
+            return [self.build_table(sheet_name, [], text)]
+        return [
+            self.build_table(sheet_name, table_data, text if i == 0 else "")
+            for i, table_data in enumerate(tables_data)
+        ]
+
+    def parse(self, workers: int = 1) -> Dict[str, Any]:
+        """
+        解析 PPT 文件，提取每页的表格和文本内容，每页的每个表格视为一个 sheet。
+        :param workers: 并行解析的进程数，大于 1 时按连续页段分发到进程池，结果按原顺序合并
         :return: 解析后的 JSON 数据，包含 doc_type、file_name 和 tables
         """
         try:
             prs = Presentation(self.file_path)
             self.result["tables"] = []
 
-            for slide_idx, slide in enumerate(prs.slides):
-                # 获取 sheet 名称（大标题）
-                sheet_name = self.get_slide_title(slide)
-
-                # 提取文本内容（非表格部分）
-                text_parts = []
-                for shape in slide.shapes:
-                    if shape.has_text_frame and not shape.has_table:
-                        text = shape.text.strip()
-                        if text:
-                            text_parts.append(text)
-
-                # 提取表格内容
-                table_data = None
-                for shape in slide.shapes:
-                    if shape.has_table:
-                        table_data = self.extract_table_data(shape.table)
-                        break  # 假设每页最多一个表格
-
-                # 构造表格数据（如果存在）
-                if table_data:
-                    # 过滤空白行
-                    table_data = [row for row in table_data if any(cell != "" for cell in row)]
-                    if table_data:
-                        # 假设第一行为表头
-                        headers = table_data[0]
-                        header_counts = {}
-                        new_headers = []
-                        for i, header in enumerate(headers):
-                            header = str(header).strip() if header else f"Column_{i+1}"
-                            if header in header_counts:
-                                header_counts[header] += 1
-                                new_headers.append(f"{header}_{header_counts[header]}")
-                            else:
-                                header_counts[header] = 0
-                                new_headers.append(header)
-
-                        df_data = table_data[1:] if len(table_data) > 1 else []
-                        df = pd.DataFrame(df_data, columns=new_headers)
-
-                        csv_content = df.to_csv(index=False, encoding='utf-8')
-                        rows = df.to_dict(orient="records")
-                    else:
-                        csv_content = ""
-                        rows = []
-                else:
-                    csv_content = ""
-                    rows = []
+            slide_count = len(prs.slides)
+            if workers > 1 and slide_count > 1:
+                workers = min(workers, slide_count)
+                # 每个进程处理一段连续的页，减少重复加载 PPT 的次数
+                step = -(-slide_count // workers)
+                ranges = [(start, min(start + step, slide_count)) for start in range(0, slide_count, step)]
+                with ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=_init_slide_worker,
+                    initargs=(self.file_path, self.doc_type),
+                ) as executor:
+                    for tables in executor.map(_parse_slide_range_worker, ranges):
+                        self.result["tables"].extend(tables)
+                return self.result
 
-                # 添加到结果
-                self.result["tables"].append({
-                    "sheet": sheet_name,
-                    "data": csv_content,
-                    "rows": rows,
-                    "text": "\n".join(text_parts)  # 非表格文本内容
-                })
+            for slide in prs.slides:
+                # 添加到结果（每个表格一个 table）
+                self.result["tables"].extend(self.parse_slide(slide))
 
         except Exception as e:
             raise Exception(f"Error processing PPT file: {str(e)}")
 
         return self.result
 
-    def save_sheets_to_files(self, output_dir: str = "output"):
+    def iter_slide_tables(self) -> Iterator[Dict[str, Any]]:
+        """
+        逐页解析幻灯片，每解析完一页立即产出该页的 table，不在内存中累积整个 PPT 的结果。
+        :return: table 字典生成器
         """
-        将每页的数据保存为单独的 JSON 文件，文件名为“ppt名称_sheet名称_2.json”。
+        prs = Presentation(self.file_path)
+        for slide in prs.slides:
+            for table in self.parse_slide(slide):
+                yield table
+
+    def iter_tables(self) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        逐个产出单页（单个表格）的 JSON 文档，文件名为“ppt名称_sheet名称_2.json”，下游可以边解析边消费。
         为重复的 sheet 名称添加数字后缀（项目概况, 项目概况1, 项目概况2 等）。
-        :param output_dir: 输出目录
+        未调用 parse 时逐页解析，内存占用上限为一页。
+        :return: (输出文件名, JSON 文档) 的生成器
         """
-        # 确保输出目录存在
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+        tables = self.result["tables"] or self.iter_slide_tables()
 
         # 跟踪 sheet 名称使用次数
         sheet_name_counts = {}
-        for table in self.result["tables"]:
+        base_name = os.path.splitext(self.file_name)[0]  # 去掉扩展名
+        for table in tables:
             sheet_name = table["sheet"]
             # 替换非法文件名字符
             sheet_name = sheet_name.replace("/", "_").replace("\\", "_").replace(":", "_")
@@ -191,22 +239,63 @@ class PPTParser:
                 sheet_name_counts[sheet_name] = 0
                 unique_sheet_name = sheet_name
 
-            # 构造输出文件名：ppt名称_sheet名称_0.json
-            base_name = os.path.splitext(self.file_name)[0]  # 去掉扩展名
-            output_file_name = f"{base_name}_{unique_sheet_name}_2.json"
-            output_path = os.path.join(output_dir, output_file_name)
-
-            # 构造单个 sheet 的 JSON 数据
-            sheet_json = {
+            # 构造输出文件名：ppt名称_sheet名称_2.json
+            yield f"{base_name}_{unique_sheet_name}_2.json", {
                 "doc_type": self.doc_type,
                 "file_name": self.file_name,
                 "tables": [table]
             }
 
+    def save_sheets_to_files(self, output_dir: str = "output", compact: bool = False):
+        """
+        将每页的数据保存为单独的 JSON 文件，文件名规则见 iter_tables。
+        未调用 parse 时逐页解析并写出。
+        :param output_dir: 输出目录
+        :param compact: 是否以紧凑表格格式（表头数组 + 行值数组）保存
+        :return: 输出文件路径列表
+        """
+        # 确保输出目录存在
+        if not os.path.exists(output_dir):
+            os.makedirs(output_dir)
+
+        output_paths = []
+        for output_file_name, sheet_json in self.iter_tables():
+            output_path = os.path.join(output_dir, output_file_name)
+
             # 保存到文件
             with open(output_path, "w", encoding="utf-8") as f:
-                json.dump(sheet_json, f, ensure_ascii=False, indent=2)
-            print(f"Saved sheet '{unique_sheet_name}' to: {output_path}")
+                json.dump(compact_document(sheet_json) if compact else sheet_json, f, ensure_ascii=False, indent=2)
+            print(f"Saved sheet '{sheet_json['tables'][0]['sheet']}' to: {output_path}")
+            output_paths.append(output_path)
+
+        return output_paths
+
+# 进程池工作进程内缓存的解析器与 PPT 对象（由 _init_slide_worker 初始化）
+_worker_parser = None
+_worker_presentation = None
+
+def _init_slide_worker(file_path: str, doc_type: str):
+    """
+    进程池初始化函数：每个工作进程只加载一次 PPT。
+    :param file_path: PPT 文件路径
+    :param doc_type: 文档类型
+    """
+    global _worker_parser, _worker_presentation
+    _worker_parser = PPTParser(file_path, doc_type)
+    _worker_presentation = Presentation(file_path)
+
+def _parse_slide_range_worker(slide_range: Tuple[int, int]) -> List[Dict[str, Any]]:
+    """
+    在工作进程中解析一段连续的幻灯片。
+    :param slide_range: (起始页索引, 结束页索引)，左闭右开
+    :return: table 列表
+    """
+    start, stop = slide_range
+    slides = list(_worker_presentation.slides)[start:stop]
+    tables = []
+    for slide in slides:
+        tables.extend(_worker_parser.parse_slide(slide))
+    return tables
 
 def main():
     # PPT 文件路径
@@ -221,21 +310,27 @@ def main():
     # 使用 PPTParser 解析 PPT 文件
     try:
         parser = PPTParser(file_path)
-        result = parser.parse()
-
-        # 打印解析结果
-        print("\n=== Parsed PPT ===")
-        print(f"Doc Type: {result['doc_type']}")
-        print(f"File Name: {result['file_name']}")
-        print(f"Total Slides: {len(result['tables'])}")
-        for i, table in enumerate(result['tables']):
-            print(f"\nSlide {i + 1} - Sheet Name: {table['sheet']}")
-            print(f"Number of Table Rows: {len(table['rows'])}")
-            print(f"Table Data Length: {len(table['data'])} characters")
-            print(f"Text Content:\n{table['text']}")
-
-        # 保存每页为单独的 JSON 文件
-        parser.save_sheets_to_files(output_dir="llm_output_test")
+        manifest = IngestManifest()
+
+        def parse_and_save():
+            result = parser.parse()
+
+            # 打印解析结果
+            print("\n=== Parsed PPT ===")
+            print(f"Doc Type: {result['doc_type']}")
+            print(f"File Name: {result['file_name']}")
+            print(f"Total Slides: {len(result['tables'])}")
+            for i, table in enumerate(result['tables']):
+                print(f"\nSlide {i + 1} - Sheet Name: {table['sheet']}")
+                print(f"Number of Table Rows: {len(table['rows'])}")
+                print(f"Table Data Length: {len(table['data'])} characters")
+                print(f"Text Content:\n{table['text']}")
+
+            # 保存每页为单独的 JSON 文件
+            return parser.save_sheets_to_files(output_dir="llm_output_test")
+
+        # 文件内容未变化时跳过解析
+        run_parse_stage(manifest, file_path, parse_and_save)
 
     except Exception as e:
         print(f"Error: {str(e)}")
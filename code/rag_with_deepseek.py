@@ -1,22 +1,35 @@
 from volcenginesdkarkruntime import Ark
 import os
-from save_to_es import Elastic
+import content_codec
+from part_numbers import route_question
+from spec_fields import parse_constraints
+from save_to_es import Elastic, GRANULARITY_ROWS
 
 # 配置火山引擎 API
 VOLCENGINE_API_KEY = os.getenv("VOLCENGINE_API_KEY")  # 从环境变量读取火山引擎 API 密钥
 VOLCENGINE_ENDPOINT_ID = os.getenv("VOLCENGINE_ENDPOINT_ID")  # 从环境变量读取推理接入点 ID
 
-# 初始化 Ark 客户端
-client = Ark(api_key=VOLCENGINE_API_KEY)
+# Ark 客户端，首次调用时创建；可通过 configure_client 替换为本地替身（见 fake_backends.FakeArk）
+client = None
+
+def configure_client(chat_client=None):
+    """
+    设置生成回答使用的客户端（需兼容 Ark 的 chat.completions.create）；传入 None 恢复使用 Ark。
+    """
+    global client
+    client = chat_client
 
 def generate_with_deepseek(query, context):
     """
     使用 Ark 客户端调用 DeepSeek R1 模型生成结果，适配 RAG 任务
     """
-    if not VOLCENGINE_API_KEY:
-        raise ValueError("未设置 VOLCENGINE_API_KEY 环境变量")
-    if not VOLCENGINE_ENDPOINT_ID:
-        raise ValueError("未设置 VOLCENGINE_ENDPOINT_ID 环境变量")
+    global client
+    if client is None:
+        if not VOLCENGINE_API_KEY:
+            raise ValueError("未设置 VOLCENGINE_API_KEY 环境变量")
+        if not VOLCENGINE_ENDPOINT_ID:
+            raise ValueError("未设置 VOLCENGINE_ENDPOINT_ID 环境变量")
+        client = Ark(api_key=VOLCENGINE_API_KEY)
 
 
     # System 提示：明确任务和要求
@@ -49,16 +62,55 @@ def generate_with_deepseek(query, context):
         print(f"DeepSeek API 调用失败: {e}")
         return "生成失败"
 
+def format_lookup_table(part_numbers, hits):
+    """
+    将按料号查到的行整理为 Markdown 表格作为回答：同一 sheet 的同一张表合为一个表格，列为这些行中非空的列
+    返回：
+    - answer: 回答文本
+    - doc_sources: 命中的文档来源列表 [(file_name, sheet_name), ...]
+    """
+    groups = {}
+    for hit in hits:
+        rows = []
+        for line in hit["json_content"].splitlines():
+            try:
+                row = content_codec.loads(line)
+            except ValueError:
+                continue
+            if isinstance(row, dict):
+                rows.append(row)
+        if rows:
+            groups.setdefault((hit["file_name"], hit["sheet_name"], hit.get("table_name")), []).extend(rows)
+
+    lines = [f"找到 {sum(len(rows) for rows in groups.values())} 条与 {'、'.join(part_numbers)} 相关的记录："]
+    for (file_name, sheet_name, table_name), rows in groups.items():
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        title = f"{file_name}_{sheet_name}" + (f" / {table_name}" if table_name and table_name != sheet_name else "")
+        lines += ["", f"**{title}**", "", "| " + " | ".join(columns) + " |", "|" + " --- |" * len(columns)]
+        for row in rows:
+            cells = [str(row.get(column, "")).replace("|", "\\|").replace("\n", " ") for column in columns]
+            lines.append("| " + " | ".join(cells) + " |")
+    return "\n".join(lines), list(dict.fromkeys((file_name, sheet_name) for file_name, sheet_name, _ in groups))
+
 def rag_pipeline(query, index_name="e_rag"):
     """
     RAG 完整流程：从 ES 查询到生成结果，并返回检索到的文档名称
+    只按料号查询的问题（如“哪些项目使用联合 CZMVF3568-V3-1228 摄像头？”，见 part_numbers.route_question）在行粒度
+    索引上直接按料号查表，以表格形式返回命中的行，不调用 DeepSeek；查不到时仍走 RAG
     返回：
-    - generated_text: LLM 生成的回答
+    - generated_text: LLM 生成的回答（或查表结果）
     - doc_sources: 检索到的文档来源列表 [(file_name, sheet_name), ...]
     """
     # 初始化 ES 客户端
     es = Elastic()
 
+    # 步骤 0：料号查询直接查表
+    route = route_question(query)
+    if route["route"] == "lookup" and es.index_layout(index_name)["granularity"] == GRANULARITY_ROWS:
+        hits = es.lookup_parts(index_name, route["part_numbers"], parse_constraints(query)["categories"])
+        if hits:
+            return format_lookup_table(route["part_numbers"], hits)
+
     # 步骤 1：搜索并构建 context，同时获取文档来源
     context, doc_sources = es.search_and_build_context(index_name, query)
     if context.startswith("未找到"):
@@ -1,22 +1,175 @@
 from elasticsearch import Elasticsearch
-from elasticsearch.helpers import bulk
-import mysql.connector
-import json
+from elasticsearch import helpers
+import hashlib
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+import content_codec
+from ingest_manifest import STAGE_ES
+from save_to_mysql import connect_to_mysql, iter_rows, list_deleted, make_chunk_id, make_doc_id, purge_deleted, sync_watermark
+from embeddings import EMBED_MAX_CHARS, get_embedder, rrf_fuse
+from part_numbers import extract_part_numbers, normalize_part_number
+from spec_fields import SPEC_MAPPING, build_filters, extract_specs, has_constraints, parse_constraints
+from table_format import compact_document, iter_row_groups
+from vector_index import open_vector_index, remove_vector_index, vector_index_path
+
+# 可替换的客户端工厂（如 fake_backends 的内存索引替身），为 None 时连接真实的 ES
+_client_factory = None
+
+def configure_elastic(factory=None):
+    """
+    设置创建 ES 客户端的工厂函数，用于在没有 ES 的环境中运行和压测；传入 None 恢复连接真实的 ES。
+    :param factory: 接收 hosts、返回客户端对象的函数
+    """
+    global _client_factory
+    _client_factory = factory
+
+def bulk(client, actions, **kwargs):
+    """
+    批量执行索引/删除请求。替身客户端提供 bulk_actions 方法时直接交给它处理，否则使用 elasticsearch.helpers.bulk。
+    :return: (成功数, 错误列表)
+    """
+    if hasattr(client, "bulk_actions"):
+        return client.bulk_actions(actions, **kwargs)
+    return helpers.bulk(client, actions, **kwargs)
+
+# bulk 请求按请求体字节数切分：表格单元大小差异很大，按条数切分时大表格会使请求过大、小表格则请求过多
+DEFAULT_BATCH_BYTES = 5 * 1024 * 1024
+DEFAULT_BATCH_DOCS = 1000
+# 增量同步时从水位线往前回读的秒数：updated_at 取语句执行时刻而不是提交时刻，多个写入事务并发时，先盖时间戳、
+# 后提交的记录可能落在已推进的水位线之前；回读窗口需大于最长的写入事务耗时（重复索引按 _id 覆盖，没有副作用）
+SYNC_SAFETY_LAG = 60
+# 索引粒度：每个 sheet/chunk 一个文档，或每个表格行（行组）一个文档（见 create_label_index）
+GRANULARITY_SHEET = "sheet"
+GRANULARITY_ROWS = "rows"
+# 向量的存放位置：ES 的 dense_vector 字段，或本地向量索引（见 vector_index，用于不支持 kNN 的 ES）
+VECTOR_STORE_ES = "es"
+VECTOR_STORE_LOCAL = "local"
+
+# 料号字段的分析设置：part_number 规范化器（全角转半角、转大写、去除连接符和空白，与
+# part_numbers.normalize_part_number 一致）用于精确匹配，part_numbers.prefix 子字段按 edge n-gram 支持前缀查找
+PART_NUMBER_ANALYSIS = {
+    "char_filter": {
+        "part_number_chars": {"type": "mapping", "mappings": ["- => ", "_ => ", "\\u0020 => ", "－ => ", "＿ => ",
+                                                                "\\u3000 => "]},
+    },
+    "normalizer": {
+        "part_number": {"type": "custom", "char_filter": ["part_number_chars"], "filter": ["cjk_width", "uppercase"]},
+    },
+    "filter": {
+        "part_number_edge": {"type": "edge_ngram", "min_gram": 3, "max_gram": 32},
+    },
+    "analyzer": {
+        "part_number_prefix": {"type": "custom", "tokenizer": "keyword", "char_filter": ["part_number_chars"],
+                               "filter": ["cjk_width", "uppercase", "part_number_edge"]},
+        "part_number_search": {"type": "custom", "tokenizer": "keyword", "char_filter": ["part_number_chars"],
+                               "filter": ["cjk_width", "uppercase"]},
+    },
+}
+
+# 每个请求的元数据行（{"index": {"_index": ..., "_id": ...}}）与 JSON 结构的估计字节数
+ACTION_OVERHEAD_BYTES = 128
+
+def action_bytes(action):
+    """
+    估计一个 bulk 请求在请求体中占用的字节数（元数据 + _source 各字段），无需为此再序列化一次 JSON。
+    """
+    size = ACTION_OVERHEAD_BYTES
+    for value in action.get("_source", {}).values():
+        size += len(value.encode("utf-8")) if isinstance(value, str) else len(str(value))
+    return size
+
+def iter_batches(actions, max_bytes=DEFAULT_BATCH_BYTES, max_docs=DEFAULT_BATCH_DOCS):
+    """
+    将请求流按字节数（同时不超过 max_docs 条）切分为批次，单个超过 max_bytes 的请求单独成批。
+    :return: (批次, 估计字节数) 生成器
+    """
+    batch, size = [], 0
+    for action in actions:
+        nbytes = action_bytes(action)
+        if batch and (size + nbytes > max_bytes or len(batch) >= max_docs):
+            yield batch, size
+            batch, size = [], 0
+        batch.append(action)
+        size += nbytes
+    if batch:
+        yield batch, size
+
+def _lagged(value, seconds):
+    """水位线时间（datetime 或字符串）往前推 seconds 秒，返回字符串"""
+    moment = value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+    return (moment - timedelta(seconds=seconds)).strftime("%Y-%m-%d %H:%M:%S.%f")
+
+def _position_key(position):
+    """(时间, id) 位置的排序键：MySQL 返回 datetime、_meta 中保存字符串，统一按字符串比较"""
+    return str(position[0]), position[1]
+
+def _plain_watermark(watermark):
+    """水位线中的时间转为字符串，便于写入 _meta（MySQL 可直接按字符串比较 TIMESTAMP）"""
+    return {key: value if value is None or isinstance(value, (int, str)) else str(value)
+            for key, value in watermark.items()}
+
+def _error_id(error):
+    """bulk 错误项（如 {"index": {"_id": ..., "status": ..., "error": ...}}）对应的文档 _id"""
+    detail = next(iter(error.values()), None) if isinstance(error, dict) else None
+    return detail.get("_id") if isinstance(detail, dict) else None
+
+def send_batches(client, batches, workers=4):
+    """
+    多线程并发发送批次：最多 workers 个 bulk 请求同时进行，调用方线程在等待期间继续读取和构造后续批次；
+    同时在途的批次不超过 workers 个，内存占用有界。每批作为一个 bulk 请求发送，部分文档出错或整个请求
+    失败都只影响该批，结果按提交顺序返回，由调用方逐批报告。
+    :param client: ES 客户端
+    :param batches: (批次, 字节数) 的可迭代对象（见 iter_batches）
+    :param workers: 并发请求数
+    :return: 生成器，每项为 {"batch": 序号, "actions": 批次, "bytes": 字节数, "success": 成功数,
+             "errors": 文档错误列表, "exception": 整个请求失败时的异常（否则为 None）, "seconds": 请求耗时}
+    """
+    def send(number, actions, nbytes):
+        started = time.perf_counter()
+        result = {"batch": number, "actions": actions, "bytes": nbytes, "success": 0, "errors": [], "exception": None}
+        try:
+            result["success"], result["errors"] = bulk(client, actions, chunk_size=len(actions),
+                                                       max_chunk_bytes=max(nbytes * 2, DEFAULT_BATCH_BYTES),
+                                                       raise_on_error=False)
+        except Exception as e:
+            result["exception"] = e
+        result["seconds"] = time.perf_counter() - started
+        return result
+
+    in_flight = deque()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for number, (actions, nbytes) in enumerate(batches, start=1):
+            if len(in_flight) >= workers:
+                yield in_flight.popleft().result()
+            in_flight.append(executor.submit(send, number, actions, nbytes))
+        while in_flight:
+            yield in_flight.popleft().result()
 
 class Elastic(object):
     def __init__(self, hosts="http://10.10.37.75:9200"):
-        self.client = Elasticsearch(hosts=hosts)
+        if _client_factory is not None:
+            self.client = _client_factory(hosts)
+        else:
+            self.client = Elasticsearch(hosts=hosts)
+        self._layouts = {}  # 索引名 -> 索引粒度（见 index_layout）
 
     def get(self, name, id):
         source = ["json_content", "sheet_name", "file_name"]
         return self.client.get(index=name, id=id, _source=source)
 
-    def create_label_index(self, name, number_of_replicas=0, number_of_shards=1):
+    def create_label_index(self, name, number_of_replicas=0, number_of_shards=1, granularity=GRANULARITY_SHEET,
+                           rows_per_doc=1, dense_vectors=False, vector_store=VECTOR_STORE_ES):
         """
         调整映射以适配你的数据结构：
         - file_name: 文件名
         - sheet_name: 工作表名
         - json_content: JSON内容，改为text类型，支持检索
+        - doc_id: 文档 ID（由文件名确定性生成），用于按文件删除或更新
+        granularity="rows" 时每 rows_per_doc 个表格行一个文档；dense_vectors=True 时另存向量（vector_store 见 search_knn）。
+        粒度与向量模型记录在映射的 _meta 中。
         """
         # 检查索引是否已经存在
         if self.client.indices.exists(index=name):
@@ -40,8 +193,34 @@ class Elastic(object):
                     "analyzer": "ik_max_word",
                     "search_analyzer": "ik_smart",
                 },
-            }
+                "doc_id": {
+                    "type": "keyword",
+                },
+            },
+            "_meta": {"granularity": granularity, "rows_per_doc": rows_per_doc},
         }
+        if granularity == GRANULARITY_ROWS:
+            mappings["properties"].update({
+                # 所属 sheet/chunk 的 chunk_id，用于整体替换或删除
+                "parent_id": {"type": "keyword"},
+                # 表名（Excel sheet、PPT 页、Word 分段）
+                "table_name": {"type": "text", "analyzer": "ik_max_word", "search_analyzer": "ik_smart"},
+                # 在所属 sheet/chunk 中的序号
+                "position": {"type": "integer"},
+                # 完整表头（只存储，不检索），用于拼接上下文
+                "headers": {"type": "keyword", "index": False},
+                # 从该行提取的结构化规格（见 spec_fields），用于 range/term 过滤
+                "spec": SPEC_MAPPING,
+                # 标识类列中的料号，按规范化后的值精确匹配，prefix 子字段支持前缀查找（见 lookup_parts）
+                "part_numbers": {
+                    "type": "keyword",
+                    "normalizer": "part_number",
+                    "fields": {
+                        "prefix": {"type": "text", "analyzer": "part_number_prefix",
+                                   "search_analyzer": "part_number_search"},
+                    },
+                },
+            })
         setting = {
             "settings": {
                 "number_of_replicas": number_of_replicas,
@@ -49,6 +228,16 @@ class Elastic(object):
             },
             "mappings": mappings,
         }
+        if granularity == GRANULARITY_ROWS:
+            setting["settings"]["analysis"] = PART_NUMBER_ANALYSIS
+        if dense_vectors:
+            embedder = get_embedder()
+            mappings["_meta"]["embedding"] = {"model": embedder.name, "dims": embedder.dims, "store": vector_store}
+            if vector_store == VECTOR_STORE_LOCAL:
+                mappings["_meta"]["embedding"]["path"] = vector_index_path(name)
+            else:
+                mappings["properties"]["embedding"] = {"type": "dense_vector", "dims": embedder.dims, "index": True,
+                                                       "similarity": "cosine"}
         self.client.indices.create(index=name, body=setting)
         return "创建索引成功"
 
@@ -65,79 +254,657 @@ class Elastic(object):
                     }
                 }
             )
+            vectors = self.local_vectors(name)
+            if vectors is not None:
+                vectors.clear()
             print(f"All documents in index '{name}' deleted.")
         else:
             print(f"Index '{name}' does not exist.")
         return "清空文档完成"
 
+    def delete_document(self, name, doc_id):
+        """
+        删除一个文档（文件）在索引中的全部单元，无需清空整个索引。
+        """
+        result = self.client.delete_by_query(index=name, body={"query": {"term": {"doc_id": doc_id}}})
+        vectors = self.local_vectors(name)
+        if vectors is not None:
+            vectors.delete("doc_id", [doc_id])
+        print(f"Deleted {result.get('deleted', 0)} documents of {doc_id} from index '{name}'.")
+        return result.get("deleted", 0)
+
+    @contextmanager
+    def bulk_load_settings(self, name, enabled=True):
+        """
+        批量导入期间关闭定时刷新（refresh_interval=-1）并将副本数设为 0，结束后（包括出错时）恢复原设置并刷新一次，
+        避免导入过程中反复生成小分段以及逐条复制到副本。索引不存在时不做任何调整。
+        """
+        if not enabled or not self.client.indices.exists(index=name):
+            yield
+            return
+        settings = self.client.indices.get_settings(index=name)
+        # 以实际索引名为键（name 可能是别名）
+        current = next(iter(settings.values()), {}).get("settings", {}).get("index", {})
+        # refresh_interval 未显式设置时恢复为 None，即 ES 的默认值
+        previous = {
+            "refresh_interval": current.get("refresh_interval"),
+            "number_of_replicas": current.get("number_of_replicas", 0),
+        }
+        self.client.indices.put_settings(index=name, body={"index": {"refresh_interval": "-1", "number_of_replicas": 0}})
+        try:
+            yield
+        finally:
+            self.client.indices.put_settings(index=name, body={"index": previous})
+            self.client.indices.refresh(index=name)
+
+    @staticmethod
+    def content_hash(row, compact=False):
+        """
+        计算一条 llm_outputs 记录在 ES 中的内容哈希（用于增量同步判断是否需要重新索引）
+        压缩存储的记录直接对压缩字节计算，内容未变化的记录无需解压
+        """
+        content = row.get("json_blob")
+        if content is None:
+            content = (row.get("json_content") or "").encode("utf-8")
+        digest = hashlib.sha256(f"{compact}\n{row['file_name']}\n{row['sheet_name']}\n".encode("utf-8"))
+        digest.update(bytes(content))
+        return digest.hexdigest()
+
+    @staticmethod
+    def document_id(row):
+        """
+        一条 llm_outputs 记录在 ES 中的 _id：即 MySQL 中的 chunk_id，旧记录没有 chunk_id 时按 (file_name, sheet_name) 计算
+        """
+        return row.get("chunk_id") or make_chunk_id(row["file_name"], row["sheet_name"])
+
+    def index_layout(self, name):
+        """
+        索引（或别名指向的索引）的粒度与向量模型 {"granularity": "sheet" 或 "rows", "rows_per_doc": n,
+        "embedding": {"model", "dims"} 或 None}，按实例缓存
+        旧索引没有 _meta 记录，以及索引不存在时视为 sheet 粒度、没有向量
+        """
+        if name not in self._layouts:
+            layout = {"granularity": GRANULARITY_SHEET, "rows_per_doc": 1, "embedding": None}
+            if self.client.indices.exists(index=name):
+                mappings = self.client.indices.get_mapping(index=name)
+                meta = next(iter(mappings.values()), {}).get("mappings", {}).get("_meta") or {}
+                layout.update({key: meta[key] for key in ("granularity", "rows_per_doc", "embedding") if meta.get(key)})
+            self._layouts[name] = layout
+        return self._layouts[name]
+
+    def index_embedder(self, name):
+        """
+        索引带有向量字段时返回计算向量用的向量化器，否则返回 None
+        当前向量化器与建索引时的模型不同时（向量不可比较）打印提示并返回 None，需重建索引
+        """
+        embedding = self.index_layout(name)["embedding"]
+        if not embedding:
+            return None
+        embedder = get_embedder()
+        if embedder.name != embedding["model"]:
+            print(f"Index '{name}' was built with embedding model {embedding['model']}, "
+                  f"current model is {embedder.name}; skipping vectors until the index is rebuilt")
+            return None
+        return embedder
+
+    def local_vectors(self, name):
+        """
+        索引的向量存放在本地向量索引中时返回该 LocalVectorIndex，否则返回 None
+        """
+        embedding = self.index_layout(name)["embedding"]
+        if not embedding or embedding.get("store") != VECTOR_STORE_LOCAL:
+            return None
+        return open_vector_index(embedding["path"], embedding["dims"])
+
+    @staticmethod
+    def embedding_text(source):
+        """
+        文档参与向量化的文本：文件名、sheet 名、表名与内容（最多 EMBED_MAX_CHARS 个字符）
+        """
+        title = " ".join(str(source[key]) for key in ("file_name", "sheet_name", "table_name") if source.get(key))
+        return f"{title}\n{source.get('json_content') or ''}"[:EMBED_MAX_CHARS]
+
+    def with_embeddings(self, name, actions, batch_size=64):
+        """
+        为 bulk 索引请求补上 embedding 字段：每 batch_size 个请求一批计算（先查向量缓存），其余请求原样传递
+        向量存放在本地向量索引时不修改请求，而是将向量连同文档 _id、文件名、sheet 名、行序号追加到本地索引
+        索引没有向量字段时直接返回 actions
+        """
+        embedder = self.index_embedder(name)
+        if embedder is None:
+            yield from actions
+            return
+        local = self.local_vectors(name)
+        batch = []
+        for action in actions:
+            batch.append(action)
+            if len(batch) >= batch_size:
+                yield from self._embed_batch(embedder, batch, local)
+                batch = []
+        if batch:
+            yield from self._embed_batch(embedder, batch, local)
+
+    def _embed_batch(self, embedder, actions, local=None):
+        targets = [action for action in actions if action.get("_op_type", "index") == "index" and "_source" in action]
+        vectors = embedder.embed([self.embedding_text(action["_source"]) for action in targets])
+        if local is not None:
+            local.add(vectors, [{
+                "key": action["_id"],
+                "doc_id": action["_source"].get("doc_id"),
+                "chunk_id": action["_source"].get("parent_id") or action["_id"],
+                "file_name": action["_source"].get("file_name"),
+                "sheet_name": action["_source"].get("sheet_name"),
+                "row": action["_source"].get("position"),
+            } for action in targets])
+            return actions
+        for action, vector in zip(targets, vectors):
+            action["_source"]["embedding"] = [round(value, 5) for value in vector]
+        return actions
+
+    def build_requests(self, name, row, compact=False):
+        """
+        按索引粒度将一条 llm_outputs 记录构造为 bulk 索引请求列表：sheet 粒度一个文档，行粒度每个行组一个文档
+        """
+        layout = self.index_layout(name)
+        if layout["granularity"] == GRANULARITY_ROWS:
+            return self.build_row_requests(name, row, layout["rows_per_doc"])
+        return [self.build_index_request(name, row, compact)]
+
+    @staticmethod
+    def build_row_requests(name, row, rows_per_doc=1):
+        """
+        将一条 llm_outputs 记录拆成行级文档（见 table_format.iter_row_groups）：每个文档带文件名、sheet 名、表名和完整表头，
+        parent_id 指回所属 sheet/chunk；_id 为 "{chunk_id}-{序号}"，重新导入时原地覆盖
+        每个文档只有一行时附带该行的结构化规格 spec（多行的行组没有单一的规格值，不提取）；part_numbers 为行组中
+        全部行的料号
+        无法解析的内容按文本分段
+        """
+        chunk_id = Elastic.document_id(row)
+        json_content_str = content_codec.row_content(row) or ""
+        try:
+            document = content_codec.loads(json_content_str)
+        except (ValueError, TypeError):
+            document = {"content": json_content_str}
+        requests = []
+        for group in iter_row_groups(document, rows_per_doc):
+            source = {
+                "doc_id": row.get("doc_id") or make_doc_id(row["file_name"]),
+                "parent_id": chunk_id,
+                "file_name": row["file_name"],
+                "sheet_name": row["sheet_name"],
+                "table_name": group["table_name"],
+                "position": group["position"],
+            }
+            if "rows" in group:
+                source["headers"] = group["headers"]
+                source["json_content"] = "\n".join(content_codec.dumps(item) for item in group["rows"])
+                specs = extract_specs(group["rows"][0]) if len(group["rows"]) == 1 else {}
+                if specs:
+                    source["spec"] = specs
+                part_numbers = [number for item in group["rows"] for number in extract_part_numbers(item)]
+                if part_numbers:
+                    source["part_numbers"] = list(dict.fromkeys(part_numbers))
+            else:
+                source["json_content"] = group["text"]
+            requests.append({"_op_type": "index", "_index": name, "_id": f"{chunk_id}-{group['position']}",
+                             "_source": source})
+        return requests
+
+    def prune_rows(self, name, counts):
+        """
+        行粒度索引中，sheet/chunk 重新导入后行数变少时，删除序号超出新行数的旧行文档；sheet 粒度时不做任何事
+        :param counts: {chunk_id: 新的行文档数}
+        :return: 删除的文档数
+        """
+        if not counts or self.index_layout(name)["granularity"] != GRANULARITY_ROWS:
+            return 0
+        vectors = self.local_vectors(name)
+        if vectors is not None:
+            vectors.prune_rows(counts)
+        deleted = 0
+        items = list(counts.items())
+        for start in range(0, len(items), 200):
+            should = [{"bool": {"filter": [{"term": {"parent_id": chunk_id}}, {"range": {"position": {"gte": count}}}]}}
+                      for chunk_id, count in items[start:start + 200]]
+            result = self.client.delete_by_query(index=name, body={"query": {"bool": {"should": should}}})
+            deleted += result.get("deleted", 0)
+        return deleted
+
+    def delete_chunks(self, name, chunk_ids, stats=None, workers=4):
+        """
+        删除若干 sheet/chunk 在索引中的全部文档：sheet 粒度按 _id 批量删除（已不存在的文档视为删除成功），
+        行粒度按 parent_id 删除其全部行文档
+        :param stats: 同步统计（累加 deleted/failed 等），为 None 时不汇总
+        :return: 删除失败的 chunk_id 集合
+        """
+        stats = stats if stats is not None else {"deleted": 0, "failed": 0, "batches": 0, "failed_batches": 0, "bytes": 0}
+        chunk_ids = list(chunk_ids)
+        failed = set()
+        vectors = self.local_vectors(name)
+        if vectors is not None:
+            vectors.delete("chunk_id", chunk_ids)
+        if self.index_layout(name)["granularity"] != GRANULARITY_ROWS:
+            deletes = [{"_op_type": "delete", "_index": name, "_id": chunk_id} for chunk_id in chunk_ids]
+            for actions, failed_ids in self._send(name, deletes, stats, DEFAULT_BATCH_BYTES, DEFAULT_BATCH_DOCS, workers):
+                stats["deleted"] += len(actions) - len(failed_ids)
+                failed.update(failed_ids)
+            return failed
+        for start in range(0, len(chunk_ids), 1000):
+            part = chunk_ids[start:start + 1000]
+            try:
+                result = self.client.delete_by_query(index=name, body={"query": {"terms": {"parent_id": part}}})
+                stats["deleted"] += result.get("deleted", 0)
+            except Exception as e:
+                print(f"Deleting rows of {len(part)} chunks from '{name}' failed: {e}")
+                stats["failed"] += len(part)
+                failed.update(part)
+        return failed
+
+    @staticmethod
+    def build_index_request(name, row, compact=False):
+        """
+        将一条 llm_outputs 记录（chunk_id, doc_id, file_name, sheet_name, json_content 或 json_blob/codec）构造为 bulk 索引请求
+        _id 使用确定性的 chunk_id，重复导入时原地覆盖
+        compact=True 时表格以紧凑格式写入 json_content
+        """
+        json_content_str = content_codec.row_content(row)
+        if row.get("codec") and not compact:
+            # 写入 MySQL 时已校验并规范化，无需再解析和序列化
+            json_content = json_content_str
+        else:
+            try:
+                # 旧记录（未压缩的文本）或需要转换为紧凑格式时解析后重新序列化
+                document = content_codec.loads(json_content_str)
+                if compact:
+                    document = compact_document(document)
+                json_content = content_codec.dumps(document)
+            except (ValueError, TypeError):
+                json_content = json_content_str  # 如果解析失败，直接使用原始字符串
+
+        return {
+            "_op_type": "index",
+            "_index": name,
+            "_id": Elastic.document_id(row),
+            "_source": {
+                "doc_id": row.get("doc_id") or make_doc_id(row["file_name"]),
+                "file_name": row["file_name"],
+                "sheet_name": row["sheet_name"],
+                "json_content": json_content,
+            },
+        }
+
     def bulk_index_data(
         self,
         name,
         database="e_rag",  
-        batch_size=64,
+        batch_size=500,
+        manifest=None,
+        compact=False,
+        max_batch_bytes=DEFAULT_BATCH_BYTES,
+        max_batch_docs=DEFAULT_BATCH_DOCS,
+        workers=4,
+        tune_settings=True,
     ):
         """
         从MySQL中读取数据并批量插入到ES
-        MySQL连接信息：
-        - 地址：10.10.37.77
-        - 账号：root
-        - 密码：TF123456
-        """
-        # MySQL连接配置
-        mysql_config = {
-            "host": "10.10.37.77",
-            "user": "root",
-            "password": "TF123456",
-            "database": database
+        按主键分页流式读取，按字节数切分批次后由 workers 个线程并发发送；compact=True 时以紧凑格式写入 json_content
+        传入 manifest（IngestManifest）时增量同步：只索引内容变化的记录，并删除 MySQL 中已不存在的记录对应的文档
+        返回同步统计：indexed/skipped/failed/deleted 文档数、batches/failed_batches 批次数、bytes、seconds、docs_per_second
+        """
+        # 连接MySQL（连接配置见 save_to_mysql.connect_to_mysql）
+        conn = connect_to_mysql(database)
+        columns = ["doc_id", "chunk_id", "file_name", "sheet_name", "json_content", "json_blob", "codec"]
+
+        stats = {"indexed": 0, "skipped": 0, "failed": 0, "deleted": 0, "batches": 0, "failed_batches": 0, "bytes": 0}
+        live_keys = []
+        # 清单键 -> [内容哈希, 未完成的请求数, 是否有失败, chunk_id]：一条记录的全部文档写入成功后才记入 manifest
+        pending = {}
+        owners = {}  # _id -> 清单键
+        row_counts = {}  # chunk_id -> 行文档数（用于清理多出来的旧行文档）
+
+        def index_requests():
+            for row in iter_rows(conn, columns, batch_size):
+                requests = self.build_requests(name, row, compact)
+                if manifest is not None:
+                    document_id = self.document_id(row)
+                    key = f"{name}/{document_id}"
+                    live_keys.append(key)
+                    content_hash = self.content_hash(row, compact)
+                    if manifest.is_current(STAGE_ES, key, content_hash):
+                        stats["skipped"] += 1
+                        continue
+                    pending[key] = [content_hash, len(requests), False, document_id]
+                    owners.update((request["_id"], key) for request in requests)
+                    if manifest.get(STAGE_ES, key) is not None:
+                        row_counts[document_id] = len(requests)
+                    if not requests:
+                        manifest.record(STAGE_ES, key, content_hash, document_id)
+                        del pending[key]
+                for request in requests:
+                    yield request
+
+        started = time.perf_counter()
+        try:
+            with self.bulk_load_settings(name, enabled=tune_settings):
+                for actions, failed_ids in self._send(name, index_requests(), stats, max_batch_bytes, max_batch_docs,
+                                                      workers):
+                    stats["indexed"] += len(actions) - len(failed_ids)
+                    if manifest is not None:
+                        for action in actions:
+                            key = owners.pop(action["_id"])
+                            entry = pending[key]
+                            entry[1] -= 1
+                            entry[2] = entry[2] or action["_id"] in failed_ids
+                            if entry[1] == 0:
+                                del pending[key]
+                                if not entry[2]:
+                                    manifest.record(STAGE_ES, key, entry[0], entry[3])
+
+                if manifest is not None:
+                    stats["deleted"] += self.prune_rows(name, row_counts)
+                    # 删除 MySQL 中已不存在的记录对应的文档
+                    stale = manifest.stale(STAGE_ES, live_keys, prefix=f"{name}/")
+                    if stale:
+                        failed_deletes = self.delete_chunks(name, [entry["artifacts"] for entry in stale.values()],
+                                                            stats, workers)
+                        for key, entry in stale.items():
+                            # 删除失败的文档保留在清单中，下次同步时重试
+                            if entry["artifacts"] not in failed_deletes:
+                                manifest.forget(STAGE_ES, key)
+                        print(f"Deleted {len(stale)} stale documents from index '{name}'.")
+        finally:
+            # 关闭MySQL连接
+            conn.close()
+            if manifest is not None:
+                manifest.save()
+
+        return self._finish_stats(name, stats, started)
+
+    @staticmethod
+    def _finish_stats(name, stats, started):
+        """补充耗时与 docs/s 并打印同步摘要"""
+        stats["seconds"] = round(time.perf_counter() - started, 3)
+        stats["docs_per_second"] = round(stats["indexed"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+        print(f"Indexed {stats['indexed']} documents into '{name}' ({stats['docs_per_second']} docs/s, "
+              f"{stats['batches']} bulk requests, {stats['bytes'] / 1048576:.1f} MB); "
+              f"skipped {stats['skipped']} unchanged, {stats['failed']} failed, {stats['deleted']} deleted")
+        return stats
+
+    def _send(self, name, actions, stats, max_batch_bytes, max_batch_docs, workers):
+        """
+        将请求按字节数切分批次并发发送，逐批汇总统计、打印失败
+        :return: (该批请求, 失败文档的 _id 集合) 生成器
+        """
+        actions = self.with_embeddings(name, actions)
+        for result in send_batches(self.client, iter_batches(actions, max_batch_bytes, max_batch_docs), workers):
+            yield result["actions"], self._report_batch(name, result, stats)
+
+    def resolve_indices(self, name):
+        """
+        name 为别名时返回其指向的实际索引列表；为普通索引时返回 [name]；不存在时返回 []
+        """
+        if self.client.indices.exists_alias(name=name):
+            return sorted(self.client.indices.get_alias(name=name).keys())
+        if self.client.indices.exists(index=name):
+            return [name]
+        return []
+
+    def get_watermark(self, name):
+        """
+        读取索引（或别名指向的索引）映射 _meta 中记录的同步水位线（见 save_to_mysql.sync_watermark），没有时返回 None
+        水位线随索引保存，切换别名后自动对应到新索引
+        """
+        mappings = self.client.indices.get_mapping(index=name)
+        mapping = next(iter(mappings.values()), {}).get("mappings", {})
+        return (mapping.get("_meta") or {}).get("sync_watermark")
+
+    def set_watermark(self, name, watermark):
+        """
+        将同步水位线写入索引映射的 _meta（时间转为字符串）；put_mapping 整体替换 _meta，因此保留其中的其他键（如索引粒度）
+        """
+        mappings = self.client.indices.get_mapping(index=name)
+        meta = dict(next(iter(mappings.values()), {}).get("mappings", {}).get("_meta") or {})
+        meta["sync_watermark"] = _plain_watermark(watermark)
+        self.client.indices.put_mapping(index=name, body={"_meta": meta})
+
+    def sync_incremental(
+        self,
+        name,
+        database="e_rag",
+        batch_size=500,
+        compact=False,
+        max_batch_bytes=DEFAULT_BATCH_BYTES,
+        max_batch_docs=DEFAULT_BATCH_DOCS,
+        workers=4,
+        safety_lag=SYNC_SAFETY_LAG,
+    ):
+        """
+        按 updated_at 水位线增量同步：只索引上次同步以来新增或内容变化的记录，并删除期间从 MySQL 删除的记录
+        （llm_outputs_deleted）对应的文档，无需扫描全表或清空索引
+        水位线保存在索引映射的 _meta 中；索引尚无水位线（旧索引）时同步全部记录；索引（或别名）不存在时改为全量重建
+        同步期间不调整刷新和副本设置，正在服务的查询不受影响
+        有文档写入失败时水位线只推进到最早失败的变更之前，下次同步时重试
+        每次从水位线往前 safety_lag 秒开始读取（见 SYNC_SAFETY_LAG），补上并发事务中晚提交的记录
+        行粒度索引中，变化的记录同时删除多出来的旧行文档，删除的记录按 parent_id 删除其全部行文档
+        返回同步统计（同 bulk_index_data），另含 watermark
+        """
+        if not self.resolve_indices(name):
+            return self.rebuild_index(name, database=database, batch_size=batch_size, compact=compact,
+                                      max_batch_bytes=max_batch_bytes, max_batch_docs=max_batch_docs, workers=workers)
+
+        previous = self.get_watermark(name) or {}
+        row_since = (previous["updated_at"], previous["id"]) if previous.get("updated_at") is not None else None
+        deleted_since = ((previous["deleted_at"], previous["chunk_id"])
+                         if previous.get("deleted_at") is not None else None)
+        row_read_since = (_lagged(row_since[0], safety_lag), 0) if row_since else None
+        deleted_read_since = (_lagged(deleted_since[0], safety_lag), "") if deleted_since else None
+        conn = connect_to_mysql(database)
+        columns = ["doc_id", "chunk_id", "file_name", "sheet_name", "json_content", "json_blob", "codec", "updated_at"]
+        stats = {"indexed": 0, "skipped": 0, "failed": 0, "deleted": 0, "batches": 0, "failed_batches": 0, "bytes": 0}
+        positions = {}  # _id -> (updated_at, id)
+        row_counts = {}  # chunk_id -> 行文档数
+        row_position, row_failed = row_since, []
+        deleted_position, deleted_failed = deleted_since, []
+
+        def index_requests():
+            nonlocal row_position
+            for row in iter_rows(conn, columns, batch_size, since=row_read_since):
+                requests = self.build_requests(name, row, compact)
+                position = (row["updated_at"], row["id"])
+                positions.update((request["_id"], position) for request in requests)
+                row_counts[self.document_id(row)] = len(requests)
+                # 水位线只前进：回读窗口内的记录可能早于上次的水位线
+                if row_position is None or _position_key(position) > _position_key(row_position):
+                    row_position = position
+                for request in requests:
+                    yield request
+
+        started = time.perf_counter()
+        try:
+            for actions, failed_ids in self._send(name, index_requests(), stats, max_batch_bytes, max_batch_docs,
+                                                  workers):
+                stats["indexed"] += len(actions) - len(failed_ids)
+                row_failed.extend(positions[_id] for _id in failed_ids if _id in positions)
+            stats["deleted"] += self.prune_rows(name, row_counts)
+
+            deleted = list_deleted(conn, deleted_read_since)
+            deleted_at = dict(deleted)
+            if deleted and (deleted_position is None or
+                            _position_key((deleted[-1][1], deleted[-1][0])) > _position_key(deleted_position)):
+                deleted_position = (deleted[-1][1], deleted[-1][0])
+            failed_ids = self.delete_chunks(name, deleted_at, stats, workers)
+            deleted_failed.extend((deleted_at[_id], _id) for _id in failed_ids)
+        finally:
+            conn.close()
+
+        # 有失败时水位线停在最早失败的变更之前（下次从它开始重新读取），否则推进到本次读到的最后一条
+        if row_failed:
+            updated_at, row_id = min(row_failed)
+            row_position = (updated_at, row_id - 1)
+        if deleted_failed:
+            deleted_position = (min(deleted_failed)[0], "")
+        watermark = {
+            "updated_at": row_position[0] if row_position else None,
+            "id": row_position[1] if row_position else None,
+            "deleted_at": deleted_position[0] if deleted_position else None,
+            "chunk_id": deleted_position[1] if deleted_position else None,
         }
+        if (row_position, deleted_position) != (row_since, deleted_since):
+            self.set_watermark(name, watermark)
+        stats["watermark"] = _plain_watermark(watermark)
+        return self._finish_stats(name, stats, started)
 
-        # 连接MySQL
-        conn = mysql.connector.connect(**mysql_config)
-        cursor = conn.cursor(dictionary=True)  # 返回字典格式的结果
-
-        # 查询数据
-        query = "SELECT id, file_name, sheet_name, json_content FROM llm_outputs;"
-        cursor.execute(query)
-        
-        # 分批处理
-        while True:
-            rows = cursor.fetchmany(batch_size)  # 每次获取batch_size条数据
-            if not rows:  # 如果没有更多数据，退出循环
-                break
+    def rebuild_index(
+        self,
+        alias,
+        database="e_rag",
+        keep=0,
+        batch_size=500,
+        compact=False,
+        max_batch_bytes=DEFAULT_BATCH_BYTES,
+        max_batch_docs=DEFAULT_BATCH_DOCS,
+        workers=4,
+        granularity=None,
+        rows_per_doc=None,
+        dense_vectors=None,
+        vector_store=None,
+    ):
+        """
+        零停机全量重建：把全部记录写入新的带版本号的索引（如 e_rag_v20261016120000），完成后在一个请求中原子地
+        将别名切换到新索引，再从重建开始前的水位线增量同步重建期间发生的变更
+        重建期间别名仍指向旧索引，rag_pipeline 等查询照常返回完整结果；有文档写入失败时不切换，删除新索引
+        首次使用时 alias 可能是旧的同名实体索引，它在切换的同一请求中删除
+        keep: 切换后保留的旧版本索引个数（用于回滚），更早的版本删除
+        granularity/rows_per_doc/dense_vectors/vector_store: 新索引的粒度、是否带向量及向量存放位置（见 create_label_index），
+        不传时沿用当前索引；本地向量索引随新索引重新生成，随旧索引删除
+        返回同步统计（同 bulk_index_data），另含 index 与 swapped
+        """
+        new_index = f"{alias}_v{time.strftime('%Y%m%d%H%M%S')}"
+        suffix = 1
+        while self.client.indices.exists(index=new_index):
+            suffix += 1
+            new_index = f"{alias}_v{time.strftime('%Y%m%d%H%M%S')}_{suffix}"
 
-            requests = []
-            for row in rows:
-                # json_content可能存储为字符串，需要解析
-                json_content_str = row["json_content"]
-                try:
-                    # 如果json_content是字符串，尝试解析为JSON并转为字符串形式用于检索
-                    json_content = json.dumps(json.loads(json_content_str), ensure_ascii=False)
-                except (json.JSONDecodeError, TypeError):
-                    json_content = json_content_str  # 如果解析失败，直接使用原始字符串
-
-                request = {
-                    "_op_type": "index",
-                    "_index": name,
-                    "_id": row["id"],
-                    "_source": {
-                        "file_name": row["file_name"],
-                        "sheet_name": row["sheet_name"],
-                        "json_content": json_content,
-                    },
-                }
-                requests.append(request)
+        # 在读取数据之前记录水位线，重建期间的变更由之后的增量同步补上
+        conn = connect_to_mysql(database)
+        try:
+            watermark = sync_watermark(conn)
+        finally:
+            conn.close()
+
+        layout = self.index_layout(alias)
+        self.create_label_index(new_index, granularity=granularity or layout["granularity"],
+                                rows_per_doc=rows_per_doc or layout["rows_per_doc"],
+                                dense_vectors=bool(layout["embedding"]) if dense_vectors is None else dense_vectors,
+                                vector_store=vector_store or (layout["embedding"] or {}).get("store", VECTOR_STORE_ES))
+        stats = self.bulk_index_data(new_index, database=database, batch_size=batch_size, compact=compact,
+                                     max_batch_bytes=max_batch_bytes, max_batch_docs=max_batch_docs, workers=workers)
+        stats.update(index=new_index, swapped=False)
+        if stats["failed"]:
+            print(f"Rebuild of '{alias}' had {stats['failed']} failed documents, keeping the current index")
+            self.delete_index(new_index)
+            return stats
+        self.set_watermark(new_index, watermark)
+
+        previous = self.resolve_indices(alias)
+        actions = [{"add": {"index": new_index, "alias": alias}}]
+        if previous == [alias]:
+            actions.append({"remove_index": {"index": alias}})
+        else:
+            actions += [{"remove": {"index": index, "alias": alias}} for index in previous]
+        self.client.indices.update_aliases(body={"actions": actions})
+        stats["swapped"] = True
+        self._layouts.pop(alias, None)
+        if previous == [alias] and (layout["embedding"] or {}).get("store") == VECTOR_STORE_LOCAL:
+            remove_vector_index(layout["embedding"]["path"])
+        print(f"Alias '{alias}' now points to '{new_index}' (was {previous or 'unset'})")
+
+        versions = sorted(index for index in self.client.indices.get(index=f"{alias}_v*") if index != new_index)
+        for index in versions[:len(versions) - keep] if keep else versions:
+            self.delete_index(index)
+            print(f"Deleted old index '{index}'")
+
+        catch_up = self.sync_incremental(alias, database=database, batch_size=batch_size, compact=compact,
+                                         max_batch_bytes=max_batch_bytes, max_batch_docs=max_batch_docs,
+                                         workers=workers)
+        if watermark["deleted_at"] is not None:
+            # 早于新索引水位线的删除记录已体现在新索引中，不再需要
+            conn = connect_to_mysql(database)
+            try:
+                purge_deleted(conn, watermark["deleted_at"])
+            finally:
+                conn.close()
+        stats["catch_up"] = {key: catch_up[key] for key in ("indexed", "deleted", "failed")}
+        return stats
 
-            # 批量插入到ES
-            bulk(self.client, requests)
+    def delete_index(self, name):
+        """
+        删除索引及其本地向量索引（如有）
+        """
+        embedding = self.index_layout(name)["embedding"]
+        self.client.indices.delete(index=name)
+        self._layouts.pop(name, None)
+        if embedding and embedding.get("store") == VECTOR_STORE_LOCAL:
+            remove_vector_index(embedding["path"])
 
-        # 关闭MySQL连接
-        cursor.close()
-        conn.close()
-        return "插入数据成功"
+    @staticmethod
+    def _report_batch(name, result, stats):
+        """
+        汇总并打印一个 bulk 批次的结果（删除已不存在的文档返回 404，视为删除成功）
+        :return: 该批中失败文档的 _id 集合
+        """
+        stats["batches"] += 1
+        stats["bytes"] += result["bytes"]
+        if result["exception"] is not None:
+            failed_ids = {action["_id"] for action in result["actions"]}
+            print(f"Batch {result['batch']} to '{name}' failed ({len(result['actions'])} documents, "
+                  f"{result['bytes']} bytes): {result['exception']}")
+        else:
+            errors = [error for error in result["errors"]
+                      if not (next(iter(error), None) == "delete" and next(iter(error.values()), {}).get("status") == 404)]
+            failed_ids = {_error_id(error) for error in errors}
+            if errors:
+                print(f"Batch {result['batch']} to '{name}': {len(errors)} of {len(result['actions'])} documents "
+                      f"failed, first error: {errors[0]}")
+        if failed_ids:
+            stats["failed"] += len(failed_ids)
+            stats["failed_batches"] += 1
+        return failed_ids
+
+    def search_knn(self, name, text, fields, size=10):
+        """
+        按问题向量在 embedding 字段上做 kNN 检索；索引没有向量（或向量模型不一致）时返回空列表
+        向量存放在本地向量索引时先在本地检索，再按 _id 从 ES 取回文档（_score 为本地索引的余弦相似度）
+        :return: ES hits 列表，按相似度从高到低
+        """
+        embedder = self.index_embedder(name)
+        if embedder is None:
+            return []
+        local = self.local_vectors(name)
+        if local is not None:
+            scores = {item["key"]: item["score"] for item in local.search(embedder.embed([text])[0], k=size)}
+            if not scores:
+                return []
+            dsl_text = {"_source": fields, "size": len(scores), "query": {"ids": {"values": list(scores)}}}
+            hits = self.client.search(index=name, body=dsl_text)["hits"]["hits"]
+            return sorted((dict(hit, _score=scores[hit["_id"]]) for hit in hits), key=lambda hit: hit["_score"],
+                          reverse=True)
+        dsl_text = {
+            "_source": fields,
+            "size": size,
+            "knn": {"field": "embedding", "query_vector": embedder.embed([text])[0], "k": size,
+                    "num_candidates": max(100, size * 10)},
+        }
+        return self.client.search(index=name, body=dsl_text)["hits"]["hits"]
 
     def search_by_text(self, name, text):
+        """
+        在 json_content 中全文检索（BM25）；索引带向量时同时做 kNN 检索，两者按倒数排名融合（RRF），
+        召回与问题用词不同但内容相近的文档
+        """
+        fields = ["file_name", "sheet_name", "json_content"]
         dsl_text = {
-            "_source": ["file_name", "sheet_name", "json_content"],
+            "_source": fields,
             "size": 10,
             "query": {
                 "match": {
@@ -147,12 +914,114 @@ class Elastic(object):
         }
         result = self.client.search(index=name, body=dsl_text)
         hits = result["hits"]["hits"]
+        knn_hits = self.search_knn(name, text, fields)
+        if knn_hits:
+            hits = rrf_fuse([hits, knn_hits], size=10)
         file_names = [x["_source"]["file_name"] for x in hits]
         sheet_names = [x["_source"]["sheet_name"] for x in hits]
         json_contents = [x["_source"]["json_content"] for x in hits]
         scores = [x["_score"] for x in hits]
         return file_names, sheet_names, json_contents, scores
 
+    def search_rows(self, name, text, size=50, min_score_ratio=0.5, knn_size=10):
+        """
+        在行粒度索引中检索匹配的行文档，按得分从高到低返回 _source 列表（含 _score）
+        行文档很短，只命中问题中常见词（如“项目”“使用”）的行得分远低于命中料号的行，得分低于最高分 min_score_ratio 倍的行不返回
+        索引带向量时再与 kNN 检索的前 knn_size 行做倒数排名融合（_score 为融合得分）
+        """
+        fields = ["file_name", "sheet_name", "table_name", "parent_id", "position", "headers", "json_content"]
+        dsl_text = {
+            "_source": fields,
+            "size": size,
+            "query": {"match": {"json_content": text}},
+        }
+        result = self.client.search(index=name, body=dsl_text)
+        hits = result["hits"]["hits"]
+        min_score = hits[0]["_score"] * min_score_ratio if hits else 0
+        hits = [hit for hit in hits if hit["_score"] >= min_score]
+        knn_hits = self.search_knn(name, text, fields, knn_size)
+        if knn_hits:
+            hits = rrf_fuse([hits, knn_hits], size=size)
+        return [dict(hit["_source"], _score=hit["_score"]) for hit in hits]
+
+    def search_specs(self, name, text, size=200):
+        """
+        在行粒度索引中按问题里的规格约束精确过滤（见 spec_fields.parse_constraints），如“功率大于0.5W的1206电阻”
+        转为 spec.power_w > 0.5、spec.package = 1206 且 sheet 名或表名含“电阻”；只过滤不计分，结果按原表顺序
+        :return: 符合条件的行文档 _source 列表；问题中没有数值或封装约束时返回 None
+        """
+        constraints = parse_constraints(text)
+        if not has_constraints(constraints):
+            return None
+        dsl_text = {
+            "_source": ["file_name", "sheet_name", "table_name", "parent_id", "position", "headers", "json_content"],
+            "size": size,
+            "query": {"bool": {"filter": build_filters(constraints)}},
+        }
+        result = self.client.search(index=name, body=dsl_text)
+        return [dict(hit["_source"], _score=hit["_score"]) for hit in result["hits"]["hits"]]
+
+    def lookup_parts(self, name, part_numbers, categories=(), size=50):
+        """
+        在行粒度索引中按料号查找行：完全匹配（规范化后相等）的行排在前面，其次是以该料号为前缀的行
+        （如“CZMVF3568”匹配“CZMVF3568-V3-1228”）
+        :param part_numbers: 料号列表（查询前按 part_numbers.normalize_part_number 规范化）
+        :param categories: 元器件类别（如“PTC”），只返回 sheet 名或表名含其中之一的行
+        :return: 命中的行文档 _source 列表（含 _score），按得分从高到低
+        """
+        part_numbers = [normalize_part_number(number) for number in part_numbers]
+        should = [{"constant_score": {"filter": {"terms": {"part_numbers": part_numbers}}, "boost": 10}}]
+        should += [{"match": {"part_numbers.prefix": number}} for number in part_numbers]
+        dsl_text = {
+            "_source": ["file_name", "sheet_name", "table_name", "parent_id", "position", "headers", "json_content"],
+            "size": size,
+            "query": {"bool": {"should": should, "minimum_should_match": 1,
+                               "filter": build_filters({"ranges": [], "package": [], "categories": list(categories)})}},
+        }
+        result = self.client.search(index=name, body=dsl_text)
+        return [dict(hit["_source"], _score=hit["_score"]) for hit in result["hits"]["hits"]]
+
+    @staticmethod
+    def build_row_context(hits, max_length=60000):
+        """
+        将命中的行拼接为上下文：同一 sheet 的同一张表合为一段，段内先给出来源和表头，再按原顺序列出命中的行；
+        各段按其最高得分排序，用分隔符拼接，总长度不超过 max_length
+        返回：
+        - context: 构建好的上下文字符串
+        - doc_sources: 命中的文档来源列表 [(file_name, sheet_name), ...]（去重，按得分排序）
+        """
+        if not hits:
+            return "未找到相关内容", []
+        groups = {}
+        for hit in hits:  # 已按得分排序，段的顺序即其最高得分的顺序
+            groups.setdefault((hit.get("parent_id"), hit.get("table_name")), []).append(hit)
+
+        selected_results = []
+        doc_sources = []
+        total_length = 0
+        for group in groups.values():
+            first = group[0]
+            source = f"{first['file_name']}_{first['sheet_name']}"
+            if first.get("table_name") and first["table_name"] != first["sheet_name"]:
+                source += f" / {first['table_name']}"
+            lines = [f"[来源: {source}]"]
+            if first.get("headers"):
+                lines.append("表头: " + " | ".join(str(header) for header in first["headers"]))
+            lines += [hit["json_content"] for hit in sorted(group, key=lambda hit: hit.get("position", 0))]
+            part = "\n".join(lines)
+            if total_length + len(part) > max_length:
+                remaining_length = max_length - total_length
+                if remaining_length > 0:
+                    selected_results.append(part[:remaining_length] + "...")
+                    doc_sources.append((first["file_name"], first["sheet_name"]))
+                break
+            selected_results.append(part)
+            doc_sources.append((first["file_name"], first["sheet_name"]))
+            total_length += len(part)
+
+        context = "   ---   ".join(selected_results)
+        return context, list(dict.fromkeys(doc_sources))
+
     def search_and_build_context(self, name, text):
         """
         搜索并构建上下文，用于 RAG 输入
@@ -162,7 +1031,12 @@ class Elastic(object):
         返回：
         - context: 构建好的上下文字符串
         - doc_sources: 检索到的文档来源列表 [(file_name, sheet_name), ...]
+        行粒度索引（见 create_label_index）只拼接命中的行及其表头（见 build_row_context）；问题中有规格约束时
+        先按结构化字段精确过滤（见 search_specs），没有符合条件的行时再全文检索
         """
+        if self.index_layout(name)["granularity"] == GRANULARITY_ROWS:
+            return self.build_row_context(self.search_specs(name, text) or self.search_rows(name, text))
+
         # 步骤 1：从 ES 查询
         file_names, sheet_names, json_contents, scores = self.search_by_text(name, text)
         if not file_names:
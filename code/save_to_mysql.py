@@ -1,19 +1,42 @@
 # -*- coding: utf-8 -*-
+import hashlib
 import os
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Tuple
+
 import mysql.connector
 from mysql.connector import Error
+from content_codec import encode_content
+from ingest_manifest import IngestManifest, STAGE_MYSQL
+from table_format import load_document
+
+# 可替换的连接工厂（如 fake_backends 的本地 SQLite 替身），为 None 时连接真实的 MySQL
+_connection_factory = None
+
+def configure_mysql(factory: Callable[[str], Any] = None):
+    """
+    设置创建数据库连接的工厂函数，用于在没有 MySQL 的环境中运行和压测；传入 None 恢复连接真实的 MySQL。
+    :param factory: 接收数据库名、返回连接对象的函数（连接对象需兼容 mysql.connector 的 cursor/commit/rollback/close/is_connected）
+    """
+    global _connection_factory
+    _connection_factory = factory
 
-def connect_to_mysql():
+def connect_to_mysql(database: str = "e_rag"):
     """
     连接到 MySQL 数据库。
+    :param database: 数据库名
     :return: 数据库连接对象
     """
+    if _connection_factory is not None:
+        return _connection_factory(database)
     try:
         connection = mysql.connector.connect(
             host="10.10.37.77",
             user="root",
             password="TF123456",
-            database="e_rag",
+            database=database,
             charset="utf8mb4"
         )
         if connection.is_connected():
@@ -23,43 +46,498 @@ def connect_to_mysql():
         print(f"Error connecting to MySQL: {str(e)}")
         raise
 
+# llm_outputs 表结构：(file_name, sheet_name) 唯一，重复写入按 upsert 覆盖；
+# chunk_id 由 (file_name, sheet_name) 确定性生成，同时作为 ES 文档的 _id；
+# 有效的 JSON 规范化后压缩存入 json_blob（codec 为压缩方式，meta 为元数据），json_content 只保存无法解析的原文；
+# updated_at 在插入和内容实际变化时自动更新，作为 ES 增量同步的水位线
+LLM_OUTPUTS_DDL = """
+CREATE TABLE IF NOT EXISTS llm_outputs (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    doc_id VARCHAR(64),
+    chunk_id CHAR(24),
+    file_name VARCHAR(255) NOT NULL,
+    sheet_name VARCHAR(255) NOT NULL,
+    json_content LONGTEXT NULL,
+    json_blob LONGBLOB NULL,
+    codec VARCHAR(8) NULL,
+    meta VARCHAR(1024) NULL,
+    updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6),
+    UNIQUE KEY uk_file_sheet (file_name(191), sheet_name(191)),
+    UNIQUE KEY uk_chunk_id (chunk_id),
+    KEY idx_doc_id (doc_id),
+    KEY idx_updated_at (updated_at, id)
+) DEFAULT CHARSET=utf8mb4
+"""
+
+# 已删除记录的 chunk_id（删除时写入），增量同步据此删除 ES 中对应的文档
+LLM_OUTPUTS_DELETED_DDL = """
+CREATE TABLE IF NOT EXISTS llm_outputs_deleted (
+    chunk_id CHAR(24) PRIMARY KEY,
+    doc_id VARCHAR(64),
+    deleted_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6),
+    KEY idx_deleted_at (deleted_at)
+) DEFAULT CHARSET=utf8mb4
+"""
+
+UPSERT_QUERY = """
+INSERT INTO llm_outputs (doc_id, chunk_id, file_name, sheet_name, json_content, json_blob, codec, meta)
+VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+ON DUPLICATE KEY UPDATE doc_id = VALUES(doc_id), chunk_id = VALUES(chunk_id), json_content = VALUES(json_content),
+    json_blob = VALUES(json_blob), codec = VALUES(codec), meta = VALUES(meta)
+"""
+
+def make_doc_id(file_name: str) -> str:
+    """
+    由文件名确定性生成文档 ID：同一文件在每次运行、每台机器上得到相同的 ID，与处理顺序无关。
+    :param file_name: 文件名（如 xxx.xlsx）
+    :return: 16 位十六进制 ID
+    """
+    return hashlib.sha256(f"doc\n{file_name}".encode("utf-8")).hexdigest()[:16]
+
+def make_chunk_id(file_name: str, sheet_name: str) -> str:
+    """
+    由 (file_name, sheet_name) 确定性生成单元（sheet/chunk/分段）ID，MySQL 的 chunk_id 与 ES 的 _id 均使用该值，
+    内容变化时可以按 ID 原地覆盖或单独删除。
+    :param file_name: 文件名
+    :param sheet_name: sheet 名称（分块时含 chunk 编号）
+    :return: 24 位十六进制 ID
+    """
+    return hashlib.sha256(f"chunk\n{file_name}\n{sheet_name}".encode("utf-8")).hexdigest()[:24]
+
+def ensure_schema(connection):
+    """
+    创建 llm_outputs 表；已有的表缺少 (file_name, sheet_name) 唯一键时，先删除重复记录（保留 id 最小的一条）再补建唯一键；
+    缺少 chunk_id 列时补建该列，并为已有记录回填 chunk_id 和确定性的 doc_id；
+    缺少压缩存储列时补建，并将已有记录转换为压缩存储（见 compress_existing_rows）；
+    缺少 updated_at 列时补建（已有记录取补建时的时间），并创建删除记录表 llm_outputs_deleted。
+    自行维护表结构的连接（如 fake_backends 的替身，manages_schema=True）跳过。
+    :param connection: 数据库连接对象
+    """
+    if getattr(connection, "manages_schema", False):
+        return
+    cursor = connection.cursor()
+    try:
+        cursor.execute(LLM_OUTPUTS_DDL)
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.statistics "
+            "WHERE table_schema = DATABASE() AND table_name = 'llm_outputs' AND index_name = 'uk_file_sheet'"
+        )
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(
+                "DELETE a FROM llm_outputs a JOIN llm_outputs b "
+                "ON a.file_name = b.file_name AND a.sheet_name = b.sheet_name AND a.id > b.id"
+            )
+            cursor.execute("ALTER TABLE llm_outputs ADD UNIQUE KEY uk_file_sheet (file_name(191), sheet_name(191))")
+            print(f"Added unique key on llm_outputs (file_name, sheet_name), removed {cursor.rowcount} duplicates")
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = 'llm_outputs' AND column_name = 'chunk_id'"
+        )
+        if cursor.fetchone()[0] == 0:
+            cursor.execute("ALTER TABLE llm_outputs ADD COLUMN chunk_id CHAR(24) AFTER doc_id, ADD KEY idx_doc_id (doc_id)")
+            cursor.execute("SELECT id, file_name, sheet_name FROM llm_outputs")
+            updates = [(make_doc_id(file_name), make_chunk_id(file_name, sheet_name), row_id)
+                       for row_id, file_name, sheet_name in cursor.fetchall()]
+            cursor.executemany("UPDATE llm_outputs SET doc_id = %s, chunk_id = %s WHERE id = %s", updates)
+            cursor.execute("ALTER TABLE llm_outputs ADD UNIQUE KEY uk_chunk_id (chunk_id)")
+            print(f"Added chunk_id to llm_outputs, backfilled {len(updates)} records")
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = 'llm_outputs' AND column_name = 'json_blob'"
+        )
+        migrate = cursor.fetchone()[0] == 0
+        if migrate:
+            cursor.execute(
+                "ALTER TABLE llm_outputs MODIFY json_content LONGTEXT NULL, ADD COLUMN json_blob LONGBLOB NULL, "
+                "ADD COLUMN codec VARCHAR(8) NULL, ADD COLUMN meta VARCHAR(1024) NULL"
+            )
+        cursor.execute(
+            "SELECT COUNT(*) FROM information_schema.columns "
+            "WHERE table_schema = DATABASE() AND table_name = 'llm_outputs' AND column_name = 'updated_at'"
+        )
+        if cursor.fetchone()[0] == 0:
+            cursor.execute(
+                "ALTER TABLE llm_outputs ADD COLUMN updated_at TIMESTAMP(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) "
+                "ON UPDATE CURRENT_TIMESTAMP(6), ADD KEY idx_updated_at (updated_at, id)"
+            )
+            print("Added updated_at to llm_outputs")
+        cursor.execute(LLM_OUTPUTS_DELETED_DDL)
+        connection.commit()
+        if migrate:
+            compress_existing_rows(connection)
+    finally:
+        cursor.close()
+
+class ConnectionPool:
+    """
+    线程安全的数据库连接池：最多 size 个连接，按需创建、用完归还复用，连接断开时重新创建。
+    连接通过 connect_to_mysql 创建，因此同样适用于 configure_mysql 设置的替身。
+    """
+
+    def __init__(self, size: int = 4, database: str = "e_rag"):
+        """
+        初始化 ConnectionPool 类。
+        :param size: 最大连接数
+        :param database: 数据库名
+        """
+        self.size = max(1, size)
+        self.database = database
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._schema_ready = False
+
+    def acquire(self):
+        """
+        取出一个连接，没有空闲连接且已达上限时阻塞等待。
+        :return: 数据库连接对象
+        """
+        connection = None
+        try:
+            connection = self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                create = self._created < self.size
+                if create:
+                    self._created += 1
+            if create:
+                try:
+                    connection = connect_to_mysql(self.database)
+                except Exception:
+                    with self._lock:
+                        self._created -= 1
+                    raise
+            else:
+                connection = self._idle.get()
+        if not connection.is_connected():
+            connection = connect_to_mysql(self.database)
+        with self._lock:
+            if not self._schema_ready:
+                ensure_schema(connection)
+                self._schema_ready = True
+        return connection
+
+    def release(self, connection):
+        """
+        归还连接。
+        :param connection: 数据库连接对象
+        """
+        self._idle.put(connection)
+
+    @contextmanager
+    def connection(self):
+        """
+        以 with 语句借用一个连接，结束时自动归还。
+        """
+        connection = self.acquire()
+        try:
+            yield connection
+        finally:
+            self.release(connection)
+
+    def close(self):
+        """
+        关闭所有空闲连接。
+        """
+        while True:
+            try:
+                connection = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            if connection.is_connected():
+                connection.close()
+
+def write_rows(connection, rows: List[Tuple[str, str, str, str]]) -> List[str]:
+    """
+    以一个事务批量写入记录：executemany 执行 upsert（按 (file_name, sheet_name) 唯一键去重，已存在时覆盖内容），
+    成功后整批提交，失败时整批回滚。json_content 在写入前校验、规范化并压缩（见 content_codec.encode_content）。
+    :param connection: 数据库连接对象
+    :param rows: [(doc_id, file_name, sheet_name, json_content), ...]；json_content 也可以是已经 encode_content 的结果
+    :return: 各记录的 chunk_id（与 rows 顺序一致，同时用作 ES 文档的 _id）
+    """
+    if not rows:
+        return []
+    chunk_ids = [make_chunk_id(file_name, sheet_name) for _, file_name, sheet_name, _ in rows]
+    params = []
+    for (doc_id, file_name, sheet_name, json_content), chunk_id in zip(rows, chunk_ids):
+        encoded = json_content if isinstance(json_content, dict) else encode_content(json_content)
+        if not encoded["valid"]:
+            print(f"Invalid JSON for {file_name}_{sheet_name}, storing the raw text uncompressed")
+        params.append((doc_id, chunk_id, file_name, sheet_name, None if encoded["valid"] else encoded["text"],
+                       encoded["blob"], encoded["codec"], encoded["meta"]))
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        cursor.executemany(UPSERT_QUERY, params)
+        connection.commit()
+        return chunk_ids
+    except Error as e:
+        connection.rollback()
+        print(f"Error saving batch of {len(rows)} records to MySQL: {str(e)}")
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+
+def compress_existing_rows(connection, batch_size: int = 200) -> int:
+    """
+    将只有 json_content 文本的旧记录转换为压缩存储（校验、规范化、压缩），每批一个事务。无法解析的记录保持原样。
+    :param connection: 数据库连接对象
+    :param batch_size: 每批转换的记录数
+    :return: 转换的记录数
+    """
+    converted = 0
+    last_id = 0
+    cursor = connection.cursor()
+    try:
+        while True:
+            cursor.execute(
+                "SELECT id, json_content FROM llm_outputs WHERE json_blob IS NULL AND id > %s ORDER BY id LIMIT %s",
+                (last_id, batch_size),
+            )
+            batch = cursor.fetchall()
+            if not batch:
+                break
+            last_id = batch[-1][0]
+            updates = []
+            for row_id, json_content in batch:
+                encoded = encode_content(json_content)
+                if encoded["valid"]:
+                    updates.append((encoded["blob"], encoded["codec"], encoded["meta"], row_id))
+            cursor.executemany(
+                "UPDATE llm_outputs SET json_content = NULL, json_blob = %s, codec = %s, meta = %s WHERE id = %s",
+                updates,
+            )
+            connection.commit()
+            converted += len(updates)
+    finally:
+        cursor.close()
+    print(f"Compressed {converted} existing llm_outputs records")
+    return converted
+
+def iter_rows(connection, columns: List[str], page_size: int = 500, since: Tuple[Any, int] = None) -> Iterator[Dict[str, Any]]:
+    """
+    按主键分页（keyset：WHERE id > 上一页最后的 id ORDER BY id LIMIT n）流式读取 llm_outputs。
+    每页是一条走主键索引的短查询，服务端不保持长时间打开的游标，客户端内存中最多只有一页记录，
+    翻页代价也不随偏移量增长（不同于 LIMIT offset, n）。
+    传入 since=(updated_at, id) 时只读取该位置之后变更的记录，按 (updated_at, id) 分页（走 idx_updated_at），
+    并总是返回 updated_at 列；同一条语句写入的记录 updated_at 相同，以 id 区分先后。
+    :param connection: 数据库连接对象
+    :param columns: 要读取的列（自动包含 id）
+    :param page_size: 每页记录数
+    :param since: 水位线位置（见 sync_watermark），为 None 时读取全部记录
+    :return: 记录字典生成器
+    """
+    columns = ["id"] + [column for column in columns if column != "id"]
+    if since is None:
+        query = f"SELECT {', '.join(columns)} FROM llm_outputs WHERE id > %s ORDER BY id LIMIT %s"
+        position = (0,)
+    else:
+        if "updated_at" not in columns:
+            columns.append("updated_at")
+        query = (f"SELECT {', '.join(columns)} FROM llm_outputs "
+                 "WHERE updated_at > %s OR (updated_at = %s AND id > %s) ORDER BY updated_at, id LIMIT %s")
+        position = (since[0], since[0], since[1])
+    cursor = connection.cursor(dictionary=True)
+    try:
+        while True:
+            cursor.execute(query, position + (page_size,))
+            page = cursor.fetchall()
+            if not page:
+                break
+            last = page[-1]
+            position = (last["id"],) if since is None else (last["updated_at"], last["updated_at"], last["id"])
+            for row in page:
+                yield row
+            if len(page) < page_size:
+                break
+    finally:
+        cursor.close()
+
+def list_deleted(connection, since: Tuple[Any, str] = None) -> List[Tuple[str, Any]]:
+    """
+    按 (deleted_at, chunk_id) 顺序列出 since 位置之后删除、且之后没有重新写入的记录。
+    :param connection: 数据库连接对象
+    :param since: 水位线位置 (deleted_at, chunk_id)，为 None 时列出全部
+    :return: [(chunk_id, deleted_at), ...]
+    """
+    query = ("SELECT d.chunk_id, d.deleted_at FROM llm_outputs_deleted d "
+             "LEFT JOIN llm_outputs o ON o.chunk_id = d.chunk_id WHERE o.id IS NULL")
+    params = ()
+    if since is not None:
+        query += " AND (d.deleted_at > %s OR (d.deleted_at = %s AND d.chunk_id > %s))"
+        params = (since[0], since[0], since[1])
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query + " ORDER BY d.deleted_at, d.chunk_id", params)
+        return [(chunk_id, deleted_at) for chunk_id, deleted_at in cursor.fetchall()]
+    finally:
+        cursor.close()
+
+def sync_watermark(connection) -> Dict[str, Any]:
+    """
+    当前最新的变更位置：最后写入的记录 (updated_at, id) 与最后的删除记录 (deleted_at, chunk_id)，表为空时对应项为 None。
+    在全量同步开始前读取，之后以它为起点增量同步，即可补上全量同步期间发生的变更。
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT updated_at, id FROM llm_outputs ORDER BY updated_at DESC, id DESC LIMIT 1")
+        updated_at, row_id = cursor.fetchone() or (None, None)
+        cursor.execute("SELECT deleted_at, chunk_id FROM llm_outputs_deleted ORDER BY deleted_at DESC, chunk_id DESC LIMIT 1")
+        deleted_at, chunk_id = cursor.fetchone() or (None, None)
+    finally:
+        cursor.close()
+    return {"updated_at": updated_at, "id": row_id, "deleted_at": deleted_at, "chunk_id": chunk_id}
+
+def purge_deleted(connection, before: Any) -> int:
+    """
+    清理 before 之前的删除记录（全量重建后已不再需要）。
+    :return: 清理的记录数
+    """
+    cursor = connection.cursor()
+    try:
+        cursor.execute("DELETE FROM llm_outputs_deleted WHERE deleted_at < %s", (before,))
+        purged = cursor.rowcount
+        connection.commit()
+        return purged
+    finally:
+        cursor.close()
+
 def save_to_mysql(connection, doc_id: str, file_name: str, sheet_name: str, json_content: str):
     """
-    将 JSON 数据保存到 MySQL 数据库，先检查是否存在重复记录，避免自增 id 跳跃。
+    将 JSON 数据保存到 MySQL 数据库（单条 upsert，批量写入请使用 write_rows 或 BatchWriter）。
     :param connection: 数据库连接对象
-    :param doc_id: 文档 ID（根据 file_name 生成）
+    :param doc_id: 文档 ID（见 make_doc_id）
     :param file_name: Excel 文件名
     :param sheet_name: Sheet 名称
     :param json_content: JSON 字符串
+    :return: 记录的 chunk_id
+    """
+    return write_rows(connection, [(doc_id, file_name, sheet_name, json_content)])[0]
+
+class BatchWriter:
+    """
+    缓冲待写入的记录，攒满 batch_size 条后从连接池借用一个连接，以一个事务批量 upsert。
+    flush 后通过 on_flush 回调通知已落库的记录（如写回增量导入清单）。
+    """
+
+    def __init__(self, pool: ConnectionPool, batch_size: int = 500,
+                 on_flush: Callable[[List[Tuple[Any, int]]], None] = None):
+        """
+        初始化 BatchWriter 类。
+        :param pool: 连接池
+        :param batch_size: 每个事务写入的记录数
+        :param on_flush: 每批提交后调用，参数为 [(调用 add 时传入的 tag, chunk_id), ...]
+        """
+        self.pool = pool
+        self.batch_size = max(1, batch_size)
+        self.on_flush = on_flush
+        self.written = 0
+        self.batches = 0
+        self._rows = []
+        self._tags = []
+
+    def add(self, doc_id: str, file_name: str, sheet_name: str, json_content: str, tag: Any = None):
+        """
+        添加一条记录，缓冲区满时写入。
+        :param tag: 随记录传给 on_flush 的任意标记
+        """
+        self._rows.append((doc_id, file_name, sheet_name, json_content))
+        self._tags.append(tag)
+        if len(self._rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        """
+        写入缓冲区中的全部记录。
+        """
+        if not self._rows:
+            return
+        rows, tags = self._rows, self._tags
+        self._rows, self._tags = [], []
+        with self.pool.connection() as connection:
+            ids = write_rows(connection, rows)
+        self.written += len(rows)
+        self.batches += 1
+        if self.on_flush:
+            self.on_flush(list(zip(tags, ids)))
+
+def _record_deleted(cursor, condition: str, params: List[tuple]):
+    """在删除前把将被删除的记录写入 llm_outputs_deleted（与删除在同一事务中），供 ES 增量同步删除对应文档"""
+    cursor.executemany(
+        "REPLACE INTO llm_outputs_deleted (chunk_id, doc_id) "
+        f"SELECT chunk_id, doc_id FROM llm_outputs WHERE {condition} AND chunk_id IS NOT NULL",
+        params,
+    )
+
+def delete_from_mysql(connection, file_name: str, sheet_name: str):
+    """
+    删除指定 file_name 和 sheet_name 的记录（用于内容变化后的重写和过期记录清理）。
+    :param connection: 数据库连接对象
+    :param file_name: 文件名
+    :param sheet_name: Sheet 名称
     """
     cursor = None
     try:
         cursor = connection.cursor()
-        
-        # 检查是否已存在相同 file_name 和 sheet_name 的记录
-        check_query = """
-        SELECT COUNT(*) FROM llm_outputs WHERE file_name = %s AND sheet_name = %s
-        """
-        cursor.execute(check_query, (file_name, sheet_name))
-        count = cursor.fetchone()[0]
-        
-        if count > 0:
-            print(f"Duplicate record found for {file_name}_{sheet_name}, skipping insertion...")
-            return  # 直接返回，不执行插入操作，避免自增 id 分配
-        
-        # 如果记录不存在，执行插入
-        insert_query = """
-        INSERT INTO llm_outputs (doc_id, file_name, sheet_name, json_content)
-        VALUES (%s, %s, %s, %s)
-        """
-        data = (doc_id, file_name, sheet_name, json_content)
-        cursor.execute(insert_query, data)
+        _record_deleted(cursor, "file_name = %s AND sheet_name = %s", [(file_name, sheet_name)])
+        delete_query = """
+        DELETE FROM llm_outputs WHERE file_name = %s AND sheet_name = %s
+        """
+        cursor.execute(delete_query, (file_name, sheet_name))
         connection.commit()
-        print(f"Successfully saved data to MySQL: {file_name}_{sheet_name}")
-        
+        print(f"Deleted MySQL record: {file_name}_{sheet_name}")
     except Error as e:
         connection.rollback()
-        print(f"Error saving to MySQL: {str(e)}")
+        print(f"Error deleting from MySQL: {str(e)}")
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+
+def delete_rows(connection, rows: List[Tuple[str, str]]):
+    """
+    以一个事务批量删除记录（用于过期记录清理）。
+    :param connection: 数据库连接对象
+    :param rows: [(file_name, sheet_name), ...]
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        _record_deleted(cursor, "file_name = %s AND sheet_name = %s", rows)
+        cursor.executemany("DELETE FROM llm_outputs WHERE file_name = %s AND sheet_name = %s", rows)
+        connection.commit()
+        print(f"Deleted {len(rows)} MySQL records")
+    except Error as e:
+        connection.rollback()
+        print(f"Error deleting from MySQL: {str(e)}")
+        raise
+    finally:
+        if cursor:
+            cursor.close()
+
+def delete_document(connection, doc_id: str) -> int:
+    """
+    删除一个文档（文件）的全部记录，用于单独移除某个文件而无需清空整张表。
+    :param connection: 数据库连接对象
+    :param doc_id: 文档 ID（见 make_doc_id）
+    :return: 删除的记录数
+    """
+    cursor = None
+    try:
+        cursor = connection.cursor()
+        _record_deleted(cursor, "doc_id = %s", [(doc_id,)])
+        cursor.execute("DELETE FROM llm_outputs WHERE doc_id = %s", (doc_id,))
+        deleted = cursor.rowcount
+        connection.commit()
+        print(f"Deleted {deleted} MySQL records of document {doc_id}")
+        return deleted
+    except Error as e:
+        connection.rollback()
+        print(f"Error deleting from MySQL: {str(e)}")
         raise
     finally:
         if cursor:
@@ -70,7 +548,7 @@ def extract_info_from_filename(filename: str) -> tuple[str, str]:
     从文件名中提取 file_name 和 sheet_name。
     文件名格式：
     - Excel 文件：excel文件名_sheet名称_llm_output_0.json
-    - Docx 文件：word名称_1.json（无 sheet_name，使用 file_name 作为 sheet_name）
+    - Docx 文件：word名称_1.json（无 sheet_name，使用 file_name 作为 sheet_name；分段文件见 extract_info_from_json）
     - Pptx 文件：ppt名称_sheet名称_2.json
     :param filename: 文件名（不含路径）
     :return: (file_name, sheet_name)
@@ -113,7 +591,26 @@ def extract_info_from_filename(filename: str) -> tuple[str, str]:
 
     return file_name, sheet_name
 
-def main():
+def extract_info_from_json(json_str: str, filename: str) -> tuple[str, str]:
+    """
+    优先从 JSON 内容中读取 file_name 和 sheet_name：Word 分段文件（word名称_分段编号_1.json）
+    自带 file_name 和分段名称，无法从文件名还原；其他文件按文件名解析。
+    :param json_str: JSON 文件内容
+    :param filename: 文件名（不含路径）
+    :return: (file_name, sheet_name)
+    """
+    document = load_document(json_str)
+    if isinstance(document, dict) and isinstance(document.get("section"), dict):
+        return document["file_name"], document["section"]["name"]
+    return extract_info_from_filename(filename)
+
+def main(manifest: IngestManifest = None, batch_size: int = 500, pool_size: int = 2):
+    """
+    将大模型处理后的 JSON 文件写入 MySQL：攒批后经连接池以事务批量 upsert，每批提交后写回增量导入清单。
+    :param manifest: 增量导入清单；内容未变化的文件跳过，变化的文件覆盖原记录，已删除的文件清理其记录
+    :param batch_size: 每个事务写入的记录数
+    :param pool_size: 连接池大小
+    """
     # 定义输入目录（大模型处理后的 JSON 文件）
     input_dir = "llm_output_test"  # 存储大模型校对后文件的目录
 
@@ -121,13 +618,22 @@ def main():
     if not os.path.exists(input_dir):
         raise FileNotFoundError(f"Input directory not found: {input_dir}")
 
-    # 连接到 MySQL 数据库
-    connection = connect_to_mysql()
+    if manifest is None:
+        manifest = IngestManifest()
+
+    pool = ConnectionPool(size=pool_size)
 
-    # 用于跟踪 file_name 到 doc_id 的映射
-    file_name_to_doc_id = {}
-    next_doc_id = 0  # 从 0 开始自增
+    def record_batch(written):
+        for (input_json_path, content_hash, file_name, sheet_name), _ in written:
+            manifest.record(STAGE_MYSQL, input_json_path, content_hash, {"file_name": file_name, "sheet_name": sheet_name})
+        manifest.save()
+        print(f"Saved {len(written)} records to MySQL")
 
+    writer = BatchWriter(pool, batch_size=batch_size, on_flush=record_batch)
+
+    live_inputs = []
+    stale_rows = []
+    skipped = 0
     try:
         # 遍历 llm_output 目录中的所有 JSON 文件
         for json_file in os.listdir(input_dir):
@@ -136,42 +642,48 @@ def main():
                 continue
 
             input_json_path = os.path.join(input_dir, json_file)
-            print(f"\n=== Processing JSON file: {input_json_path} ===")
+            live_inputs.append(input_json_path)
 
-            # 从文件名中提取 file_name 和 sheet_name
+            # 读取 JSON 文件内容（作为字符串）
+            with open(input_json_path, "r", encoding="utf-8") as f:
+                json_str = f.read()
+
+            # 从 JSON 内容或文件名中提取 file_name 和 sheet_name
             try:
-                file_name, sheet_name = extract_info_from_filename(json_file)
+                file_name, sheet_name = extract_info_from_json(json_str, json_file)
             except ValueError as e:
                 print(f"Error processing filename {json_file}: {str(e)}")
                 continue
 
-            # 去掉 file_name 的后缀，用于映射 doc_id
-            file_name_base = os.path.splitext(file_name)[0]
+            # doc_id 由文件名确定性生成，与遍历顺序和运行次数无关
+            doc_id = make_doc_id(file_name)
 
-            # 为 file_name 分配 doc_id
-            if file_name_base not in file_name_to_doc_id:
-                file_name_to_doc_id[file_name_base] = str(next_doc_id)
-                next_doc_id += 1
-            doc_id = file_name_to_doc_id[file_name_base]
-            print(f"Assigned doc_id: {doc_id} for file_name: {file_name}")
-
-            # 读取 JSON 文件内容（作为字符串）
-            with open(input_json_path, "r", encoding="utf-8") as f:
-                json_str = f.read()
+            # 内容未变化时跳过；变化时按唯一键覆盖原记录，file_name/sheet_name 也变化时删除旧记录
+            content_hash = IngestManifest.hash_text(json_str)
+            if manifest.is_current(STAGE_MYSQL, input_json_path, content_hash):
+                skipped += 1
+                continue
+            previous = manifest.get(STAGE_MYSQL, input_json_path)
+            if previous and (previous["artifacts"]["file_name"], previous["artifacts"]["sheet_name"]) != (file_name, sheet_name):
+                stale_rows.append((previous["artifacts"]["file_name"], previous["artifacts"]["sheet_name"]))
 
-            # 调试：检查 JSON 字符串的完整性
-            print(f"JSON string length: {len(json_str)} characters")
-            print(f"First 500 characters:\n{json_str[:500]}")
-            print(f"Last 500 characters:\n{json_str[-500:]}")
+            writer.add(doc_id, file_name, sheet_name, json_str, tag=(input_json_path, content_hash, file_name, sheet_name))
+        writer.flush()
 
-            # 保存到 MySQL 数据库
-            save_to_mysql(connection, doc_id, file_name, sheet_name, json_str)
+        # 清理已删除文件对应的记录
+        stale = manifest.stale(STAGE_MYSQL, live_inputs, prefix=os.path.join(input_dir, ""))
+        stale_rows.extend((entry["artifacts"]["file_name"], entry["artifacts"]["sheet_name"]) for entry in stale.values())
+        with pool.connection() as connection:
+            delete_rows(connection, stale_rows)
+        for key in stale:
+            manifest.forget(STAGE_MYSQL, key)
+        manifest.save()
+        print(f"MySQL: {writer.written} records written in {writer.batches} batches, {skipped} unchanged, "
+              f"{len(stale_rows)} deleted")
 
     finally:
         # 关闭数据库连接
-        if connection.is_connected():
-            connection.close()
-            print("MySQL connection closed")
+        pool.close()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+# 结构化规格字段：(字段名, 物理量, 列名关键词)。数值统一换算为基本单位（Ω、W、V、F、Hz、A、%）
+SPEC_FIELDS = [
+    ("resistance_ohm", "ohm", ("阻值",)),
+    ("capacitance_f", "farad", ("容值",)),
+    ("power_w", "watt", ("功率",)),
+    ("voltage_v", "volt", ("电压", "耐压")),
+    ("current_a", "ampere", ("电流",)),
+    ("frequency_hz", "hertz", ("频率",)),
+    ("tolerance_pct", "percent", ("精度", "容差", "误差")),
+]
+
+# 封装为关键词字段（统一大写、去除空白）
+PACKAGE_FIELD = "package"
+PACKAGE_HEADERS = ("封装",)
+
+# 写入 ES 映射 spec 对象的字段类型
+SPEC_MAPPING = {
+    "properties": dict(
+        {field: {"type": "double"} for field, _, _ in SPEC_FIELDS},
+        **{PACKAGE_FIELD: {"type": "keyword"}},
+    )
+}
+
+# 单位前缀的倍数（u、μ 与 µ 均表示微）
+PREFIXES = {"p": 1e-12, "n": 1e-9, "u": 1e-6, "µ": 1e-6, "μ": 1e-6, "m": 1e-3, "": 1.0, "k": 1e3, "K": 1e3,
+            "M": 1e6, "G": 1e9}
+
+# 各物理量的单位符号；电阻的 R 可以单独使用（100R、27kR），也可以作为小数点（4R7、4k7）
+UNITS = {
+    "ohm": ("\u03a9", "\u2126", "ohm", "R", "r"),
+    "farad": ("F",),
+    "watt": ("W",),
+    "volt": ("V",),
+    "ampere": ("A",),
+    "hertz": ("Hz", "HZ", "hz"),
+    "percent": ("%",),
+}
+
+_NUMBER = r"(\d+(?:\.\d+)?)(?:\s*/\s*(\d+(?:\.\d+)?))?"
+_PREFIX = r"([pnuµμmkKMG]?)"
+_UNIT = "|".join(sorted({re.escape(unit) for units in UNITS.values() for unit in units}, key=len, reverse=True))
+# 数值 + 可选前缀 + 单位，如 0.01R、1/20W、27kR、32.768 KHz、±20%
+QUANTITY = re.compile(r"(?<![\dA-Za-z.])" + _NUMBER + r"\s*" + _PREFIX + r"(" + _UNIT + r")(?![a-zA-Z])")
+# 电阻的 4R7、4k7、1M5 写法
+RESISTOR_CODE = re.compile(r"(?<![\d.])(\d+)([RrkKM])(\d+)(?![\d.a-zA-Z])")
+# 只有数值的单元格（单位来自列名）
+BARE_NUMBER = re.compile(r"^\s*[±+]?" + _NUMBER + r"\s*$")
+# 阻值列中只有数值和前缀的单元格，如 130K、4.7k（列名为“标称阻值(R/kR/MR)”等）
+BARE_PREFIXED = re.compile(r"^\s*" + _NUMBER + r"\s*" + _PREFIX + r"\s*$")
+# 列名括号中的单位，如 最大工作电压(V)、时钟频率(MHz)、额定电流(mA)
+HEADER_UNIT = re.compile(r"[（(]\s*" + _PREFIX + r"(" + _UNIT + r")\s*[)）]")
+
+def _unit_kind(unit: str) -> Optional[str]:
+    for kind, units in UNITS.items():
+        if unit in units:
+            return kind
+    return None
+
+def _number(numerator: str, denominator: Optional[str]) -> float:
+    value = float(numerator)
+    return value / float(denominator) if denominator else value
+
+def parse_quantity(text: Any, kind: str, default_unit: Optional[Tuple[str, str]] = None) -> Optional[float]:
+    """
+    从单元格文本中解析出指定物理量的数值（换算为基本单位）。文本中有多个数值时取第一个单位匹配的
+    （如“220V，50W”按功率解析为 50）；只有数值时使用列名中的单位，阻值只有数值和前缀时（如 130K）单位为 Ω。
+    :param text: 单元格内容
+    :param kind: 物理量（UNITS 的键）
+    :param default_unit: 列名中的 (前缀, 单位)，如 ("m", "A")
+    :return: 数值，无法解析时返回 None
+    """
+    if isinstance(text, (int, float)) and not isinstance(text, bool):
+        text = str(text)
+    if not isinstance(text, str) or not text.strip():
+        return None
+    if kind == "ohm":
+        match = RESISTOR_CODE.search(text)
+        if match:
+            whole, mark, fraction = match.groups()
+            return float(f"{whole}.{fraction}") * PREFIXES["" if mark in ("R", "r") else mark]
+    for match in QUANTITY.finditer(text):
+        numerator, denominator, prefix, unit = match.groups()
+        if _unit_kind(unit) == kind:
+            return _number(numerator, denominator) * PREFIXES[prefix]
+    if kind == "ohm" and (default_unit is None or _unit_kind(default_unit[1]) == "ohm"):
+        match = BARE_PREFIXED.match(text)
+        if match:
+            numerator, denominator, prefix = match.groups()
+            scale = PREFIXES[prefix if prefix or default_unit is None else default_unit[0]]
+            return _number(numerator, denominator) * scale
+    match = BARE_NUMBER.match(text)
+    if match and default_unit is not None and _unit_kind(default_unit[1]) == kind:
+        return _number(*match.groups()) * PREFIXES[default_unit[0]]
+    return None
+
+def header_unit(header: str) -> Optional[Tuple[str, str]]:
+    """
+    取列名括号中的单位（只有一个单位时），如“额定电流(mA)”返回 ("m", "A")，“标称容值(pF/nF/uF/F)”返回 None。
+    """
+    match = HEADER_UNIT.search(header)
+    return (match.group(1), match.group(2)) if match else None
+
+def normalize_package(value: Any) -> Optional[str]:
+    """
+    规范化封装名称：去除空白并转为大写（如“sot-23 ”→“SOT-23”），空值返回 None。
+    """
+    if value in ("", None):
+        return None
+    return re.sub(r"\s+", "", str(value)).upper() or None
+
+def extract_specs(row: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    从一行表格数据中提取结构化规格字段：按列名关键词识别阻值、容值、功率、电压、电流、频率、精度与封装，
+    数值换算为基本单位（精度为百分数；列名带 % 而数值小于 1 时视为比例，如 精度(%)=0.01 即 1%）。
+    同一字段有多列时取第一个能解析的值。
+    :param row: 行字典（列名 -> 单元格）
+    :return: {字段名: 数值或封装}，没有可识别的字段时为空字典
+    """
+    specs = {}
+    for header, value in row.items():
+        header = str(header)
+        if PACKAGE_FIELD not in specs and any(word in header for word in PACKAGE_HEADERS):
+            package = normalize_package(value)
+            if package:
+                specs[PACKAGE_FIELD] = package
+            continue
+        for field, kind, words in SPEC_FIELDS:
+            if field in specs or not any(word in header for word in words):
+                continue
+            unit = header_unit(header)
+            if kind == "percent" and "%" in header:
+                unit = ("", "%")
+            number = parse_quantity(value, kind, unit)
+            if number is None:
+                continue
+            if kind == "percent" and "%" not in str(value) and number < 1:
+                number *= 100
+            specs[field] = number
+            break
+    return specs
+
+# 问题中的比较词
+_GREATER = r"大于|高于|超过|多于|不低于|不小于|至少|>=|≥|>|＞"
+_LESS = r"小于|低于|不超过|不大于|不高于|至多|最多|<=|≤|<|＜"
+_QUANTITY_TEXT = _NUMBER + r"\s*" + _PREFIX + r"(" + _UNIT + r")?"
+# “A 到 B 之间”、“A~B”
+BETWEEN = re.compile(r"(?<![\dA-Za-z.])" + _QUANTITY_TEXT + r"\s*(?:到|至|~|～|-)\s*" + _QUANTITY_TEXT + r"\s*(?:之间|范围内)?")
+# “大于 0.5W”
+COMPARE_BEFORE = re.compile(r"(" + _GREATER + r"|" + _LESS + r")\s*" + _QUANTITY_TEXT)
+# “0.5W 以上 / 以下”
+COMPARE_AFTER = re.compile(r"(?<![\dA-Za-z.])" + _QUANTITY_TEXT + r"\s*(以上|及以上|以下|及以下)")
+# 单独出现的带单位数值，视为等于
+EQUAL = re.compile(r"(?<![\dA-Za-z.])" + _NUMBER + r"\s*" + _PREFIX + r"(" + _UNIT + r")(?![a-zA-Z])")
+# 常见贴片封装尺寸代码与 IC 封装名称
+PACKAGE_PATTERN = re.compile(
+    r"(?<![\dA-Za-z])(0201|0402|0603|0805|1206|1210|1812|2010|2512|"
+    r"(?:SOT|SOD|SOP|SSOP|TSSOP|MSOP|QFN|DFN|LQFP|TQFP|QFP|BGA|FBGA|TO)-?\d+[A-Z0-9-]*)(?![\dA-Za-z])",
+    re.IGNORECASE,
+)
+# 元器件类别，匹配行文档的 sheet 名或表名
+CATEGORIES = ("电阻", "电容", "电感", "磁珠", "晶振", "二极管", "三极管", "MOSFET", "TVS", "LDO", "DC-DC", "LED",
+              "连接器", "开关", "扬声器", "摄像头", "MCU", "PTC", "传感器")
+
+# 物理量名称（问题中没有单位时据此推断，如“阻值大于 10k”）
+KIND_WORDS = {"ohm": ("阻值", "电阻"), "farad": ("容值", "电容"), "watt": ("功率",), "volt": ("电压", "耐压"),
+              "ampere": ("电流",), "hertz": ("频率",), "percent": ("精度", "容差", "误差")}
+
+def _field_for(kind: str) -> Optional[str]:
+    for field, field_kind, _ in SPEC_FIELDS:
+        if field_kind == kind:
+            return field
+    return None
+
+def _infer_kind(unit: Optional[str], question: str, start: int) -> Optional[str]:
+    """
+    确定数值的物理量：有单位时由单位决定，否则取数值之前最近出现的物理量名称（如“阻值大于10k”）。
+    """
+    if unit:
+        return _unit_kind(unit)
+    best, kind = -1, None
+    for candidate, words in KIND_WORDS.items():
+        for word in words:
+            index = question.rfind(word, 0, start)
+            if index > best:
+                best, kind = index, candidate
+    return kind
+
+def parse_constraints(question: str) -> Dict[str, Any]:
+    """
+    从问题中解析规格约束：比较（大于/小于/以上/以下）、区间（A 到 B）、带单位数值（等于）、封装与元器件类别。
+    不带单位的数值只在前面出现物理量名称时识别（如“阻值大于10k”）。
+    :param question: 用户问题
+    :return: {"ranges": [{"field": 字段名, "gte"/"gt"/"lte"/"lt": 数值}, ...], "package": [封装, ...],
+              "categories": [类别, ...]}
+    """
+    # 电阻的 4R7、4k7 写法先改写为 4.7Ω、4.7kΩ，避免被当作 4Ω
+    question = RESISTOR_CODE.sub(lambda match: f"{match.group(1)}.{match.group(3)}"
+                                 f"{'' if match.group(2) in ('R', 'r') else match.group(2)}\u03a9", question)
+    ranges = []
+    consumed = []
+
+    def free(match):
+        return all(match.end() <= start or match.start() >= end for start, end in consumed)
+
+    def value_of(numerator, denominator, prefix, unit, start):
+        kind = _infer_kind(unit, question, start)
+        if kind is None or (not unit and not prefix and kind not in ("ohm", "percent")):
+            return None, None
+        return _field_for(kind), _number(numerator, denominator) * PREFIXES[prefix]
+
+    for match in BETWEEN.finditer(question):
+        # 不带单位的封装尺寸代码（如“0402-0603封装”）不是区间
+        if any(not match.group(i + 2) and not match.group(i + 3) and PACKAGE_PATTERN.fullmatch(match.group(i))
+               for i in (1, 5)):
+            continue
+        low = value_of(*match.groups()[:3], match.group(4) or match.group(8), match.start())
+        high = value_of(*match.groups()[4:7], match.group(8) or match.group(4), match.start())
+        if low[0] and low[0] == high[0]:
+            ranges.append({"field": low[0], "gte": min(low[1], high[1]), "lte": max(low[1], high[1])})
+            consumed.append(match.span())
+    for match in COMPARE_BEFORE.finditer(question):
+        if not free(match):
+            continue
+        field, value = value_of(*match.groups()[1:], match.start())
+        if field:
+            op = "gt" if re.fullmatch(_GREATER, match.group(1)) else "lt"
+            op += "e" if match.group(1) in ("不低于", "不小于", "至少", ">=", "≥", "不超过", "不大于", "不高于",
+                                            "至多", "最多", "<=", "≤") else ""
+            ranges.append({"field": field, op: value})
+            consumed.append(match.span())
+    for match in COMPARE_AFTER.finditer(question):
+        if not free(match):
+            continue
+        field, value = value_of(*match.groups()[:4], match.start())
+        if field:
+            ranges.append({"field": field, ("gte" if "以上" in match.group(5) else "lte"): value})
+            consumed.append(match.span())
+    for match in EQUAL.finditer(question):
+        if not free(match):
+            continue
+        field, value = value_of(*match.groups(), match.start())
+        if field:
+            # 浮点换算有舍入误差，等于按极小的区间匹配
+            ranges.append({"field": field, "gte": value * (1 - 1e-9), "lte": value * (1 + 1e-9)})
+            consumed.append(match.span())
+
+    packages = [normalize_package(match.group(1)) for match in PACKAGE_PATTERN.finditer(question) if free(match)]
+    categories = [word for word in CATEGORIES if word.lower() in question.lower()]
+    return {"ranges": ranges, "package": list(dict.fromkeys(packages)), "categories": categories}
+
+def has_constraints(constraints: Dict[str, Any]) -> bool:
+    """
+    判断是否解析出可用于过滤的规格约束（数值区间或封装；只有类别时不算）。
+    """
+    return bool(constraints["ranges"] or constraints["package"])
+
+def build_filters(constraints: Dict[str, Any], prefix: str = "spec.") -> List[Dict[str, Any]]:
+    """
+    将规格约束转为 ES bool 查询的 filter 子句：数值为 range，封装为 term（多个封装为 terms），
+    类别匹配 sheet 名或表名之一。
+    :param constraints: parse_constraints 的返回值
+    :param prefix: 规格字段在映射中的路径前缀
+    :return: filter 子句列表
+    """
+    filters = []
+    for item in constraints["ranges"]:
+        bounds = {op: value for op, value in item.items() if op != "field"}
+        filters.append({"range": {prefix + item["field"]: bounds}})
+    if constraints["package"]:
+        packages = constraints["package"]
+        filters.append({"terms": {prefix + PACKAGE_FIELD: packages}} if len(packages) > 1
+                       else {"term": {prefix + PACKAGE_FIELD: packages[0]}})
+    if constraints["categories"]:
+        filters.append({"bool": {"should": [{"match": {field: word}} for word in constraints["categories"]
+                                            for field in ("sheet_name", "table_name")],
+                                 "minimum_should_match": 1}})
+    return filters
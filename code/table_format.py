@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+import json
+from typing import Dict, Any, List
+
+from chunking import csv_line
+
+# 紧凑格式标记
+COMPACT = "compact"
+
+def is_compact(table: Dict[str, Any]) -> bool:
+    """
+    判断 table 是否为紧凑格式。
+    :param table: table 字典
+    :return: True 表示紧凑格式
+    """
+    return table.get("format") == COMPACT
+
+def build_csv(headers: List[str], rows: List[Dict[str, Any]]) -> str:
+    """
+    由表头和行字典生成与 pandas.DataFrame.to_csv(index=False) 一致的 CSV 文本。
+    :param headers: 表头列表
+    :param rows: 行字典列表
+    :return: CSV 文本
+    """
+    return csv_line(headers) + "".join(csv_line(row.get(h, "") for h in headers) for row in rows)
+
+def dedupe_headers(headers: List[Any]) -> List[str]:
+    """
+    规范化表头（Excel、PPT、Word 解析器共用）：去除首尾空白，空表头命名为 Column_N，重复表头追加 _N 后缀。
+    :param headers: 原始表头行
+    :return: 去重后的表头列表
+    """
+    header_counts = {}
+    new_headers = []
+    for i, header in enumerate(headers):
+        header = str(header).strip() if header else f"Column_{i+1}"
+        if header in header_counts:
+            header_counts[header] += 1
+            new_headers.append(f"{header}_{header_counts[header]}")
+        else:
+            header_counts[header] = 0
+            new_headers.append(header)
+    return new_headers
+
+def _encode_row(values: List[Any]) -> Any:
+    """
+    编码单行：空单元格较多时使用稀疏对象 {"列索引": 值}，否则使用去掉末尾空值的数组。
+    """
+    filled = {str(i): v for i, v in enumerate(values) if v != ""}
+    while values and values[-1] == "":
+        values = values[:-1]
+    if len(filled) * 2 < len(values):
+        return filled
+    return values
+
+def _decode_row(encoded: Any, width: int) -> List[Any]:
+    """
+    解码单行为长度为 width 的值列表。
+    """
+    if isinstance(encoded, dict):
+        values = [""] * width
+        for index, value in encoded.items():
+            values[int(index)] = value
+        return values
+    return list(encoded) + [""] * (width - len(encoded))
+
+def to_compact(table: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将 table 转换为紧凑格式：表头数组 + 行值数组，空单元格稀疏编码，不再存储可重建的 CSV。
+    行的键与表头不一致（如大模型改写过的表）或 CSV 无法由行重建时保留原字段，保证无损。
+    :param table: 常规格式的 table（sheet, data, rows, ...）
+    :return: 紧凑格式的 table（sheet, format, headers, values, ...）
+    """
+    if is_compact(table):
+        return table
+    rows = table.get("rows")
+    if not isinstance(rows, list) or not rows or not all(isinstance(row, dict) for row in rows):
+        return table
+
+    headers = table.get("headers") or list(rows[0].keys())
+    if any(list(row.keys()) != headers for row in rows):
+        return table
+
+    values = [_encode_row([row[h] for h in headers]) for row in rows]
+    csv_matches = table.get("data", "") == build_csv(headers, rows)
+
+    def compact_fields():
+        fields = {"format": COMPACT}
+        if "headers" in table:
+            # 原 table 自带 headers 字段（分块时），还原时需要保留
+            fields["keep_headers"] = True
+        fields["headers"] = headers
+        fields["values"] = values
+        if "data" not in table:
+            # 原 table 没有 data 字段（如大模型输出），还原时不生成
+            fields["no_data"] = True
+        elif not csv_matches:
+            fields["data"] = table["data"]
+        return fields
+
+    # 在原 data/rows 字段的位置写入紧凑字段，保持其余字段的顺序
+    compact = {}
+    for key, value in table.items():
+        if key in ("data", "rows"):
+            if "format" not in compact:
+                compact.update(compact_fields())
+        elif key != "headers":
+            compact[key] = value
+    return compact
+
+def from_compact(table: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将紧凑格式还原为常规格式（sheet, data, rows, ...），与 to_compact 互逆。
+    :param table: 紧凑格式的 table
+    :return: 常规格式的 table
+    """
+    if not is_compact(table):
+        return table
+    headers = table["headers"]
+    rows = [dict(zip(headers, _decode_row(encoded, len(headers)))) for encoded in table["values"]]
+
+    restored = {}
+    for key, value in table.items():
+        if key == "format":
+            if table.get("keep_headers"):
+                restored["headers"] = headers
+            if not table.get("no_data"):
+                restored["data"] = table["data"] if "data" in table else build_csv(headers, rows)
+            restored["rows"] = rows
+        elif key not in ("keep_headers", "no_data", "headers", "values", "data"):
+            restored[key] = value
+    return restored
+
+def compact_document(document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将文档中的所有 table 转换为紧凑格式。
+    :param document: {"doc_type", "file_name", "tables": [...]}
+    :return: 新的文档字典
+    """
+    if not isinstance(document, dict) or not isinstance(document.get("tables"), list):
+        return document
+    return {**document, "tables": [to_compact(t) if isinstance(t, dict) else t for t in document["tables"]]}
+
+def expand_document(document: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    将文档中的紧凑格式 table 还原为常规格式。
+    :param document: {"doc_type", "file_name", "tables": [...]}
+    :return: 新的文档字典
+    """
+    if not isinstance(document, dict) or not isinstance(document.get("tables"), list):
+        return document
+    return {**document, "tables": [from_compact(t) if isinstance(t, dict) else t for t in document["tables"]]}
+
+def iter_table_rows(table: Dict[str, Any]):
+    """
+    遍历 table 的行字典，同时支持常规格式与紧凑格式。
+    :param table: table 字典
+    :return: 行字典生成器
+    """
+    if is_compact(table):
+        headers = table["headers"]
+        for encoded in table["values"]:
+            yield dict(zip(headers, _decode_row(encoded, len(headers))))
+    else:
+        for row in table.get("rows") or []:
+            yield row
+
+def table_headers(table: Dict[str, Any]) -> List[str]:
+    """
+    table 的表头：紧凑格式或带 headers 字段时直接使用，否则取各行键的并集（保持首次出现的顺序）。
+    :param table: table 字典
+    :return: 表头列表
+    """
+    if table.get("headers"):
+        return list(table["headers"])
+    headers = {}
+    for row in table.get("rows") or []:
+        if isinstance(row, dict):
+            headers.update(dict.fromkeys(row))
+    return list(headers)
+
+def _split_text(text: str, max_chars: int) -> List[str]:
+    """按行将文本拼成不超过 max_chars 的段（单行超长时单独成段）。"""
+    parts, current = [], ""
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        if current and len(current) + len(line) + 1 > max_chars:
+            parts.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        parts.append(current)
+    return parts
+
+def iter_row_groups(document: Dict[str, Any], rows_per_group: int = 1, max_text_chars: int = 500):
+    """
+    将文档拆成行级单元：每个表格每 rows_per_group 行（只保留非空单元格）为一组，附带表名和完整表头；
+    表格以外的文本（PPT 的 text、Word 分段的 content）按行拼成不超过 max_text_chars 的文本组。
+    同时支持常规格式与紧凑格式的表格、Excel/PPT 的 tables 与 Word 分段。
+    :param document: 解析后的 JSON 文档
+    :param rows_per_group: 每组的行数
+    :param max_text_chars: 每个文本组的最大字符数
+    :return: 生成器，每项为 {"position": 在文档内的序号, "table_name": 表名, "headers": 表头, "row_index": 起始行号,
+             "rows": [行字典, ...]} 或 {"position", "table_name", "text": 文本}
+    """
+    if not isinstance(document, dict):
+        return
+    position = 0
+    tables = [table for table in document.get("tables") or [] if isinstance(table, dict)]
+    section = document.get("section") if isinstance(document.get("section"), dict) else {}
+    section_name = section.get("name") or document.get("file_name") or ""
+    if isinstance(document.get("content"), str):
+        for text in _split_text(document["content"], max_text_chars):
+            yield {"position": position, "table_name": section_name, "text": text}
+            position += 1
+
+    for index, table in enumerate(tables):
+        table_name = table.get("sheet") or table.get("sheet_name") or section_name or f"table_{index + 1}"
+        headers = table_headers(table)
+        group, start = [], 0
+        for row_index, row in enumerate(iter_table_rows(table)):
+            if not isinstance(row, dict):
+                continue
+            filled = {key: value for key, value in row.items() if value not in ("", None)}
+            if not filled:
+                continue
+            if not group:
+                start = row_index
+            group.append(filled)
+            if len(group) >= rows_per_group:
+                yield {"position": position, "table_name": table_name, "headers": headers, "row_index": start,
+                       "rows": group}
+                position += 1
+                group = []
+        if group:
+            yield {"position": position, "table_name": table_name, "headers": headers, "row_index": start,
+                   "rows": group}
+            position += 1
+        if isinstance(table.get("text"), str):
+            for text in _split_text(table["text"], max_text_chars):
+                yield {"position": position, "table_name": table_name, "text": text}
+                position += 1
+
+def load_document(json_str: str) -> Any:
+    """
+    解析 JSON 文本，无法解析时返回 None。
+    :param json_str: JSON 文本
+    :return: 解析结果或 None
+    """
+    try:
+        return json.loads(json_str)
+    except (json.JSONDecodeError, TypeError):
+        return None
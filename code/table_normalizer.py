@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import re
+from typing import Dict, Any, List, Tuple
+
+from table_format import build_csv, is_compact
+
+# 解析器或 pandas 为空表头生成的占位列名（Column_3、Column_3_1、Unnamed: 3、Unnamed: 3_level_0）
+PLACEHOLDER_HEADER = re.compile(r"^(?:Column_\d+|Unnamed:\s*\d+(?:_level_\d+)?)(?:_\d+)?$")
+
+# 单元格文本达到该长度、且该行只有这一个非空单元格时视为自然段
+PROSE_MIN_LENGTH = 20
+
+# 杂乱度达到该值的 sheet 仍交给大模型校对，低于该值直接使用本地规整结果
+MESSINESS_THRESHOLD = 0.15
+
+def is_placeholder(header: str) -> bool:
+    """
+    判断列名是否为占位列名。
+    :param header: 列名
+    :return: True 表示占位列名
+    """
+    return bool(PLACEHOLDER_HEADER.match(str(header).strip()))
+
+def _clean(value: Any) -> Any:
+    """
+    去除字符串首尾空白，非字符串原样返回。
+    """
+    return value.strip() if isinstance(value, str) else value
+
+def normalize_table(table: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    按规则规整单个 table（大模型提示词中可以机械完成的部分）：
+    1.去除单元格和列名首尾空白；
+    2.删除全部为空的占位列（如“Column_1: ''”），以及与左侧列逐行相同的占位列（合并单元格展开产生的重复）；
+    3.删除所有单元格都为空的行。
+    有意义的空单元格（列名有效的列）保留。紧凑格式或没有行数据的 table 原样返回。
+    带 chunk 元数据的 table 只做第 1 步：各 chunk 独立处理，按单个 chunk 的数据删列会使同一 sheet 的表头不一致，
+    删行会使行数与 row_offset、row_count 不符。
+    :param table: 常规格式的 table（sheet, data, rows, ...）
+    :return: 规整后的 table（新字典，chunk 等其它字段保留）
+    """
+    rows = table.get("rows")
+    if is_compact(table) or not isinstance(rows, list) or not rows or not all(isinstance(row, dict) for row in rows):
+        return table
+
+    headers = table.get("headers") or list(rows[0].keys())
+    rows = [{_clean(key): _clean(value) for key, value in row.items()} for row in rows]
+    headers = [_clean(header) for header in headers]
+
+    # 分块的 sheet 以表头决定列集合，各 chunk 一致
+    chunked = "chunk" in table
+    kept = []
+    for header in headers:
+        if is_placeholder(header) and not chunked:
+            values = [row.get(header, "") for row in rows]
+            if all(value in ("", None) for value in values):
+                continue
+            if kept and all(value in ("", None) or value == row.get(kept[-1], "") for value, row in zip(values, rows)):
+                continue
+        kept.append(header)
+
+    rows = [{header: row.get(header, "") for header in kept} for row in rows]
+    if not chunked:
+        rows = [row for row in rows if any(value not in ("", None) for value in row.values())]
+
+    normalized = {key: value for key, value in table.items() if key not in ("headers", "data", "rows")}
+    if "headers" in table:
+        normalized["headers"] = kept
+    normalized["data"] = build_csv(kept, rows)
+    normalized["rows"] = rows
+    return normalized
+
+def score_table(table: Dict[str, Any]) -> Tuple[float, Dict[str, float]]:
+    """
+    评估规整后的 table 的杂乱度，即规则无法处理、仍需要大模型判断的程度：
+    - placeholder: 仍有数据的占位列占比（表头错位，或表头不在第一行）；
+    - prose: 只有一个较长非空单元格的行占比（表格中混杂自然段）；
+    - numeric_header: 纯数字列名占比（第一行是数据而不是表头）。
+    :param table: 规整后的 table
+    :return: (杂乱度 0~1, 各项指标)
+    """
+    rows = table.get("rows")
+    if is_compact(table) or not isinstance(rows, list) or not all(isinstance(row, dict) for row in rows):
+        # 无法按规则分析的结构交给大模型
+        return 1.0, {"unsupported": 1.0}
+    if not rows:
+        return 0.0, {}
+
+    headers = table.get("headers") or list(rows[0].keys())
+    width = max(len(headers), 1)
+    # 分块的 table 保留了空占位列（见 normalize_table），只统计有数据的占位列
+    placeholder = sum(1 for header in headers
+                      if is_placeholder(header) and any(row.get(header) not in ("", None) for row in rows)) / width
+    numeric_header = sum(1 for header in headers if re.fullmatch(r"[\d.\-]+", str(header))) / width
+
+    prose_rows = 0
+    if len(headers) >= 2:
+        for row in rows:
+            filled = [value for value in row.values() if value not in ("", None)]
+            if len(filled) == 1 and len(str(filled[0])) >= PROSE_MIN_LENGTH:
+                prose_rows += 1
+    prose = prose_rows / len(rows)
+
+    metrics = {"placeholder": placeholder, "prose": prose, "numeric_header": numeric_header}
+    return min(1.0, placeholder + prose + 0.5 * numeric_header), metrics
+
+def normalize_document(document: Dict[str, Any]) -> Tuple[Dict[str, Any], float, Dict[str, float]]:
+    """
+    规整单个 sheet/chunk 的 JSON 中的所有 table，并取各 table 杂乱度的最大值。
+    :param document: 解析得到的 JSON 数据
+    :return: (规整后的 JSON 数据, 杂乱度, 最杂乱的 table 的各项指标)
+    """
+    tables: List[Any] = []
+    score, metrics = 0.0, {}
+    for table in document.get("tables", []):
+        if not isinstance(table, dict):
+            tables.append(table)
+            continue
+        table = normalize_table(table)
+        table_score, table_metrics = score_table(table)
+        if table_score >= score:
+            score, metrics = table_score, table_metrics
+        tables.append(table)
+    normalized = dict(document)
+    normalized["tables"] = tables
+    return normalized, score, metrics
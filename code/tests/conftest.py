@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+
+# code/ 下的模块以脚本目录为导入路径
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+@pytest.fixture
+def fake_backends(tmp_path):
+    """
+    把 save_to_es / save_to_mysql 切换到进程内的 FakeElasticsearch 与 SQLite 替身，用完后恢复。
+    :return: 命名空间：es（FakeElasticsearch）、connect（打开一个新的替身 MySQL 连接）
+    """
+    import save_to_es
+    import save_to_mysql
+    from fake_backends import FakeElasticsearch, FakeMySQLConnection
+
+    path = str(tmp_path / "e_rag.sqlite")
+    es = FakeElasticsearch()
+    save_to_es.configure_elastic(lambda hosts: es)
+    save_to_mysql.configure_mysql(lambda database: FakeMySQLConnection(path))
+    try:
+        yield SimpleNamespace(es=es, connect=lambda: FakeMySQLConnection(path))
+    finally:
+        save_to_es.configure_elastic(None)
+        save_to_mysql.configure_mysql(None)
@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+import chunking
+from table_format import build_csv
+
+HEADERS = ["料号", "名称", "封装", "备注"]
+
+def _rows(count):
+    return [{"料号": f"RC{i:04d}", "名称": "贴片电阻", "封装": "0402", "备注": "" if i % 5 else "常用"}
+            for i in range(count)]
+
+def _chunk(rows, index, offset, last):
+    return {"sheet": "Sheet1", "headers": HEADERS, "data": build_csv(HEADERS, rows), "rows": rows,
+            "chunk": {"index": index, "row_offset": offset, "row_count": len(rows), "last": last}}
+
+def test_chunks_respect_budget_and_merge_back():
+    rows = _rows(500)
+    base = chunking.base_size("excel", "a.xlsx", "Sheet1", HEADERS)
+    budget = 2000
+    chunks = list(chunking.with_last_flag(chunking.iter_row_chunks(rows, HEADERS, budget, base)))
+    assert len(chunks) > 1
+    assert [last for _, _, last in chunks] == [False] * (len(chunks) - 1) + [True]
+
+    tables = []
+    for index, (offset, chunk_rows, last) in enumerate(chunks, 1):
+        table = _chunk(chunk_rows, index, offset, last)
+        document = {"doc_type": "excel", "file_name": "a.xlsx", "tables": [table]}
+        # base_size 是上界，序列化后的真实大小不超过预算
+        assert len(json.dumps(document, ensure_ascii=False, separators=(",", ":"))) <= budget
+        tables.append(table)
+
+    merged = chunking.merge_chunks(list(reversed(tables)))
+    assert merged["rows"] == rows
+    assert merged["data"] == build_csv(HEADERS, rows)
+
+def test_oversized_row_gets_its_own_chunk():
+    rows = [{"料号": "A", "名称": "x" * 5000, "封装": "", "备注": ""}, {"料号": "B", "名称": "", "封装": "", "备注": ""}]
+    base = chunking.base_size("excel", "a.xlsx", "Sheet1", HEADERS)
+    chunks = list(chunking.iter_row_chunks(rows, HEADERS, 1000, base))
+    assert [(offset, len(chunk_rows)) for offset, chunk_rows in chunks] == [(0, 1), (1, 1)]
+
+def test_merge_rejects_missing_chunks():
+    rows = _rows(4)
+    first = _chunk(rows[:2], 1, 0, False)
+    third = _chunk(rows[3:], 3, 3, True)
+    with pytest.raises(ValueError):
+        chunking.merge_chunks([first, third])
+    with pytest.raises(ValueError):
+        chunking.merge_chunks([first])
+
+def test_token_budget_uses_token_counts():
+    rows = _rows(300)
+    base = chunking.base_size("excel", "a.xlsx", "Sheet1", HEADERS, "tokens")
+    for _, chunk_rows in chunking.iter_row_chunks(rows, HEADERS, 800, base, "tokens"):
+        assert base + sum(chunking.row_size(row, HEADERS, "tokens") for row in chunk_rows) <= 800
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+import content_codec
+from content_codec import decompress, dumps, encode_content, loads, row_content
+
+@pytest.mark.parametrize("value", [123456789012345678901234, -9223372036854775809, 18446744073709551616,
+                                   9223372036854775807, 1.5, "04160100000105000000000"])
+def test_numbers_round_trip_exactly(value):
+    encoded = encode_content(json.dumps({"编码": value, "rows": [value]}))
+    assert encoded["valid"]
+    assert loads(encoded["text"]) == {"编码": value, "rows": [value]}
+    assert loads(decompress(encoded["blob"], encoded["codec"]).encode("utf-8"))["编码"] == value
+
+def test_canonical_text_keeps_key_order_and_chinese():
+    document = {"名称": "电阻", "a": [1, 2], "b": {"c": None}}
+    assert dumps(document) == json.dumps(document, ensure_ascii=False, separators=(",", ":"))
+
+def test_invalid_content_is_kept_as_is():
+    encoded = encode_content("not json")
+    assert not encoded["valid"] and encoded["blob"] is None
+    assert row_content({"json_content": encoded["text"], "json_blob": None, "codec": None}) == "not json"
+
+def test_compressed_row_content():
+    encoded = encode_content('{"tables": [{"sheet": "S", "rows": [{"a": "1"}]}]}', content_codec.CODEC_ZLIB)
+    row = {"json_content": None, "json_blob": encoded["blob"], "codec": encoded["codec"]}
+    assert row_content(row) == encoded["text"]
+    assert json.loads(encoded["meta"])["rows"] == 1
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import json
+import time
+
+from save_to_es import Elastic
+from save_to_mysql import delete_rows, make_chunk_id, make_doc_id, write_rows
+
+def _rows(file_name, sheets, tag="v1"):
+    return [(make_doc_id(file_name), file_name, sheet,
+             json.dumps({"tables": [{"rows": [{"料号": f"{tag}-{sheet}-{i}"} for i in range(3)]}]}, ensure_ascii=False))
+            for sheet in sheets]
+
+def _ids(es):
+    return {hit["_id"] for hit in es.search(index="e_rag", body={"size": 1000})["hits"]["hits"]}
+
+def _write(backends, rows):
+    conn = backends.connect()
+    try:
+        return write_rows(conn, rows)
+    finally:
+        conn.close()
+
+def _backdate(backends, chunk_ids, updated_at):
+    # 模拟并发事务：记录在 updated_at 时刻执行写入语句，但在另一个事务提交之后才提交
+    conn = backends.connect()
+    try:
+        conn._conn.executemany("UPDATE llm_outputs SET updated_at = ? WHERE chunk_id = ?",
+                               [(updated_at, chunk_id) for chunk_id in chunk_ids])
+        conn._conn.commit()
+    finally:
+        conn.close()
+
+def _interleave(backends, es, safety_lag):
+    # 写入方 A 先盖时间戳、后提交；写入方 B 在两者之间提交，同步在 A 提交前运行
+    stamped_a = time.strftime("%Y-%m-%d %H:%M:%S.000", time.gmtime())  # 替身的时间戳为 UTC
+    time.sleep(0.01)
+    _write(backends, _rows("b.xlsx", ["Sheet1"]))
+    es.sync_incremental("e_rag", safety_lag=safety_lag)
+    chunk_ids = _write(backends, _rows("a.xlsx", ["Sheet1", "Sheet2"]))
+    _backdate(backends, chunk_ids, stamped_a)
+    es.sync_incremental("e_rag", safety_lag=safety_lag)
+    return chunk_ids
+
+def test_sync_keeps_rows_committed_behind_the_watermark(fake_backends):
+    es = Elastic()
+    _write(fake_backends, _rows("base.xlsx", ["Sheet1"]))
+    es.rebuild_index("e_rag")
+    chunk_ids = _interleave(fake_backends, es, safety_lag=60)
+    assert set(chunk_ids) <= _ids(fake_backends.es)
+    assert _ids(fake_backends.es) == {make_chunk_id(f, s) for f, s in
+                                      [("base.xlsx", "Sheet1"), ("b.xlsx", "Sheet1"), ("a.xlsx", "Sheet1"),
+                                       ("a.xlsx", "Sheet2")]}
+
+def test_sync_without_lag_misses_late_commits(fake_backends):
+    # 不回读时晚提交的记录被跳过，说明回读窗口是必要的
+    es = Elastic()
+    _write(fake_backends, _rows("base.xlsx", ["Sheet1"]))
+    es.rebuild_index("e_rag")
+    chunk_ids = _interleave(fake_backends, es, safety_lag=0)
+    assert not set(chunk_ids) & _ids(fake_backends.es)
+
+def test_sync_watermark_does_not_move_back(fake_backends):
+    es = Elastic()
+    _write(fake_backends, _rows("base.xlsx", ["Sheet1", "Sheet2"]))
+    es.rebuild_index("e_rag")
+    first = es.get_watermark("e_rag")
+    stats = es.sync_incremental("e_rag")
+    assert stats["watermark"]["updated_at"] == first["updated_at"]
+    assert stats["watermark"]["id"] == first["id"]
+
+def test_sync_applies_updates_and_deletes(fake_backends):
+    es = Elastic()
+    _write(fake_backends, _rows("a.xlsx", ["Sheet1", "Sheet2"]))
+    es.rebuild_index("e_rag")
+    _write(fake_backends, _rows("a.xlsx", ["Sheet1"], tag="v2"))
+    conn = fake_backends.connect()
+    delete_rows(conn, [("a.xlsx", "Sheet2")])
+    conn.close()
+    stats = es.sync_incremental("e_rag")
+    assert stats["failed"] == 0
+    assert _ids(fake_backends.es) == {make_chunk_id("a.xlsx", "Sheet1")}
+    source = fake_backends.es.get(index="e_rag", id=make_chunk_id("a.xlsx", "Sheet1"))["_source"]
+    assert "v2-Sheet1-0" in source["json_content"]
+
+def test_rebuild_swaps_alias_and_drops_old_index(fake_backends):
+    es = Elastic()
+    _write(fake_backends, _rows("a.xlsx", ["Sheet1"]))
+    first = es.rebuild_index("e_rag")
+    time.sleep(1.1)  # 版本号精确到秒
+    second = es.rebuild_index("e_rag")
+    assert first["swapped"] and second["swapped"]
+    assert es.resolve_indices("e_rag") == [second["index"]]
+    assert not fake_backends.es.indices.exists(index=first["index"])
+    assert _ids(fake_backends.es) == {make_chunk_id("a.xlsx", "Sheet1")}
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+import threading
+import time
+
+from gemini_client import CorrectionEngine
+
+class CountingClient:
+    """记录同时进行的请求数的模型替身"""
+
+    def __init__(self, latency=0.02):
+        self.latency = latency
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def _leave(self):
+        with self._lock:
+            self.active -= 1
+
+    def generate(self, prompt):
+        self._enter()
+        try:
+            time.sleep(self.latency)
+            return prompt
+        finally:
+            self._leave()
+
+    def generate_stream(self, prompt):
+        self._enter()
+        try:
+            for piece in (prompt[:1], prompt[1:]):
+                time.sleep(self.latency / 2)
+                yield piece
+        finally:
+            self._leave()
+
+def test_nested_map_caps_requests_and_overlaps_batches():
+    client = CountingClient(latency=0.2)
+    engine = CorrectionEngine(client=client, concurrency=4)
+
+    def job(item):
+        # 与超大 sheet 分批校对相同：在 map 的任务中再次调用 map
+        start = time.perf_counter()
+        texts = [text for _, text, _ in engine.map(engine.generate, [f"{item}-{i}" for i in range(4)])]
+        return texts, time.perf_counter() - start
+
+    # 单个超大 sheet：各批次并发，耗时接近一次请求
+    (_, (texts, seconds), error), = list(engine.map(job, [0]))
+    assert error is None and len(texts) == 4
+    assert client.peak == 4
+    assert seconds < 0.6
+
+    # 多个 sheet 同时分批：进行中的请求数仍不超过 concurrency
+    client.peak = 0
+    results = list(engine.map(job, range(6)))
+    assert all(error is None for _, _, error in results)
+    assert sorted(len(texts) for _, (texts, _), _ in results) == [4] * 6
+    assert client.peak <= 4
+    assert engine.stats()["sheets"] == 28
+
+def test_callers_on_separate_threads_share_the_limit():
+    client = CountingClient()
+    engine = CorrectionEngine(client=client, concurrency=2)
+    threads = [threading.Thread(target=lambda: list(engine.map(engine.generate, ["a", "b", "c"]))) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert client.peak <= 2
+
+def test_stream_holds_a_slot_until_closed():
+    client = CountingClient()
+    engine = CorrectionEngine(client=client, concurrency=2)
+    results = list(engine.map(lambda prompt: "".join(engine.stream(prompt)), ["abc", "def", "ghi", "jkl"]))
+    assert sorted(text for _, text, _ in results) == ["abc", "def", "ghi", "jkl"]
+    assert client.peak <= 2
+    # 全部释放后仍可获取 concurrency 个槽位
+    assert all(engine._slots.acquire(blocking=False) for _ in range(2))
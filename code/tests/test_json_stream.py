@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from json_stream import MalformedStream, RowStreamParser
+
+DOCUMENT = {"doc_type": "excel", "file_name": "a.xlsx",
+            "tables": [{"sheet": "Sheet1", "data": "料号\n\"A,1\"\n", "rows": [{"料号": "A,1"}, {"料号": "B\"]}"},
+                                                                                 {"料号": "C"}]}]}
+
+def _feed(text, size):
+    parser = RowStreamParser()
+    counts = [parser.feed(text[i:i + size]) for i in range(0, len(text), size)]
+    return parser, counts
+
+@pytest.mark.parametrize("size", [1, 3, 7, 1000])
+def test_rows_are_parsed_as_they_arrive(size):
+    text = "```json\n" + json.dumps(DOCUMENT, ensure_ascii=False, indent=2) + "\n```"
+    parser, counts = _feed(text, size)
+    assert sum(counts) == 3
+    assert parser.rows == DOCUMENT["tables"][0]["rows"]
+    assert parser.finish() == DOCUMENT
+
+def test_compact_values_are_parsed():
+    document = {"tables": [{"sheet": "Sheet1", "format": "compact", "headers": ["a", "b"],
+                            "values": [["1", "2"], {"1": "x"}]}]}
+    parser, _ = _feed(json.dumps(document), 5)
+    assert parser.rows == [["1", "2"], {"1": "x"}]
+
+def test_empty_rows_array():
+    parser, counts = _feed('{"tables": [{"sheet": "S", "rows": []}]}', 4)
+    assert sum(counts) == 0
+    assert parser.finish()["tables"][0]["rows"] == []
+
+def test_malformed_row_fails_early_with_rows_ok():
+    parser = RowStreamParser()
+    parser.feed('{"tables": [{"rows": [{"a": 1}, {"a": 2}')
+    with pytest.raises(MalformedStream) as error:
+        parser.feed(' {"a": 3}]}]}')
+    assert error.value.rows_ok == 2
+
+def test_truncated_output_is_rejected():
+    text = json.dumps(DOCUMENT, ensure_ascii=False)
+    parser, _ = _feed(text[:text.index("B") + 5], 10)
+    assert len(parser.rows) == 1
+    with pytest.raises(MalformedStream):
+        parser.finish()
@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from part_numbers import find_part_numbers, normalize_part_number, route_question
+
+def test_normalize_part_number():
+    assert normalize_part_number("ｃｚｍｖｆ３５６８－Ｖ３ 1228") == "CZMVF3568V31228"
+
+def test_find_part_numbers_skips_quantities_and_packages():
+    assert find_part_numbers("RC0402FR-0739KL / 10kΩ 0402 2023 04160100000105") == ["RC0402FR0739KL",
+                                                                                   "04160100000105"]
+
+@pytest.mark.parametrize("question", [
+    "哪些项目使用联合 CZMVF3568-V3-1228 摄像头？",
+    "CZMVF3568-V3-1228用在哪些项目",
+    "ＣＺＭＶＦ３５６８－Ｖ３用在哪些机型？",
+    "RC0402FR-0739KL",
+])
+def test_lookup_questions(question):
+    assert route_question(question)["route"] == "lookup"
+
+@pytest.mark.parametrize("question", [
+    "R2350电机保护逻辑是什么",
+    "R2350的电机堵转阈值",
+    "MPU6050和ICM42688哪个好",
+    "MPU6050用在哪些项目，和ICM42688有什么区别",
+    "为什么CZMVF3568-V3-1228用在这些项目",
+    "抹布烘干的事项有哪些",
+])
+def test_other_questions_go_to_rag(question):
+    assert route_question(question)["route"] == "rag"
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+from spec_fields import build_filters, extract_specs, has_constraints, parse_constraints
+
+def test_comparison_with_package_and_category():
+    constraints = parse_constraints("阻值大于10k的0402电阻")
+    assert constraints == {"ranges": [{"field": "resistance_ohm", "gt": 10000.0}], "package": ["0402"],
+                           "categories": ["电阻"]}
+    assert build_filters(constraints, prefix="spec.")[:2] == [
+        {"range": {"spec.resistance_ohm": {"gt": 10000.0}}},
+        {"term": {"spec.package": "0402"}},
+    ]
+
+def test_range_between_fractions():
+    assert parse_constraints("功率1/16W到1/4W")["ranges"] == [{"field": "power_w", "gte": 0.0625, "lte": 0.25}]
+
+def test_suffix_comparison():
+    assert parse_constraints("耐压50V以上的电容")["ranges"] == [{"field": "voltage_v", "gte": 50.0}]
+
+def test_value_with_unit_matches_a_narrow_range():
+    (item,) = parse_constraints("100nF 0603 电容")["ranges"]
+    assert item["field"] == "capacitance_f"
+    assert item["gte"] == pytest.approx(100e-9) and item["lte"] == pytest.approx(100e-9)
+    assert item["gte"] <= 100e-9 <= item["lte"]
+
+def test_bare_numbers_are_ignored():
+    constraints = parse_constraints("2023年采购了10个项目")
+    assert not has_constraints(constraints)
+    assert constraints["ranges"] == []
+
+def test_extracted_specs_fall_inside_parsed_constraints():
+    spec = extract_specs({"料号": "RC0402FR-0710KL", "阻值": "10kΩ", "功率": "1/16W", "封装": "0402"})
+    assert spec["resistance_ohm"] == pytest.approx(10000.0)
+    assert spec["power_w"] == pytest.approx(0.0625)
+    assert spec["package"] == "0402"
+    (item,) = parse_constraints("10kΩ的电阻")["ranges"]
+    assert item["gte"] <= spec["resistance_ohm"] <= item["lte"]
+
+@pytest.mark.parametrize("question, value", [("阻值4R7的电阻", 4.7), ("4k7电阻", 4700.0), ("1M5的电阻", 1.5e6)])
+def test_resistor_codes_in_questions(question, value):
+    (item,) = parse_constraints(question)["ranges"]
+    assert item["field"] == "resistance_ohm"
+    assert item["gte"] == pytest.approx(value) and item["lte"] == pytest.approx(value)
+
+def test_resistor_code_range():
+    assert parse_constraints("4k7到10k的电阻")["ranges"] == [{"field": "resistance_ohm", "gte": 4700.0, "lte": 10000.0}]
+
+def test_package_sizes_are_not_a_range():
+    constraints = parse_constraints("电阻0402-0603封装")
+    assert constraints["ranges"] == []
+    assert constraints["package"] == ["0402", "0603"]
+
+@pytest.mark.parametrize("row, value", [
+    ({"标称阻值(R/kR/MR)": "130K"}, 130e3),
+    ({"标称阻值(R/kR/MR)": "2.2M"}, 2.2e6),
+    ({"标称阻值(R/kR/MR)": "47"}, 47.0),
+    ({"阻值(kΩ)": "10"}, 10e3),
+    ({"阻值": "4R7"}, 4.7),
+])
+def test_resistance_cells(row, value):
+    assert extract_specs(row)["resistance_ohm"] == pytest.approx(value)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+import json
+
+from excel_llm_main import _align_rows, _corrected_rows, split_document
+from table_format import build_csv, compact_document
+
+HEADERS = ["料号", "名称", "数量"]
+
+def _document(count):
+    rows = [{"料号": f"RC{i:04d}", "名称": "贴片电阻" * 5, "数量": str(i)} for i in range(count)]
+    return {"doc_type": "excel", "file_name": "a.xlsx",
+            "tables": [{"sheet": "Sheet1", "data": build_csv(HEADERS, rows), "rows": rows}]}
+
+def test_batches_stay_within_limit_and_cover_all_rows():
+    document = _document(300)
+    batches = split_document(document, limit=3000)
+    assert len(batches) > 1
+    rows = []
+    for offset, batch in batches:
+        assert offset == len(rows)
+        assert len(json.dumps(batch, ensure_ascii=False, separators=(",", ":"))) <= 3000
+        table = batch["tables"][0]
+        assert table["headers"] == HEADERS
+        assert table["data"] == build_csv(HEADERS, table["rows"])
+        rows.extend(table["rows"])
+    assert rows == document["tables"][0]["rows"]
+
+def test_unsplittable_documents():
+    assert split_document(_document(1), limit=10) == []
+    assert split_document(compact_document(_document(50)), limit=1000) == []
+    two_tables = _document(50)
+    two_tables["tables"].append(two_tables["tables"][0])
+    assert split_document(two_tables, limit=1000) == []
+
+def test_corrected_rows_checks_row_count():
+    _, batch = split_document(_document(40), limit=2000)[0]
+    expected = len(batch["tables"][0]["rows"])
+    json_str = json.dumps(batch, ensure_ascii=False)
+    assert _corrected_rows(json_str, expected) == batch["tables"][0]["rows"]
+    assert _corrected_rows(json_str, expected + 1) is None
+    assert _corrected_rows(json.dumps(compact_document(batch)), expected) == batch["tables"][0]["rows"]
+    assert _corrected_rows("not json", expected) is None
+
+def test_align_rows_by_name():
+    rows = [{"数量": "1", "名称": "电阻", "料号": "A"}]
+    assert _align_rows(rows, HEADERS) == [{"料号": "A", "名称": "电阻", "数量": "1"}]
+
+def test_align_rows_drops_empty_extra_columns():
+    rows = [{"料号": "A", "名称": "电阻", "数量": "1", "Column_4": ""}]
+    assert _align_rows(rows, HEADERS) == [{"料号": "A", "名称": "电阻", "数量": "1"}]
+
+def test_align_rows_by_position_when_renamed():
+    rows = [{"料号": "A", "品名": "电阻", "数量": "1"}]
+    assert _align_rows(rows, HEADERS) == [{"料号": "A", "名称": "电阻", "数量": "1"}]
+
+def test_align_rows_rejects_mismatches():
+    # 多出的列有数据
+    assert _align_rows([{"料号": "A", "名称": "电阻", "数量": "1", "备注": "x"}], HEADERS) is None
+    # 批次内各行的列不一致
+    assert _align_rows([{"料号": "A", "名称": "电阻", "数量": "1"}, {"料号": "B", "名称": "电阻"}], HEADERS) is None
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import json
+
+from excel_llm_main import stream_correction
+from gemini_client import CorrectionEngine
+from table_format import build_csv
+
+HEADERS = ["料号", "名称", "数量"]
+
+class ScriptedClient:
+    """按顺序返回预设输出的模型替身；输出为 None 时原样返回提示词中的输入 JSON"""
+
+    model_name = "scripted"
+
+    def __init__(self, outputs):
+        self.outputs = list(outputs)
+        self.prompts = []
+
+    def generate_stream(self, prompt):
+        self.prompts.append(prompt)
+        output = self.outputs.pop(0)
+        if output is None:
+            output = prompt[prompt.index("以下是输入的JSON数据：") + len("以下是输入的JSON数据："):
+                            prompt.rindex("请返回校对后的JSON字符串。")]
+        for start in range(0, len(output), 50):
+            yield output[start:start + 50]
+
+def _document(rows):
+    return {"doc_type": "excel", "file_name": "a.xlsx",
+            "tables": [{"sheet": "Sheet1", "data": build_csv(HEADERS, rows), "rows": rows}]}
+
+def _source():
+    return _document([{"料号": f"RC{i:04d}", "名称": f"电阻{i}", "数量": str(i * 10)} for i in range(8)])
+
+def _truncated(rows):
+    text = json.dumps(_document(rows), ensure_ascii=False)
+    # 截断在最后一行之后
+    return text[:text.rindex("]")]
+
+def _input_rows(prompt):
+    document = json.loads(prompt[prompt.index("以下是输入的JSON数据：") + len("以下是输入的JSON数据："):
+                                 prompt.rindex("请返回校对后的JSON字符串。")])
+    return document["tables"][0]["rows"]
+
+def test_truncated_output_re_requests_remaining_rows():
+    source = _source()
+    rows = source["tables"][0]["rows"]
+    client = ScriptedClient([_truncated(rows[:5]), None])
+    result = json.loads(stream_correction(source, CorrectionEngine(client=client, retries=1)))
+    assert result["tables"][0]["rows"] == rows
+    assert _input_rows(client.prompts[1]) == rows[5:]
+
+def test_dropped_row_before_truncation_re_requests_whole_table():
+    source = _source()
+    rows = source["tables"][0]["rows"]
+    # 模型删除了第 2 行，随后输出在第 6 行处截断
+    client = ScriptedClient([_truncated(rows[:2] + rows[3:6]), None])
+    result = json.loads(stream_correction(source, CorrectionEngine(client=client, retries=1)))
+    assert result["tables"][0]["rows"] == rows
+    assert _input_rows(client.prompts[1]) == rows
+
+def test_corrected_cells_still_line_up():
+    source = _source()
+    rows = source["tables"][0]["rows"]
+    corrected = [dict(row) for row in rows[:5]]
+    corrected[4]["名称"] = "贴片电阻"
+    client = ScriptedClient([_truncated(corrected), None])
+    result = json.loads(stream_correction(source, CorrectionEngine(client=client, retries=1)))
+    assert result["tables"][0]["rows"] == corrected + rows[5:]
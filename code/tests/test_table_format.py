@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+
+from table_format import (build_csv, compact_document, dedupe_headers, expand_document, from_compact, is_compact,
+                          iter_row_groups, to_compact)
+
+HEADERS = ["料号", "名称", "封装", "备注"]
+
+def _table(rows, **extra):
+    return dict({"sheet": "Sheet1", "data": build_csv(HEADERS, rows), "rows": rows}, **extra)
+
+def _rows(count):
+    return [{"料号": f"RC{i:04d}", "名称": "贴片电阻" if i % 3 else "", "封装": "0402", "备注": "" if i % 5 else "常用"}
+            for i in range(count)]
+
+@pytest.mark.parametrize("table", [
+    _table(_rows(20)),
+    # 与 ExcelParser 输出的 chunk 字段顺序一致
+    {"sheet": "Sheet1", "headers": HEADERS, "data": build_csv(HEADERS, _rows(5)), "rows": _rows(5),
+     "chunk": {"index": 2, "row_offset": 5, "row_count": 5, "last": True}},
+    # 稀疏行（大部分单元格为空）
+    _table([{"料号": "", "名称": "", "封装": "", "备注": "只有备注"}, {"料号": "A", "名称": "", "封装": "", "备注": ""}]),
+    # data 与 rows 不一致时原样保留 data
+    dict(_table(_rows(3)), data="手工修改过的 CSV\n"),
+])
+def test_compact_round_trip(table):
+    compact = to_compact(table)
+    assert is_compact(compact)
+    assert "rows" not in compact
+    assert from_compact(json.loads(json.dumps(compact, ensure_ascii=False))) == table
+    assert list(from_compact(compact).keys()) == list(table.keys())
+
+def test_compact_is_smaller():
+    table = _table(_rows(200))
+    assert len(json.dumps(to_compact(table), ensure_ascii=False)) < len(json.dumps(table, ensure_ascii=False)) / 2
+
+def test_tables_that_cannot_be_compacted_are_kept():
+    # 行的键与表头不一致（如大模型改写过的表）
+    renamed = {"sheet": "Sheet1", "rows": [{"a": 1, "b": 2}, {"b": 3, "a": 4}]}
+    assert to_compact(renamed) is renamed
+    assert to_compact({"sheet": "Sheet1", "rows": []})["rows"] == []
+
+def test_document_round_trip_keeps_non_table_entries():
+    document = {"doc_type": "excel", "file_name": "a.xlsx", "tables": [_table(_rows(4)), "text"]}
+    compact = compact_document(document)
+    assert compact["tables"][1] == "text"
+    assert expand_document(compact) == document
+
+def test_row_groups_cover_every_row_once():
+    document = {"doc_type": "excel", "file_name": "a.xlsx", "tables": [_table(_rows(7))]}
+    groups = list(iter_row_groups(document, rows_per_group=3))
+    assert len(groups) == 3
+    for compact in (False, True):
+        source = compact_document(document) if compact else document
+        assert list(iter_row_groups(source, rows_per_group=3)) == groups
+
+def test_dedupe_headers():
+    assert dedupe_headers([" 料号 ", "", "名称", "名称", None, "名称"]) == ["料号", "Column_2", "名称", "名称_1", "Column_5",
+                                                                   "名称_2"]
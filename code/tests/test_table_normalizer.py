@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+from chunking import merge_chunks
+from table_format import build_csv
+from table_normalizer import normalize_table, normalize_document
+
+HEADERS = ["名称", "Column_2", "数量"]
+
+def _table(rows, chunk=None):
+    table = {"sheet": "Sheet1", "headers": HEADERS, "data": build_csv(HEADERS, rows), "rows": rows}
+    if chunk is not None:
+        table["chunk"] = chunk
+    return table
+
+def test_unchunked_table_drops_empty_placeholder_columns_and_rows():
+    rows = [{"名称": " A ", "Column_2": "", "数量": "1"},
+            {"名称": "", "Column_2": "", "数量": ""},
+            {"名称": "B", "Column_2": "", "数量": "2"}]
+    table = normalize_table(_table(rows))
+    assert table["headers"] == ["名称", "数量"]
+    assert table["rows"] == [{"名称": "A", "数量": "1"}, {"名称": "B", "数量": "2"}]
+
+def test_chunks_of_one_sheet_keep_the_same_columns_and_rows():
+    # Column_2 在第一个 chunk 中为空，在第二个 chunk 中有数据
+    first = [{"名称": "A", "Column_2": "", "数量": "1"}, {"名称": " ", "Column_2": "", "数量": ""}]
+    second = [{"名称": "B", "Column_2": "备注", "数量": "2"}]
+    chunks = [
+        _table(first, {"index": 1, "row_offset": 0, "row_count": 2, "last": False}),
+        _table(second, {"index": 2, "row_offset": 2, "row_count": 1, "last": True}),
+    ]
+    normalized = [normalize_table(chunk) for chunk in chunks]
+
+    assert [table["headers"] for table in normalized] == [HEADERS, HEADERS]
+    assert [len(table["rows"]) for table in normalized] == [2, 1]
+    merged = merge_chunks(normalized)
+    assert [row["名称"] for row in merged["rows"]] == ["A", "", "B"]
+
+def test_empty_placeholder_column_in_a_chunk_does_not_count_as_messy():
+    rows = [{"名称": "A", "Column_2": "", "数量": "1"}]
+    document = {"tables": [_table(rows, {"index": 1, "row_offset": 0, "row_count": 1, "last": False})]}
+    _, score, metrics = normalize_document(document)
+    assert metrics["placeholder"] == 0
+    assert score == 0
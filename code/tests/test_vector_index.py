@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+import pytest
+
+np = pytest.importorskip("numpy")
+
+import vector_index
+from vector_index import LocalVectorIndex
+
+DIMS = 16
+
+def _vectors(count, seed=0):
+    vectors = np.random.default_rng(seed).normal(size=(count, DIMS)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def _entries(count, start=0, chunk_rows=10):
+    return [{"key": f"k{i}", "doc_id": f"d{i // 100}", "chunk_id": f"c{i // chunk_rows}", "file_name": "a.xlsx",
+             "sheet_name": "Sheet1", "row": i % chunk_rows} for i in range(start, start + count)]
+
+@pytest.fixture
+def index(tmp_path):
+    index = LocalVectorIndex(str(tmp_path / "vectors"), DIMS)
+    yield index
+    index.close()
+
+def test_search_returns_nearest_entries(index):
+    vectors = _vectors(200)
+    index.add(vectors, _entries(200))
+    hits = index.search(vectors[42], k=3)
+    assert hits[0]["key"] == "k42"
+    assert hits[0]["score"] == pytest.approx(1.0, abs=0.02)
+    assert [hit["score"] for hit in hits] == sorted((hit["score"] for hit in hits), reverse=True)
+
+def test_rewritten_key_replaces_old_vector(index):
+    vectors = _vectors(50)
+    index.add(vectors, _entries(50))
+    index.add(vectors[:1] * -1, _entries(1))
+    hits = index.search(vectors[0], k=50)
+    assert [hit["key"] for hit in hits].count("k0") == 1
+    assert next(hit for hit in hits if hit["key"] == "k0")["score"] < 0
+
+def test_delete_and_prune(index):
+    vectors = _vectors(300)
+    index.add(vectors, _entries(300))
+    assert index.delete("doc_id", ["d0"]) == 100
+    assert all(hit["doc_id"] != "d0" for hit in index.search(vectors[5], k=300))
+    # c20 重新导入后只剩 4 行
+    assert index.prune_rows({"c20": 4}) == 6
+    keys = {hit["key"] for hit in index.search(vectors[200], k=300)}
+    assert {"k200", "k203"} <= keys and not {"k204", "k209"} & keys
+    with pytest.raises(ValueError):
+        index.delete("file_name", ["a.xlsx"])
+
+def test_trained_index_finds_vectors_added_before_and_after_training(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_index, "TRAIN_MIN", 500)
+    index = LocalVectorIndex(str(tmp_path / "vectors"), DIMS)
+    vectors = _vectors(800)
+    index.add(vectors[:600], _entries(600))
+    assert index.meta["nlist"] > 0
+    # 训练后追加的向量先留在尾部
+    index.add(vectors[600:], _entries(200, start=600))
+    for i in (3, 599, 600, 799):
+        assert index.search(vectors[i], k=1, nprobe=index.meta["nlist"])[0]["key"] == f"k{i}"
+    index.delete("key", ["k3"])
+    assert index.search(vectors[3], k=1, nprobe=index.meta["nlist"])[0]["key"] != "k3"
+    index.close()
+
+def test_reopen_and_clear(tmp_path):
+    path = str(tmp_path / "vectors")
+    vectors = _vectors(20)
+    index = LocalVectorIndex(path, DIMS)
+    index.add(vectors, _entries(20))
+    index.close()
+
+    index = LocalVectorIndex(path, DIMS)
+    assert len(index) == 20
+    assert index.search(vectors[7], k=1)[0]["key"] == "k7"
+    index.clear()
+    assert index.search(vectors[7], k=1) == []
+    index.close()
+    with pytest.raises(ValueError):
+        LocalVectorIndex(path, DIMS * 2)
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import json
+
+import pytest
+from docx import Document
+
+import chunking
+from word_parser import WordParser
+
+def _section_size(section, size_unit="chars"):
+    # 与 iter_section_parts 的预算口径一致：正文文本 + 表格 JSON
+    lines = section["content"].split("\n") if section["content"] else []
+    return (sum(chunking.measure(line, size_unit) + 1 for line in lines) +
+            sum(chunking.measure(json.dumps(table, ensure_ascii=False), size_unit) for table in section["tables"]))
+
+@pytest.fixture
+def huge_table_docx(tmp_path):
+    document = Document()
+    document.add_heading("电阻规格", 1)
+    document.add_paragraph("以下为常用贴片电阻清单。" * 10)
+    table = document.add_table(rows=1, cols=4)
+    for i, header in enumerate(["料号", "名称", "封装", "备注"]):
+        table.rows[0].cells[i].text = header
+    for row in range(2000):
+        cells = table.add_row().cells
+        for i, value in enumerate([f"RC0402FR-07{row:05d}L", "贴片电阻", "0402", "常用物料，优先选用"]):
+            cells[i].text = value
+    document.add_paragraph("表格结束。")
+    path = tmp_path / "huge_table.docx"
+    document.save(str(path))
+    return str(path)
+
+def test_huge_table_sections_stay_within_budget(huge_table_docx):
+    sections = list(WordParser(huge_table_docx).iter_section_parts(target_char_limit=4000))
+    assert len(sections) > 10
+    assert all(_section_size(section) <= 4000 for section in sections)
+    # 续段编号连续，续段以标题路径开头
+    assert [section["section"]["part"] for section in sections] == list(range(1, len(sections) + 1))
+    assert all(section["content"].startswith("电阻规格") for section in sections)
+    # 所有数据行都保留且顺序不变
+    rows = [row for section in sections for table in section["tables"] for row in table["rows"]]
+    assert [row["料号"] for row in rows] == [f"RC0402FR-07{i:05d}L" for i in range(2000)]
+    assert sections[-1]["content"].endswith("表格结束。")
+
+def test_small_table_stays_in_its_section(tmp_path):
+    document = Document()
+    document.add_heading("概述", 1)
+    document.add_paragraph("正文")
+    table = document.add_table(rows=2, cols=2)
+    for i, value in enumerate(["名称", "数量", "电阻", "10"]):
+        table.cell(i // 2, i % 2).text = value
+    path = str(tmp_path / "small.docx")
+    document.save(path)
+    sections = list(WordParser(path).iter_section_parts())
+    assert len(sections) == 1
+    assert sections[0]["tables"][0]["rows"] == [{"名称": "电阻", "数量": "10"}]
+    assert "chunk" not in sections[0]["tables"][0]
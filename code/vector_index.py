@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from typing import Dict, Any, Iterable, List
+
+try:
+    import numpy as np
+except ImportError:  # numpy 为可选依赖，未安装时不能使用本地向量索引（向量仍可存入 ES）
+    np = None
+
+# 向量条数达到该值时训练 IVF 聚类中心，之前全部暴力检索
+TRAIN_MIN = 20000
+# 训练后新增的向量追加在尾部（查询时按所属的桶筛选），尾部超过 max(REORGANIZE_MIN, 已分桶条数 * REORGANIZE_RATIO) 时
+# 按桶重新排列
+REORGANIZE_MIN = 20000
+REORGANIZE_RATIO = 0.1
+# 向量条数增长到上次训练时的 RETRAIN_FACTOR 倍时重新训练（聚类中心数随条数增长）
+RETRAIN_FACTOR = 4
+
+# 侧表的列：ES 文档 _id、所属文件 doc_id、所属 sheet/chunk 的 chunk_id、文件名、sheet 名、行序号（sheet 粒度为 NULL）
+ENTRY_COLUMNS = ("key", "doc_id", "chunk_id", "file_name", "sheet_name", "row")
+
+class LocalVectorIndex:
+    """
+    本地向量索引，用于 ES 不支持 kNN 的部署：
+    - 向量按行做 int8 量化（每条向量一个 float32 缩放系数），追加写入 vectors.i8 / scales.f32，查询时按内存映射读取，
+      打开索引只需读取 meta.json，不加载向量；
+    - 倒排文件（IVF）：k-means 聚类中心（centroids.f32）、每条向量所属的桶（assign.i32）、按桶排序的向量编号
+      （lists.i32）及每个桶的起止位置（offsets.i64）；查询时只扫描与问题最接近的 nprobe 个桶（包括训练后新增、
+      尚未按桶排列的尾部向量中属于这些桶的）；
+    - 删除标记（alive.u8）：重新写入或删除的文档置 0，查询时跳过；
+    - 侧表（entries.sqlite）：向量编号 -> (ES 文档 _id, doc_id, chunk_id, file_name, sheet_name, row)。
+    meta.json 中的 count 为已提交的向量条数，写入中断时多出的数据在下次追加时截断。同一目录只能由一个进程写入。
+    """
+
+    def __init__(self, path: str, dims: int):
+        """
+        初始化 LocalVectorIndex 类，目录不存在时创建空索引。
+        :param path: 索引目录
+        :param dims: 向量维数（与已有索引不一致时报错）
+        """
+        if np is None:
+            raise ValueError("numpy is not installed")
+        if not os.path.exists(path):
+            os.makedirs(path)
+
+        self.path = path
+        self._lock = threading.RLock()
+        self._arrays = None
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                self.meta = json.load(f)
+            if self.meta["dims"] != dims:
+                raise ValueError(f"Vector index {path} has {self.meta['dims']} dims, expected {dims}")
+        else:
+            self.meta = {"dims": dims, "count": 0, "indexed": 0, "nlist": 0, "trained_count": 0}
+            self._write_meta()
+        self._conn = sqlite3.connect(os.path.join(path, "entries.sqlite"), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS entries (id INTEGER PRIMARY KEY, key TEXT UNIQUE, doc_id TEXT, "
+                           "chunk_id TEXT, file_name TEXT, sheet_name TEXT, row INTEGER)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_doc_id ON entries (doc_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_chunk_id ON entries (chunk_id, row)")
+        self._conn.commit()
+
+    @property
+    def dims(self) -> int:
+        return self.meta["dims"]
+
+    def __len__(self) -> int:
+        return self.meta["count"]
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _write_meta(self):
+        tmp_path = self._file("meta.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(tmp_path, self._file("meta.json"))
+
+    def _map(self, name: str, dtype: Any, shape: tuple, mode: str = "r") -> Any:
+        if not shape[0]:
+            return np.zeros(shape, dtype=dtype)
+        return np.memmap(self._file(name), dtype=dtype, mode=mode, shape=shape)
+
+    def _load(self) -> Dict[str, Any]:
+        """
+        按 meta.json 中的条数内存映射各数据文件（追加或重新分桶后重新映射）
+        """
+        if self._arrays is None:
+            count, dims, nlist = self.meta["count"], self.meta["dims"], self.meta["nlist"]
+            self._arrays = {
+                "vectors": self._map("vectors.i8", np.int8, (count, dims)),
+                "scales": self._map("scales.f32", np.float32, (count,)),
+                "assign": self._map("assign.i32", np.int32, (count,)),
+                "alive": self._map("alive.u8", np.uint8, (count,), mode="r+"),
+                "centroids": self._map("centroids.f32", np.float32, (nlist, dims)),
+                "lists": self._map("lists.i32", np.int32, (self.meta["indexed"],)),
+                "offsets": self._map("offsets.i64", np.int64, (nlist + 1 if nlist else 0,)),
+            }
+        return self._arrays
+
+    def _replace_file(self, name: str, data: Any):
+        # 写入临时文件后替换，正在查询的线程仍映射着旧文件，不会读到写了一半的数据
+        data.tofile(self._file(name + ".tmp"))
+        os.replace(self._file(name + ".tmp"), self._file(name))
+
+    def _append_file(self, name: str, data: Any, itemsize: int):
+        # 截断上次写入中断时多出的数据，保证新数据紧接在已提交的条数之后
+        path = self._file(name)
+        committed = self.meta["count"] * itemsize
+        with open(path, "ab") as f:
+            if f.tell() != committed:
+                f.truncate(committed)
+                f.seek(committed)
+            f.write(np.ascontiguousarray(data).tobytes())
+
+    @staticmethod
+    def quantize(vectors: Any) -> tuple:
+        """
+        按行对称 int8 量化：缩放系数为该行最大绝对值 / 127。
+        :param vectors: (n, dims) 浮点数组
+        :return: (int8 数组, float32 缩放系数数组)
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _assign(self, vectors: Any, centroids: Any, batch_size: int = 16384) -> Any:
+        assign = np.empty(len(vectors), dtype=np.int32)
+        for start in range(0, len(vectors), batch_size):
+            part = np.asarray(vectors[start:start + batch_size], dtype=np.float32)
+            assign[start:start + batch_size] = np.argmax(part @ centroids.T, axis=1)
+        return assign
+
+    def add(self, vectors: Any, entries: List[Dict[str, Any]]) -> List[int]:
+        """
+        追加一批向量及其侧表信息。entries 中的 key（ES 文档 _id）已存在时，旧向量标记为删除。
+        条数达到 TRAIN_MIN 时训练聚类中心，训练后的尾部过长时重新分桶（见模块常量）。
+        :param vectors: (n, dims) 浮点数组或列表，应已归一化
+        :param entries: 与 vectors 一一对应的字典，键见 ENTRY_COLUMNS（缺少的键为 NULL）
+        :return: 新向量的编号列表
+        """
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dims)
+        if len(vectors) != len(entries):
+            raise ValueError(f"Got {len(vectors)} vectors for {len(entries)} entries")
+        if not len(vectors):
+            return []
+        with self._lock:
+            start = self.meta["count"]
+            ids = list(range(start, start + len(vectors)))
+            codes, scales = self.quantize(vectors)
+            if self.meta["nlist"]:
+                assign = self._assign(vectors, self._load()["centroids"])
+            else:
+                assign = np.full(len(vectors), -1, dtype=np.int32)
+            self._delete_ids(self._select_ids("key", [entry.get("key") for entry in entries]))
+            self._append_file("vectors.i8", codes, self.dims)
+            self._append_file("scales.f32", scales, 4)
+            self._append_file("assign.i32", assign, 4)
+            self._append_file("alive.u8", np.ones(len(vectors), dtype=np.uint8), 1)
+            self._conn.executemany(
+                f"INSERT OR REPLACE INTO entries (id, {', '.join(ENTRY_COLUMNS)}) "
+                f"VALUES (?, {', '.join('?' * len(ENTRY_COLUMNS))})",
+                [(vector_id, *(entry.get(column) for column in ENTRY_COLUMNS)) for vector_id, entry in zip(ids, entries)])
+            self._conn.commit()
+            self.meta["count"] += len(vectors)
+            self._write_meta()
+            self._arrays = None
+            self._maybe_reorganize()
+        return ids
+
+    def _maybe_reorganize(self):
+        count, indexed = self.meta["count"], self.meta["indexed"]
+        if not self.meta["nlist"]:
+            if count >= TRAIN_MIN:
+                self.train()
+        elif count >= self.meta["trained_count"] * RETRAIN_FACTOR:
+            self.train()
+        elif count - indexed > max(REORGANIZE_MIN, indexed * REORGANIZE_RATIO):
+            self.reorganize()
+
+    def train(self, nlist: int = None, sample_size: int = None, iterations: int = 10, seed: int = 0):
+        """
+        用抽样向量训练 k-means 聚类中心（球面 k-means，按内积分配），重新计算全部向量所属的桶并分桶。
+        :param nlist: 桶数，默认约为 2 * sqrt(条数)
+        :param sample_size: 训练样本数，默认 nlist * 32
+        :param iterations: 迭代次数
+        :param seed: 抽样随机种子
+        """
+        with self._lock:
+            arrays = self._load()
+            count = self.meta["count"]
+            if not count:
+                return
+            nlist = min(nlist or max(1, int(2 * count ** 0.5)), count)
+            rng = np.random.default_rng(seed)
+            sample_ids = np.sort(rng.choice(count, size=min(count, sample_size or nlist * 32), replace=False))
+            sample = self._decode(arrays, sample_ids)
+            centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+            for _ in range(iterations):
+                labels = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, sample)
+                empty = ~np.bincount(labels, minlength=nlist).astype(bool)
+                # 空桶用随机样本重新初始化
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+                centroids = sums / np.maximum(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12)
+
+            assign = np.empty(count, dtype=np.int32)
+            for start in range(0, count, 65536):
+                part = self._decode(arrays, np.arange(start, min(count, start + 65536)))
+                assign[start:start + len(part)] = np.argmax(part @ centroids.T, axis=1)
+            self._arrays = None
+            self._replace_file("assign.i32", assign)
+            self._replace_file("centroids.f32", centroids.astype(np.float32))
+            self.meta.update(nlist=nlist, trained_count=count)
+            self._write_lists(assign)
+
+    def reorganize(self):
+        """
+        按已记录的所属桶重新排列全部向量编号（不重新训练），把尾部的新增向量并入各桶。
+        """
+        with self._lock:
+            if self.meta["nlist"]:
+                self._write_lists(np.asarray(self._load()["assign"]))
+
+    def _write_lists(self, assign: Any):
+        # meta 最后写入，替换完成前查询仍使用旧的分桶
+        lists = np.argsort(assign, kind="stable").astype(np.int32)
+        offsets = np.zeros(self.meta["nlist"] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assign, minlength=self.meta["nlist"]), out=offsets[1:])
+        self._arrays = None
+        self._replace_file("lists.i32", lists)
+        self._replace_file("offsets.i64", offsets)
+        self.meta["indexed"] = len(assign)
+        self._write_meta()
+
+    @staticmethod
+    def _decode(arrays: Dict[str, Any], ids: Any) -> Any:
+        return arrays["vectors"][ids].astype(np.float32) * arrays["scales"][ids][:, None]
+
+    def search(self, vector: Any, k: int = 10, nprobe: int = 8) -> List[Dict[str, Any]]:
+        """
+        查询与 vector 内积最大的 k 条向量（向量已归一化时即余弦相似度最高）。
+        :param vector: 问题向量
+        :param k: 返回条数
+        :param nprobe: 扫描的桶数（越大召回率越高、越慢）；未训练时暴力检索
+        :return: [{"id": 向量编号, "score": 相似度, 侧表各列...}, ...]，按相似度从高到低
+        """
+        query = np.asarray(vector, dtype=np.float32).reshape(-1)
+        with self._lock:
+            arrays = self._load()
+            count, indexed, nlist = self.meta["count"], self.meta["indexed"], self.meta["nlist"]
+        if not count:
+            return []
+        if nlist:
+            probe = np.argpartition(-(arrays["centroids"] @ query), min(nprobe, nlist) - 1)[:nprobe]
+            offsets = arrays["offsets"]
+            parts = [arrays["lists"][offsets[bucket]:offsets[bucket + 1]] for bucket in probe]
+            # 尾部向量追加时已计算所属的桶，只取落在这 nprobe 个桶中的
+            parts.append(indexed + np.flatnonzero(np.isin(arrays["assign"][indexed:count], probe)).astype(np.int32))
+            ids = np.sort(np.concatenate(parts))
+        else:
+            ids = np.arange(count, dtype=np.int32)
+        ids = ids[arrays["alive"][ids] == 1]
+        if not len(ids):
+            return []
+        scores = (arrays["vectors"][ids] @ query) * arrays["scales"][ids]
+        top = np.argpartition(-scores, min(k, len(ids)) - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        entries = self.entries([int(vector_id) for vector_id in ids[top]])
+        return [dict(entries.get(int(ids[i]), {}), id=int(ids[i]), score=float(scores[i])) for i in top]
+
+    def entries(self, ids: Iterable[int]) -> Dict[int, Dict[str, Any]]:
+        """
+        按向量编号查询侧表。
+        :return: {向量编号: {"key", "doc_id", "chunk_id", "file_name", "sheet_name", "row"}}
+        """
+        ids = list(ids)
+        with self._lock:
+            rows = self._conn.execute(f"SELECT id, {', '.join(ENTRY_COLUMNS)} FROM entries "
+                                      f"WHERE id IN ({', '.join('?' * len(ids))})", ids).fetchall()
+        return {row[0]: dict(zip(ENTRY_COLUMNS, row[1:])) for row in rows}
+
+    def _select_ids(self, column: str, values: List[Any], min_row: int = None) -> List[int]:
+        values = [value for value in values if value is not None]
+        found = []
+        for start in range(0, len(values), 500):
+            part = values[start:start + 500]
+            sql = f"SELECT id FROM entries WHERE {column} IN ({', '.join('?' * len(part))})"
+            if min_row is not None:
+                sql += f" AND row >= {int(min_row)}"
+            found.extend(row[0] for row in self._conn.execute(sql, part))
+        return found
+
+    def _delete_ids(self, ids: List[int]) -> int:
+        if not ids:
+            return 0
+        alive = self._load()["alive"]
+        alive[np.asarray(ids, dtype=np.int64)] = 0
+        alive.flush()
+        self._conn.executemany("DELETE FROM entries WHERE id = ?", [(vector_id,) for vector_id in ids])
+        self._conn.commit()
+        return len(ids)
+
+    def delete(self, column: str, values: Iterable[Any]) -> int:
+        """
+        按侧表的列（"key"、"doc_id" 或 "chunk_id"）删除向量（置删除标记），空间在重建索引时回收。
+        :return: 删除的条数
+        """
+        if column not in ("key", "doc_id", "chunk_id"):
+            raise ValueError(f"Cannot delete vectors by {column}")
+        with self._lock:
+            return self._delete_ids(self._select_ids(column, list(values)))
+
+    def prune_rows(self, counts: Dict[str, int]) -> int:
+        """
+        删除 chunk 重新导入后行数变少时多出来的旧行向量（与 Elastic.prune_rows 对应）。
+        :param counts: {chunk_id: 新的行文档数}
+        :return: 删除的条数
+        """
+        with self._lock:
+            return sum(self._delete_ids(self._select_ids("chunk_id", [chunk_id], min_row=count))
+                       for chunk_id, count in counts.items())
+
+    def clear(self):
+        """
+        删除全部向量（保留目录与维数）。
+        """
+        with self._lock:
+            self._arrays = None
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+            for name in ("vectors.i8", "scales.f32", "assign.i32", "alive.u8", "centroids.f32", "lists.i32",
+                         "offsets.i64"):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+            self.meta.update(count=0, indexed=0, nlist=0, trained_count=0)
+            self._write_meta()
+
+    def close(self):
+        """
+        关闭侧表连接并释放内存映射。
+        """
+        with self._lock:
+            self._arrays = None
+            self._conn.close()
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def vector_index_path(name: str) -> str:
+    """
+    ES 索引 name 对应的本地向量索引目录：环境变量 VECTOR_INDEX_DIR（默认 vector_index）下的同名子目录。
+    """
+    return os.path.join(os.getenv("VECTOR_INDEX_DIR", "vector_index"), name)
+
+def open_vector_index(path: str, dims: int) -> LocalVectorIndex:
+    """
+    打开（不存在时创建）本地向量索引；同一目录在进程内共用一个对象，多个线程可同时写入和查询。
+    :param path: 索引目录
+    :param dims: 向量维数
+    :return: LocalVectorIndex 对象
+    """
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        if key not in _indexes:
+            _indexes[key] = LocalVectorIndex(path, dims)
+        return _indexes[key]
+
+def remove_vector_index(path: str):
+    """
+    关闭并删除本地向量索引目录（随对应的 ES 索引一起删除）。
+    """
+    key = os.path.abspath(path)
+    with _indexes_lock:
+        index = _indexes.pop(key, None)
+    if index is not None:
+        index.close()
+    if os.path.exists(path):
+        shutil.rmtree(path)
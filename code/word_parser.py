@@ -1,11 +1,27 @@
 # -*- coding: utf-8 -*-
 import json
+import re
 from docx import Document
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List, Iterator, Tuple
+
+import chunking
+from ingest_manifest import IngestManifest, run_parse_stage
+from table_format import build_csv, dedupe_headers
+
+# 标题样式名称，如 "Heading 2"、"标题 2"
+_HEADING_STYLE = re.compile(r"^(?:heading|标题)\s*(\d)$", re.IGNORECASE)
+
+# 文档正文中的块级元素
+_W_P = qn("w:p")
+_W_TBL = qn("w:tbl")
+_W_OUTLINE_LVL = qn("w:outlineLvl")
 
 class WordParser:
-    """用于解析 Word 文档并将其转换为 JSON 格式的类，仅提取文本内容。"""
+    """用于解析 Word 文档并将其转换为 JSON 格式的类，按标题切分为大小受限的分段，表格保留为结构化行。"""
 
     def __init__(self, file_path: str, doc_type: str = "word"):
         """
@@ -22,65 +38,223 @@ class WordParser:
         self.result = {
             "doc_type": self.doc_type,
             "file_name": self.file_name,
-            "content": ""
+            "sections": []
         }
 
-    def parse(self) -> Dict[str, Any]:
+    @staticmethod
+    def _heading_level(paragraph: Paragraph) -> int:
         """
-        解析 Word 文档，提取段落和表格的文本内容。
-        :return: 解析后的 JSON 数据，包含 doc_type、file_name 和 content
+        获取段落的标题级别：优先使用段落自身的大纲级别（没有样式表的文档也能识别），
+        其次使用标题样式名称或样式（及其基样式）的大纲级别。
+        :param paragraph: 段落对象
+        :return: 标题级别（1 为最高级），正文返回 0
+        """
+        p_pr = paragraph._p.pPr
+        outline = p_pr.find(_W_OUTLINE_LVL) if p_pr is not None else None
+        if outline is not None:
+            level = int(outline.get(qn("w:val"), "9"))
+            return level + 1 if level < 9 else 0
+
+        style = paragraph.style
+        while style is not None:
+            match = _HEADING_STYLE.match(style.name or "")
+            if match:
+                return int(match.group(1))
+            style_p_pr = style.element.pPr
+            outline = style_p_pr.find(_W_OUTLINE_LVL) if style_p_pr is not None else None
+            if outline is not None:
+                level = int(outline.get(qn("w:val"), "9"))
+                return level + 1 if level < 9 else 0
+            style = style.base_style
+        return 0
+
+    def iter_blocks(self) -> Iterator[Tuple[str, int, Any]]:
+        """
+        按文档顺序逐个产出正文中的块，忽略空段落和空表格行。
+        :return: (类型, 标题级别, 内容) 的生成器：
+                 ("heading", 级别, 文本)、("paragraph", 0, 文本) 或 ("table", 0, 二维数据列表)
+        """
+        # 加载 Word 文档
+        doc = Document(self.file_path)
+
+        for child in doc.element.body.iterchildren():
+            if child.tag == _W_P:
+                paragraph = Paragraph(child, doc)
+                text = paragraph.text.strip()
+                if not text:  # 忽略空段落
+                    continue
+                level = self._heading_level(paragraph)
+                yield ("heading", level, text) if level else ("paragraph", 0, text)
+            elif child.tag == _W_TBL:
+                table_data = []
+                for row in Table(child, doc).rows:
+                    row_text = [cell.text.strip() for cell in row.cells]
+                    if any(row_text):  # 忽略空行
+                        table_data.append(row_text)
+                if table_data:
+                    yield "table", 0, table_data
+
+    def _build_tables(self, sheet_name: str, table_data: List[List[str]], target_char_limit: int,
+                      size_unit: str) -> List[Dict[str, Any]]:
+        """
+        将 Word 表格构造为 table（第一行为表头）。超出预算的大表格按行分块，每块重复表头并带 chunk 元数据。
+        :param sheet_name: table 名称（所在分段名称）
+        :param table_data: 二维数据列表
+        :param target_char_limit: 每个分段的大小预算
+        :param size_unit: 大小单位
+        :return: table 列表
+        """
+        headers = dedupe_headers(table_data[0])
+        rows = [dict(zip(headers, row)) for row in table_data[1:]]
+
+        base = chunking.base_size(self.doc_type, self.file_name, sheet_name, headers, size_unit)
+        chunks = list(chunking.with_last_flag(
+            chunking.iter_row_chunks(rows, headers, target_char_limit, base, size_unit)
+        ))
+        if len(chunks) == 1:
+            return [{"sheet": sheet_name, "data": build_csv(headers, rows), "rows": rows}]
+
+        return [
+            {
+                "sheet": sheet_name,
+                "headers": headers,
+                "data": build_csv(headers, chunk_rows),
+                "rows": chunk_rows,
+                "chunk": {"index": index, "row_offset": offset, "row_count": len(chunk_rows), "last": last},
+            }
+            for index, (offset, chunk_rows, last) in enumerate(chunks, 1)
+        ]
+
+    def iter_section_parts(self, target_char_limit: int = 4000,
+                           size_unit: str = "chars") -> Iterator[Dict[str, Any]]:
+        """
+        按文档顺序遍历正文，在标题处切分分段；分段超出预算时在块边界处切出续段（part 递增）。
+        每个分段携带标题路径（从一级标题到当前标题），表格以结构化行保存。
+        :param target_char_limit: 每个分段的大小预算（正文文本 + 表格 JSON）
+        :param size_unit: 大小单位，"chars" 或 "tokens"
+        :return: 分段字典生成器 {"section": {"index", "name", "heading_path", "part"}, "content", "tables"}
+        """
+        base_name = os.path.splitext(self.file_name)[0]
+        heading_path = []  # [(级别, 标题文本), ...]
+        index = 0
+        part = 1
+        lines = []
+        tables = []
+        size = 0
+        has_body = False
+
+        def make_section():
+            path = [text for _, text in heading_path]
+            title = path[-1] if path else base_name
+            name = f"{index}_{title}" if part == 1 else f"{index}_{title}({part})"
+            return {
+                "section": {"index": index, "name": name, "heading_path": path, "part": part},
+                "content": "\n".join(lines),
+                "tables": tables,
+            }
+
+        for kind, level, value in self.iter_blocks():
+            if kind == "heading":
+                if has_body:
+                    index += 1
+                    yield make_section()
+                    lines, tables, size, has_body = [], [], 0, False
+                part = 1
+                while heading_path and heading_path[-1][0] >= level:
+                    heading_path.pop()
+                heading_path.append((level, value))
+                lines.append(value)
+                size += chunking.measure(value, size_unit) + 1
+                continue
+
+            continuation = [" > ".join(text for _, text in heading_path)] if heading_path else []
+            continuation_size = sum(chunking.measure(line, size_unit) + 1 for line in continuation)
+            if kind == "paragraph":
+                pieces = [(kind, value, chunking.measure(value, size_unit) + 1)]
+            else:
+                # 大表格的每个分块单独参与预算判断，分块之间可以切出续段；分块预算扣除续段开头的标题路径
+                sheet_name = heading_path[-1][1] if heading_path else base_name
+                pieces = [(kind, table, chunking.measure(json.dumps(table, ensure_ascii=False), size_unit))
+                          for table in self._build_tables(sheet_name, value, target_char_limit - continuation_size,
+                                                          size_unit)]
+
+            for kind, value, block_size in pieces:
+                if has_body and size + block_size > target_char_limit:
+                    # 当前分段已满，切出续段；续段以标题路径开头，保证单独检索时有上下文
+                    index += 1
+                    yield make_section()
+                    part += 1
+                    lines, tables, size = list(continuation), [], continuation_size
+
+                has_body = True
+                size += block_size
+                if kind == "paragraph":
+                    lines.append(value)
+                else:
+                    tables.append(value)
+
+        if has_body or lines:
+            index += 1
+            yield make_section()
+
+    def iter_sections(self, target_char_limit: int = 4000,
+                      size_unit: str = "chars") -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        逐个产出文档分段的 JSON 文档，文件名为“word名称_分段编号_1.json”，下游可以边解析边消费。
+        已调用 parse 时直接使用其结果。
+        :param target_char_limit: 每个分段的大小预算
+        :param size_unit: 大小单位，"chars" 或 "tokens"
+        :return: (输出文件名, JSON 文档) 的生成器
+        """
+        base_name = os.path.splitext(self.file_name)[0]  # 去掉扩展名
+        sections = self.result["sections"] or self.iter_section_parts(target_char_limit, size_unit)
+        for section in sections:
+            yield f"{base_name}_{section['section']['index']}_1.json", {
+                "doc_type": self.doc_type,
+                "file_name": self.file_name,
+                **section
+            }
+
+    def parse(self, target_char_limit: int = 4000, size_unit: str = "chars") -> Dict[str, Any]:
+        """
+        解析 Word 文档，按标题切分为大小受限的分段。
+        :param target_char_limit: 每个分段的大小预算
+        :param size_unit: 大小单位，"chars" 或 "tokens"
+        :return: 解析后的 JSON 数据，包含 doc_type、file_name 和 sections
         """
         try:
-            # 加载 Word 文档
-            doc = Document(self.file_path)
-
-            # 存储所有文本内容的列表
-            text_parts = []
-
-            # 提取段落文本
-            for para in doc.paragraphs:
-                text = para.text.strip()
-                if text:  # 忽略空段落
-                    text_parts.append(text)
-
-            # 提取表格中的文本
-            for table in doc.tables:
-                for row in table.rows:
-                    row_text = []
-                    for cell in row.cells:
-                        cell_text = cell.text.strip()
-                        if cell_text:
-                            row_text.append(cell_text)
-                    if row_text:  # 忽略空行
-                        # 用制表符 \t 分隔单元格内容，模拟表格结构
-                        text_parts.append("\t".join(row_text))
-
-            # 将所有文本拼接为一个长字符串，用换行符分隔
-            self.result["content"] = "\n".join(text_parts)
+            self.result["sections"] = list(self.iter_section_parts(target_char_limit, size_unit))
 
         except Exception as e:
             raise Exception(f"Error processing Word file: {str(e)}")
 
         return self.result
 
-    def save_to_file(self, output_dir: str = "llm_output_test"):
+    def save_to_file(self, output_dir: str = "llm_output_test", target_char_limit: int = 4000,
+                     size_unit: str = "chars"):
         """
-        将解析结果保存为 JSON 文件，文件名为“word名称_1.json”。
+        将每个分段保存为单独的 JSON 文件，文件名规则见 iter_sections。
+        未调用 parse 时逐段解析并写出。
         :param output_dir: 输出目录
+        :param target_char_limit: 每个分段的大小预算
+        :param size_unit: 大小单位，"chars" 或 "tokens"
+        :return: 输出文件路径列表
         """
         # 确保输出目录存在
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        # 构造输出文件名：word名称_1.json
-        base_name = os.path.splitext(self.file_name)[0]  # 去掉扩展名
-        output_file_name = f"{base_name}_1.json"
-        output_path = os.path.join(output_dir, output_file_name)
+        output_paths = []
+        for output_file_name, section_json in self.iter_sections(target_char_limit, size_unit):
+            output_path = os.path.join(output_dir, output_file_name)
+
+            # 保存 JSON 文件
+            with open(output_path, "w", encoding="utf-8") as f:
+                json.dump(section_json, f, ensure_ascii=False, indent=2)
+            print(f"Saved Word section '{section_json['section']['name']}' to: {output_path}")
+            output_paths.append(output_path)
 
-        # 保存 JSON 文件
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(self.result, f, ensure_ascii=False, indent=2)
-        print(f"Saved Word content to: {output_path}")
+        return output_paths
 
 def main():
     # 替换为你的 Word 文件路径
@@ -88,16 +262,26 @@ def main():
 
     # 使用 WordParser 解析 Word 文件
     parser = WordParser(file_path)
-    result = parser.parse()
+    manifest = IngestManifest()
+
+    def parse_and_save():
+        result = parser.parse()
+
+        # 打印结果
+        print("=== Parsed Word ===")
+        print(f"Doc Type: {result['doc_type']}")
+        print(f"File Name: {result['file_name']}")
+        print(f"Total Sections: {len(result['sections'])}")
+        for section in result['sections']:
+            print(f"\nSection {section['section']['name']} - Path: {' > '.join(section['section']['heading_path'])}")
+            print(f"Number of Tables: {len(section['tables'])}")
+            print(f"Content:\n{section['content']}")
 
-    # 打印结果
-    print("=== Parsed Word ===")
-    print(f"Doc Type: {result['doc_type']}")
-    print(f"File Name: {result['file_name']}")
-    print(f"Content:\n{result['content']}")
+        # 保存每个分段为单独的 JSON 文件
+        return parser.save_to_file(output_dir="llm_output_test")
 
-    # 保存为 JSON 文件
-    parser.save_to_file(output_dir="llm_output_test")
+    # 文件内容未变化时跳过解析
+    run_parse_stage(manifest, file_path, parse_and_save)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()